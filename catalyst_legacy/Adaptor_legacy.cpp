@@ -17,179 +17,352 @@
 #include <vtkNew.h>
 #include <vtkPointData.h>
 #include <vtkPoints.h>
+#include <vtkSOADataArrayTemplate.h>
 #include <vtkStringArray.h>
+#include <vtkStructuredGrid.h>
+#include <vtkUnsignedCharArray.h>
+
+#include "mpi.h"
+#include "MPIdata.h"
 
 namespace {
 vtkCPProcessor *Processor = nullptr;
-vtkImageData *VTKGrid = nullptr;
+vtkDataSet *VTKGrid = nullptr;
 const char *InputName = "input";
 
 int _start_x;
 int _nx;
-int _dx;
+double _dx;
 int _start_y;
 int _ny;
-int _dy;
+double _dy;
 int _start_z;
 int _nz;
-int _dz;
+double _dz;
 const Collective *_sim_params{};
 
+// true if the VTK grid is laid over the iPIC3D node storage (zero-copy mode)
+bool _zero_copy;
+// time spent in UpdateVTKAttributes, used to report adaptor cost per cycle
+double _update_time = 0.;
+int _update_calls = 0;
+
+const double FourPI = 4*3.1415926535897;
+
+//tag_names for each species' fields 
+const string rhotag[]={"rhoe0", "rhoi1", "rhoe2", "rhoi3", "rhoe4", "rhoi5", "rhoe6", "rhoi7"};
+const string Vtag[]={"Ve0", "Vi1", "Ve2", "Vi3", "Ve4", "Vi5", "Ve6", "Vi7"};
+const string Tcart_tag[]={"Tcart_e0", "Tcart_i1", "Tcart_e2", "Tcart_i3", "Tcart_e4", "Tcart_i5", "Tcart_e6", "Tcart_i7"};
+const string Tperpar_tag[]={"Tperpar_e0", "Tperpar_i1", "Tperpar_e2", "Tperpar_i3", "Tperpar_e4", "Tperpar_i5", "Tperpar_e6", "Tperpar_i7"};
+
 //----------------------------------------------------------------------------
+/*
+  Zero-copy grid.
+
+  iPIC3D stores node arrays as [nxn][nyn][nzn] with z running fastest,
+  while the points of a vtkImageData run x fastest, so the field storage
+  cannot be given to an image without transposing it. Instead we build a
+  vtkStructuredGrid whose logical axes are (z,y,x): its point id
+  p = k + nzn*(j + nyn*i) is then exactly the flat index of [i][j][k],
+  and every scalar field of EMfields3D can be handed to VTK as is.
+  The points carry the physical coordinates, so the Python pipelines see
+  the same geometry as with the image data.
+
+  The grid covers the whole node storage, ghost nodes included; the
+  ghost layer is blanked with the vtkGhostType arrays instead of being
+  stripped by a copy.
+*/
+void BuildZeroCopyGrid() {
+  const int nxn = _nx;
+  const int nyn = _ny;
+  const int nzn = _nz;
+
+  vtkStructuredGrid *sgrid = vtkStructuredGrid::New();
+  sgrid->SetDimensions(nzn, nyn, nxn);
+
+  vtkNew<vtkPoints> points;
+  points->SetDataTypeToDouble();
+  points->SetNumberOfPoints(vtkIdType(nxn)*nyn*nzn);
+  double *xyz = static_cast<double*>(points->GetVoidPointer(0));
+  vtkIdType p = 0;
+  for (int i = 0; i < nxn; i++)
+    for (int j = 0; j < nyn; j++)
+      for (int k = 0; k < nzn; k++, p++) {
+        // node 1 is the first node owned by this process
+        xyz[3*p+0] = (_start_x + i - 1)*_dx;
+        xyz[3*p+1] = (_start_y + j - 1)*_dy;
+        xyz[3*p+2] = (_start_z + k - 1)*_dz;
+      }
+  sgrid->SetPoints(points);
+
+  // nodes 0 and n-1 are the ghost layer, the same nodes that the
+  // image data of the copy mode leaves out
+  vtkNew<vtkUnsignedCharArray> point_ghosts;
+  point_ghosts->SetName(vtkDataSetAttributes::GhostArrayName());
+  point_ghosts->SetNumberOfTuples(vtkIdType(nxn)*nyn*nzn);
+  p = 0;
+  for (int i = 0; i < nxn; i++)
+    for (int j = 0; j < nyn; j++)
+      for (int k = 0; k < nzn; k++, p++) {
+        const bool ghost = i == 0 || i == nxn-1 || j == 0 || j == nyn-1 || k == 0 || k == nzn-1;
+        point_ghosts->SetValue(p, ghost ? vtkDataSetAttributes::DUPLICATEPOINT : 0);
+      }
+  sgrid->GetPointData()->AddArray(point_ghosts);
+
+  vtkNew<vtkUnsignedCharArray> cell_ghosts;
+  cell_ghosts->SetName(vtkDataSetAttributes::GhostArrayName());
+  cell_ghosts->SetNumberOfTuples(vtkIdType(nxn-1)*(nyn-1)*(nzn-1));
+  p = 0;
+  for (int i = 0; i < nxn-1; i++)
+    for (int j = 0; j < nyn-1; j++)
+      for (int k = 0; k < nzn-1; k++, p++) {
+        const bool ghost = i == 0 || i == nxn-2 || j == 0 || j == nyn-2 || k == 0 || k == nzn-2;
+        cell_ghosts->SetValue(p, ghost ? vtkDataSetAttributes::DUPLICATECELL : 0);
+      }
+  sgrid->GetCellData()->AddArray(cell_ghosts);
+
+  VTKGrid = sgrid;
+}
 
 //----------------------------------------------------------------------------
-void UpdateVTKAttributes(vtkCPInputDataDescription *idd, EMfields3D *EMf) {
-  // I am not sure whether we need to do this check
-  if (idd->IsFieldNeeded("B", vtkDataObject::POINT) == true) {
-    // Create a VTK object representing magnetic field array
-
-    // Get a reference to the grid's point data object.
-    vtkPointData *vtk_point_data = VTKGrid->GetPointData();
-
-    //tag_names for each species' fields 
-    int ns = _sim_params->getNs();
-    const string rhotag[]={"rhoe0", "rhoi1", "rhoe2", "rhoi3", "rhoe4", "rhoi5", "rhoe6", "rhoi7"};
-    const string Vtag[]={"Ve0", "Vi1", "Ve2", "Vi3", "Ve4", "Vi5", "Ve6", "Vi7"};
-    const string Tcart_tag[]={"Tcart_e0", "Tcart_i1", "Tcart_e2", "Tcart_i3", "Tcart_e4", "Tcart_i5", "Tcart_e6", "Tcart_i7"};
-    const string Tperpar_tag[]={"Tperpar_e0", "Tperpar_i1", "Tperpar_e2", "Tperpar_i3", "Tperpar_e4", "Tperpar_i5", "Tperpar_e6", "Tperpar_i7"};
-
-
-    // We need to create a new VTK array objects per variable per species
-    //  and attach it to the point data, if it hasn't been done yet.
-    if (vtk_point_data->GetNumberOfArrays() == 0) {
-      //B
-      vtkNew<vtkDoubleArray> field_array_B;
-      field_array_B->SetName("B");
-      field_array_B->SetNumberOfComponents(3);
-      field_array_B->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
-      vtk_point_data->AddArray(field_array_B);
-
-      //E
-      vtkNew<vtkDoubleArray> field_array_E;
-      field_array_E->SetName("E");
-      field_array_E->SetNumberOfComponents(3);
-      field_array_E->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
-      vtk_point_data->AddArray(field_array_E);
-
-      //add a VTKdoubleArray for each species (everycycle overwrite the vtkDoubleArray)  
-      for(int si=0; si<ns; si++){
-        //rho
-        vtkNew<vtkDoubleArray> rho_array;
-        rho_array->SetName(rhotag[si].c_str());
-        rho_array->SetNumberOfComponents(1);
-        rho_array->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
-        vtk_point_data->AddArray(rho_array);
-        //V
-        vtkNew<vtkDoubleArray> field_array_V;
-        field_array_V->SetName(Vtag[si].c_str());
-        field_array_V->SetNumberOfComponents(3);
-        field_array_V->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
-        vtk_point_data->AddArray(field_array_V);
-        //T_cart
-        vtkNew<vtkDoubleArray> field_array_Tcart;
-        field_array_Tcart->SetName(Tcart_tag[si].c_str());
-        field_array_Tcart->SetNumberOfComponents(6);
-        field_array_Tcart->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
-        vtk_point_data->AddArray(field_array_Tcart);
-        //T_perpar
-        vtkNew<vtkDoubleArray> field_array_Tperpar;
-        field_array_Tperpar->SetName(Tperpar_tag[si].c_str());
-        field_array_Tperpar->SetNumberOfComponents(6);
-        field_array_Tperpar->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
-        vtk_point_data->AddArray(field_array_Tperpar);
-      }      
+// Wrap three node arrays of EMfields3D as the components of one VTK vector
+// without copying them. The array does not own the memory.
+void ShareVectorArray(vtkPointData *vtk_point_data, const char *name,
+                      arr3_double X, arr3_double Y, arr3_double Z) {
+  typedef vtkSOADataArrayTemplate<double> SOAArray;
+  const vtkIdType npoints = VTKGrid->GetNumberOfPoints();
+  SOAArray *array = SOAArray::SafeDownCast(vtk_point_data->GetArray(name));
+  if (array == nullptr) {
+    vtkNew<SOAArray> new_array;
+    new_array->SetName(name);
+    new_array->SetNumberOfComponents(3);
+    vtk_point_data->AddArray(new_array);
+    array = new_array;
+  }
+  // the pointers do not change between cycles, but resetting them is cheap
+  // and keeps us safe if the arrays are ever reallocated
+  array->SetArray(0, X.fetch_arr(), npoints, true, true);
+  array->SetArray(1, Y.fetch_arr(), npoints, false, true);
+  array->SetArray(2, Z.fetch_arr(), npoints, false, true);
+  array->Modified();
+}
+
+//----------------------------------------------------------------------------
+// Fetch (or create on first use) an array owned by VTK that we fill
+// through its raw pointer.
+double *OwnedArrayPointer(vtkPointData *vtk_point_data, const char *name, int ncomp) {
+  vtkDoubleArray *array = vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray(name));
+  if (array == nullptr) {
+    vtkNew<vtkDoubleArray> new_array;
+    new_array->SetName(name);
+    new_array->SetNumberOfComponents(ncomp);
+    new_array->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
+    vtk_point_data->AddArray(new_array);
+    array = new_array;
+  }
+  array->Modified();
+  return array->GetPointer(0);
+}
+
+//----------------------------------------------------------------------------
+// Copy one species' temperature tensor, stored [z][y][x][6] by
+// EMfields3D::calcT_si, into the (z fastest) point order of the grid.
+// This copy cannot be avoided: calcT_si reuses the same storage for
+// every species.
+void CopyTensor(double *out, arr4_double T) {
+  const int nxn = _nx;
+  const int nyn = _ny;
+  const int nzn = _nz;
+  const double *in = T.fetch_arr();
+  const size_t zstride = size_t(nyn)*nxn*6;
+  for (int i = 0; i < nxn; i++)
+    for (int j = 0; j < nyn; j++) {
+      const double *in_ij = in + (size_t(j)*nxn + i)*6;
+      double *out_ij = out + (size_t(i)*nyn + j)*nzn*6;
+      for (int k = 0; k < nzn; k++)
+        for (int c = 0; c < 6; c++)
+          out_ij[6*k+c] = in_ij[k*zstride+c];
+    }
+}
+
+//----------------------------------------------------------------------------
+// True if the pipeline asked for the point array this cycle. Scripts that
+// set requestSpecificArrays list their arrays with SetRequestedArrays;
+// the others get everything. An array that is no longer requested is
+// dropped so that the pipeline never sees stale values.
+bool IsNeeded(vtkCPInputDataDescription *idd, vtkPointData *vtk_point_data,
+              const string &name) {
+  if (idd->IsFieldNeeded(name.c_str(), vtkDataObject::POINT))
+    return true;
+  if (vtk_point_data->HasArray(name.c_str()))
+    vtk_point_data->RemoveArray(name.c_str());
+  return false;
+}
+
+//----------------------------------------------------------------------------
+void UpdateVTKAttributesZeroCopy(vtkCPInputDataDescription *idd, EMfields3D *EMf) {
+  vtkPointData *vtk_point_data = VTKGrid->GetPointData();
+  const int ns = _sim_params->getNs();
+  const size_t npoints = VTKGrid->GetNumberOfPoints();
+
+  // fields are shared with VTK: only B_tot has to be summed first
+  if (IsNeeded(idd, vtk_point_data, "B"))
+    ShareVectorArray(vtk_point_data, "B", EMf->getBxTot(), EMf->getByTot(), EMf->getBzTot());
+  if (IsNeeded(idd, vtk_point_data, "E"))
+    ShareVectorArray(vtk_point_data, "E", EMf->getEx(), EMf->getEy(), EMf->getEz());
+
+  // moments are rescaled, so they are computed straight into VTK storage
+  // with flat loops over the node arrays
+  const double *rho = EMf->getRHOns().fetch_arr();
+  const double *Jxs = EMf->getJxs().fetch_arr();
+  const double *Jys = EMf->getJys().fetch_arr();
+  const double *Jzs = EMf->getJzs().fetch_arr();
+
+  for (int si = 0; si < ns; si++) {
+    const size_t offset = si*npoints;
+    if (IsNeeded(idd, vtk_point_data, rhotag[si])) {
+      double *rho_out = OwnedArrayPointer(vtk_point_data, rhotag[si].c_str(), 1);
+      for (size_t p = 0; p < npoints; p++)
+        rho_out[p] = rho[offset+p]*FourPI;
     }
-    
-    //if the VTK array objects exist, it use the exixting ones
-    vtkDoubleArray *field_array_B =
-        vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray("B"));    
-    vtkDoubleArray *field_array_E =
-        vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray("E"));
-    vtkDoubleArray *rhons[ns];
-    vtkDoubleArray *Vns[ns];
-    vtkDoubleArray *Tcart_ns[ns];
-    vtkDoubleArray *Tperpar_ns[ns];
-    for(int si = 0; si<ns; ++si){
-      rhons[si]         = vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray(rhotag[si].c_str()));
-      Vns[si]           = vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray(Vtag[si].c_str()));
-      Tcart_ns[si]      = vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray(Tcart_tag[si].c_str()));
-      Tperpar_ns[si]    = vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray(Tperpar_tag[si].c_str()));
+    if (IsNeeded(idd, vtk_point_data, Vtag[si])) {
+      double *V_out = OwnedArrayPointer(vtk_point_data, Vtag[si].c_str(), 3);
+      for (size_t p = 0; p < npoints; p++) {
+        const double inv_rho = 1./(rho[offset+p]*FourPI);
+        V_out[3*p+0] = Jxs[offset+p]*inv_rho;
+        V_out[3*p+1] = Jys[offset+p]*inv_rho;
+        V_out[3*p+2] = Jzs[offset+p]*inv_rho;
+      }
     }
-    
-    // Feed the data into VTK array. Since we don't know the memory layout of
-    // our field data, we feed it point-by-point (slow way)
 
-    // Array of grid's dimensions
-    int *dims = VTKGrid->GetDimensions();
+    // the temperature tensors are the expensive part: compute them
+    // only for the species whose tensors are actually shown
+    const bool needTcart = IsNeeded(idd, vtk_point_data, Tcart_tag[si]);
+    const bool needTperpar = IsNeeded(idd, vtk_point_data, Tperpar_tag[si]);
+    if (needTcart || needTperpar)
+      EMf->calcT_si(si);
+    if (needTcart)
+      CopyTensor(OwnedArrayPointer(vtk_point_data, Tcart_tag[si].c_str(), 6), EMf->getTcart());
+    if (needTperpar)
+      CopyTensor(OwnedArrayPointer(vtk_point_data, Tperpar_tag[si].c_str(), 6), EMf->getTperpar());
+  }
+}
+
+//----------------------------------------------------------------------------
+// Fetch (or create on first use) an array of the copy mode.
+vtkDoubleArray *CopiedArray(vtkPointData *vtk_point_data, const string &name, int ncomp) {
+  vtkDoubleArray *array = vtkDoubleArray::SafeDownCast(vtk_point_data->GetArray(name.c_str()));
+  if (array == nullptr) {
+    vtkNew<vtkDoubleArray> new_array;
+    new_array->SetName(name.c_str());
+    new_array->SetNumberOfComponents(ncomp);
+    new_array->SetNumberOfTuples(VTKGrid->GetNumberOfPoints());
+    vtk_point_data->AddArray(new_array);
+    array = new_array;
+  }
+  array->Modified();
+  return array;
+}
 
-    //simulation values
-    auto Bx = EMf->getBxTot();
-    auto By = EMf->getByTot();
-    auto Bz = EMf->getBzTot();
+//----------------------------------------------------------------------------
+void UpdateVTKAttributesCopy(vtkCPInputDataDescription *idd, EMfields3D *EMf) {
+  // Get a reference to the grid's point data object.
+  vtkPointData *vtk_point_data = VTKGrid->GetPointData();
+
+  int ns = _sim_params->getNs();
+
+  // Create (or reuse) a VTK array per requested variable per species,
+  // arrays that are not requested stay null.
+  vtkDoubleArray *field_array_B = IsNeeded(idd, vtk_point_data, "B") ?
+      CopiedArray(vtk_point_data, "B", 3) : nullptr;
+  vtkDoubleArray *field_array_E = IsNeeded(idd, vtk_point_data, "E") ?
+      CopiedArray(vtk_point_data, "E", 3) : nullptr;
+  vtkDoubleArray *rhons[ns];
+  vtkDoubleArray *Vns[ns];
+  vtkDoubleArray *Tcart_ns[ns];
+  vtkDoubleArray *Tperpar_ns[ns];
+  for(int si = 0; si<ns; ++si){
+    rhons[si]      = IsNeeded(idd, vtk_point_data, rhotag[si]) ?
+        CopiedArray(vtk_point_data, rhotag[si], 1) : nullptr;
+    Vns[si]        = IsNeeded(idd, vtk_point_data, Vtag[si]) ?
+        CopiedArray(vtk_point_data, Vtag[si], 3) : nullptr;
+    Tcart_ns[si]   = IsNeeded(idd, vtk_point_data, Tcart_tag[si]) ?
+        CopiedArray(vtk_point_data, Tcart_tag[si], 6) : nullptr;
+    Tperpar_ns[si] = IsNeeded(idd, vtk_point_data, Tperpar_tag[si]) ?
+        CopiedArray(vtk_point_data, Tperpar_tag[si], 6) : nullptr;
+  }
+
+  // Feed the data into VTK array. Since we don't know the memory layout of
+  // our field data, we feed it point-by-point (slow way)
+
+  // Array of grid's dimensions
+  int *dims = vtkImageData::SafeDownCast(VTKGrid)->GetDimensions();
 
-    auto Ex = EMf->getEx();
-    auto Ey = EMf->getEy();
-    auto Ez = EMf->getEz();
+  //simulation values
+  auto Bx = EMf->getBxTot();
+  auto By = EMf->getByTot();
+  auto Bz = EMf->getBzTot();
 
-    auto Jxs = EMf->getJxs();
-    auto Jys = EMf->getJys();
-    auto Jzs = EMf->getJzs();
+  auto Ex = EMf->getEx();
+  auto Ey = EMf->getEy();
+  auto Ez = EMf->getEz();
 
-    auto rho = EMf->getRHOns();
+  auto Jxs = EMf->getJxs();
+  auto Jys = EMf->getJys();
+  auto Jzs = EMf->getJzs();
 
-    // Cycle over all VTK grid's points, get their indices and copy the data.
-    // [KTH] We want to have only one cycle over point's ID to efficiently use multi-threading.
-    for(int si=0; si<ns; si++){
+  auto rho = EMf->getRHOns();
+
+  // Cycle over all VTK grid's points, get their indices and copy the data.
+  // [KTH] We want to have only one cycle over point's ID to efficiently use multi-threading.
+  for(int si=0; si<ns; si++){
+    const bool needT = Tcart_ns[si] || Tperpar_ns[si];
+    if (needT)
       EMf->calcT_si(si);
 
-      auto Tcart = EMf -> getTcart();
-      auto Tperpar = EMf -> getTperpar();
-
-      for (vtkIdType p = 0; p < VTKGrid->GetNumberOfPoints(); ++p) {
-        // Get cells's indices i, j , k
-        const size_t k = p / (dims[0] * dims[1]);
-        const size_t j = (p - k * dims[0] * dims[1]) / dims[0];
-        const size_t i = p - k * dims[0] * dims[1] - j * dims[0];
-
-        //not repeating for each species
-        if(si==0){
-          // CAUTION!!! K should be always zero in the 2D case?
-          field_array_B->SetComponent(p, 0, Bx[i+1][j+1][k+1]);
-          field_array_B->SetComponent(p, 1, By[i+1][j+1][k+1]);
-          field_array_B->SetComponent(p, 2, Bz[i+1][j+1][k+1]);
-
-          field_array_E->SetComponent(p, 0, Ex[i+1][j+1][k+1]);
-          field_array_E->SetComponent(p, 1, Ey[i+1][j+1][k+1]);
-          field_array_E->SetComponent(p, 2, Ez[i+1][j+1][k+1]);
-        }
-       
-        rhons[si]-> SetValue(p, rho[si][i+1][j+1][k+1]*4*3.1415926535897);
-
-        Vns[si]  -> SetComponent(p, 0, Jxs[si][i+1][j+1][k+1]/(rho[si][i+1][j+1][k+1]*4*3.1415926535897));
-        Vns[si]  -> SetComponent(p, 1, Jys[si][i+1][j+1][k+1]/(rho[si][i+1][j+1][k+1]*4*3.1415926535897));
-        Vns[si]  -> SetComponent(p, 2, Jzs[si][i+1][j+1][k+1]/(rho[si][i+1][j+1][k+1]*4*3.1415926535897));
-
-        Tcart_ns[si]  -> SetComponent(p,0, Tcart[k+1][j+1][i+1][0]);
-        Tcart_ns[si]  -> SetComponent(p,1, Tcart[k+1][j+1][i+1][1]);
-        Tcart_ns[si]  -> SetComponent(p,2, Tcart[k+1][j+1][i+1][2]);
-        Tcart_ns[si]  -> SetComponent(p,3, Tcart[k+1][j+1][i+1][3]);
-        Tcart_ns[si]  -> SetComponent(p,4, Tcart[k+1][j+1][i+1][4]);
-        Tcart_ns[si]  -> SetComponent(p,5, Tcart[k+1][j+1][i+1][5]);
-
-        Tperpar_ns[si]  -> SetComponent(p,0, Tperpar[k+1][j+1][i+1][0]);
-        Tperpar_ns[si]  -> SetComponent(p,1, Tperpar[k+1][j+1][i+1][1]);
-        Tperpar_ns[si]  -> SetComponent(p,2, Tperpar[k+1][j+1][i+1][2]);
-        Tperpar_ns[si]  -> SetComponent(p,3, Tperpar[k+1][j+1][i+1][3]);
-        Tperpar_ns[si]  -> SetComponent(p,4, Tperpar[k+1][j+1][i+1][4]);
-        Tperpar_ns[si]  -> SetComponent(p,5, Tperpar[k+1][j+1][i+1][5]);
+    auto Tcart = EMf -> getTcart();
+    auto Tperpar = EMf -> getTperpar();
+
+    for (vtkIdType p = 0; p < VTKGrid->GetNumberOfPoints(); ++p) {
+      // Get cells's indices i, j , k
+      const size_t k = p / (dims[0] * dims[1]);
+      const size_t j = (p - k * dims[0] * dims[1]) / dims[0];
+      const size_t i = p - k * dims[0] * dims[1] - j * dims[0];
+
+      //not repeating for each species
+      if(si==0 && field_array_B){
+        // CAUTION!!! K should be always zero in the 2D case?
+        field_array_B->SetComponent(p, 0, Bx[i+1][j+1][k+1]);
+        field_array_B->SetComponent(p, 1, By[i+1][j+1][k+1]);
+        field_array_B->SetComponent(p, 2, Bz[i+1][j+1][k+1]);
+      }
+      if(si==0 && field_array_E){
+        field_array_E->SetComponent(p, 0, Ex[i+1][j+1][k+1]);
+        field_array_E->SetComponent(p, 1, Ey[i+1][j+1][k+1]);
+        field_array_E->SetComponent(p, 2, Ez[i+1][j+1][k+1]);
       }
-    }
 
-    // ----[KTH CODE]---- 
-    // Fast way, if memry layout is correct.
-    // velocityData->SetArray(const_cast<double*>(velocity.data()),
-    // static_cast<vtkIdType>(velocity.size()), 1);
+      if (rhons[si])
+        rhons[si]-> SetValue(p, rho[si][i+1][j+1][k+1]*FourPI);
+
+      if (Vns[si]) {
+        Vns[si]  -> SetComponent(p, 0, Jxs[si][i+1][j+1][k+1]/(rho[si][i+1][j+1][k+1]*FourPI));
+        Vns[si]  -> SetComponent(p, 1, Jys[si][i+1][j+1][k+1]/(rho[si][i+1][j+1][k+1]*FourPI));
+        Vns[si]  -> SetComponent(p, 2, Jzs[si][i+1][j+1][k+1]/(rho[si][i+1][j+1][k+1]*FourPI));
+      }
+
+      if (Tcart_ns[si])
+        for (int c = 0; c < 6; c++)
+          Tcart_ns[si]  -> SetComponent(p,c, Tcart[k+1][j+1][i+1][c]);
+
+      if (Tperpar_ns[si])
+        for (int c = 0; c < 6; c++)
+          Tperpar_ns[si]  -> SetComponent(p,c, Tperpar[k+1][j+1][i+1][c]);
+    }
   }
+
+  // The fast way, sharing the memory with VTK, is
+  // UpdateVTKAttributesZeroCopy (CatalystZeroCopy = true).
   //  if (idd->IsFieldNeeded("collision", vtkDataObject::POINT) == true)
   //  {
   //    if (VTKGrid->GetPointData()->GetArray("collision") == nullptr)
@@ -209,6 +382,17 @@ void UpdateVTKAttributes(vtkCPInputDataDescription *idd, EMfields3D *EMf) {
   //  }
 }
 
+//----------------------------------------------------------------------------
+void UpdateVTKAttributes(vtkCPInputDataDescription *idd, EMfields3D *EMf) {
+  const double start = MPI_Wtime();
+  if (_zero_copy)
+    UpdateVTKAttributesZeroCopy(idd, EMf);
+  else
+    UpdateVTKAttributesCopy(idd, EMf);
+  _update_time += MPI_Wtime() - start;
+  _update_calls++;
+}
+
 //----------------------------------------------------------------------------
 /*
 ----Paraview suggests to use another function to create the data structure.---
@@ -218,8 +402,8 @@ void BuildVTKDataStructures(vtkCPInputDataDescription *idd, EMfields3D *EMf) {
   // feed data to grid
   UpdateVTKAttributes(idd, EMf);
 }
-} // namespace
 */
+} // namespace
 
 namespace Adaptor_legacy {
 
@@ -249,21 +433,36 @@ void Initialize(const Collective *sim_params, const int start_x,
   _dz = dz;
 
   _sim_params = sim_params;
+  _zero_copy = sim_params->getCatalystZeroCopy();
 
   if (VTKGrid == NULL) {
     // The grid structure isn't changing so we only build it
     // the first time it's needed. If we needed the memory
     // we could delete it and rebuild as necessary.
-    VTKGrid = vtkImageData::New();
-    // the value 3 is the numberof ghost cells
-    VTKGrid->SetExtent(start_x, start_x + nx - 3, start_y , start_y + ny - 3,
+    if (_zero_copy) {
+      BuildZeroCopyGrid();
+    } else {
+      vtkImageData *image = vtkImageData::New();
+      // the value 3 is the numberof ghost cells
+      image->SetExtent(start_x, start_x + nx - 3, start_y , start_y + ny - 3,
                        start_z, start_z + nz - 3);
-    VTKGrid->SetSpacing(dx, dy, dz);
+      image->SetSpacing(dx, dy, dz);
+      VTKGrid = image;
+    }
   }
 }
 
 //----------------------------------------------------------------------------
 void Finalize() {
+  // report the cost of feeding the pipeline, slowest process
+  double time_per_call = _update_calls > 0 ? _update_time/_update_calls : 0.;
+  double max_time_per_call;
+  MPI_Reduce(&time_per_call, &max_time_per_call, 1, MPI_DOUBLE, MPI_MAX, 0,
+             MPIdata::get_PicGlobalComm());
+  if (MPIdata::get_rank() == 0 && _update_calls > 0)
+    printf("Catalyst adaptor (%s): %d co-processed cycles, %g s per cycle\n",
+           _zero_copy ? "zero-copy" : "copy", _update_calls, max_time_per_call);
+
   if (Processor) {
     Processor->Delete();
     Processor = NULL;
@@ -0,0 +1,27 @@
+#--------------------------------------------------------------
+# All the quantities of the single-field scripts rendered through one
+# shared producer, view and set of slices; compare catalyst_timing.txt
+# with the one of the separate scripts to get the saving per output.
+# The pipeline itself is built by ipic_pipeline.py.
+#--------------------------------------------------------------
+
+from ipic_pipeline import IPICCoProcessor, Callbacks
+
+outputs = [
+  {'array': 'B', 'component': 'Magnitude', 'normal': 'z'},
+  {'array': 'rhoe0', 'normal': 'z'},
+  {'array': 'rhoi1', 'normal': 'z'},
+  {'array': 'Tcart_e0', 'component': 'XX', 'normal': 'z'},
+  {'array': 'Tcart_e0', 'component': 'YY', 'normal': 'z'},
+  {'array': 'Tperpar_e0', 'component': 'XX', 'normal': 'z'},
+  {'array': 'Tperpar_e0', 'component': 'YY', 'normal': 'z'},
+  {'array': 'rhoe0', 'normal': 'y', 'name': 'rhoe0_y'},
+  {'array': 'Ve0', 'kind': 'streamlines', 'seed_center': [1.0, 4.0, 1.0],
+   'seed_points': 60, 'max_length': 8.0},
+]
+
+# images are rendered off the solver's critical path by ipic_render_worker.py
+coprocessor = IPICCoProcessor(outputs, frequency=1, showOutline=True,
+                              asyncImages=True, queueSize=4, dropPolicy='oldest')
+
+RequestDataDescription, DoCoProcessing = Callbacks(coprocessor)
@@ -0,0 +1,430 @@
+#--------------------------------------------------------------
+# Shared Catalyst pipeline for iPIC3D.
+#
+# The per-quantity scripts in this directory (B.py, rhoe0.py, ...) only
+# describe *what* to render; this module builds the pipeline once:
+#
+#   - a single 'input' producer fed by the adaptor,
+#   - a single render view reused for every image,
+#   - one filter per distinct geometry (slices on the same plane and
+#     streamlines with the same seeds are shared between outputs),
+#   - one display per output, toggled visible only while its image is saved.
+#
+# The arrays passed to SetRequestedArrays are derived from the outputs list,
+# so the adaptor only computes what is actually drawn.
+#
+# Each output is a dict; missing keys take the values of OUTPUT_DEFAULTS:
+#
+#   name       file name prefix of the images (default: array[_component])
+#   array      point array read from the adaptor (e.g. 'B', 'rhoe0', 'Ve0')
+#   kind       'slice', 'streamlines' or 'outline'
+#   color      array used to color the display (default: array, None = solid)
+#   component  'Magnitude' or a component index/name ('X', 'XX', 1, ...)
+#   normal     slice normal, 'x'/'y'/'z' or a 3-vector
+#   origin     slice origin (None = centre of the domain)
+#   range      fixed [min, max] of the color map (None = rescale every frame)
+#   seed_center, seed_radius, seed_points, max_length   streamline seeding
+#
+# Timing: with timing=True rank 0 appends one line per co-processed cycle to
+# <rootDirectory>/catalyst_timing.txt with the producer update time, the render
+# time and the render time per output (with asyncImages the time to gather
+# and queue the frame), plus the frames dropped so far.  Running the same
+# outputs once as separate scripts and once as a single outputs list (see
+# all_fields.py) gives the cost per output of the separate and of the shared
+# pipeline.
+#
+# frequency=0 never runs the pipeline (the adaptor then skips all work).
+#
+# Asynchronous images (asyncImages=True): instead of rendering, every output
+# cycle gathers the 2D geometry of each output (slices, streamlines, outline)
+# on rank 0, writes it to <rootDirectory>/render_queue and returns.  A
+# render worker (ipic_render_worker.py, started once by rank 0 with
+# renderCommand, pvbatch by default) turns the queued frames into the same
+# PNGs off-screen.  At most queueSize frames wait in the queue; when the
+# worker falls behind, dropPolicy='oldest' discards the oldest waiting frame
+# (the queue coalesces to the most recent ones) and dropPolicy='newest'
+# skips the current one.  The worker drains the queue and exits once the
+# simulation is gone.
+#--------------------------------------------------------------
+
+import glob
+import json
+import os
+import subprocess
+import time
+
+from paraview.simple import *
+from paraview import coprocessing
+from paraview import servermanager
+from vtkmodules.vtkCommonCore import vtkIntArray
+from vtkmodules.vtkIOXML import vtkXMLPolyDataWriter
+
+OUTPUT_DEFAULTS = {
+  'name'        : None,
+  'array'       : None,
+  'kind'        : 'slice',
+  'color'       : '',
+  'component'   : 'Magnitude',
+  'normal'      : 'z',
+  'origin'      : None,
+  'range'       : None,
+  'seed_center' : None,
+  'seed_radius' : None,
+  'seed_points' : 60,
+  'max_length'  : 8.0,
+}
+
+_AXES = {'x': [1.0, 0.0, 0.0], 'y': [0.0, 1.0, 0.0], 'z': [0.0, 0.0, 1.0]}
+
+# vector/tensor component names as shown by ParaView for 3 and 6 components
+_COMPONENTS = {'X': 0, 'Y': 1, 'Z': 2,
+               'XX': 0, 'YY': 1, 'ZZ': 2, 'XY': 3, 'YZ': 4, 'XZ': 5}
+
+
+def _normal(value):
+  if isinstance(value, str):
+    return list(_AXES[value.lower()])
+  return [float(v) for v in value]
+
+
+def _key(value):
+  "hashable version of a config entry"
+  if value is None or isinstance(value, str):
+    return value
+  return tuple(value)
+
+
+def _complete(output):
+  o = dict(OUTPUT_DEFAULTS)
+  o.update(output)
+  if o['array'] is None:
+    raise ValueError("Catalyst output %r has no 'array'" % (output,))
+  if o['kind'] not in ('slice', 'streamlines', 'outline'):
+    raise ValueError("Catalyst output %r: unknown kind '%s'" % (output, o['kind']))
+  if o['color'] == '':
+    o['color'] = None if o['kind'] == 'streamlines' else o['array']
+  if o['name'] is None:
+    o['name'] = o['array']
+    if o['color'] is not None and o['component'] != 'Magnitude':
+      o['name'] += '_' + str(o['component'])
+    if o['kind'] != 'slice':
+      o['name'] += '_' + o['kind']
+  o['normal'] = _normal(o['normal'])
+  return o
+
+
+def _rank():
+  return servermanager.vtkProcessModule.GetProcessModule().GetPartitionId()
+
+
+def ImageName(directory, o, timestep, padding):
+  return os.path.join(directory, '%s_%s.png' % (o['name'], str(timestep).zfill(padding)))
+
+
+def ColorDisplay(view, display, o):
+  "color display as requested by output o and show its scalar bar"
+  if o['color'] is None:
+    ColorBy(display, None)
+    return
+  ColorBy(display, ('POINTS', o['color']))
+  lut = GetColorTransferFunction(o['color'])
+  if o['component'] == 'Magnitude':
+    lut.VectorMode = 'Magnitude'
+  else:
+    c = o['component']
+    lut.VectorMode = 'Component'
+    lut.VectorComponent = _COMPONENTS[c.upper()] if isinstance(c, str) else int(c)
+  if o['range'] is not None:
+    lut.RescaleTransferFunction(o['range'][0], o['range'][1])
+  else:
+    display.RescaleTransferFunctionToDataRange(False, True)
+  display.SetScalarBarVisibility(view, True)
+
+
+def CreateRenderView(imageSize, backend):
+  view = CreateView('RenderView')
+  view.ViewSize = list(imageSize)
+  view.OrientationAxesVisibility = 0
+  view.CameraParallelProjection = 1
+  if backend:
+    view.EnableRayTracing = 1
+    view.BackEnd = backend
+  return view
+
+
+def PlaceCamera(view, o, center):
+  "look along the slice normal at the whole domain"
+  n = o['normal'] if o['kind'] == 'slice' else _AXES['z']
+  view.CameraFocalPoint = center
+  view.CameraPosition = [center[0] + n[0], center[1] + n[1], center[2] + n[2]]
+  view.CameraViewUp = [0.0, 0.0, 1.0] if abs(n[2]) < 0.9 else [0.0, 1.0, 0.0]
+  view.ResetCamera()
+
+
+class IPICCoProcessor(coprocessing.CoProcessor):
+  "CoProcessor rendering a list of outputs through one shared pipeline"
+
+  def __init__(self, outputs, frequency=1, rootDirectory='./data/images',
+               imageSize=(1280, 720), padding=3, backend='OSPRay raycaster',
+               showOutline=False, timing=True, asyncImages=False, queueSize=4,
+               dropPolicy='oldest', renderCommand=('pvbatch', '--force-offscreen-rendering')):
+    coprocessing.CoProcessor.__init__(self)
+    self.Outputs = [_complete(o) for o in outputs]
+    self.Frequency = frequency
+    self.ImageSize = list(imageSize)
+    self.Padding = padding
+    self.Backend = backend
+    self.ShowOutline = showOutline
+    self.Timing = timing
+    self.ImageDirectory = rootDirectory if rootDirectory else '.'
+    self.AsyncImages = asyncImages
+    self.QueueSize = max(1, queueSize)
+    if dropPolicy not in ('oldest', 'newest'):
+      raise ValueError("dropPolicy must be 'oldest' or 'newest', not '%s'" % dropPolicy)
+    self.DropPolicy = dropPolicy
+    self.RenderCommand = list(renderCommand)
+    self.QueueDirectory = os.path.join(self.ImageDirectory, 'render_queue')
+    self.SetRootDirectory(rootDirectory)
+
+    if frequency > 0:
+      self.SetUpdateFrequencies({'input': [frequency]})
+    else:
+      self.SetUpdateFrequencies({'input': []})
+
+    # request only the arrays that are drawn (or used as streamline vectors)
+    arrays = []
+    for o in self.Outputs:
+      for a in (o['array'], o['color']):
+        if a is not None and a not in arrays:
+          arrays.append(a)
+    self.SetRequestedArrays('input', [[a, 0] for a in arrays])
+
+    self.Producer = None
+    self.View = None
+    self.Filters = {}
+    self.Displays = []
+    self.OutlineDisplay = None
+    self.Sources = []
+    self.OutlineSource = None
+    self.Worker = None
+    self.Dropped = 0
+
+  # ----------------------------------------------------------------
+  # pipeline construction, done once at the first co-processed cycle
+  # ----------------------------------------------------------------
+
+  def CreatePipeline(self, datadescription):
+    self.Producer = self.CreateProducer(datadescription, 'input')
+    if _rank() == 0 and not os.path.isdir(self.ImageDirectory):
+      os.makedirs(self.ImageDirectory)
+    if not self.Outputs:
+      return
+    if self.AsyncImages:
+      self._CreateSnapshotPipeline()
+      return
+
+    view = CreateRenderView(self.ImageSize, self.Backend)
+    self.View = view
+
+    for o in self.Outputs:
+      display = Show(self._Filter(o), view)
+      if o['kind'] == 'outline':
+        display.Representation = 'Outline'
+      display.Visibility = 0
+      self.Displays.append(display)
+
+    if self.ShowOutline:
+      self.OutlineDisplay = Show(self._Filter({'kind': 'outline'}), view)
+      self.OutlineDisplay.Representation = 'Outline'
+      ColorBy(self.OutlineDisplay, None)
+
+  def _CreateSnapshotPipeline(self):
+    "geometry sources gathered every output cycle, plus the render worker on rank 0"
+    for o in self.Outputs:
+      f = self._Filter(o)
+      if o['kind'] == 'outline':
+        f = Outline(Input=f)
+      self.Sources.append(f)
+    if self.ShowOutline:
+      self.OutlineSource = Outline(Input=self.Producer)
+
+    if _rank() != 0:
+      return
+    if not os.path.isdir(self.QueueDirectory):
+      os.makedirs(self.QueueDirectory)
+    worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ipic_render_worker.py')
+    log = open(os.path.join(self.QueueDirectory, 'worker.log'), 'a')
+    self.Worker = subprocess.Popen(self.RenderCommand + [worker, self.QueueDirectory, str(os.getpid())],
+                                   stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+
+  def _Filter(self, o):
+    "filter producing the geometry of output o, shared with outputs of the same geometry"
+    kind = o['kind']
+    if kind == 'outline':
+      return self.Producer
+    if kind == 'slice':
+      key = (kind, _key(o['normal']), _key(o['origin']))
+    else:
+      key = (kind, o['array'], _key(o['seed_center']), o['seed_radius'],
+             o['seed_points'], o['max_length'])
+    if key in self.Filters:
+      return self.Filters[key]
+
+    center = self._Center()
+    if kind == 'slice':
+      f = Slice(Input=self.Producer)
+      f.SliceType = 'Plane'
+      f.SliceType.Origin = o['origin'] if o['origin'] is not None else center
+      f.SliceType.Normal = o['normal']
+    else:
+      f = StreamTracer(Input=self.Producer, SeedType='Point Source')
+      f.Vectors = ['POINTS', o['array']]
+      f.MaximumStreamlineLength = o['max_length']
+      f.SeedType.Center = o['seed_center'] if o['seed_center'] is not None else center
+      if o['seed_radius'] is not None:
+        f.SeedType.Radius = o['seed_radius']
+      f.SeedType.NumberOfPoints = o['seed_points']
+    self.Filters[key] = f
+    return f
+
+  def _Center(self):
+    b = self.Producer.GetDataInformation().GetBounds()
+    return [0.5*(b[0] + b[1]), 0.5*(b[2] + b[3]), 0.5*(b[4] + b[5])]
+
+  # ----------------------------------------------------------------
+  # rendering
+  # ----------------------------------------------------------------
+
+  def _ImageName(self, o, timestep):
+    return ImageName(self.ImageDirectory, o, timestep, self.Padding)
+
+  def RenderOutputs(self, datadescription):
+    timestep = datadescription.GetTimeStep()
+    for i, o in enumerate(self.Outputs):
+      for d in self.Displays:
+        d.Visibility = 0
+      display = self.Displays[i]
+      display.Visibility = 1
+      ColorDisplay(self.View, display, o)
+      PlaceCamera(self.View, o, self._Center())
+      SaveScreenshot(self._ImageName(o, timestep), self.View, ImageResolution=self.ImageSize)
+      if o['color'] is not None:
+        display.SetScalarBarVisibility(self.View, False)
+
+  def _PendingJobs(self):
+    return sorted(glob.glob(os.path.join(self.QueueDirectory, 'c*.json')))
+
+  def _DropJob(self, job):
+    "remove a waiting job; False if the worker has already claimed it"
+    try:
+      os.remove(job)
+    except OSError:
+      return False
+    for f in glob.glob(job[:-len('.json')] + '_*.vtp'):
+      os.remove(f)
+    return True
+
+  def _QueueAccepts(self):
+    "rank 0 decides if this frame is queued; the decision is broadcast since gathering is collective"
+    flag = vtkIntArray()
+    flag.SetNumberOfTuples(1)
+    flag.SetValue(0, 1)
+    if _rank() == 0:
+      pending = self._PendingJobs()
+      while len(pending) >= self.QueueSize:
+        if self.DropPolicy == 'newest':
+          flag.SetValue(0, 0)
+          break
+        if self._DropJob(pending[0]):
+          pending.pop(0)
+          self.Dropped += 1
+        else:
+          # the worker claimed it meanwhile, which also frees a slot
+          pending = self._PendingJobs()
+    controller = servermanager.vtkProcessModule.GetProcessModule().GetGlobalController()
+    if controller is not None and controller.GetNumberOfProcesses() > 1:
+      controller.Broadcast(flag, 0)
+    if flag.GetValue(0) == 0:
+      self.Dropped += 1
+      return False
+    return True
+
+  def _WriteGeometry(self, source, name):
+    "gather the output of source on rank 0 and write it there"
+    data = servermanager.Fetch(source)
+    if _rank() != 0:
+      return None
+    writer = vtkXMLPolyDataWriter()
+    writer.SetInputData(data)
+    writer.SetDataModeToAppended()
+    writer.SetCompressorTypeToNone()
+    writer.SetFileName(name)
+    writer.Write()
+    return name
+
+  def QueueOutputs(self, datadescription):
+    "hand the 2D geometry of this cycle to the render worker; returns the number of queued images"
+    if not self._QueueAccepts():
+      return 0
+    timestep = datadescription.GetTimeStep()
+    base = os.path.join(self.QueueDirectory, 'c%010d' % timestep)
+    job = {'cycle': timestep, 'directory': os.path.abspath(self.ImageDirectory),
+           'padding': self.Padding, 'imageSize': self.ImageSize, 'backend': self.Backend,
+           'center': self._Center(), 'outline': None, 'outputs': []}
+    for i, (o, source) in enumerate(zip(self.Outputs, self.Sources)):
+      entry = dict(o)
+      entry['geometry'] = self._WriteGeometry(source, '%s_%02d.vtp' % (base, i))
+      job['outputs'].append(entry)
+    if self.OutlineSource is not None:
+      job['outline'] = self._WriteGeometry(self.OutlineSource, base + '_outline.vtp')
+    if _rank() == 0:
+      # the worker only picks up *.json, so the rename publishes a complete job
+      f = open(base + '.tmp', 'w')
+      json.dump(job, f)
+      f.close()
+      os.rename(base + '.tmp', base + '.json')
+    return len(self.Outputs)
+
+  def Process(self, datadescription):
+    "update the producer and save one image per output, if this is an output cycle"
+    t0 = time.time()
+    self.UpdateProducers(datadescription)
+    t1 = time.time()
+    rendered = 0
+    if self.Outputs and self.NeedToOutput(datadescription, self.Frequency):
+      if self.AsyncImages:
+        rendered = self.QueueOutputs(datadescription)
+      else:
+        self.RenderOutputs(datadescription)
+        rendered = len(self.Outputs)
+    t2 = time.time()
+    if self.Timing and _rank() == 0:
+      self._LogTiming(datadescription.GetTimeStep(), rendered, t1 - t0, t2 - t1)
+
+  def _LogTiming(self, timestep, rendered, update, render):
+    name = os.path.join(self.ImageDirectory, 'catalyst_timing.txt')
+    new = not os.path.exists(name)
+    f = open(name, 'a')
+    if new:
+      f.write('# cycle  outputs  update[s]  render[s]  render_per_output[s]  dropped\n')
+    f.write('%d  %d  %.6e  %.6e  %.6e  %d\n'
+            % (timestep, rendered, update, render, render/rendered if rendered else 0.0, self.Dropped))
+    f.close()
+
+
+# ----------------------------------------------------------------
+# the two Catalyst callbacks, bound to a coprocessor by the scripts
+# ----------------------------------------------------------------
+
+def Callbacks(coprocessor):
+  "return the (RequestDataDescription, DoCoProcessing) pair for coprocessor"
+  def RequestDataDescription(datadescription):
+    "Callback to populate the request for current timestep"
+    coprocessor.LoadRequestedData(datadescription)
+
+  def DoCoProcessing(datadescription):
+    "Callback to do co-processing for current timestep"
+    coprocessor.Process(datadescription)
+
+  return RequestDataDescription, DoCoProcessing
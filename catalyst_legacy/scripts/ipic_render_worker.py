@@ -0,0 +1,96 @@
+#--------------------------------------------------------------
+# Off-screen render worker for the asynchronous images of ipic_pipeline.py.
+#
+#   pvbatch --force-offscreen-rendering ipic_render_worker.py <queue_dir> <parent_pid>
+#
+# Started by rank 0 of the simulation.  Renders the queued jobs in cycle
+# order, deleting each job once its images are written, and exits when the
+# queue is empty and the simulation process is gone.
+#--------------------------------------------------------------
+
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from paraview.simple import *
+from ipic_pipeline import ColorDisplay, CreateRenderView, ImageName, PlaceCamera
+
+POLL_INTERVAL = 0.2
+
+
+def _alive(pid):
+  try:
+    os.kill(pid, 0)
+  except OSError:
+    return False
+  return True
+
+
+def _claim(queue):
+  "oldest waiting job, renamed so that the simulation can no longer drop it"
+  for job in sorted(glob.glob(os.path.join(queue, 'c*.json'))):
+    claimed = job + '.rendering'
+    try:
+      os.rename(job, claimed)
+    except OSError:
+      continue
+    return claimed
+  return None
+
+
+def render(job, views):
+  size = tuple(job['imageSize'])
+  key = (size, job['backend'])
+  if key not in views:
+    views[key] = CreateRenderView(size, job['backend'])
+  view = views[key]
+
+  outline = None
+  if job['outline'] is not None:
+    outline = XMLPolyDataReader(FileName=[job['outline']])
+    ColorBy(Show(outline, view), None)
+
+  for o in job['outputs']:
+    reader = XMLPolyDataReader(FileName=[o['geometry']])
+    display = Show(reader, view)
+    ColorDisplay(view, display, o)
+    PlaceCamera(view, o, job['center'])
+    SaveScreenshot(ImageName(job['directory'], o, job['cycle'], job['padding']), view,
+                   ImageResolution=list(size))
+    if o['color'] is not None:
+      display.SetScalarBarVisibility(view, False)
+    Hide(reader, view)
+    Delete(reader)
+    os.remove(o['geometry'])
+
+  if outline is not None:
+    Hide(outline, view)
+    Delete(outline)
+    os.remove(job['outline'])
+
+
+def main(queue, parent):
+  views = {}
+  while True:
+    claimed = _claim(queue)
+    if claimed is None:
+      if not _alive(parent):
+        break
+      time.sleep(POLL_INTERVAL)
+      continue
+    f = open(claimed)
+    job = json.load(f)
+    f.close()
+    t0 = time.time()
+    render(job, views)
+    os.remove(claimed)
+    print('cycle %d: %d images in %.3f s' % (job['cycle'], len(job['outputs']), time.time() - t0))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+  main(sys.argv[1], int(sys.argv[2]))
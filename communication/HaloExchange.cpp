@@ -0,0 +1,227 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <mpi.h>
+#include <assert.h>
+#include "HaloExchange.h"
+#include "Alloc.h"
+#include "VCtopology3D.h"
+#include "BcFields3D.h"
+#include "errors.h"
+
+/* the objects are built in the same order on all the processes,
+   so each of them gets its own tags */
+static int halo_exchange_count = 0;
+
+/* cell p of the plane normal to direction d, q and s along the two other directions */
+static inline double &plane_cell(double ***a, int d, int p, int q, int s)
+{
+  if (d == 0)
+    return a[p][q][s];
+  if (d == 1)
+    return a[q][p][s];
+  return a[q][s][p];
+}
+
+HaloExchange::HaloExchange(const VirtualTopology3D *vct_, int nx, int ny, int nz,
+  bool isCenter, bool faceOnly_, int width_, bool isParticle_) :
+  vct(vct_),
+  comm(isParticle_ ? vct_->getParticleComm() : vct_->getFieldComm()),
+  faceOnly(faceOnly_),
+  width(width_),
+  isParticle(isParticle_),
+  tag(1000 + 6 * halo_exchange_count++),
+  messages(0),
+  started(false),
+  nrequests(0)
+{
+  n[0] = nx;
+  n[1] = ny;
+  n[2] = nz;
+  // a boundary node is shared with the neighbour, which sends the nodes
+  // next to it, while the centres next to the boundary are its own
+  const int offset = isCenter ? 0 : 1;
+  // first plane of the width planes sent and received on each side
+  for (int d = 0; d < 3; d++) {
+    sendplane[0][d] = width + offset;
+    sendplane[1][d] = n[d] - 2 * width - offset;
+    recvplane[0][d] = 0;
+    recvplane[1][d] = n[d] - width;
+  }
+  if (isParticle) {
+    neighbor[0][0] = vct->getXleft_neighbor_P();
+    neighbor[0][1] = vct->getYleft_neighbor_P();
+    neighbor[0][2] = vct->getZleft_neighbor_P();
+    neighbor[1][0] = vct->getXright_neighbor_P();
+    neighbor[1][1] = vct->getYright_neighbor_P();
+    neighbor[1][2] = vct->getZright_neighbor_P();
+  }
+  else {
+    neighbor[0][0] = vct->getXleft_neighbor();
+    neighbor[0][1] = vct->getYleft_neighbor();
+    neighbor[0][2] = vct->getZleft_neighbor();
+    neighbor[1][0] = vct->getXright_neighbor();
+    neighbor[1][1] = vct->getYright_neighbor();
+    neighbor[1][2] = vct->getZright_neighbor();
+  }
+}
+
+void HaloExchange::add(arr3_double vector, const int bc[6])
+{
+  assert(!started);
+  assert(bc == 0 || width == 1);
+  vectors.push_back(vector.fetch_arr3());
+  // -1: no boundary conditions
+  for (int i = 0; i < 6; i++)
+    bcs.push_back(bc ? bc[i] : -1);
+}
+
+/*! cells of the planes of direction d along the direction t */
+void HaloExchange::range(int d, int t, int &lo, int &hi)const
+{
+  // ghost cells of the directions already exchanged are included
+  if (!faceOnly && t < d) {
+    lo = 0;
+    hi = n[t] - 1;
+  }
+  else {
+    lo = width;
+    hi = n[t] - 1 - width;
+  }
+}
+
+int HaloExchange::plane_size(int d)const
+{
+  int size = 1;
+  for (int t = 0; t < 3; t++) {
+    if (t == d) continue;
+    int lo, hi;
+    range(d, t, lo, hi);
+    size *= hi - lo + 1;
+  }
+  return size;
+}
+
+/*! pack the planes of direction d and post their messages */
+void HaloExchange::post(int d)
+{
+  const int t1 = (d == 0) ? 1 : 0;
+  const int t2 = (d == 2) ? 1 : 2;
+  int q0, q1, s0, s1;
+  range(d, t1, q0, q1);
+  range(d, t2, s0, s1);
+  const int count = width * plane_size(d) * vectors.size();
+  // receives first; the message sent to the left of direction d has
+  // tag + 2*d and comes from the right of the receiver
+  for (int side = 0; side < 2; side++) {
+    if (neighbor[side][d] == MPI_PROC_NULL) continue;
+    recvbuf[side][d].resize(count);
+    MPI_Irecv(&recvbuf[side][d][0], count, MPI_DOUBLE, neighbor[side][d],
+      tag + 2 * d + (1 - side), comm, &requests[nrequests++]);
+  }
+  for (int side = 0; side < 2; side++) {
+    if (neighbor[side][d] == MPI_PROC_NULL) continue;
+    std::vector<double> &buf = sendbuf[side][d];
+    buf.resize(count);
+    const int p0 = sendplane[side][d];
+    int c = 0;
+    for (size_t v = 0; v < vectors.size(); v++) {
+      double ***a = vectors[v];
+      for (int p = p0; p < p0 + width; p++)
+        for (int q = q0; q <= q1; q++)
+          for (int s = s0; s <= s1; s++)
+            buf[c++] = plane_cell(a, d, p, q, s);
+    }
+    MPI_Isend(&buf[0], count, MPI_DOUBLE, neighbor[side][d],
+      tag + 2 * d + side, comm, &requests[nrequests++]);
+    messages++;
+  }
+}
+
+/*! wait for all the posted messages */
+void HaloExchange::complete(int d)
+{
+  if (nrequests > 0) {
+    if (MPI_Waitall(nrequests, requests, MPI_STATUSES_IGNORE) != MPI_SUCCESS)
+      eprintf("halo exchange failed");
+    nrequests = 0;
+  }
+  // unpack the ghost planes of the directions up to d
+  const int dfirst = faceOnly ? 0 : d;
+  for (int dd = dfirst; dd <= d; dd++) {
+    const int t1 = (dd == 0) ? 1 : 0;
+    const int t2 = (dd == 2) ? 1 : 2;
+    int q0, q1, s0, s1;
+    range(dd, t1, q0, q1);
+    range(dd, t2, s0, s1);
+    for (int side = 0; side < 2; side++) {
+      if (neighbor[side][dd] == MPI_PROC_NULL) continue;
+      const std::vector<double> &buf = recvbuf[side][dd];
+      const int p0 = recvplane[side][dd];
+      int c = 0;
+      for (size_t v = 0; v < vectors.size(); v++) {
+        double ***a = vectors[v];
+        for (int p = p0; p < p0 + width; p++)
+          for (int q = q0; q <= q1; q++)
+            for (int s = s0; s <= s1; s++)
+              plane_cell(a, dd, p, q, s) = buf[c++];
+      }
+    }
+  }
+}
+
+void HaloExchange::start()
+{
+  assert(!started);
+  started = true;
+  messages = 0;
+  if (faceOnly) {
+    post(0);
+    post(1);
+    post(2);
+  }
+  else
+    post(0);
+}
+
+void HaloExchange::finish()
+{
+  assert(started);
+  if (faceOnly)
+    complete(2);
+  else {
+    complete(0);
+    post(1);
+    complete(1);
+    post(2);
+    complete(2);
+  }
+  // boundary conditions on the faces without neighbour
+  for (size_t v = 0; v < vectors.size(); v++) {
+    const int *bc = &bcs[6 * v];
+    if (bc[0] < 0)
+      continue;
+    if (isParticle)
+      BCface_P(n[0], n[1], n[2], vectors[v], bc[0], bc[1], bc[2], bc[3], bc[4], bc[5], vct);
+    else
+      BCface(n[0], n[1], n[2], vectors[v], bc[0], bc[1], bc[2], bc[3], bc[4], bc[5], vct);
+  }
+  started = false;
+}
@@ -22,12 +22,15 @@
 #include "ipichdf5.h"
 #include "EMfields3D.h"
 #include "Collective.h"
+#include "SharedRestart.h"
 #include "Basic.h"
 #include "Com3DNonblk.h"
 #include "VCtopology3D.h"
 #include "Grid3DCU.h"
 #include "CG.h"
 #include "GMRES.h"
+#include "Preconditioner.h"
+#include "Multigrid.h"
 #include "Particles3Dcomm.h"
 #include "Moments.h"
 #include "Parameters.h"
@@ -43,6 +46,7 @@
 #endif
 
 #include <iostream>
+#include <algorithm>
 //#include <sstream>
 using std::cout;
 using std::endl;
@@ -164,7 +168,18 @@ EMfields3D::EMfields3D(Collective * col, Grid * grid, VirtualTopology3D *vct) :
   vectY (nxn, nyn, nzn),
   vectZ (nxn, nyn, nzn),
   divC  (nxc, nyc, nzc),
+  gradXxC(nxc, nyc, nzc),
+  gradXyC(nxc, nyc, nzc),
+  gradXzC(nxc, nyc, nzc),
+  gradYxC(nxc, nyc, nzc),
+  gradYyC(nxc, nyc, nzc),
+  gradYzC(nxc, nyc, nzc),
+  gradZxC(nxc, nyc, nzc),
+  gradZyC(nxc, nyc, nzc),
+  gradZzC(nxc, nyc, nzc),
   Lambda (nxn, nyn, nzn),
+  tempPoisson  (nxc, nyc, nzc),
+  imagePoisson (nxc, nyc, nzc),
   //arr (nxc-2,nyc-2,nzc-2),
   // B_ext and J_ext should not be allocated unless used.
   Bx_ext(nxn,nyn,nzn),
@@ -178,7 +193,14 @@ EMfields3D::EMfields3D(Collective * col, Grid * grid, VirtualTopology3D *vct) :
   Jz_ext(nxn,nyn,nzn), 
   //temperature
   Tcart(nzn,nyn,nxn,6),
-  Tperpar(nzn,nyn,nxn,6) 
+  Tperpar(nzn,nyn,nxn,6),
+  haloE      (vct, nxn, nyn, nzn, false),
+  haloBn     (vct, nxn, nyn, nzn, false),
+  haloBc     (vct, nxc, nyc, nzc, true),
+  haloImage  (vct, nxc, nyc, nzc, true),
+  smootherE   (vct, nxn, nyn, nzn, false, false, col->getSmooth(), col->getSmoothNiter(), nyn > 1),
+  smootherRhoc(vct, nxc, nyc, nzc, true, true, col->getSmooth(), col->getSmoothNiter(), nyn > 1),
+  smootherJh  (vct, nxn, nyn, nzn, false, true, col->getSmooth(), col->getSmoothNiter(), nyn > 1)
 {
   // External imposed fields
   //
@@ -200,6 +222,81 @@ EMfields3D::EMfields3D(Collective * col, Grid * grid, VirtualTopology3D *vct) :
   }
   CGtol = col->getCGtol();
   GMREStol = col->getGMREStol();
+  MaxwellCGS2 = false;
+  if (col->getMaxwellSolver() == "GMRES_CGS2")
+    MaxwellCGS2 = true;
+  else if (col->getMaxwellSolver() != "GMRES")
+    eprintf("unknown MaxwellSolver %s, use GMRES or GMRES_CGS2",
+      col->getMaxwellSolver().c_str());
+  // Krylov vectors and work space of the field solves
+  const int lenMaxwell = 3 * (nxn - 2) * (nyn - 2) * (nzn - 2);
+  const int lenPoisson = (nxc - 2) * (nyc - 2) * (nzc - 2);
+  xkrylovMaxwell = new double[lenMaxwell];
+  bkrylovMaxwell = new double[lenMaxwell];
+  xkrylovPHI = new double[lenPoisson];
+  xkrylovPSI = new double[lenPoisson];
+  bkrylovPoisson = new double[lenPoisson];
+  eqValue(0.0, xkrylovPHI, lenPoisson);
+  eqValue(0.0, xkrylovPSI, lenPoisson);
+  // preconditioner of the Maxwell solve
+  maxwellPreconditioner = 0;
+  const string preconditioner = col->getMaxwellPreconditioner();
+  const int precIterations = col->getPreconditionerIterations();
+  if (preconditioner == "BlockJacobi")
+    maxwellPreconditioner = new BlockJacobiPreconditioner(&Field::MaxwellImageLocal,
+      this, lenMaxwell, precIterations);
+  else if (preconditioner == "Polynomial")
+    maxwellPreconditioner = new PolynomialPreconditioner(&Field::MaxwellImage,
+      &Field::MaxwellImageLocal, this, lenMaxwell, precIterations);
+  else if (preconditioner != "none")
+    eprintf("unknown MaxwellPreconditioner %s, use none, BlockJacobi or Polynomial",
+      preconditioner.c_str());
+  // solver of the divergence cleanings
+  poissonMultigrid = 0;
+  PoissonMultigridGMRES = false;
+  if (col->getPoissonSolver() == "Multigrid" || col->getPoissonSolver() == "GMRES_Multigrid") {
+    poissonMultigrid = new PoissonMultigrid(this, col->getMultigridSweeps());
+    PoissonMultigridGMRES = (col->getPoissonSolver() == "GMRES_Multigrid");
+  }
+  else if (col->getPoissonSolver() != "GMRES")
+    eprintf("unknown PoissonSolver %s, use GMRES, Multigrid or GMRES_Multigrid",
+      col->getPoissonSolver().c_str());
+  krylovWorkspace.reserve(lenMaxwell, 20, maxwellPreconditioner != 0 || PoissonMultigridGMRES);
+  // halo exchanges of the field components
+  haloE.add(Exth, col->bcEx);
+  haloE.add(Eyth, col->bcEy);
+  haloE.add(Ezth, col->bcEz);
+  haloE.add(Ex, col->bcEx);
+  haloE.add(Ey, col->bcEy);
+  haloE.add(Ez, col->bcEz);
+  haloBn.add(Bxn, col->bcBx);
+  haloBn.add(Byn, col->bcBy);
+  haloBn.add(Bzn, col->bcBz);
+  haloBc.add(Bxc, col->bcBx);
+  haloBc.add(Byc, col->bcBy);
+  haloBc.add(Bzc, col->bcBz);
+  // gradients of E and divergence of mu dot E in MaxwellImage
+  const int bcGradient[6] = { 1, 1, 1, 1, 1, 1 };
+  const int bcDivergence[6] = { 2, 2, 2, 2, 2, 2 };
+  haloImage.add(gradXxC, bcGradient);
+  haloImage.add(gradXyC, bcGradient);
+  haloImage.add(gradXzC, bcGradient);
+  haloImage.add(gradYxC, bcGradient);
+  haloImage.add(gradYyC, bcGradient);
+  haloImage.add(gradYzC, bcGradient);
+  haloImage.add(gradZxC, bcGradient);
+  haloImage.add(gradZyC, bcGradient);
+  haloImage.add(gradZzC, bcGradient);
+  haloImage.add(divC, bcDivergence);
+  // smoothing, with zero derivative at the boundaries for the moments
+  const int bcMoments[6] = { 2, 2, 2, 2, 2, 2 };
+  smootherE.add(Ex, col->bcEx);
+  smootherE.add(Ey, col->bcEy);
+  smootherE.add(Ez, col->bcEz);
+  smootherRhoc.add(rhoc, bcMoments);
+  smootherJh.add(Jxh, bcMoments);
+  smootherJh.add(Jyh, bcMoments);
+  smootherJh.add(Jzh, bcMoments);
   qom = new double[ns];
   for (int i = 0; i < ns; i++)
     qom[i] = col->getQOM(i);
@@ -239,22 +336,17 @@ EMfields3D::EMfields3D(Collective * col, Grid * grid, VirtualTopology3D *vct) :
   /*! Restart */
   restart1 = col->getRestart_status();
 
-  if(Parameters::get_VECTORIZE_MOMENTS())
-  {
-    // In this case particles are sorted
-    // and there is no need for each thread
-    // to sum moments in a separate array.
-    sizeMomentsArray = 1;
-  }
-  else
-  {
-    sizeMomentsArray = omp_get_max_threads();
-  }
+  // Either particles are sorted (vectorized moments) or the threads
+  // deposit moments in disjoint mesh columns (sumMoments_AoS):
+  // there is no need for each thread to sum moments in a separate array.
+  sizeMomentsArray = 1;
   moments10Array = new Moments10*[sizeMomentsArray];
   for(int i=0;i<sizeMomentsArray;i++)
   {
     moments10Array[i] = new Moments10(nxn,nyn,nzn);
   }
+  momentsCheck = col->getMomentsCheck();
+  momentsCheckArray = momentsCheck ? new Moments10(nxn,nyn,nzn) : NULL;
     
     
     
@@ -663,6 +755,98 @@ void EMfields3D::sumMoments(const Particles3Dcomm* part)
   }
 }
 
+// add the ten velocity moments of particle pcl to the 8 nodes of its cell
+static inline void add_moments_AoS(arr4_double& moments, const SpeciesParticle& pcl,
+  const Grid *grid, double xstart, double ystart, double zstart,
+  double inv_dx, double inv_dy, double inv_dz, double invVOL)
+{
+  // compute the quadratic moments of velocity
+  //
+  const double ui=pcl.get_u();
+  const double vi=pcl.get_v();
+  const double wi=pcl.get_w();
+  const double uui=ui*ui;
+  const double uvi=ui*vi;
+  const double uwi=ui*wi;
+  const double vvi=vi*vi;
+  const double vwi=vi*wi;
+  const double wwi=wi*wi;
+  double velmoments[10];
+  velmoments[0] = 1.;
+  velmoments[1] = ui;
+  velmoments[2] = vi;
+  velmoments[3] = wi;
+  velmoments[4] = uui;
+  velmoments[5] = uvi;
+  velmoments[6] = uwi;
+  velmoments[7] = vvi;
+  velmoments[8] = vwi;
+  velmoments[9] = wwi;
+
+  //
+  // compute the weights to distribute the moments
+  //
+  const int ix = 2 + int (floor((pcl.get_x() - xstart) * inv_dx));
+  const int iy = 2 + int (floor((pcl.get_y() - ystart) * inv_dy));
+  const int iz = 2 + int (floor((pcl.get_z() - zstart) * inv_dz));
+  const double xi0   = pcl.get_x() - grid->getXN(ix-1);
+  const double eta0  = pcl.get_y() - grid->getYN(iy-1);
+  const double zeta0 = pcl.get_z() - grid->getZN(iz-1);
+  const double xi1   = grid->getXN(ix) - pcl.get_x();
+  const double eta1  = grid->getYN(iy) - pcl.get_y();
+  const double zeta1 = grid->getZN(iz) - pcl.get_z();
+  const double qi = pcl.get_q();
+  const double invVOLqi = invVOL*qi;
+  const double weight0 = invVOLqi * xi0;
+  const double weight1 = invVOLqi * xi1;
+  const double weight00 = weight0*eta0;
+  const double weight01 = weight0*eta1;
+  const double weight10 = weight1*eta0;
+  const double weight11 = weight1*eta1;
+  double weights[8];
+  weights[0] = weight00*zeta0; // weight000
+  weights[1] = weight00*zeta1; // weight001
+  weights[2] = weight01*zeta0; // weight010
+  weights[3] = weight01*zeta1; // weight011
+  weights[4] = weight10*zeta0; // weight100
+  weights[5] = weight10*zeta1; // weight101
+  weights[6] = weight11*zeta0; // weight110
+  weights[7] = weight11*zeta1; // weight111
+
+  // add particle to moments
+  arr1_double_fetch momentsArray[8];
+  arr2_double_fetch moments00 = moments[ix  ][iy  ];
+  arr2_double_fetch moments01 = moments[ix  ][iy-1];
+  arr2_double_fetch moments10 = moments[ix-1][iy  ];
+  arr2_double_fetch moments11 = moments[ix-1][iy-1];
+  momentsArray[0] = moments00[iz  ]; // moments000 
+  momentsArray[1] = moments00[iz-1]; // moments001 
+  momentsArray[2] = moments01[iz  ]; // moments010 
+  momentsArray[3] = moments01[iz-1]; // moments011 
+  momentsArray[4] = moments10[iz  ]; // moments100 
+  momentsArray[5] = moments10[iz-1]; // moments101 
+  momentsArray[6] = moments11[iz  ]; // moments110 
+  momentsArray[7] = moments11[iz-1]; // moments111 
+
+  for(int m=0; m<10; m++)
+  for(int c=0; c<8; c++)
+  {
+    momentsArray[c][m] += velmoments[m]*weights[c];
+  }
+}
+
+// Sum moments of AoS particles with all threads in a single array.
+//
+// A particle in mesh column (cx,cy) (cell in x and y) adds its moments
+// to nodes cx..cx+1 and cy..cy+1 only, so columns whose indices both
+// have the same parity write to disjoint nodes. Each species is
+//   1. sorted by mesh column with a stable counting sort,
+//   2. deposited in four colours (parity of cx and cy): the columns of
+//      a colour are shared among the threads, the colours in turn.
+// Memory does not grow with the number of threads (one int per particle
+// for the sort, a count per column and thread), and since each column is
+// summed by one thread in particle order the moments do not depend on
+// the number of threads.
 void EMfields3D::sumMoments_AoS(const Particles3Dcomm* part)
 {
   const Grid *grid = &get_grid();
@@ -676,13 +860,17 @@ void EMfields3D::sumMoments_AoS(const Particles3Dcomm* part)
   const double xstart = grid->getXstart();
   const double ystart = grid->getYstart();
   const double zstart = grid->getZstart();
-  // To make memory use scale to a large number of threads, we
-  // could first apply an efficient parallel sorting algorithm
-  // to the particles and then accumulate moments in smaller
-  // subarrays.
-  //#ifdef _OPENMP
-  // #pragma omp parallel
-  {
+  // mesh columns
+  const int ncx = nxn-1;
+  const int ncy = nyn-1;
+  const int ncolumns = ncx*ncy;
+
+  arr4_double moments = fetch_moments10Array(0).fetch_arr();
+  double *moments1d = &moments[0][0][0][0];
+  const int moments1dsize = moments.get_size();
+  momentsColumnStart.resize(ncolumns+1);
+  momentsColumnCount.resize(ncolumns*omp_get_max_threads());
+
   for (int species_idx = 0; species_idx < ns; species_idx++)
   {
     const Particles3Dcomm& pcls = part[species_idx];
@@ -691,136 +879,95 @@ void EMfields3D::sumMoments_AoS(const Particles3Dcomm* part)
     assert_eq(species_idx,is);
 
     const int nop = pcls.getNOP();
+    momentsColumn.resize(nop);
+    momentsOrder.resize(nop);
 
-    int thread_num = omp_get_thread_num();
-    Moments10& speciesMoments10 = fetch_moments10Array(thread_num);
-    arr4_double moments = speciesMoments10.fetch_arr();
-    //
-    // moments.setmode(ompmode::mine);
-    // moments.setall(0.);
-    // 
-    double *moments1d = &moments[0][0][0][0];
-    int moments1dsize = moments.get_size();
-    for(int i=0; i<moments1dsize; i++) moments1d[i]=0;
-    //
-    // #pragma omp barrier
-    // #pragma omp for
-    for (int pidx = 0; pidx < nop; pidx++)
+    #pragma omp parallel
     {
-      const SpeciesParticle& pcl = pcls.get_pcl(pidx);
-      // compute the quadratic moments of velocity
-      //
-      const double ui=pcl.get_u();
-      const double vi=pcl.get_v();
-      const double wi=pcl.get_w();
-      const double uui=ui*ui;
-      const double uvi=ui*vi;
-      const double uwi=ui*wi;
-      const double vvi=vi*vi;
-      const double vwi=vi*wi;
-      const double wwi=wi*wi;
-      double velmoments[10];
-      velmoments[0] = 1.;
-      velmoments[1] = ui;
-      velmoments[2] = vi;
-      velmoments[3] = wi;
-      velmoments[4] = uui;
-      velmoments[5] = uvi;
-      velmoments[6] = uwi;
-      velmoments[7] = vvi;
-      velmoments[8] = vwi;
-      velmoments[9] = wwi;
+      const int nthreads = omp_get_num_threads();
+      int *count = &momentsColumnCount[omp_get_thread_num()*ncolumns];
+      for(int n=0; n<ncolumns; n++) count[n]=0;
 
-      //
-      // compute the weights to distribute the moments
-      //
-      const int ix = 2 + int (floor((pcl.get_x() - xstart) * inv_dx));
-      const int iy = 2 + int (floor((pcl.get_y() - ystart) * inv_dy));
-      const int iz = 2 + int (floor((pcl.get_z() - zstart) * inv_dz));
-      const double xi0   = pcl.get_x() - grid->getXN(ix-1);
-      const double eta0  = pcl.get_y() - grid->getYN(iy-1);
-      const double zeta0 = pcl.get_z() - grid->getZN(iz-1);
-      const double xi1   = grid->getXN(ix) - pcl.get_x();
-      const double eta1  = grid->getYN(iy) - pcl.get_y();
-      const double zeta1 = grid->getZN(iz) - pcl.get_z();
-      const double qi = pcl.get_q();
-      const double invVOLqi = invVOL*qi;
-      const double weight0 = invVOLqi * xi0;
-      const double weight1 = invVOLqi * xi1;
-      const double weight00 = weight0*eta0;
-      const double weight01 = weight0*eta1;
-      const double weight10 = weight1*eta0;
-      const double weight11 = weight1*eta1;
-      double weights[8];
-      weights[0] = weight00*zeta0; // weight000
-      weights[1] = weight00*zeta1; // weight001
-      weights[2] = weight01*zeta0; // weight010
-      weights[3] = weight01*zeta1; // weight011
-      weights[4] = weight10*zeta0; // weight100
-      weights[5] = weight10*zeta1; // weight101
-      weights[6] = weight11*zeta0; // weight110
-      weights[7] = weight11*zeta1; // weight111
-      //weights[0] = xi0 * eta0 * zeta0 * qi * invVOL; // weight000
-      //weights[1] = xi0 * eta0 * zeta1 * qi * invVOL; // weight001
-      //weights[2] = xi0 * eta1 * zeta0 * qi * invVOL; // weight010
-      //weights[3] = xi0 * eta1 * zeta1 * qi * invVOL; // weight011
-      //weights[4] = xi1 * eta0 * zeta0 * qi * invVOL; // weight100
-      //weights[5] = xi1 * eta0 * zeta1 * qi * invVOL; // weight101
-      //weights[6] = xi1 * eta1 * zeta0 * qi * invVOL; // weight110
-      //weights[7] = xi1 * eta1 * zeta1 * qi * invVOL; // weight111
+      #pragma omp for schedule(static)
+      for(int i=0; i<moments1dsize; i++) moments1d[i]=0;
 
-      // add particle to moments
+      // count the particles of each column
+      #pragma omp for schedule(static)
+      for (int pidx = 0; pidx < nop; pidx++)
       {
-        arr1_double_fetch momentsArray[8];
-        arr2_double_fetch moments00 = moments[ix  ][iy  ];
-        arr2_double_fetch moments01 = moments[ix  ][iy-1];
-        arr2_double_fetch moments10 = moments[ix-1][iy  ];
-        arr2_double_fetch moments11 = moments[ix-1][iy-1];
-        momentsArray[0] = moments00[iz  ]; // moments000 
-        momentsArray[1] = moments00[iz-1]; // moments001 
-        momentsArray[2] = moments01[iz  ]; // moments010 
-        momentsArray[3] = moments01[iz-1]; // moments011 
-        momentsArray[4] = moments10[iz  ]; // moments100 
-        momentsArray[5] = moments10[iz-1]; // moments101 
-        momentsArray[6] = moments11[iz  ]; // moments110 
-        momentsArray[7] = moments11[iz-1]; // moments111 
+        const SpeciesParticle& pcl = pcls.get_pcl(pidx);
+        int cx = 1 + int (floor((pcl.get_x() - xstart) * inv_dx));
+        int cy = 1 + int (floor((pcl.get_y() - ystart) * inv_dy));
+        cx = cx < 0 ? 0 : (cx >= ncx ? ncx-1 : cx);
+        cy = cy < 0 ? 0 : (cy >= ncy ? ncy-1 : cy);
+        const int column = cx*ncy + cy;
+        momentsColumn[pidx] = column;
+        count[column]++;
+      }
 
-        for(int m=0; m<10; m++)
-        for(int c=0; c<8; c++)
+      // where each thread writes the particles of each column
+      #pragma omp single
+      {
+        int offset = 0;
+        for(int n=0; n<ncolumns; n++)
         {
-          momentsArray[c][m] += velmoments[m]*weights[c];
+          momentsColumnStart[n] = offset;
+          for(int t=0; t<nthreads; t++)
+          {
+            int& count_t = momentsColumnCount[t*ncolumns+n];
+            const int num = count_t;
+            count_t = offset;
+            offset += num;
+          }
         }
+        momentsColumnStart[ncolumns] = offset;
       }
-    }
-   
 
-    // reduction
-   
+      // same static schedule as above: stable in particle order
+      #pragma omp for schedule(static)
+      for (int pidx = 0; pidx < nop; pidx++)
+        momentsOrder[count[momentsColumn[pidx]]++] = pidx;
 
-    // reduce moments in parallel
-    //
-    for(int thread_num=0;thread_num<get_sizeMomentsArray();thread_num++)
-    {
-      arr4_double moments = fetch_moments10Array(thread_num).fetch_arr();
-      // #pragma omp for collapse(2)
-      for(int i=0;i<nxn;i++)
-      for(int j=0;j<nyn;j++)
-      for(int k=0;k<nzn;k++)
+      for (int colour = 0; colour < 4; colour++)
       {
-        rhons[is][i][j][k] += invVOL*moments[i][j][k][0];
-        Jxs  [is][i][j][k] += invVOL*moments[i][j][k][1];
-        Jys  [is][i][j][k] += invVOL*moments[i][j][k][2];
-        Jzs  [is][i][j][k] += invVOL*moments[i][j][k][3];
-        pXXsn[is][i][j][k] += invVOL*moments[i][j][k][4];
-        pXYsn[is][i][j][k] += invVOL*moments[i][j][k][5];
-        pXZsn[is][i][j][k] += invVOL*moments[i][j][k][6];
-        pYYsn[is][i][j][k] += invVOL*moments[i][j][k][7];
-        pYZsn[is][i][j][k] += invVOL*moments[i][j][k][8];
-        pZZsn[is][i][j][k] += invVOL*moments[i][j][k][9];
+        const int px = colour/2;
+        const int py = colour%2;
+        const int nx = (ncx-px+1)/2;
+        const int ny = (ncy-py+1)/2;
+        #pragma omp for collapse(2) schedule(dynamic)
+        for (int a = 0; a < nx; a++)
+        for (int b = 0; b < ny; b++)
+        {
+          const int column = (px+2*a)*ncy + (py+2*b);
+          for (int n = momentsColumnStart[column]; n < momentsColumnStart[column+1]; n++)
+          {
+            add_moments_AoS(moments, pcls.get_pcl(momentsOrder[n]), grid,
+              xstart, ystart, zstart, inv_dx, inv_dy, inv_dz, invVOL);
+          }
+        }
       }
     }
-    
-  }
+
+    if (momentsCheck)
+      checkMoments_AoS(pcls);
+
+    // reduction
+    #pragma omp parallel for collapse(2)
+    for(int i=0;i<nxn;i++)
+    for(int j=0;j<nyn;j++)
+    for(int k=0;k<nzn;k++)
+    {
+      rhons[is][i][j][k] += invVOL*moments[i][j][k][0];
+      Jxs  [is][i][j][k] += invVOL*moments[i][j][k][1];
+      Jys  [is][i][j][k] += invVOL*moments[i][j][k][2];
+      Jzs  [is][i][j][k] += invVOL*moments[i][j][k][3];
+      pXXsn[is][i][j][k] += invVOL*moments[i][j][k][4];
+      pXYsn[is][i][j][k] += invVOL*moments[i][j][k][5];
+      pXZsn[is][i][j][k] += invVOL*moments[i][j][k][6];
+      pYYsn[is][i][j][k] += invVOL*moments[i][j][k][7];
+      pYZsn[is][i][j][k] += invVOL*moments[i][j][k][8];
+      pZZsn[is][i][j][k] += invVOL*moments[i][j][k][9];
+    }
   }
   for (int i = 0; i < ns; i++)
   {
@@ -828,6 +975,48 @@ void EMfields3D::sumMoments_AoS(const Particles3Dcomm* part)
   }
 }
 
+// Deposit the moments of species pcls serially, in particle order, and
+// compare them with the moments summed by sumMoments_AoS: stop if any
+// moment differs by more than round-off from the serial one.
+void EMfields3D::checkMoments_AoS(const Particles3Dcomm& pcls)
+{
+  const Grid *grid = &get_grid();
+  const double tolerance = 1e-12;
+
+  arr4_double moments = fetch_moments10Array(0).fetch_arr();
+  arr4_double serial = momentsCheckArray->fetch_arr();
+  const double *moments1d = &moments[0][0][0][0];
+  double *serial1d = &serial[0][0][0][0];
+  const int moments1dsize = serial.get_size();
+  for(int i=0; i<moments1dsize; i++) serial1d[i]=0;
+
+  const int nop = pcls.getNOP();
+  for (int pidx = 0; pidx < nop; pidx++)
+  {
+    add_moments_AoS(serial, pcls.get_pcl(pidx), grid,
+      grid->getXstart(), grid->getYstart(), grid->getZstart(),
+      1.0/dx, 1.0/dy, 1.0/dz, invVOL);
+  }
+
+  // largest difference of each moment relative to its largest value
+  double maxdiff[10] = {0,0,0,0,0,0,0,0,0,0};
+  double maxval[10] = {0,0,0,0,0,0,0,0,0,0};
+  for(int i=0; i<moments1dsize; i++)
+  {
+    const int m = i%10;
+    maxdiff[m] = std::max(maxdiff[m], fabs(moments1d[i]-serial1d[i]));
+    maxval[m] = std::max(maxval[m], fabs(serial1d[i]));
+  }
+  double error = 0.;
+  for(int m=0; m<10; m++)
+    if (maxval[m] > 0.) error = std::max(error, maxdiff[m]/maxval[m]);
+
+  dprintf("species %d: threaded moments differ from serial ones by %g", pcls.get_species_num(), error);
+  if (error > tolerance)
+    eprintf("threaded moments of species %d differ from serial ones by %g",
+      pcls.get_species_num(), error);
+}
+
 #ifdef __MIC__
 // add moment weights to all ten moments for the cell of the particle
 // (assumes that particle data is aligned with cache boundary and
@@ -1931,16 +2120,20 @@ void EMfields3D::calculateE(int cycle)
   if (vct->getCartesian_rank() == 0)
     cout << "*** E CALCULATION ***" << endl;
 
-  array3_double divE     (nxc, nyc, nzc);
-  array3_double gradPHIX (nxn, nyn, nzn);
-  array3_double gradPHIY (nxn, nyn, nzn);
-  array3_double gradPHIZ (nxn, nyn, nzn);
+  const int lenMaxwell = 3 * (nxn - 2) * (nyn - 2) * (nzn - 2);
+  // divergence and gradient of the cleaning live in temporary arrays
+  // that are free at this point of the cycle
+  arr3_double divE = tempXC;
+  arr3_double gradPHIX = tempXN;
+  arr3_double gradPHIY = tempYN;
+  arr3_double gradPHIZ = tempZN;
+
+  statsPoissonE.reset();
+  statsMaxwell.reset();
+  statsPoissonB.reset();
 
-  double *xkrylov = new double[3 * (nxn - 2) * (nyn - 2) * (nzn - 2)];  // 3 E components
-  double *bkrylov = new double[3 * (nxn - 2) * (nyn - 2) * (nzn - 2)];  // 3 components
   // set to zero all the stuff 
-  eqValue(0.0, xkrylov, 3 * (nxn - 2) * (nyn - 2) * (nzn - 2));
-  eqValue(0.0, bkrylov, 3 * (nxn - 2) * (nyn - 2) * (nzn - 2));
+  eqValue(0.0, bkrylovMaxwell, lenMaxwell);
   eqValue(0.0, divE, nxc, nyc, nzc);
   eqValue(0.0, tempC, nxc, nyc, nzc);
   eqValue(0.0, gradPHIX, nxn, nyn, nzn);
@@ -1949,25 +2142,22 @@ void EMfields3D::calculateE(int cycle)
   // Adjust E calculating laplacian(PHI) = div(E) -4*PI*rho DIVERGENCE CLEANING
   
   if (PoissonCorrection &&  cycle%PoissonCorrectionCycle == 0) {
-		double *xkrylovPoisson = new double[(nxc - 2) * (nyc - 2) * (nzc - 2)];
-		double *bkrylovPoisson = new double[(nxc - 2) * (nyc - 2) * (nzc - 2)];
-		eqValue(0.0, xkrylovPoisson, (nxc - 2) * (nyc - 2) * (nzc - 2));
-
+		// the initial guess is the solution of the last cleaning
 		grid->divN2C(divE, Ex, Ey, Ez);
 		scale(tempC, rhoc, -FourPI, nxc, nyc, nzc);
 		sum(divE, tempC, nxc, nyc, nzc);
 		// move to krylov space
 		phys2solver(bkrylovPoisson, divE, nxc, nyc, nzc);
 		// use conjugate gradient first
-		//if (!CG(xkrylovPoisson, (nxc - 2) * (nyc - 2) * (nzc - 2), bkrylovPoisson, 3000, CGtol, &Field::PoissonImage, this)) {
+		//if (!CG(xkrylovPHI, lenPoisson, bkrylovPoisson, 3000, CGtol, &Field::PoissonImage, this, &krylovWorkspace, &statsPoissonE)) {
 		  	  //if (vct->getCartesian_rank() == 0)
 					//cout << "CG not Converged. Trying with GMRes. Consider to increase the number of the CG iterations" << endl;
-		  //eqValue(0.0, xkrylovPoisson, (nxc - 2) * (nyc - 2) * (nzc - 2));
-		  if (vct->getCartesian_rank() == 0) cout << "*** DIVERGENCE CLEANING div(E)=rho using GMRes***" << endl;
-		  GMRES(&Field::PoissonImage, xkrylovPoisson, (nxc - 2) * (nyc - 2) * (nzc - 2), bkrylovPoisson, 20, 200, GMREStol, this);
+		  //eqValue(0.0, xkrylovPHI, lenPoisson);
+		  if (vct->getCartesian_rank() == 0) cout << "*** DIVERGENCE CLEANING div(E)=rho using " << col->getPoissonSolver() << "***" << endl;
+		  solvePoisson(xkrylovPHI, &statsPoissonE);
 
 		//}
-		solver2phys(PHI, xkrylovPoisson, nxc, nyc, nzc);
+		solver2phys(PHI, xkrylovPHI, nxc, nyc, nzc);
 		communicateCenterBC(nxc, nyc, nzc, PHI, 2, 2, 2, 2, 2, 2, vct,this);
 		// calculate the gradient
 		grid->gradC2N(gradPHIX, gradPHIY, gradPHIZ, PHI);
@@ -1975,21 +2165,24 @@ void EMfields3D::calculateE(int cycle)
 		sub(Ex, gradPHIX, nxn, nyn, nzn);
 		sub(Ey, gradPHIY, nxn, nyn, nzn);
 		sub(Ez, gradPHIZ, nxn, nyn, nzn);
-
-		delete[]xkrylovPoisson;
-		delete[]bkrylovPoisson;
   }                             // end of divergence cleaning
   
   if (col->getVerbose() and vct->getCartesian_rank() == 0)
     cout << "*** MAXWELL SOLVER ***" << endl;
   // prepare the source 
-  MaxwellSource(bkrylov);
-  phys2solver(xkrylov, Ex, Ey, Ez, nxn, nyn, nzn);
+  MaxwellSource(bkrylovMaxwell);
+  phys2solver(xkrylovMaxwell, Ex, Ey, Ez, nxn, nyn, nzn);
   // solver
-  GMRES(&Field::MaxwellImage, xkrylov, 3 * (nxn - 2) * (nyn - 2) * (nzn - 2),
-    bkrylov, 20, 200, GMREStol, this);
+  if (MaxwellCGS2)
+    GMRES_CGS2(&Field::MaxwellImage, xkrylovMaxwell, lenMaxwell,
+      bkrylovMaxwell, 20, 200, GMREStol, this, &krylovWorkspace, &statsMaxwell,
+      maxwellPreconditioner);
+  else
+    GMRES(&Field::MaxwellImage, xkrylovMaxwell, lenMaxwell,
+      bkrylovMaxwell, 20, 200, GMREStol, this, &krylovWorkspace, &statsMaxwell,
+      maxwellPreconditioner);
   // move from krylov space to physical space
- solver2phys(Exth, Eyth, Ezth, xkrylov, nxn, nyn, nzn);
+ solver2phys(Exth, Eyth, Ezth, xkrylovMaxwell, nxn, nyn, nzn);
  
   addscale(1 / th, -(1.0 - th) / th, Ex, Exth, nxn, nyn, nzn);
   addscale(1 / th, -(1.0 - th) / th, Ey, Eyth, nxn, nyn, nzn);
@@ -1999,20 +2192,11 @@ void EMfields3D::calculateE(int cycle)
   smoothE();
 
   // communicate so the interpolation can have good values
-  communicateNodeBC(nxn, nyn, nzn, Exth, col->bcEx[0],col->bcEx[1],col->bcEx[2],col->bcEx[3],col->bcEx[4],col->bcEx[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Eyth, col->bcEy[0],col->bcEy[1],col->bcEy[2],col->bcEy[3],col->bcEy[4],col->bcEy[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Ezth, col->bcEz[0],col->bcEz[1],col->bcEz[2],col->bcEz[3],col->bcEz[4],col->bcEz[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Ex,   col->bcEx[0],col->bcEx[1],col->bcEx[2],col->bcEx[3],col->bcEx[4],col->bcEx[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Ey,   col->bcEy[0],col->bcEy[1],col->bcEy[2],col->bcEy[3],col->bcEy[4],col->bcEy[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Ez,   col->bcEz[0],col->bcEz[1],col->bcEz[2],col->bcEz[3],col->bcEz[4],col->bcEz[5], vct, this);
+  haloE.exchange();
  
   // OpenBC Inflow: this needs to be integrate to Halo Exchange BC
   OpenBoundaryInflowE(Exth, Eyth, Ezth, nxn, nyn, nzn);
   OpenBoundaryInflowE(Ex, Ey, Ez, nxn, nyn, nzn);
- 
-  // deallocate temporary arrays
-  delete[]xkrylov;
-  delete[]bkrylov;
 }
 
 /*! Calculate sorgent for Maxwell solver */
@@ -2033,9 +2217,7 @@ void EMfields3D::MaxwellSource(double *bkrylov)
   eqValue(0.0, temp2Y, nxn, nyn, nzn);
   eqValue(0.0, temp2Z, nxn, nyn, nzn);
 
-  communicateCenterBC(nxc, nyc, nzc, Bxc, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct, this);
-  communicateCenterBC(nxc, nyc, nzc, Byc, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct, this);
-  communicateCenterBC(nxc, nyc, nzc, Bzc, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct, this);
+  haloBc.exchange();
  
   if (get_col().getCase()=="ForceFree") 		fixBforcefree();
   if (get_col().getCase()=="GEM")       		fixBnGEM();
@@ -2175,6 +2357,54 @@ void EMfields3D::MaxwellSource(double *bkrylov)
 // rescaling their values in these two methods.
 // 
 void EMfields3D::MaxwellImage(double *im, double* vector)
+{
+  applyMaxwellOperator(im, vector, false);
+}
+
+/*! Image of the Maxwell operator on the local subdomain only (for the preconditioners) */
+void EMfields3D::MaxwellImageLocal(double *im, double* vector)
+{
+  applyMaxwellOperator(im, vector, true);
+}
+
+/*! set the guard cells of a field to zero */
+static void zeroGuardCells(arr3_double vect, int nx, int ny, int nz)
+{
+  for (int j = 0; j < ny; j++)
+    for (int k = 0; k < nz; k++) {
+      vect[0][j][k] = 0.0;
+      vect[nx - 1][j][k] = 0.0;
+    }
+  for (int i = 0; i < nx; i++)
+    for (int k = 0; k < nz; k++) {
+      vect[i][0][k] = 0.0;
+      vect[i][ny - 1][k] = 0.0;
+    }
+  for (int i = 0; i < nx; i++)
+    for (int j = 0; j < ny; j++) {
+      vect[i][j][0] = 0.0;
+      vect[i][j][nz - 1] = 0.0;
+    }
+}
+
+/*! laplacian on nodes without communication, the gradients
+    on the guard cells are set to zero (uses tempXC, tempYC, tempZC) */
+void EMfields3D::lapN2Nlocal(arr3_double lapN, const_arr3_double scFieldN)
+{
+  const Grid *grid = &get_grid();
+  grid->gradN2C(tempXC, tempYC, tempZC, scFieldN);
+  zeroGuardCells(tempXC, nxc, nyc, nzc);
+  zeroGuardCells(tempYC, nxc, nyc, nzc);
+  zeroGuardCells(tempZC, nxc, nyc, nzc);
+  grid->divC2N(lapN, tempXC, tempYC, tempZC);
+}
+
+/*! Image of the Maxwell operator as the composition of the Grid3DCU
+    operators, one whole array after the other. With local the halo exchanges
+    are replaced by zero guard cells, which gives the operator of the
+    subdomain alone. applyMaxwellOperator computes the same image in two
+    fused sweeps; this one is kept as its reference. */
+void EMfields3D::MaxwellImageComposed(double *im, double* vector, bool local)
 {
   const Collective *col = &get_col();
   const VirtualTopology3D *vct = &get_vct();
@@ -2192,9 +2422,16 @@ void EMfields3D::MaxwellImage(double *im, double* vector)
   eqValue(0.0, Dz, nxn, nyn, nzn);
   // move from krylov space to physical space
   solver2phys(vectX, vectY, vectZ, vector, nxn, nyn, nzn);
-  grid->lapN2N(imageX, vectX,this);
-  grid->lapN2N(imageY, vectY,this);
-  grid->lapN2N(imageZ, vectZ,this);
+  if (local) {
+    lapN2Nlocal(imageX, vectX);
+    lapN2Nlocal(imageY, vectY);
+    lapN2Nlocal(imageZ, vectZ);
+  }
+  else {
+    grid->lapN2N(imageX, vectX,this);
+    grid->lapN2N(imageY, vectY,this);
+    grid->lapN2N(imageZ, vectZ,this);
+  }
   neg(imageX, nxn, nyn, nzn);
   neg(imageY, nxn, nyn, nzn);
   neg(imageZ, nxn, nyn, nzn);
@@ -2206,7 +2443,10 @@ void EMfields3D::MaxwellImage(double *im, double* vector)
   // communicateCenterBC(nxc,nyc,nzc,divC,1,1,1,1,1,1,vct);
   
 
-  communicateCenterBC(nxc, nyc, nzc, divC, 2, 2, 2, 2, 2, 2, vct, this);
+  if (local)
+    zeroGuardCells(divC, nxc, nyc, nzc);
+  else
+    communicateCenterBC(nxc, nyc, nzc, divC, 2, 2, 2, 2, 2, 2, vct, this);
 
   grid->gradC2N(tempX, tempY, tempZ, divC);
 
@@ -2262,6 +2502,174 @@ void EMfields3D::MaxwellImage(double *im, double* vector)
 
 }
 
+/*! vectX, vectY, vectZ from the Krylov vector and Dx, Dy, Dz = mu dot vect
+    on the interior nodes of the plane i, as solver2phys and MUdot */
+void EMfields3D::MaxwellImageNodes(int i, const double *vector)
+{
+  double ***vx = vectX.fetch_arr3();
+  double ***vy = vectY.fetch_arr3();
+  double ***vz = vectZ.fetch_arr3();
+  double ***dx = Dx.fetch_arr3();
+  double ***dy = Dy.fetch_arr3();
+  double ***dz = Dz.fetch_arr3();
+  for (int j = 1; j < nyn - 1; j++) {
+    const double *v = vector + 3 * ((i - 1) * (nyn - 2) + (j - 1)) * (nzn - 2);
+    for (int k = 1; k < nzn - 1; k++) {
+      vx[i][j][k] = *v++;
+      vy[i][j][k] = *v++;
+      vz[i][j][k] = *v++;
+      dx[i][j][k] = 0.0;
+      dy[i][j][k] = 0.0;
+      dz[i][j][k] = 0.0;
+    }
+  }
+  for (int is = 0; is < ns; is++) {
+    const double beta = .5 * qom[is] * dt / c;
+    for (int j = 1; j < nyn - 1; j++)
+      for (int k = 1; k < nzn - 1; k++) {
+        const double omcx = beta * (Bxn[i][j][k] + Bx_ext[i][j][k]);
+        const double omcy = beta * (Byn[i][j][k] + By_ext[i][j][k]);
+        const double omcz = beta * (Bzn[i][j][k] + Bz_ext[i][j][k]);
+        const double edotb = vx[i][j][k] * omcx + vy[i][j][k] * omcy + vz[i][j][k] * omcz;
+        const double denom = FourPI / 2 * delt * dt / c * qom[is] * rhons[is][i][j][k] / (1.0 + omcx * omcx + omcy * omcy + omcz * omcz);
+        dx[i][j][k] += (vx[i][j][k] + (vy[i][j][k] * omcz - vz[i][j][k] * omcy + edotb * omcx)) * denom;
+        dy[i][j][k] += (vy[i][j][k] + (vz[i][j][k] * omcx - vx[i][j][k] * omcz + edotb * omcy)) * denom;
+        dz[i][j][k] += (vz[i][j][k] + (vx[i][j][k] * omcy - vy[i][j][k] * omcx + edotb * omcz)) * denom;
+      }
+  }
+}
+
+/*! gradients of vectX, vectY, vectZ and divergence of Dx, Dy, Dz (divC)
+    on the interior centres of the plane i, as gradN2C and divN2C */
+void EMfields3D::MaxwellImageCenters(int i)
+{
+  const Grid *grid = &get_grid();
+  const double invdx = grid->get_invdx();
+  const double invdy = grid->get_invdy();
+  const double invdz = grid->get_invdz();
+  double ***vect[3] = { vectX.fetch_arr3(), vectY.fetch_arr3(), vectZ.fetch_arr3() };
+  double ***gradx[3] = { gradXxC.fetch_arr3(), gradYxC.fetch_arr3(), gradZxC.fetch_arr3() };
+  double ***grady[3] = { gradXyC.fetch_arr3(), gradYyC.fetch_arr3(), gradZyC.fetch_arr3() };
+  double ***gradz[3] = { gradXzC.fetch_arr3(), gradYzC.fetch_arr3(), gradZzC.fetch_arr3() };
+  double ***dx = Dx.fetch_arr3();
+  double ***dy = Dy.fetch_arr3();
+  double ***dz = Dz.fetch_arr3();
+  double ***div = divC.fetch_arr3();
+  for (int n = 0; n < 3; n++) {
+    double ***f = vect[n];
+    double ***gx = gradx[n];
+    double ***gy = grady[n];
+    double ***gz = gradz[n];
+    for (int j = 1; j < nyc - 1; j++)
+      for (int k = 1; k < nzc - 1; k++) {
+        gx[i][j][k] = .25 * (f[i + 1][j][k] - f[i][j][k]) * invdx + .25 * (f[i + 1][j][k + 1] - f[i][j][k + 1]) * invdx + .25 * (f[i + 1][j + 1][k] - f[i][j + 1][k]) * invdx + .25 * (f[i + 1][j + 1][k + 1] - f[i][j + 1][k + 1]) * invdx;
+        gy[i][j][k] = .25 * (f[i][j + 1][k] - f[i][j][k]) * invdy + .25 * (f[i][j + 1][k + 1] - f[i][j][k + 1]) * invdy + .25 * (f[i + 1][j + 1][k] - f[i + 1][j][k]) * invdy + .25 * (f[i + 1][j + 1][k + 1] - f[i + 1][j][k + 1]) * invdy;
+        gz[i][j][k] = .25 * (f[i][j][k + 1] - f[i][j][k]) * invdz + .25 * (f[i + 1][j][k + 1] - f[i + 1][j][k]) * invdz + .25 * (f[i][j + 1][k + 1] - f[i][j + 1][k]) * invdz + .25 * (f[i + 1][j + 1][k + 1] - f[i + 1][j + 1][k]) * invdz;
+      }
+  }
+  for (int j = 1; j < nyc - 1; j++)
+    for (int k = 1; k < nzc - 1; k++) {
+      const double compX = .25 * (dx[i + 1][j][k] - dx[i][j][k]) * invdx + .25 * (dx[i + 1][j][k + 1] - dx[i][j][k + 1]) * invdx + .25 * (dx[i + 1][j + 1][k] - dx[i][j + 1][k]) * invdx + .25 * (dx[i + 1][j + 1][k + 1] - dx[i][j + 1][k + 1]) * invdx;
+      const double compY = .25 * (dy[i][j + 1][k] - dy[i][j][k]) * invdy + .25 * (dy[i][j + 1][k + 1] - dy[i][j][k + 1]) * invdy + .25 * (dy[i + 1][j + 1][k] - dy[i + 1][j][k]) * invdy + .25 * (dy[i + 1][j + 1][k + 1] - dy[i + 1][j][k + 1]) * invdy;
+      const double compZ = .25 * (dz[i][j][k + 1] - dz[i][j][k]) * invdz + .25 * (dz[i + 1][j][k + 1] - dz[i + 1][j][k]) * invdz + .25 * (dz[i][j + 1][k + 1] - dz[i][j + 1][k]) * invdz + .25 * (dz[i + 1][j + 1][k + 1] - dz[i + 1][j + 1][k]) * invdz;
+      div[i][j][k] = compX + compY + compZ;
+    }
+}
+
+/*! image on the interior nodes of the plane i, into the Krylov vector im:
+    (-lap(vect) - grad(divC)) * delt^2 + D + vect, with lap the divC2N of
+    the gradients of vect and grad the gradC2N */
+void EMfields3D::MaxwellImageResult(int i, double *im)
+{
+  const Grid *grid = &get_grid();
+  const double invdx = grid->get_invdx();
+  const double invdy = grid->get_invdy();
+  const double invdz = grid->get_invdz();
+  const double delt2 = delt * delt;
+  double ***vect[3] = { vectX.fetch_arr3(), vectY.fetch_arr3(), vectZ.fetch_arr3() };
+  double ***D[3] = { Dx.fetch_arr3(), Dy.fetch_arr3(), Dz.fetch_arr3() };
+  double ***gradx[3] = { gradXxC.fetch_arr3(), gradYxC.fetch_arr3(), gradZxC.fetch_arr3() };
+  double ***grady[3] = { gradXyC.fetch_arr3(), gradYyC.fetch_arr3(), gradZyC.fetch_arr3() };
+  double ***gradz[3] = { gradXzC.fetch_arr3(), gradYzC.fetch_arr3(), gradZzC.fetch_arr3() };
+  double ***div = divC.fetch_arr3();
+  for (int j = 1; j < nyn - 1; j++) {
+    double *out = im + 3 * ((i - 1) * (nyn - 2) + (j - 1)) * (nzn - 2);
+    for (int k = 1; k < nzn - 1; k++) {
+      double graddiv[3];
+      graddiv[0] = .25 * (div[i][j][k] - div[i - 1][j][k]) * invdx + .25 * (div[i][j][k - 1] - div[i - 1][j][k - 1]) * invdx + .25 * (div[i][j - 1][k] - div[i - 1][j - 1][k]) * invdx + .25 * (div[i][j - 1][k - 1] - div[i - 1][j - 1][k - 1]) * invdx;
+      graddiv[1] = .25 * (div[i][j][k] - div[i][j - 1][k]) * invdy + .25 * (div[i][j][k - 1] - div[i][j - 1][k - 1]) * invdy + .25 * (div[i - 1][j][k] - div[i - 1][j - 1][k]) * invdy + .25 * (div[i - 1][j][k - 1] - div[i - 1][j - 1][k - 1]) * invdy;
+      graddiv[2] = .25 * (div[i][j][k] - div[i][j][k - 1]) * invdz + .25 * (div[i - 1][j][k] - div[i - 1][j][k - 1]) * invdz + .25 * (div[i][j - 1][k] - div[i][j - 1][k - 1]) * invdz + .25 * (div[i - 1][j - 1][k] - div[i - 1][j - 1][k - 1]) * invdz;
+      for (int n = 0; n < 3; n++) {
+        double ***gx = gradx[n];
+        double ***gy = grady[n];
+        double ***gz = gradz[n];
+        const double compX = .25 * (gx[i][j][k] - gx[i - 1][j][k]) * invdx + .25 * (gx[i][j][k - 1] - gx[i - 1][j][k - 1]) * invdx + .25 * (gx[i][j - 1][k] - gx[i - 1][j - 1][k]) * invdx + .25 * (gx[i][j - 1][k - 1] - gx[i - 1][j - 1][k - 1]) * invdx;
+        const double compY = .25 * (gy[i][j][k] - gy[i][j - 1][k]) * invdy + .25 * (gy[i][j][k - 1] - gy[i][j - 1][k - 1]) * invdy + .25 * (gy[i - 1][j][k] - gy[i - 1][j - 1][k]) * invdy + .25 * (gy[i - 1][j][k - 1] - gy[i - 1][j - 1][k - 1]) * invdy;
+        const double compZ = .25 * (gz[i][j][k] - gz[i][j][k - 1]) * invdz + .25 * (gz[i - 1][j][k] - gz[i - 1][j][k - 1]) * invdz + .25 * (gz[i][j - 1][k] - gz[i][j - 1][k - 1]) * invdz + .25 * (gz[i - 1][j - 1][k] - gz[i - 1][j - 1][k - 1]) * invdz;
+        // same operations, in the same order, as lapN2N, neg, sub, scale and sum
+        double image = -(compX + compY + compZ);
+        image = image - graddiv[n];
+        image *= delt2;
+        image += D[n][i][j][k];
+        image += vect[n][i][j][k];
+        *out++ = image;
+      }
+    }
+  }
+}
+
+/*! Image of the Maxwell operator, in two sweeps over the planes of the
+    subdomain with one halo exchange between them: the first sweep computes
+    the gradients of E(n + theta) and the divergence of mu dot E(n + theta)
+    on the centres, the second the image on the nodes. With local the halo
+    exchange is replaced by zero guard cells, which gives the operator of
+    the subdomain alone. */
+void EMfields3D::applyMaxwellOperator(double *im, double* vector, bool local)
+{
+  // The centre plane i needs the node planes i and i+1. Each thread
+  // computes the nodes of its planes of centres one plane ahead of the
+  // centres, so that they are still in cache; the first node plane of a
+  // thread is the last one of the previous thread, computed before the
+  // barrier.
+  #pragma omp parallel
+  {
+    const int nthreads = omp_get_num_threads();
+    const int thread = omp_get_thread_num();
+    const int planes = nxc - 2;
+    const int first = 1 + (planes * thread) / nthreads;
+    const int last = (planes * (thread + 1)) / nthreads;
+    if (first <= last)
+      MaxwellImageNodes(last + 1, vector);
+    #pragma omp barrier
+    if (first == 1 && first <= last)
+      MaxwellImageNodes(1, vector);
+    for (int i = first; i <= last; i++) {
+      if (i < last)
+        MaxwellImageNodes(i + 1, vector);
+      MaxwellImageCenters(i);
+    }
+  }
+  if (local) {
+    zeroGuardCells(gradXxC, nxc, nyc, nzc);
+    zeroGuardCells(gradXyC, nxc, nyc, nzc);
+    zeroGuardCells(gradXzC, nxc, nyc, nzc);
+    zeroGuardCells(gradYxC, nxc, nyc, nzc);
+    zeroGuardCells(gradYyC, nxc, nyc, nzc);
+    zeroGuardCells(gradYzC, nxc, nyc, nzc);
+    zeroGuardCells(gradZxC, nxc, nyc, nzc);
+    zeroGuardCells(gradZyC, nxc, nyc, nzc);
+    zeroGuardCells(gradZzC, nxc, nyc, nzc);
+    zeroGuardCells(divC, nxc, nyc, nzc);
+  }
+  else
+    haloImage.exchange();
+  // OpenBoundaryInflowEImage of the composed image only sets ghost nodes,
+  // which are not in the Krylov vector
+  #pragma omp parallel for schedule(static)
+  for (int i = 1; i < nxn - 1; i++)
+    MaxwellImageResult(i, im);
+}
+
 /*! Calculate PI dot (vectX, vectY, vectZ) */
 void EMfields3D::PIdot(arr3_double PIdotX, arr3_double PIdotY, arr3_double PIdotZ, const_arr3_double vectX, const_arr3_double vectY, const_arr3_double vectZ, int ns)
 {
@@ -2310,136 +2718,17 @@ void EMfields3D::MUdot(arr3_double MUdotX, arr3_double MUdotY, arr3_double MUdot
         }
   }
 }
-/* Interpolation smoothing: Smoothing (vector must already have ghost cells) TO MAKE SMOOTH value as to be different from 1.0 type = 0 --> center based vector ; type = 1 --> node based vector ; */
-void EMfields3D::smooth(arr3_double vector, int type)
-{
-  if(Smooth==1.0) return;
-  const Collective *col = &get_col();
-  const VirtualTopology3D *vct = &get_vct();
-  const Grid *grid = &get_grid();
-
-  double alpha   = Smooth;
-  double beta3D  = (1-alpha)/6.0;
-  double beta2D  = (1-alpha)/4.0;
-  int nx, ny, nz;
-
-  if (col->getVerbose() and vct->getCartesian_rank() == 0)
-    cout << "*** smooth rho,Jx,Jy,Jz "<< SmoothNiter <<" times, strength (in range 0-1) = "<< 1.-alpha <<" ***" << endl;
-    
-  switch (type) {
-  	  case (0):
-			   nx = grid->getNXC();
-			   ny = grid->getNYC();
-			   nz = grid->getNZC();
-			   break;
-  	  case (1):
-			   nx = grid->getNXN();
-			   ny = grid->getNYN();
-			   nz = grid->getNZN();
-			   break;
-  }
-  double ***temp = newArr3(double, nx, ny, nz);
-  for (int icount = 1; icount < SmoothNiter + 1; icount++) {
-      switch (type) {
-        case (0):
-          communicateCenterBoxStencilBC_P(nx, ny, nz, vector, 2, 2, 2, 2, 2, 2, vct, this);
-          break;
-        case (1):
-          communicateNodeBoxStencilBC_P(nx, ny, nz, vector, 2, 2, 2, 2, 2, 2, vct, this);
-          break;
-      }
-
-      for (int i = 1; i < nx - 1; i++)
-        for (int j = 1; j < ny - 1; j++)
-          for (int k = 1; k < nz - 1; k++){
-            if ( nyn>1 ) 
-              temp[i][j][k] = alpha * vector[i][j][k] + beta3D * (vector[i - 1][j][k] + vector[i + 1][j][k] + vector[i][j - 1][k] + vector[i][j + 1][k] + vector[i][j][k - 1] + vector[i][j][k + 1]);
-            else
-              temp[i][j][k] = alpha * vector[i][j][k] + beta2D * (vector[i - 1][j][k] + vector[i + 1][j][k] + vector[i][j][k - 1] + vector[i][j][k + 1]);//2D smooth in XZ dimension
-          }
-              //temp[i][j][k] = alpha * vector[i][j][k] + beta2D * (vector[i - 1][j][k] + vector[i + 1][j][k] + vector[i][j-1][k] + vector[i][j+1][k]);//2D smooth in XY dimension
-
-      for (int i = 1; i < nx - 1; i++)
-        for (int j = 1; j < ny - 1; j++)
-          for (int k = 1; k < nz - 1; k++)
-            vector[i][j][k] = temp[i][j][k];
-
-  }
-  delArr3(temp, nx, ny);
-}
-
-/* Interpolation smoothing: Smoothing (vector must already have ghost cells)
- * TO MAKE SMOOTH value as to be different from 1.0 type = 0 --> center based vector ; type = 1 --> node based vector ; */
+/*! smooth the electric field */
 void EMfields3D::smoothE()
 {
   if(Smooth==1.0) return;
   const Collective *col = &get_col();
   const VirtualTopology3D *vct = &get_vct();
 
-  double alpha   = Smooth;
-  double beta3D  = (1-alpha)/6.0;
-  double beta2D  = (1-alpha)/4.0;
-
-  double ***temp = newArr3(double, nxn, nyn, nzn);
-
   if (col->getVerbose() and vct->getCartesian_rank() == 0)
-    cout << "*** smoothE "<< SmoothNiter <<" times, strength (in range 0-1) = "<< 1.-alpha <<" ***" << endl;
-
-  for (int icount = 1; icount < SmoothNiter + 1; icount++) {
-      communicateNodeBoxStencilBC(nxn, nyn, nzn, Ex, col->bcEx[0],col->bcEx[1],col->bcEx[2],col->bcEx[3],col->bcEx[4],col->bcEx[5], vct, this);
-      communicateNodeBoxStencilBC(nxn, nyn, nzn, Ey, col->bcEy[0],col->bcEy[1],col->bcEy[2],col->bcEy[3],col->bcEy[4],col->bcEy[5], vct, this);
-      communicateNodeBoxStencilBC(nxn, nyn, nzn, Ez, col->bcEz[0],col->bcEz[1],col->bcEz[2],col->bcEz[3],col->bcEz[4],col->bcEz[5], vct, this);
-
-      // Exth
-      for (int i = 1; i < nxn - 1; i++)
-        for (int j = 1; j < nyn - 1; j++)
-          for (int k = 1; k < nzn - 1; k++){
-              if ( nyn>1 )
-                temp[i][j][k] = alpha * Ex[i][j][k] + beta3D * (Ex[i - 1][j][k] + Ex[i + 1][j][k] + Ex[i][j - 1][k] + Ex[i][j + 1][k] + Ex[i][j][k - 1] + Ex[i][j][k + 1]);
-              else
-      	      temp[i][j][k] = alpha * Ex[i][j][k] + beta2D * (Ex[i - 1][j][k] + Ex[i + 1][j][k] + Ex[i][j][k - 1] + Ex[i][j][k + 1]);//2D smooth in XZ dimension
-              //temp[i][j][k] = alpha * Ex[i][j][k] + beta2D * (Ex[i - 1][j][k] + Ex[i + 1][j][k] + Ex[i][j-1][k] + Ex[i][j+1][k]);//2D smooth in XY dimension
-          }
+    cout << "*** smoothE "<< SmoothNiter <<" times, strength (in range 0-1) = "<< 1.-Smooth <<" ***" << endl;
 
-      for (int i = 1; i < nxn - 1; i++)
-        for (int j = 1; j < nyn - 1; j++)
-          for (int k = 1; k < nzn - 1; k++)
-            Ex[i][j][k] = temp[i][j][k];
-
-      // Eyth
-      for (int i = 1; i < nxn - 1; i++)
-        for (int j = 1; j < nyn - 1; j++)
-          for (int k = 1; k < nzn - 1; k++){
-                 if ( nyn>1 )
-	           temp[i][j][k] = alpha * Ey[i][j][k] + beta3D * (Ey[i - 1][j][k] + Ey[i + 1][j][k] + Ey[i][j - 1][k] + Ey[i][j + 1][k] + Ey[i][j][k - 1] + Ey[i][j][k + 1]);
-                 else
-                   temp[i][j][k] = alpha * Ey[i][j][k] + beta2D * (Ey[i - 1][j][k] + Ey[i + 1][j][k] + Ey[i][j][k - 1] + Ey[i][j][k + 1]);//2D smooth in XZ dimension
-	           //temp[i][j][k] = alpha * Ey[i][j][k] + beta2D * (Ey[i - 1][j][k] + Ey[i + 1][j][k] + Ey[i][j-1][k]   + Ey[i][j+1][k]);//2D smooth in XY dimension
-          }
- 
-      for (int i = 1; i < nxn - 1; i++)
-        for (int j = 1; j < nyn - 1; j++)
-          for (int k = 1; k < nzn - 1; k++)
-            Ey[i][j][k] = temp[i][j][k];
-
-      // Ezth
-      for (int i = 1; i < nxn - 1; i++)
-        for (int j = 1; j < nyn - 1; j++)
-          for (int k = 1; k < nzn - 1; k++){
-             if ( nyn>1 )
-               temp[i][j][k] = alpha * Ez[i][j][k] + beta3D * (Ez[i - 1][j][k] + Ez[i + 1][j][k] + Ez[i][j - 1][k] + Ez[i][j + 1][k] + Ez[i][j][k - 1] + Ez[i][j][k + 1]);
-             else
-               temp[i][j][k] = alpha * Ez[i][j][k] + beta2D * (Ez[i - 1][j][k] + Ez[i + 1][j][k] + Ez[i][j][k - 1] + Ez[i][j][k + 1]);//2D smooth in XZ dimension
-	       //temp[i][j][k] = alpha * Ez[i][j][k] + beta2D * (Ez[i - 1][j][k] + Ez[i + 1][j][k] + Ez[i][j-1][k]   + Ez[i][j+1][k]);//2D smooth in XY dimension
-          }
-
-      for (int i = 1; i < nxn - 1; i++)
-        for (int j = 1; j < nyn - 1; j++)
-          for (int k = 1; k < nzn - 1; k++)
-            Ez[i][j][k] = temp[i][j][k];
-
-  }
-  delArr3(temp, nxn, nyn);
+  smootherE.smooth();
 }
 
 
@@ -2911,9 +3200,7 @@ void EMfields3D::calculateB()
   addscale(-c * dt, 1, Bzc, tempZC, nxc, nyc, nzc);
 
   // communicate ghost 
-  communicateCenterBC(nxc, nyc, nzc, Bxc, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct,this);
-  communicateCenterBC(nxc, nyc, nzc, Byc, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct,this);
-  communicateCenterBC(nxc, nyc, nzc, Bzc, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct,this);
+  haloBc.exchange();
 
   // OpenBC:
   OpenBoundaryInflowB(Bxc,Byc,Bzc,nxc,nyc,nzc);
@@ -2923,36 +3210,31 @@ void EMfields3D::calculateB()
   grid->interpC2N(Byn, Byc);
   grid->interpC2N(Bzn, Bzc);
 
-  communicateNodeBC(nxn, nyn, nzn, Bxn, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Byn, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Bzn, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct, this);
+  haloBn.exchange();
 
   // Adjust B after BC by applying divergence cleaning, laplacian(PSI) = div(B), B = B - grad(PSI)
   // START
   
-  array3_double divB     (nxc, nyc, nzc);
-  array3_double gradPSIX (nxn, nyn, nzn);
-  array3_double gradPSIY (nxn, nyn, nzn);
-  array3_double gradPSIZ (nxn, nyn, nzn);
+  arr3_double divB = tempXC;
+  arr3_double gradPSIX = tempXN;
+  arr3_double gradPSIY = tempYN;
+  arr3_double gradPSIZ = tempZN;
 
-  double *xkrylovPoisson = new double[(nxc - 2) * (nyc - 2) * (nzc - 2)];
-  double *bkrylovPoisson = new double[(nxc - 2) * (nyc - 2) * (nzc - 2)];
-  
   eqValue(0.0, divB, nxc, nyc, nzc);
   eqValue(0.0, gradPSIX, nxn, nyn, nzn);
   eqValue(0.0, gradPSIY, nxn, nyn, nzn);
   eqValue(0.0, gradPSIZ, nxn, nyn, nzn);
-  eqValue(0.0, xkrylovPoisson, (nxc - 2) * (nyc - 2) * (nzc - 2));
 
   // compute divB
   grid->divN2C(divB, Bxn, Byn, Bzn);
   // move to krylov space the RHS
   phys2solver(bkrylovPoisson, divB, nxc, nyc, nzc);
-  // compute solution poisson lapl(PSI)=0 using GMRES
-  if (col->getVerbose() and vct->getCartesian_rank() == 0) cout << "*** DIVERGENCE CLEANING div(B)=0 using GMRes***" << endl;
-  GMRES(&Field::PoissonImage, xkrylovPoisson, (nxc - 2) * (nyc - 2) * (nzc - 2), bkrylovPoisson, 20, 200, GMREStol, this);
+  // compute solution poisson lapl(PSI)=0 using GMRES,
+  // starting from the solution of the last cycle
+  if (col->getVerbose() and vct->getCartesian_rank() == 0) cout << "*** DIVERGENCE CLEANING div(B)=0 using " << col->getPoissonSolver() << "***" << endl;
+  solvePoisson(xkrylovPSI, &statsPoissonB);
   // solution back to physical space 
-  solver2phys(PSI, xkrylovPoisson, nxc, nyc, nzc);
+  solver2phys(PSI, xkrylovPSI, nxc, nyc, nzc);
   communicateCenterBC(nxc, nyc, nzc, PSI, 2, 2, 2, 2, 2, 2, vct,this);
   // calculate the gradient
   grid->gradC2N(gradPSIX, gradPSIY, gradPSIZ, PSI);
@@ -3020,9 +3302,7 @@ void EMfields3D::calculateB()
   // END
 
   // communicate ghost
-  communicateNodeBC(nxn, nyn, nzn, Bxn, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Byn, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct, this);
-  communicateNodeBC(nxn, nyn, nzn, Bzn, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct, this);
+  haloBn.exchange();
   
   // correct B on centers
   grid->interpN2C(Bxc, Bxn);
@@ -3030,9 +3310,7 @@ void EMfields3D::calculateB()
   grid->interpN2C(Bzc, Bzn);
 
   // communicate ghost
-  communicateCenterBC(nxc, nyc, nzc, Bxc, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct,this);
-  communicateCenterBC(nxc, nyc, nzc, Byc, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct,this);
-  communicateCenterBC(nxc, nyc, nzc, Bzc, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct,this);
+  haloBc.exchange();
  
 }
 
@@ -3122,7 +3400,9 @@ void EMfields3D::calculateHatFunctions()
   const VirtualTopology3D *vct = &get_vct();
   const Grid *grid = &get_grid();
   // smoothing
-  smooth(rhoc, 0);
+  if (Smooth != 1.0 and get_col().getVerbose() and vct->getCartesian_rank() == 0)
+    cout << "*** smooth rho,Jx,Jy,Jz "<< SmoothNiter <<" times, strength (in range 0-1) = "<< 1.-Smooth <<" ***" << endl;
+  smootherRhoc.smooth();
   // calculate j hat
 
   for (int is = 0; is < ns; is++) {
@@ -3147,9 +3427,7 @@ void EMfields3D::calculateHatFunctions()
 
   }
   // smooth j
-  smooth(Jxh, 1);
-  smooth(Jyh, 1);
-  smooth(Jzh, 1);
+  smootherJh.smooth();
 
   // calculate rho hat = rho - (dt*theta)div(jhat)
   grid->divN2C(tempXC, Jxh, Jyh, Jzh);
@@ -3165,18 +3443,29 @@ void EMfields3D::PoissonImage(double *image, double *vector)
   const VirtualTopology3D *vct = &get_vct();
   const Grid *grid = &get_grid();
 
-  // allocate 2 three dimensional service vectors
-  array3_double temp(nxc, nyc, nzc);
-  array3_double im(nxc, nyc, nzc);
-  eqValue(0.0, image, (nxc - 2) * (nyc - 2) * (nzc - 2));
-  eqValue(0.0, temp, nxc, nyc, nzc);
-  eqValue(0.0, im, nxc, nyc, nzc);
+  // the laplacian is computed on the interior cells only, so the
+  // image does not need to be cleared; the ghost cells of the
+  // vector are cleared before the boundary conditions are applied
+  eqValue(0.0, tempPoisson, nxc, nyc, nzc);
   // move from krylov space to physical space and communicate ghost cells
-  solver2phys(temp, vector, nxc, nyc, nzc);
+  solver2phys(tempPoisson, vector, nxc, nyc, nzc);
   // calculate the laplacian
-  grid->lapC2Cpoisson(im, temp, this);
+  grid->lapC2Cpoisson(imagePoisson, tempPoisson, this);
   // move from physical space to krylov space
-  phys2solver(image, im, nxc, nyc, nzc);
+  phys2solver(image, imagePoisson, nxc, nyc, nzc);
+}
+/*! Solve the Poisson problem of a divergence cleaning, lap(x) = bkrylovPoisson */
+void EMfields3D::solvePoisson(double *xkrylov, KrylovStats *stats)
+{
+  const int lenPoisson = (nxc - 2) * (nyc - 2) * (nzc - 2);
+  if (!poissonMultigrid)
+    GMRES(&Field::PoissonImage, xkrylov, lenPoisson, bkrylovPoisson, 20, 200, GMREStol, this,
+      &krylovWorkspace, stats);
+  else if (PoissonMultigridGMRES)
+    GMRES(&Field::PoissonImage, xkrylov, lenPoisson, bkrylovPoisson, 20, 200, GMREStol, this,
+      &krylovWorkspace, stats, poissonMultigrid);
+  else
+    poissonMultigrid->solve(xkrylov, bkrylovPoisson, GMREStol, 200, stats);
 }
 /*! interpolate charge density and pressure density from node to center */
 void EMfields3D::interpDensitiesN2C()
@@ -3393,7 +3682,10 @@ void EMfields3D::init()
   #ifdef NO_HDF5
     eprintf("restart requires compiling with HDF5");
   #else
-    col->read_field_restart(vct,grid,Bxn,Byn,Bzn,Ex,Ey,Ez,&rhons,ns);
+    if (col->getRestartMethod() == "shared")
+      ReadSharedRestartFields(col,vct,grid,Bxn,Byn,Bzn,Ex,Ey,Ez,&rhons,ns);
+    else
+      col->read_field_restart(vct,grid,Bxn,Byn,Bzn,Ex,Ey,Ez,&rhons,ns);
 
     // communicate species densities to ghost nodes
     for (int is = 0; is < ns; is++) {
@@ -3416,9 +3708,7 @@ void EMfields3D::init()
     }*/ // commented this part since I do not see its utility F. Lavorenti
 
     // communicate ghost
-    communicateNodeBC(nxn, nyn, nzn, Bxn, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct, this);
-    communicateNodeBC(nxn, nyn, nzn, Byn, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct, this);
-    communicateNodeBC(nxn, nyn, nzn, Bzn, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct, this);
+    haloBn.exchange();
 
     // initialize B on centers
     grid->interpN2C(Bxc, Bxn);
@@ -3426,9 +3716,7 @@ void EMfields3D::init()
     grid->interpN2C(Bzc, Bzn);
 
     // communicate ghost
-    communicateCenterBC(nxc, nyc, nzc, Bxc, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct,this);
-    communicateCenterBC(nxc, nyc, nzc, Byc, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct,this);
-    communicateCenterBC(nxc, nyc, nzc, Bzc, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct,this);
+    haloBc.exchange();
 
     // communicate E
     communicateNodeBC(nxn, nyn, nzn, Ex, col->bcEx[0],col->bcEx[1],col->bcEx[2],col->bcEx[3],col->bcEx[4],col->bcEx[5], vct, this);
@@ -3879,9 +4167,7 @@ void EMfields3D::initDoublePeriodicHarrisWithGaussianHumpPerturbation()
           Bzn[i][j][k] = B0z;
         }
     // communicate ghost
-    communicateNodeBC(nxn, nyn, nzn, Bxn, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct, this);
-    communicateNodeBC(nxn, nyn, nzn, Byn, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct, this);
-    communicateNodeBC(nxn, nyn, nzn, Bzn, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct, this);
+    haloBn.exchange();
 
     // initialize B on centers
     for (int i = 0; i < nxc; i++)
@@ -3911,9 +4197,7 @@ void EMfields3D::initDoublePeriodicHarrisWithGaussianHumpPerturbation()
           Bzc[i][j][k] = B0z;
         }
     // communicate ghost
-    communicateCenterBC(nxc, nyc, nzc, Bxc, col->bcBx[0],col->bcBx[1],col->bcBx[2],col->bcBx[3],col->bcBx[4],col->bcBx[5], vct,this);
-    communicateCenterBC(nxc, nyc, nzc, Byc, col->bcBy[0],col->bcBy[1],col->bcBy[2],col->bcBy[3],col->bcBy[4],col->bcBy[5], vct,this);
-    communicateCenterBC(nxc, nyc, nzc, Bzc, col->bcBz[0],col->bcBz[1],col->bcBz[2],col->bcBz[3],col->bcBz[4],col->bcBz[5], vct,this);
+    haloBc.exchange();
     for (int is = 0; is < ns; is++)
       grid->interpN2C(rhocs, is, rhons);
   }
@@ -4672,60 +4956,48 @@ void EMfields3D::perfectConductorLeft(arr3_double imageX, arr3_double imageY, ar
   const_arr3_double vectorX, const_arr3_double vectorY, const_arr3_double vectorZ,
   int dir)
 {
-  double** susxy;
-  double** susyy;
-  double** suszy;
-  double** susxx;
-  double** susyx;
-  double** suszx;
-  double** susxz;
-  double** susyz;
-  double** suszz;
   switch(dir){
     case 0:  // boundary condition on X-DIRECTION 
-      susxx = newArr2(double,nyn,nzn);
-      susyx = newArr2(double,nyn,nzn);
-      suszx = newArr2(double,nyn,nzn);
-      sustensorLeftX(susxx, susyx, suszx);
-      for (int i=1; i <  nyn-1;i++)
-        for (int j=1; j <  nzn-1;j++){
-          imageX[1][i][j] = vectorX.get(1,i,j) - (Ex[1][i][j] - susyx[i][j]*vectorY.get(1,i,j) - suszx[i][j]*vectorZ.get(1,i,j) - Jxh[1][i][j]*dt*th*FourPI)/susxx[i][j];
-          imageY[1][i][j] = vectorY.get(1,i,j) - 0.0*vectorY.get(2,i,j);
-          imageZ[1][i][j] = vectorZ.get(1,i,j) - 0.0*vectorZ.get(2,i,j);
-        }
-      delArr2(susxx,nxn);
-      delArr2(susyx,nxn);
-      delArr2(suszx,nxn);
+      {
+        array2_double susxx(nyn, nzn);
+        array2_double susyx(nyn, nzn);
+        array2_double suszx(nyn, nzn);
+        sustensorLeftX(susxx.fetch_arr2(), susyx.fetch_arr2(), suszx.fetch_arr2());
+        for (int i=1; i <  nyn-1;i++)
+          for (int j=1; j <  nzn-1;j++){
+            imageX[1][i][j] = vectorX.get(1,i,j) - (Ex[1][i][j] - susyx[i][j]*vectorY.get(1,i,j) - suszx[i][j]*vectorZ.get(1,i,j) - Jxh[1][i][j]*dt*th*FourPI)/susxx[i][j];
+            imageY[1][i][j] = vectorY.get(1,i,j) - 0.0*vectorY.get(2,i,j);
+            imageZ[1][i][j] = vectorZ.get(1,i,j) - 0.0*vectorZ.get(2,i,j);
+          }
+      }
       break;
     case 1: // boundary condition on Y-DIRECTION
-      susxy = newArr2(double,nxn,nzn);
-      susyy = newArr2(double,nxn,nzn);
-      suszy = newArr2(double,nxn,nzn);
-      sustensorLeftY(susxy, susyy, suszy);
-      for (int i=1; i < nxn-1;i++)
-        for (int j=1; j <  nzn-1;j++){
-          imageX[i][1][j] = vectorX.get(i,1,j) - 0.0*vectorX.get(i,2,j);
-          imageY[i][1][j] = vectorY.get(i,1,j) - (Ey[i][1][j] - susxy[i][j]*vectorX.get(i,1,j) - suszy[i][j]*vectorZ.get(i,1,j) - Jyh[i][1][j]*dt*th*FourPI)/susyy[i][j];
-          imageZ[i][1][j] = vectorZ.get(i,1,j) - 0.0*vectorZ.get(i,2,j);
-        }
-      delArr2(susxy,nxn);
-      delArr2(susyy,nxn);
-      delArr2(suszy,nxn);
+      {
+        array2_double susxy(nxn, nzn);
+        array2_double susyy(nxn, nzn);
+        array2_double suszy(nxn, nzn);
+        sustensorLeftY(susxy.fetch_arr2(), susyy.fetch_arr2(), suszy.fetch_arr2());
+        for (int i=1; i < nxn-1;i++)
+          for (int j=1; j <  nzn-1;j++){
+            imageX[i][1][j] = vectorX.get(i,1,j) - 0.0*vectorX.get(i,2,j);
+            imageY[i][1][j] = vectorY.get(i,1,j) - (Ey[i][1][j] - susxy[i][j]*vectorX.get(i,1,j) - suszy[i][j]*vectorZ.get(i,1,j) - Jyh[i][1][j]*dt*th*FourPI)/susyy[i][j];
+            imageZ[i][1][j] = vectorZ.get(i,1,j) - 0.0*vectorZ.get(i,2,j);
+          }
+      }
       break;
     case 2: // boundary condition on Z-DIRECTION
-      susxz = newArr2(double,nxn,nyn);
-      susyz = newArr2(double,nxn,nyn);
-      suszz = newArr2(double,nxn,nyn);
-      sustensorLeftZ(susxz, susyz, suszz);
-      for (int i=1; i <  nxn-1;i++)
-        for (int j=1; j <  nyn-1;j++){
-          imageX[i][j][1] = vectorX.get(i,j,1);
-          imageY[i][j][1] = vectorX.get(i,j,1);
-          imageZ[i][j][1] = vectorZ.get(i,j,1) - (Ez[i][j][1] - susxz[i][j]*vectorX.get(i,j,1) - susyz[i][j]*vectorY.get(i,j,1) - Jzh[i][j][1]*dt*th*FourPI)/suszz[i][j];
-        }
-      delArr2(susxz,nxn);
-      delArr2(susyz,nxn);
-      delArr2(suszz,nxn);
+      {
+        array2_double susxz(nxn, nyn);
+        array2_double susyz(nxn, nyn);
+        array2_double suszz(nxn, nyn);
+        sustensorLeftZ(susxz.fetch_arr2(), susyz.fetch_arr2(), suszz.fetch_arr2());
+        for (int i=1; i <  nxn-1;i++)
+          for (int j=1; j <  nyn-1;j++){
+            imageX[i][j][1] = vectorX.get(i,j,1);
+            imageY[i][j][1] = vectorX.get(i,j,1);
+            imageZ[i][j][1] = vectorZ.get(i,j,1) - (Ez[i][j][1] - susxz[i][j]*vectorX.get(i,j,1) - susyz[i][j]*vectorY.get(i,j,1) - Jzh[i][j][1]*dt*th*FourPI)/suszz[i][j];
+          }
+      }
       break;
   }
 }
@@ -4739,60 +5011,48 @@ void EMfields3D::perfectConductorRight(
   int dir)
 {
   double beta, omcx, omcy, omcz, denom;
-  double** susxy;
-  double** susyy;
-  double** suszy;
-  double** susxx;
-  double** susyx;
-  double** suszx;
-  double** susxz;
-  double** susyz;
-  double** suszz;
   switch(dir){
     case 0: // boundary condition on X-DIRECTION RIGHT
-      susxx = newArr2(double,nyn,nzn);
-      susyx = newArr2(double,nyn,nzn);
-      suszx = newArr2(double,nyn,nzn);
-      sustensorRightX(susxx, susyx, suszx);
-      for (int i=1; i < nyn-1;i++)
-        for (int j=1; j <  nzn-1;j++){
-          imageX[nxn-2][i][j] = vectorX.get(nxn-2,i,j) - (Ex[nxn-2][i][j] - susyx[i][j]*vectorY.get(nxn-2,i,j) - suszx[i][j]*vectorZ.get(nxn-2,i,j) - Jxh[nxn-2][i][j]*dt*th*FourPI)/susxx[i][j];
-          imageY[nxn-2][i][j] = vectorY.get(nxn-2,i,j) - 0.0 * vectorY.get(nxn-3,i,j);
-          imageZ[nxn-2][i][j] = vectorZ.get(nxn-2,i,j) - 0.0 * vectorZ.get(nxn-3,i,j);
-        }
-      delArr2(susxx,nxn);
-      delArr2(susyx,nxn);       
-      delArr2(suszx,nxn);
+      {
+        array2_double susxx(nyn, nzn);
+        array2_double susyx(nyn, nzn);
+        array2_double suszx(nyn, nzn);
+        sustensorRightX(susxx.fetch_arr2(), susyx.fetch_arr2(), suszx.fetch_arr2());
+        for (int i=1; i < nyn-1;i++)
+          for (int j=1; j <  nzn-1;j++){
+            imageX[nxn-2][i][j] = vectorX.get(nxn-2,i,j) - (Ex[nxn-2][i][j] - susyx[i][j]*vectorY.get(nxn-2,i,j) - suszx[i][j]*vectorZ.get(nxn-2,i,j) - Jxh[nxn-2][i][j]*dt*th*FourPI)/susxx[i][j];
+            imageY[nxn-2][i][j] = vectorY.get(nxn-2,i,j) - 0.0 * vectorY.get(nxn-3,i,j);
+            imageZ[nxn-2][i][j] = vectorZ.get(nxn-2,i,j) - 0.0 * vectorZ.get(nxn-3,i,j);
+          }
+      }
       break;
     case 1: // boundary condition on Y-DIRECTION RIGHT
-      susxy = newArr2(double,nxn,nzn);
-      susyy = newArr2(double,nxn,nzn);
-      suszy = newArr2(double,nxn,nzn);
-      sustensorRightY(susxy, susyy, suszy);
-      for (int i=1; i < nxn-1;i++)
-        for (int j=1; j < nzn-1;j++){
-          imageX[i][nyn-2][j] = vectorX.get(i,nyn-2,j) - 0.0*vectorX.get(i,nyn-3,j);
-          imageY[i][nyn-2][j] = vectorY.get(i,nyn-2,j) - (Ey[i][nyn-2][j] - susxy[i][j]*vectorX.get(i,nyn-2,j) - suszy[i][j]*vectorZ.get(i,nyn-2,j) - Jyh[i][nyn-2][j]*dt*th*FourPI)/susyy[i][j];
-          imageZ[i][nyn-2][j] = vectorZ.get(i,nyn-2,j) - 0.0*vectorZ.get(i,nyn-3,j);
-        }
-      delArr2(susxy,nxn);
-      delArr2(susyy,nxn);
-      delArr2(suszy,nxn);
+      {
+        array2_double susxy(nxn, nzn);
+        array2_double susyy(nxn, nzn);
+        array2_double suszy(nxn, nzn);
+        sustensorRightY(susxy.fetch_arr2(), susyy.fetch_arr2(), suszy.fetch_arr2());
+        for (int i=1; i < nxn-1;i++)
+          for (int j=1; j < nzn-1;j++){
+            imageX[i][nyn-2][j] = vectorX.get(i,nyn-2,j) - 0.0*vectorX.get(i,nyn-3,j);
+            imageY[i][nyn-2][j] = vectorY.get(i,nyn-2,j) - (Ey[i][nyn-2][j] - susxy[i][j]*vectorX.get(i,nyn-2,j) - suszy[i][j]*vectorZ.get(i,nyn-2,j) - Jyh[i][nyn-2][j]*dt*th*FourPI)/susyy[i][j];
+            imageZ[i][nyn-2][j] = vectorZ.get(i,nyn-2,j) - 0.0*vectorZ.get(i,nyn-3,j);
+          }
+      }
       break;
     case 2: // boundary condition on Z-DIRECTION RIGHT
-      susxz = newArr2(double,nxn,nyn);
-      susyz = newArr2(double,nxn,nyn);
-      suszz = newArr2(double,nxn,nyn);
-      sustensorRightZ(susxz, susyz, suszz);
-      for (int i=1; i < nxn-1;i++)
-        for (int j=1; j < nyn-1;j++){
-          imageX[i][j][nzn-2] = vectorX.get(i,j,nzn-2);
-          imageY[i][j][nzn-2] = vectorY.get(i,j,nzn-2);
-          imageZ[i][j][nzn-2] = vectorZ.get(i,j,nzn-2) - (Ez[i][j][nzn-2] - susxz[i][j]*vectorX.get(i,j,nzn-2) - susyz[i][j]*vectorY.get(i,j,nzn-2) - Jzh[i][j][nzn-2]*dt*th*FourPI)/suszz[i][j];
-        }
-      delArr2(susxz,nxn);
-      delArr2(susyz,nxn);       
-      delArr2(suszz,nxn);
+      {
+        array2_double susxz(nxn, nyn);
+        array2_double susyz(nxn, nyn);
+        array2_double suszz(nxn, nyn);
+        sustensorRightZ(susxz.fetch_arr2(), susyz.fetch_arr2(), suszz.fetch_arr2());
+        for (int i=1; i < nxn-1;i++)
+          for (int j=1; j < nyn-1;j++){
+            imageX[i][j][nzn-2] = vectorX.get(i,j,nzn-2);
+            imageY[i][j][nzn-2] = vectorY.get(i,j,nzn-2);
+            imageZ[i][j][nzn-2] = vectorZ.get(i,j,nzn-2) - (Ez[i][j][nzn-2] - susxz[i][j]*vectorX.get(i,j,nzn-2) - susyz[i][j]*vectorY.get(i,j,nzn-2) - Jzh[i][j][nzn-2]*dt*th*FourPI)/suszz[i][j];
+          }
+      }
       break;
   }
 }
@@ -5446,6 +5706,14 @@ EMfields3D::~EMfields3D() {
   delete [] rhoINIT;
   for(int i=0;i<sizeMomentsArray;i++) { delete moments10Array[i]; }
   delete [] moments10Array;
+  delete momentsCheckArray;
+  delete [] xkrylovMaxwell;
+  delete [] bkrylovMaxwell;
+  delete [] xkrylovPHI;
+  delete [] xkrylovPSI;
+  delete [] bkrylovPoisson;
+  delete maxwellPreconditioner;
+  delete poissonMultigrid;
   freeDataType();
 }
 
@@ -0,0 +1,255 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <mpi.h>
+#include <assert.h>
+#include <algorithm>
+#include "Smoother.h"
+#include "Alloc.h"
+#include "VCtopology3D.h"
+
+/* layers of ghost cells of the buffers: the number of passes, as long as
+   the planes sent to the neighbours are in the interior of the subdomain */
+static int smoother_width(int nx, int ny, int nz, bool isCenter, int niter)
+{
+  const int offset = isCenter ? 0 : 1;
+  int width = niter;
+  width = std::min(width, nx - 2 - offset);
+  width = std::min(width, ny - 2 - offset);
+  width = std::min(width, nz - 2 - offset);
+  return std::max(width, 1);
+}
+
+/* cell p of the plane normal to direction d, q and s along the two other directions */
+static inline double &plane_cell(double ***a, int d, int p, int q, int s)
+{
+  if (d == 0)
+    return a[p][q][s];
+  if (d == 1)
+    return a[q][p][s];
+  return a[q][s][p];
+}
+
+Smoother::Smoother(const VirtualTopology3D *vct_, int nx, int ny, int nz,
+  bool isCenter, bool isParticle, double alpha_, int niter_, bool is3D_) :
+  vct(vct_),
+  alpha(alpha_),
+  niter(niter_),
+  is3D(is3D_),
+  width(smoother_width(nx, ny, nz, isCenter, niter_)),
+  haloA(vct_, nx + 2 * (width - 1), ny + 2 * (width - 1), nz + 2 * (width - 1),
+    isCenter, false, width, isParticle),
+  haloB(vct_, nx + 2 * (width - 1), ny + 2 * (width - 1), nz + 2 * (width - 1),
+    isCenter, false, width, isParticle),
+  src(0),
+  dst(0)
+{
+  nf[0] = nx;
+  nf[1] = ny;
+  nf[2] = nz;
+  for (int d = 0; d < 3; d++)
+    n[d] = nf[d] + 2 * (width - 1);
+  if (isParticle) {
+    neighbor[0][0] = vct->getXleft_neighbor_P() != MPI_PROC_NULL;
+    neighbor[0][1] = vct->getYleft_neighbor_P() != MPI_PROC_NULL;
+    neighbor[0][2] = vct->getZleft_neighbor_P() != MPI_PROC_NULL;
+    neighbor[1][0] = vct->getXright_neighbor_P() != MPI_PROC_NULL;
+    neighbor[1][1] = vct->getYright_neighbor_P() != MPI_PROC_NULL;
+    neighbor[1][2] = vct->getZright_neighbor_P() != MPI_PROC_NULL;
+  }
+  else {
+    neighbor[0][0] = vct->getXleft_neighbor() != MPI_PROC_NULL;
+    neighbor[0][1] = vct->getYleft_neighbor() != MPI_PROC_NULL;
+    neighbor[0][2] = vct->getZleft_neighbor() != MPI_PROC_NULL;
+    neighbor[1][0] = vct->getXright_neighbor() != MPI_PROC_NULL;
+    neighbor[1][1] = vct->getYright_neighbor() != MPI_PROC_NULL;
+    neighbor[1][2] = vct->getZright_neighbor() != MPI_PROC_NULL;
+  }
+}
+
+Smoother::~Smoother()
+{
+  for (size_t v = 0; v < bufA.size(); v++) {
+    delete bufA[v];
+    delete bufB[v];
+  }
+}
+
+void Smoother::add(arr3_double vector, const int bc[6])
+{
+  // no buffers without smoothing
+  if (alpha == 1.0)
+    return;
+  vectors.push_back(vector.fetch_arr3());
+  for (int i = 0; i < 6; i++)
+    bcs.push_back(bc[i]);
+  array3_double *a = new array3_double(n[0], n[1], n[2]);
+  array3_double *b = new array3_double(n[0], n[1], n[2]);
+  a->setall(0.0);
+  b->setall(0.0);
+  bufA.push_back(a);
+  bufB.push_back(b);
+  arrA.push_back(a->fetch_arr3());
+  arrB.push_back(b->fetch_arr3());
+  // the boundary conditions are applied by apply_bc on the wide halos
+  haloA.add(*a);
+  haloB.add(*b);
+}
+
+/*! ghost cells of the faces without neighbour, next to the interior,
+    for all the cells of the buffers along the face */
+void Smoother::apply_bc(std::vector<double***> &buf)
+{
+  for (size_t v = 0; v < buf.size(); v++) {
+    double ***a = buf[v];
+    for (int d = 0; d < 3; d++) {
+      const int t1 = (d == 0) ? 1 : 0;
+      const int t2 = (d == 2) ? 1 : 2;
+      for (int side = 0; side < 2; side++) {
+        if (neighbor[side][d]) continue;
+        // bcs are in the order right, left of each direction
+        const int code = bcs[6 * v + 2 * d + 1 - side];
+        const int ghost = side ? n[d] - width : width - 1;
+        const int inner = side ? n[d] - 1 - width : width;
+        for (int q = 0; q < n[t1]; q++)
+          for (int s = 0; s < n[t2]; s++)
+            switch (code) {
+              case 0:            // Dirichilet = 0 Second Order
+                plane_cell(a, d, ghost, q, s) = -plane_cell(a, d, inner, q, s);
+                break;
+              case 1:            // Dirichilet = 0 First Order
+                plane_cell(a, d, ghost, q, s) = 0.0;
+                break;
+              case 2:            // Neumann = 0 First Order
+                plane_cell(a, d, ghost, q, s) = plane_cell(a, d, inner, q, s);
+                break;
+            }
+      }
+    }
+  }
+}
+
+/*! one pass on the cells i0..i1, j0..j1, k0..k1 of all the arrays, from src to dst */
+void Smoother::sweep_box(int i0, int i1, int j0, int j1, int k0, int k1)
+{
+  const double beta3D = (1 - alpha) / 6.0;
+  const double beta2D = (1 - alpha) / 4.0;
+  const int nv = vectors.size();
+  for (int i = i0; i <= i1; i++)
+    for (int j = j0; j <= j1; j++)
+      for (int v = 0; v < nv; v++) {
+        double ***s = (*src)[v];
+        double *out = (*dst)[v][i][j];
+        const double *c  = s[i][j];
+        const double *xm = s[i - 1][j];
+        const double *xp = s[i + 1][j];
+        const double *ym = s[i][j - 1];
+        const double *yp = s[i][j + 1];
+        if (is3D)
+          for (int k = k0; k <= k1; k++)
+            out[k] = alpha * c[k] + beta3D * (xm[k] + xp[k] + ym[k] + yp[k] + c[k - 1] + c[k + 1]);
+        else
+          for (int k = k0; k <= k1; k++)
+            out[k] = alpha * c[k] + beta2D * (xm[k] + xp[k] + c[k - 1] + c[k + 1]);//2D smooth in XZ dimension
+      }
+}
+
+/*! one pass on the box lo..hi but the box inlo..inhi inside it */
+void Smoother::sweep(int lo[3], int hi[3], int inlo[3], int inhi[3])
+{
+  sweep_box(lo[0], inlo[0] - 1, lo[1], hi[1], lo[2], hi[2]);
+  sweep_box(inhi[0] + 1, hi[0], lo[1], hi[1], lo[2], hi[2]);
+  sweep_box(inlo[0], inhi[0], lo[1], inlo[1] - 1, lo[2], hi[2]);
+  sweep_box(inlo[0], inhi[0], inhi[1] + 1, hi[1], lo[2], hi[2]);
+  sweep_box(inlo[0], inhi[0], inlo[1], inhi[1], lo[2], inlo[2] - 1);
+  sweep_box(inlo[0], inhi[0], inlo[1], inhi[1], inhi[2] + 1, hi[2]);
+}
+
+void Smoother::smooth()
+{
+  if (alpha == 1.0 || vectors.empty())
+    return;
+  // index of the cell 0 of the arrays in the buffers
+  const int g = width - 1;
+  const int nv = vectors.size();
+  for (int v = 0; v < nv; v++) {
+    double ***a = vectors[v];
+    double ***b = arrA[v];
+    for (int i = 1; i < nf[0] - 1; i++)
+      for (int j = 1; j < nf[1] - 1; j++)
+        for (int k = 1; k < nf[2] - 1; k++)
+          b[i + g][j + g][k + g] = a[i][j][k];
+  }
+  src = &arrA;
+  dst = &arrB;
+  // cells that do not need the halo
+  int inlo[3], inhi[3];
+  bool inner = true;
+  for (int d = 0; d < 3; d++) {
+    inlo[d] = width + 1;
+    inhi[d] = n[d] - 2 - width;
+    inner = inner && inlo[d] <= inhi[d];
+  }
+  for (int done = 0; done < niter; ) {
+    const int passes = std::min(width, niter - done);
+    HaloExchange &halo = (src == &arrA) ? haloA : haloB;
+    // the ghost cells of the faces without neighbour go with the planes
+    // of the next directions, and are set again on the halo received
+    apply_bc(*src);
+    halo.start();
+    if (inner)
+      sweep_box(inlo[0], inhi[0], inlo[1], inhi[1], inlo[2], inhi[2]);
+    halo.finish();
+    for (int p = 0; p < passes; p++) {
+      // each pass computes one layer of the halo less
+      const int extra = passes - 1 - p;
+      int lo[3], hi[3];
+      for (int d = 0; d < 3; d++) {
+        lo[d] = width - (neighbor[0][d] ? extra : 0);
+        hi[d] = n[d] - 1 - width + (neighbor[1][d] ? extra : 0);
+      }
+      apply_bc(*src);
+      if (p == 0 && inner)
+        sweep(lo, hi, inlo, inhi);
+      else
+        sweep_box(lo[0], hi[0], lo[1], hi[1], lo[2], hi[2]);
+      std::swap(src, dst);
+    }
+    done += passes;
+  }
+  // interior cells from the result, ghost cells from the input of the last pass
+  for (int v = 0; v < nv; v++) {
+    double ***a = vectors[v];
+    double ***out = (*src)[v];
+    double ***in = (*dst)[v];
+    for (int i = 0; i < nf[0]; i++)
+      for (int j = 0; j < nf[1]; j++) {
+        if (i == 0 || i == nf[0] - 1 || j == 0 || j == nf[1] - 1) {
+          for (int k = 0; k < nf[2]; k++)
+            a[i][j][k] = in[i + g][j + g][k + g];
+          continue;
+        }
+        a[i][j][0] = in[i + g][j + g][g];
+        for (int k = 1; k < nf[2] - 1; k++)
+          a[i][j][k] = out[i + g][j + g][k + g];
+        a[i][j][nf[2] - 1] = in[i + g][j + g][nf[2] - 1 + g];
+      }
+  }
+}
@@ -21,7 +21,9 @@
 #ifndef IPIC_ALLOC_H
 #define IPIC_ALLOC_H
 #include <cstddef> // for alignment stuff
+#include <cstdlib> // for posix_memalign
 #include "asserts.h" // for assert_le, assert_lt
+#include "errors.h" // for eprintf
 #include "arraysfwd.h"
 
 /*
@@ -57,6 +59,15 @@
     well, since all arrays are approximately the same size, but
     would require a recompile when changing the maximum array size.
 
+    The elements of an array are always stored in one contiguous
+    block, aligned to ALIGNMENT bytes, in row-major order (the last
+    index is contiguous); the chained pointers are only an index
+    over this block. get_arr()/fetch_arr() give the block and
+    strideN() the distance between consecutive values of the N-th
+    index, so that stencils, MPI datatypes and the output can work
+    on the block directly: element (i,j,k) of an array3 a is
+      a.get_arr()[i*a.stride1() + j*a.stride2() + k].
+
     Rather than using these templates directly, the typedefs
     declared in "arraysfwd.h" should be used:
 
@@ -93,8 +104,17 @@
     #define ALLOC_ALIGNED
     #define ASSUME_ALIGNED(X)
     #define ALIGNED(X)
-    #define AlignedFree(S) (delete[] S)
-    #define AlignedAlloc(T, NUM) (new T[NUM]) 
+    // new[] only guarantees the alignment of the type
+    template <class type>
+    inline type *aligned_malloc(size_t num)
+    {
+      void *ptr = 0;
+      if (posix_memalign(&ptr, ALIGNMENT, sizeof(type) * (num ? num : 1)))
+        eprintf("cannot allocate %lu bytes", (unsigned long)(sizeof(type) * num));
+      return (type *) ptr;
+    }
+    #define AlignedFree(S) (free((void *)(S)))
+    #define AlignedAlloc(T, NUM) (aligned_malloc<T>(NUM))
 #endif
 inline bool is_aligned(void *p, int N)
 {
@@ -494,6 +514,9 @@ namespace iPic3D
       int get_size() const { return size; }
       size_t dim1() const { return S2; }
       size_t dim2() const { return S1; }
+      // strides of the indices in get_arr()
+      size_t stride1() const { return S1; }
+      size_t stride2() const { return 1; }
     #if defined(FLAT_ARRAYS) || defined(CHECK_BOUNDS)
       const const_array_get1<type> operator[](size_t n2)const{
         check_bounds(n2, S2);
@@ -558,7 +581,7 @@ namespace iPic3D
         size_t s2, size_t s1) :
         const_array_ref2<type>(in,s2,s1)
       { }
-      void free(){ delArray2<type>((type***)arr2); }
+      void free(){ delArray2<type>((type**)arr2); }
     #if defined(FLAT_ARRAYS) || defined(CHECK_BOUNDS)
       inline array_fetch1<type> operator[](size_t n2){
         check_bounds(n2, S2);
@@ -616,6 +639,10 @@ namespace iPic3D
       size_t dim1() const { return S3; }
       size_t dim2() const { return S2; }
       size_t dim3() const { return S1; }
+      // strides of the indices in get_arr()
+      size_t stride1() const { return S2*S1; }
+      size_t stride2() const { return S1; }
+      size_t stride3() const { return 1; }
     #if defined(FLAT_ARRAYS) || defined(CHECK_BOUNDS)
       const const_array_get2<type> operator[](size_t n3)const{
         check_bounds(n3, S3);
@@ -742,6 +769,11 @@ namespace iPic3D
       size_t dim2() const { return S3; }
       size_t dim3() const { return S2; }
       size_t dim4() const { return S1; }
+      // strides of the indices in get_arr()
+      size_t stride1() const { return S3*S2*S1; }
+      size_t stride2() const { return S2*S1; }
+      size_t stride3() const { return S1; }
+      size_t stride4() const { return 1; }
     #if defined(FLAT_ARRAYS) || defined(CHECK_BOUNDS)
       const const_array_get3<type> operator[](size_t n4)const{
         check_bounds(n4, S4);
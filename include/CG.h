@@ -28,6 +28,7 @@ developers: Stefano Markidis, Giovanni Lapenta
 #define CG_H
 
 #include "ipicfwd.h"
+#include "KrylovWorkspace.h"
 
 // These declarations are currently needed because Field is not anymore a class
 // CG needs a pointer to the function that solves the fields.
@@ -40,6 +41,9 @@ typedef EMfields3D Field;
 typedef void (Field::*FIELD_IMAGE) (double *, double *);
 typedef void (*GENERIC_IMAGE) (double *, double *);
 
-bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD_IMAGE FunctionImage, Field * field);
+/*! CG solve of A x = b, with xkrylov the initial guess on input and the
+ *  solution on output; workspace and stats as in GMRES() */
+bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD_IMAGE FunctionImage, Field * field,
+  KrylovWorkspace *workspace = 0, KrylovStats *stats = 0);
 
 #endif
@@ -109,6 +109,7 @@ class Collective
     int getImplSusceptMode()const{ return ImplSusceptMode; }
     double getSmooth()const{ return (Smooth); }
     int    getSmoothNiter()const{return SmoothNiter;}
+    bool   getMomentsCheck()const{ return MomentsCheck; }
     int getNcycles()const{ return (ncycles); }
     int getNs()const{ return (ns); }
     int getNs_sw()const{ return (ns_sw); }
@@ -138,6 +139,7 @@ class Collective
     double getEstarte(){ return (Estarte); }
     double getEende(){ return (Eende); }
     double getdEe(){ return (dEe); }
+    bool getSpectraLogAxis()const{ return (SpectraLogAxis); }
 
     double getPitchAngle(int nspecies)const{ return (pitch_angle[nspecies]); }
     double getEnergy(int nspecies)const{ return (energy[nspecies]); }
@@ -158,12 +160,14 @@ class Collective
     double getE_th_el(int nColl)const{ return (E_th_el[nColl]); }
     int    getnIoniColls()const{ return (nIoniColls); }
     int    getcollStepSkip()const{ return (collStepSkip); }
+    bool   getCollBulkVelocityCache()const{ return (CollBulkVelocityCache); }
 
     int    getnNeutSpecies()const{ return (nNeutSpecies); }
     double getWfact(int nNeutral)const{ return (Wfact[nNeutral]); }
     double getnSurf(int nNeutral)const{ return (nSurf[nNeutral]); }
     double gethExo(int nNeutral) const{ return (hExo[nNeutral]); }
     double getfExo(int nNeutral) const{ return (fExo[nNeutral]); }
+    string getNeutralProfile(int nNeutral) const{ return (NeutralProfile[nNeutral]); }
 
     int getYes_sal()const{ return (yes_sal); }
     int getN_layers_sal()const{ return (n_layers_sal); }
@@ -171,7 +175,7 @@ class Collective
     int getNewPclInit()const{ return (NewPclInit); }
     int getNonTrivialBCPlanet()const{ return (NonTrivialBCPlanet); }
     int getAddExosphere()const{ return (AddExosphere); }
-    int getRmax()const{ return (Rmax); }
+    double getRmax()const{ return (Rmax); }
 
     int getBcPfaceXright()const{ return (bcPfaceXright); }
     int getBcPfaceXleft()const{ return (bcPfaceXleft); }
@@ -179,6 +183,7 @@ class Collective
     int getBcPfaceYleft()const{ return (bcPfaceYleft); }
     int getBcPfaceZright()const{ return (bcPfaceZright); }
     int getBcPfaceZleft()const{ return (bcPfaceZleft); }
+    string getInflowMethod()const{ return (InflowMethod); }
     int getBcPHIfaceXright()const{ return (bcPHIfaceXright); }
     int getBcPHIfaceXleft()const{ return (bcPHIfaceXleft); }
     int getBcPHIfaceYright()const{ return (bcPHIfaceYright); }
@@ -213,18 +218,30 @@ class Collective
     string getPclOutputTag()const{return ParticlesOutputTag;}
     string getPoissonCorrection()const{ return (PoissonCorrection); }
     string getParaviewScriptPath()const{return ParaviewScriptPath;}
+    bool getCatalystZeroCopy()const{return CatalystZeroCopy;}
     int getPoissonCorrectionCycle()const{ return (PoissonCorrectionCycle); }
     int getLast_cycle()const{ return (last_cycle); }
     double getVinj()const{ return (Vinj); }
     double getCGtol()const{ return (CGtol); }
     double getGMREStol()const{ return (GMREStol); }
+    string getMaxwellSolver()const{ return (MaxwellSolver); }
+    string getMaxwellPreconditioner()const{ return (MaxwellPreconditioner); }
+    int getPreconditionerIterations()const{ return (PreconditionerIterations); }
+    string getPoissonSolver()const{ return (PoissonSolver); }
+    int getMultigridSweeps()const{ return (MultigridSweeps); }
     int getNiterMover()const{ return (NiterMover); }
+    int getPopulationControlCycle()const{ return (PopulationControlCycle); }
+    int getPopulationMax()const{ return (PopulationMax); }
+    int getPopulationMin()const{ return (PopulationMin); }
     int getFieldOutputCycle()const{ return (FieldOutputCycle); }
     int getSpectraOutputCycle()const{ return (SpectraOutputCycle); }
     int getTemperatureOutputCycle()const{ return (TemperatureOutputCycle); }
     int getParticlesOutputCycle()const{ return (ParticlesOutputCycle); }
     int getTestParticlesOutputCycle()const{ return (TestParticlesOutputCycle); }
     int getRestartOutputCycle()const{ return (RestartOutputCycle); }
+    string getRestartMethod()const{ return (RestartMethod); }
+    string getRestartStagingDirName()const{ return (RestartStagingDirName); }
+    int getRestartKeep()const{ return (RestartKeep); }
     int getRemoveParticlesOutputCycle()const{ return (RemoveParticlesOutputCycle); }
     int getDiagnosticsOutputCycle()const{ return (DiagnosticsOutputCycle); }
     bool getCallFinalize()const{ return (CallFinalize); }
@@ -266,6 +283,8 @@ class Collective
     /*! Smoothing value */
     double Smooth;
     int SmoothNiter;
+    /*! compare the threaded moments with a serial deposition */
+    bool MomentsCheck;
     /*! number of time cycles */
     int ncycles;
     /*! physical space dimensions */
@@ -311,7 +330,7 @@ class Collective
     int DeltaX;
     int DeltaY;
     int DeltaZ;
-    /*! Spectra's logarithmically spaced array's information */
+    /*! Spectra's energy array's information (log10 exponents on a log axis) */
     double Estarti;
     double Eendi;
     double dEi;
@@ -319,6 +338,8 @@ class Collective
     double Estarte;
     double Eende;
     double dEe;
+    /*! log10-spaced (true) or linearly spaced (false) energy bins of the spectra */
+    bool SpectraLogAxis;
 
     /*! number of species */
     int ns;
@@ -378,6 +399,8 @@ class Collective
     int nIoniColls;
     /*! Number of skipped steps for collisional processes */
     int collStepSkip;
+    /*! Compute the bulk velocity J/rho once per node instead of once per particle */
+    bool CollBulkVelocityCache;
     double Emin, Emax;
 
 
@@ -392,6 +415,8 @@ class Collective
     double *hExo;
     /*! Photoionization frequency of species*/
     double *fExo;
+    /*! Radial profile of the neutral density of species (exp or powerlaw) */
+    string *NeutralProfile;
 
     /* bool value for applying SAL BC fields */
     int yes_sal;
@@ -448,6 +473,9 @@ class Collective
     int bcPfaceZright;
     /*! Boundary Condition Particles: FaceYleft */
     int bcPfaceZleft;
+    /*! solar wind at the repopulate faces: layers = the 3 cells next to them
+        refilled every cycle, flux = injection of the pcls crossing them */
+    string InflowMethod;
 
 
     /*! Field Boundary Condition 0 = Dirichlet Boundary Condition: specifies the valueto take pn the boundary of the domain 1 = Neumann Boundary Condition: specifies the value of derivative to take on the boundary of the domain 2 = Periodic Condition */
@@ -503,8 +531,24 @@ class Collective
     double CGtol;
     /*! GMRES solver stopping criterium tolerance */
     double GMREStol;
+    /*! Krylov solver of the implicit Maxwell solve: GMRES or GMRES_CGS2 */
+    string MaxwellSolver;
+    /*! preconditioner of the Maxwell solve: none, BlockJacobi or Polynomial */
+    string MaxwellPreconditioner;
+    /*! inner iterations of BlockJacobi, degree of Polynomial */
+    int PreconditionerIterations;
+    /*! solver of the divergence cleanings: GMRES, Multigrid or GMRES_Multigrid */
+    string PoissonSolver;
+    /*! smoothing sweeps before and after the coarse grid correction of multigrid */
+    int MultigridSweeps;
     /*! mover predictor correcto iteration */
     int NiterMover;
+    /*! cycles between the merging and splitting of the particles (0 = off) */
+    int PopulationControlCycle;
+    /*! particles of a species per cell above which they are merged (0 = no merging) */
+    int PopulationMax;
+    /*! particles of a species per cell below which the heaviest are split (0 = no splitting) */
+    int PopulationMin;
 
     /*! Output for field */
     int FieldOutputCycle;
@@ -523,10 +567,18 @@ class Collective
     int TestParticlesOutputCycle;
     /*! Catalyst implementation*/
     string ParaviewScriptPath;
+    /*! Catalyst adaptor hands the field storage to VTK without copying it */
+    bool CatalystZeroCopy;
     /*! test particles are flushed to disk every testPartFlushCycle  */
     int testPartFlushCycle;
     /*! restart cycle */
     int RestartOutputCycle;
+    /*! restart files: fpp (one file per process) or shared (one file, any decomposition) */
+    string RestartMethod;
+    /*! node-local directory of the restart dumps, copied in the background to SaveDirName/checkpoint_<cycle> (empty = off) */
+    string RestartStagingDirName;
+    /*! number of complete checkpoints kept in SaveDirName */
+    int RestartKeep;
     /*! print particle removed in planet cycle */
     int RemoveParticlesOutputCycle;
     /*! Output for diagnostics */
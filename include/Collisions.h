@@ -6,6 +6,7 @@ developers: Peter Stephenson
 #ifndef _Collisions_
 #define _Collisions_
 #include "ipicfwd.h"
+#include <vector>
 /*! @file 
  *  Class to manage collisional processes
     Developers: P. Stephenson (Jul 2022)
@@ -27,14 +28,20 @@ class Collisions {
       * @param[in] vct Topology of the simulation
       * @param[in] grid Grid object
       * @param[in] EMf Fields object 
+      * @param[in] neutrals neutral exosphere
       */
-      Collisions(CollectiveIO * col, VirtualTopology3D *vct, Grid * grid, EMfields3D *Emf);
+      Collisions(CollectiveIO * col, VirtualTopology3D *vct, Grid * grid, EMfields3D *Emf,
+        const NeutralAtmosphere *neutrals);
 
       /*! @brief Determines if collisions occur and implements collisions.
       *
-      * Cycles through particles of each species, testing whether they undergo
-      * collisions or not. Energy degradation and recording of secondary particles 
-      * from impact ionization occur within.
+      * Tests the particles of the species for collisions in chunks of
+      * collChunk particles, shared among the OpenMP threads: neutral density,
+      * bulk velocity and collision probability are computed for the whole
+      * chunk before the random draws of the thread's own stream. The colliding
+      * particles are then processed in particle order by CollideElectron.
+      * Energy degradation and recording of secondary particles from impact
+      * ionization occur there.
       * 
       * @param[in] species index of species
       * @param[in] part particles object
@@ -66,20 +73,10 @@ class Collisions {
       * single step. For electrons, uses a rescaled velocity to correct
       * for the reduced electron-ion mass ratio
       * 
+      * @param[in] nNeutr neutral density at the particle
       * @param[in] vMag magnitude of the rescaled velocity
       */
-      double ProbColl(double nNeutr, double vMag);
-
-      /*! @brief Calculates velocity magnitude
-      *
-      * Calculates magnitude of the particle velocity, with no scaling
-      * to correct for the electron mass.
-      * 
-      * @param[in] species index of species
-      * @param[in] part particles object
-      * @param[in] pidx index of colliding particle
-      */
-      double velMagnitude(int species, Particles3D *part, int pidx);
+      double ProbColl(double nNeutr, double vMag)const;
 
       /*! @brief Calculates velocity magnitude with correction for electron mass
       *
@@ -87,28 +84,23 @@ class Collisions {
       * for the mass of the electron. If electron, scales up the thermal velocity to correct 
       * for the increased electron mass. 
       * 
-      * @param[in] species index of species
-      * @param[in] part particles object
-      * @param[in] pidx index of colliding particle
+      * @param[in] u,v,w particle velocity
       * @param[in] u0 bulk velocity at pl along x
       * @param[in] v0 bulk velocity at pl along y
       * @param[in] w0 bulk velocity at pl along z
       */
-      double velMagnitude_wScale(int species, Particles3D *part, int pidx, 
-        double u0, double v0, double w0);
-      // double velMagnitude_wScale(int species, Particles3D *part, int pidx, 
-      //   double u0, double v0, double w0, double u0Mag2, double vScale);
+      double velMagnitude_wScale(double u, double v, double w,
+        double u0, double v0, double w0)const;
 
       /*! @brief Finds neutral desnity at particle location
       *
-      *  Calculates neutral density at the location of the particle. Uses neutral
-      *  exosphere defined in the Particles3D module
+      *  Neutral density at the location of the particle, interpolated in the
+      *  radial table of the neutral exosphere.
       * 
-      *  @param[in] species index of species
-      *  @param[in] part particles object
+      *  @param[in] x,y,z particle position
       * 
       */
-      double findneutDensity(int species, Particles3D *part);
+      double findneutDensity(double x, double y, double z)const;
 
       /*! @brief Records properties of the secondary particles.
       *
@@ -153,16 +145,18 @@ class Collisions {
 
       /*! @brief Finds bulk velocity at position of electron 
       *
-      * Calculates velocity of secondary electron with random angles
-      * theta and phi. Uniform angular distribution.
+      * Bulk velocity J/rho of the species at the local grid node
+      * closest to the particle (from the node cache if enabled).
       * 
       * @param[in] species index of species
       * @param[in] EMf Fields object 
+      * @param[in] x,y,z particle position
       * @param[out] u0 bulk velocity in x at particle
       * @param[out] v0 bulk velocity in y at particle
       * @param[out] w0 bulk velocity in z at particle
       */
-      void findBulkVelocity(int species, EMfields3D *Emf, double &u0, double &v0, double &w0);
+      void findBulkVelocity(int species, EMfields3D *Emf, double x, double y, double z,
+        double &u0, double &v0, double &w0)const;
  
   private:
     Particles3D *eImpIoniPls; // Particles generated by e-impact ionization
@@ -171,9 +165,7 @@ class Collisions {
     double *E_th_el; // Threshold energies for electron collisions.
     int nIoniColls; // No. of ionization collisions
     int collStepSkip;
-    bool isIoni;
  
-    double nNeutral;
     double qom_eReal = -1836; // Real charge per mass for electrons (if qom = 1 for protons)
 
     // Used to keep track of how many electrons have 'large' coll probabilities
@@ -182,41 +174,23 @@ class Collisions {
     int ns;
     double dt;
 
-    // Particle Velocity 
-    double upl;
-    double vpl;
-    double wpl;
-
-    // Particle Position
-    double xpl;
-    double ypl;
-    double zpl;
-
-    // Particle energy
-    double Epl;
-    double Eth;
-    double Epl_new;
-
-    // Bulk Velocity
-    double u0;
-    double v0;
-    double w0;
+    // Per-thread random streams (erand48 states, 3 per thread) and
+    // per-thread indexes of the particles selected for collision
+    std::vector<unsigned short> rngState;
+    std::vector< std::vector<int> > collidingPcls;
 
     // Size of cells
     double dx;
     double dy;
     double dz;
     
-    // Planet properties
-    double PlanetOffset;
-    double x_center;
-    double y_center;
-    double z_center;
-    
-    // Exosphere properties
-    double R; // Mercury/planet radius
-    double Nexo_H; // density of exosphere neutrals at the surface (in nsw units)
-    double hexo_H; // scale length of exosphere
+    // Neutral exosphere; the electrons collide with neutral species 0
+    const NeutralAtmosphere *neutrals;
+
+    // Bulk velocity J/rho of the colliding species at the local nodes,
+    // filled at each call of Collide if bulkVelocityCache
+    bool bulkVelocityCache;
+    std::vector<double> bulkVelocity;
 
     // Ratio between electron mass in PiC sim. and real world
     // sqrt(me_PiC / me_Real)
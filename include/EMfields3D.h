@@ -23,10 +23,14 @@
 #ifndef EMfields3D_H
 #define EMfields3D_H
 
+#include <vector>
 #include "asserts.h"
 #include "ipicfwd.h"
 #include "Alloc.h"
 #include "Basic.h"
+#include "KrylovWorkspace.h"
+#include "HaloExchange.h"
+#include "Smoother.h"
 
 
 /*! Electromagnetic fields and sources defined for each local grid, and for an implicit maxwell's solver @date May 2008 @par Copyright: (C) 2008 KUL @author Stefano Markidis, Giovanni Lapenta. @version 3.0 */
@@ -36,6 +40,8 @@ const int DFIELD_3or4=4; // 4 pads with garbage but is needed for alignment
 
 class Particles3Dcomm;
 class Moments10;
+class KrylovPreconditioner;
+class PoissonMultigrid;
 class EMfields3D                // :public Field
 {
   public:
@@ -96,6 +102,11 @@ class EMfields3D                // :public Field
     void PoissonImage(double *image, double *vector);
     /*! Image of Maxwell Solver (for Solver) */
     void MaxwellImage(double *im, double *vector);
+    /*! Image of Maxwell Solver on the local subdomain, without communication (for the preconditioners) */
+    void MaxwellImageLocal(double *im, double *vector);
+    /*! Image of Maxwell Solver as the composition of the Grid3DCU operators,
+        the reference of the fused MaxwellImage (for the benchmarks) */
+    void MaxwellImageComposed(double *im, double *vector, bool local = false);
     /*! Maxwell source term (for SOLVER) */
     void MaxwellSource(double *bkrylov);
     /*! Impose a constant charge inside a spherical zone of the domain */
@@ -135,8 +146,6 @@ class EMfields3D                // :public Field
     void sumOverSpecies();
     /*! Sum current over different species */
     void sumOverSpeciesJ();
-    /*! Smoothing after the interpolation* */
-    void smooth(arr3_double vector, int type);
     /*! smooth the electric field */
     void smoothE();
     /*! copy the field data to the array used to move the particles */
@@ -146,6 +155,7 @@ class EMfields3D                // :public Field
     /*! sum moments (interp_P2G) versions */
     void sumMoments(const Particles3Dcomm* part);
     void sumMoments_AoS(const Particles3Dcomm* part);
+    void checkMoments_AoS(const Particles3Dcomm& pcls);
     void sumMoments_AoS_intr(const Particles3Dcomm* part);
     void sumMoments_vectorized(const Particles3Dcomm* part);
     void sumMoments_vectorized_AoS(const Particles3Dcomm* part);
@@ -303,6 +313,12 @@ class EMfields3D                // :public Field
     /*! get bulk kinetic energy */
     double getBulkEnergy(int is);
 
+    /*! statistics of the field solves of the last cycle: divergence
+        cleaning of E, Maxwell solve and divergence cleaning of B */
+    const KrylovStats& getPoissonEStats()const{ return statsPoissonE; }
+    const KrylovStats& getMaxwellStats()const{ return statsMaxwell; }
+    const KrylovStats& getPoissonBStats()const{ return statsPoissonB; }
+
     /*! fetch array for summing moments of thread i */
     Moments10& fetch_moments10Array(int i){
       assert_le(0,i);
@@ -349,6 +365,15 @@ class EMfields3D                // :public Field
     const VirtualTopology3D& get_vct()const{return _vct;}
     /* ********************************* // VARIABLES ********************************* */
     
+  private:
+    void applyMaxwellOperator(double *im, double *vector, bool local);
+    void MaxwellImageNodes(int i, const double *vector);
+    void MaxwellImageCenters(int i);
+    void MaxwellImageResult(int i, double *im);
+    void lapN2Nlocal(arr3_double lapN, const_arr3_double scFieldN);
+    /*! solve lap(x) = bkrylovPoisson with the solver of PoissonSolver */
+    void solvePoisson(double *xkrylov, KrylovStats *stats);
+
   private:
     // access to global data
     const Collective& _col;
@@ -474,11 +499,29 @@ class EMfields3D                // :public Field
     array3_double vectY;
     array3_double vectZ;
     array3_double divC;
+    /*! gradients on the centres of vectX, vectY, vectZ
+        (gradXyC = d vectX / dy), for the fused MaxwellImage */
+    array3_double gradXxC, gradXyC, gradXzC;
+    array3_double gradYxC, gradYyC, gradYzC;
+    array3_double gradZxC, gradZyC, gradZzC;
     array3_double Lambda;
+    /*! and for PoissonImage */
+    array3_double tempPoisson;
+    array3_double imagePoisson;
     //array3_double arr;
     /* temporary arrays for summing moments */
     int sizeMomentsArray;
     Moments10 **moments10Array;
+    // AoS moments: mesh column (x,y cell) of each particle, particles
+    // sorted by column, first particle of each column and per thread
+    // number of particles in each column
+    std::vector<int> momentsColumn;
+    std::vector<int> momentsOrder;
+    std::vector<int> momentsColumnStart;
+    std::vector<int> momentsColumnCount;
+    // serial deposition compared with the threaded one (MomentsCheck)
+    bool momentsCheck;
+    Moments10 *momentsCheckArray;
 
     // *******************************************************************************
     // *********** SOURCES **
@@ -583,6 +626,38 @@ class EMfields3D                // :public Field
     double CGtol;
     /*! GMRES tolerance criterium for stopping iterations */
     double GMREStol;
+    /*! use GMRES_CGS2 instead of GMRES for the Maxwell solve */
+    bool MaxwellCGS2;
+    /*! preconditioner of the Maxwell solve, NULL if none */
+    KrylovPreconditioner *maxwellPreconditioner;
+    /*! multigrid of the divergence cleanings, NULL if they use GMRES */
+    PoissonMultigrid *poissonMultigrid;
+    /*! use the multigrid as preconditioner of GMRES instead of as solver */
+    bool PoissonMultigridGMRES;
+
+    // Krylov vectors of the field solves, allocated once. The solutions
+    // of the two divergence cleanings are kept as initial guess of the
+    // next solve, the Maxwell solve starts from the current E.
+    double *xkrylovMaxwell;
+    double *bkrylovMaxwell;
+    double *xkrylovPHI;
+    double *xkrylovPSI;
+    double *bkrylovPoisson;
+    /*! GMRES work vectors shared by all the field solves */
+    KrylovWorkspace krylovWorkspace;
+    /*! statistics of the field solves of the current cycle */
+    KrylovStats statsPoissonE;
+    KrylovStats statsMaxwell;
+    KrylovStats statsPoissonB;
+    /*! batched halo exchanges of the field components */
+    HaloExchange haloE;        // Exth, Eyth, Ezth, Ex, Ey, Ez
+    HaloExchange haloBn;       // Bxn, Byn, Bzn
+    HaloExchange haloBc;       // Bxc, Byc, Bzc
+    HaloExchange haloImage;    // gradients of vect and divC of MaxwellImage
+    /*! smoothing of E and of the interpolated moments */
+    Smoother smootherE;        // Ex, Ey, Ez
+    Smoother smootherRhoc;     // rhoc
+    Smoother smootherJh;       // Jxh, Jyh, Jzh
 
 
     //MPI Derived Datatype for Center Halo Exchange
@@ -22,11 +22,26 @@
 #define GMRES_new2_H
 
 #include "ipicfwd.h"
+#include "KrylovWorkspace.h"
+
+class KrylovPreconditioner;
 
 typedef void (EMfields3D::*FIELD_IMAGE) (double *, double *);
 typedef void (*GENERIC_IMAGE) (double *, double *);
 
-void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen, const double *b, int m, int max_iter, double tol, EMfields3D * field);
+/*! GMRES(m) solve of A x = b, with xkrylov the initial guess on input and
+ *  the solution on output. The work vectors are taken from workspace if
+ *  given, otherwise they are allocated for this solve only; stats, if given,
+ *  receives the iteration count and the time of the solve. With a
+ *  preconditioner M the solve is flexible GMRES, right preconditioned. */
+void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen, const double *b, int m, int max_iter, double tol, EMfields3D * field,
+  KrylovWorkspace *workspace = 0, KrylovStats *stats = 0, KrylovPreconditioner *preconditioner = 0);
+/*! Same as GMRES() with a classical Gram-Schmidt orthogonalization taking a
+ *  single global reduction per iteration, and a second one only when the
+ *  first pass loses accuracy (CGS2). Fewer MPI_Allreduce calls than GMRES()
+ *  for latency bound solves on many processes. */
+void GMRES_CGS2(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen, const double *b, int m, int max_iter, double tol, EMfields3D * field,
+  KrylovWorkspace *workspace = 0, KrylovStats *stats = 0, KrylovPreconditioner *preconditioner = 0);
 void ApplyPlaneRotation(double &dx, double &dy, double &cs, double &sn);
 
 #endif
@@ -0,0 +1,109 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  HaloExchange.h  -  Batched halo exchange of several arrays
+  -------------------
+ ********************************************************************************************/
+
+#ifndef HaloExchange_H
+#define HaloExchange_H
+
+#include <mpi.h>
+#include <vector>
+#include "ipicfwd.h"
+#include "arraysfwd.h"
+
+/*! @brief Halo exchange of several arrays of the same layout in one go
+ *
+ * The arrays, nodes or centres of the same size, are registered once with
+ * add() together with their boundary conditions (the bcFace codes of
+ * BCface, in the order Xright, Xleft, Yright, Yleft, Zright, Zleft). One
+ * exchange packs the planes of all the arrays into one message per
+ * neighbour, instead of one message per array and per face, edge and
+ * corner as communicateNodeBC() and communicateCenterBC() do.
+ *
+ * The exchange goes one direction after the other: the planes of Y
+ * include the ghost cells of X just received and the planes of Z those of
+ * X and Y, which fills edges and corners with 6 messages in total. With
+ * faceOnly (the box stencil of communicateNodeBoxStencilBC()) the three
+ * directions go at once. The boundary conditions are applied at the end,
+ * as BCface() does after NBDerivedHaloComm().
+ *
+ * The exchange is split in two phases: start() packs the arrays and
+ * posts the messages of the first direction (all of them with faceOnly),
+ * finish() completes the exchange. Between the two the arrays must not be
+ * written, but the cells that do not depend on the ghost cells can be
+ * computed into other arrays. exchange() does both.
+ *
+ * With a width larger than one the arrays have width layers of ghost
+ * cells on each side (nx, ny, nz include them) and the width planes next
+ * to them are exchanged. The boundary conditions, which only know one
+ * layer of ghost cells, are then left to the caller and the arrays are
+ * added without them. isParticle selects the neighbours of the particle
+ * topology, as the _P communications do.
+ */
+class HaloExchange
+{
+  public:
+    /*! exchange of arrays of nx*ny*nz nodes (isCenter false) or centres */
+    HaloExchange(const VirtualTopology3D *vct, int nx, int ny, int nz,
+      bool isCenter, bool faceOnly = false, int width = 1, bool isParticle = false);
+    /*! add an array with the boundary conditions of its 6 faces,
+        or without boundary conditions if bc is null */
+    void add(arr3_double vector, const int bc[6] = 0);
+    void start();
+    void finish();
+    void exchange(){ start(); finish(); }
+    /*! number of arrays and messages sent by the last exchange */
+    int get_arrays()const{ return vectors.size(); }
+    int get_messages()const{ return messages; }
+
+  private:
+    void post(int d);
+    void complete(int d);
+    void range(int d, int t, int &lo, int &hi)const;
+    int plane_size(int d)const;
+
+  private:
+    const VirtualTopology3D *vct;
+    MPI_Comm comm;
+    int n[3];
+    bool faceOnly;
+    int width;
+    bool isParticle;
+    /*! planes sent to the left and right neighbours */
+    int sendplane[2][3];
+    /*! ghost planes received from the left and right neighbours */
+    int recvplane[2][3];
+    int neighbor[2][3];
+    int tag;
+    int messages;
+    bool started;
+    std::vector<double***> vectors;
+    std::vector<int> bcs;
+    /*! buffers of the left and right neighbours of each direction */
+    std::vector<double> sendbuf[2][3];
+    std::vector<double> recvbuf[2][3];
+    MPI_Request requests[12];
+    int nrequests;
+};
+
+#endif
@@ -0,0 +1,100 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  KrylovWorkspace.h  -  Work vectors of the Krylov solvers
+  -------------------
+ ********************************************************************************************/
+
+#ifndef KrylovWorkspace_H
+#define KrylovWorkspace_H
+
+/*! Statistics of one solve, filled by GMRES() and CG() */
+struct KrylovStats
+{
+  KrylovStats(){ reset(); }
+  void reset()
+  {
+    iterations = 0;
+    restarts = 0;
+    reductions = 0;
+    residual = 0.0;
+    time = 0.0;
+    preconditioner_time = 0.0;
+    converged = false;
+  }
+  /*! number of Krylov iterations (matrix-vector products after the first residual) */
+  int iterations;
+  /*! number of GMRES restarts (0 for CG) */
+  int restarts;
+  /*! number of global reductions (MPI_Allreduce calls) */
+  int reductions;
+  /*! final residual relative to the source */
+  double residual;
+  /*! wall clock time of the solve in seconds */
+  double time;
+  /*! part of time spent in the preconditioner */
+  double preconditioner_time;
+  bool converged;
+};
+
+/*! @brief Work vectors of GMRES(m) and CG
+ *
+ * The vectors are allocated by reserve() and reused by all the following
+ * solves, so the solvers do not allocate anything when they are given a
+ * workspace. The workspace grows if a solve needs a longer vector or a
+ * larger Krylov space, or the preconditioned basis, it never shrinks. One workspace can be shared by
+ * solves of different length as long as they do not run at the same time.
+ */
+class KrylovWorkspace
+{
+  public:
+    KrylovWorkspace();
+    ~KrylovWorkspace();
+    /*! make room for vectors of length len and a Krylov space of dimension m,
+        with the preconditioned basis Z if flexible */
+    void reserve(int len, int m, bool flexible = false);
+    int get_len()const{ return len; }
+    int get_m()const{ return m; }
+
+  public:
+    /*! residual and image of the current solution */
+    double *r;
+    double *im;
+    /*! Krylov basis, (m+1) vectors of length len */
+    double **V;
+    /*! preconditioned basis of flexible GMRES, (m+1) vectors of length len */
+    double **Z;
+    /*! Hessenberg matrix, (m+1) x m */
+    double **H;
+    /*! right hand side of the least squares problem and Givens rotations */
+    double *s;
+    double *cs;
+    double *sn;
+    double *y;
+
+  private:
+    void release();
+    int len;
+    int m;
+    bool flexible;
+};
+
+#endif
@@ -41,6 +41,7 @@ template<class type>
 class Larray
 {
   static const int num_elem_in_block = 8;
+  static const int num_elem_first_touch = 1<<16;
  private: // members
   type* list;
   int _size; // number of particles in list
@@ -78,7 +79,9 @@ class Larray
     }
     else
     {
-      reserve(newsize);
+      // keep any larger capacity already reserved
+      if(newsize > _capacity)
+        reserve(newsize);
       _size = newsize;
     }
   }
@@ -176,10 +179,17 @@ class Larray
     {
       _capacity = newcapacity;
       type* oldList = list;
-      // the next two lines assume that type has no indirection
+      // the next lines assume that type has no indirection
       list = AlignedAlloc(type,_capacity);
-      memcpy(list,oldList,sizeof(type)*_size);
-      // for(int i=0;i<_size;i++) list[i] = oldList[i];
+      // large lists are copied by all threads with the static schedule of
+      // the particle loops, so each page is first touched by its user
+      if(_size < num_elem_first_touch)
+        memcpy(list,oldList,sizeof(type)*_size);
+      else
+      {
+        #pragma omp parallel for schedule(static)
+        for(int i=0;i<_size;i++) list[i] = oldList[i];
+      }
       AlignedFree(oldList);
     }
   }
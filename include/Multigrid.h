@@ -0,0 +1,96 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  Multigrid.h  -  Geometric multigrid for the Poisson problems of the divergence cleanings
+  -------------------
+ ********************************************************************************************/
+
+#ifndef Multigrid_H
+#define Multigrid_H
+
+#include <mpi.h>
+#include <vector>
+#include "ipicfwd.h"
+#include "arraysfwd.h"
+#include "Preconditioner.h"
+
+struct KrylovStats;
+
+/*! @brief Geometric multigrid for lap(u) = f on the cell centres
+ *
+ * The operator is the one of EMfields3D::PoissonImage: the 7 point
+ * laplacian of Grid3DCU::lapC2Cpoisson on the interior cells, with zero
+ * ghost cells at the physical boundaries. Vectors are in the layout of
+ * the Krylov vectors (interior cells, k fastest).
+ *
+ * Each coarse level halves the local number of cells in the three
+ * directions, as long as they are all even, so that the subdomains are
+ * the same on all levels. The smoother is red-black Gauss-Seidel with
+ * the colours of the global cell indices, restriction averages the 8 fine
+ * cells of a coarse cell and prolongation is trilinear. The finest level
+ * exchanges its ghost cells with communicateCenterBoxStencilBC, the
+ * coarse levels with one MPI_Sendrecv per face, and the coarsest level is
+ * solved approximately by more sweeps of the smoother.
+ *
+ * solve() iterates V-cycles until the relative residual is below the
+ * tolerance, with one global reduction per V-cycle. apply() is one V-cycle
+ * from a zero initial guess, which is a fixed linear preconditioner of
+ * GMRES.
+ */
+class PoissonMultigrid : public KrylovPreconditioner
+{
+  public:
+    PoissonMultigrid(EMfields3D *field, int sweeps);
+    ~PoissonMultigrid();
+    /*! V-cycles on lap(x) = b from the initial guess x;
+        returns true if the relative residual gets below tol */
+    bool solve(double *x, const double *b, double tol, int max_cycles, KrylovStats *stats = 0);
+    /*! z = one V-cycle on lap(z) = v from z = 0 */
+    void apply(double *z, double *v);
+    int get_levels()const{ return levels; }
+
+  private:
+    void vcycle(int l);
+    void smooth(int l, int colour);
+    void residual(int l);
+    void restrict_residual(int l);
+    void prolong_correction(int l);
+    void exchange(int l, array3_double *a);
+    void copy_in(double ***a, const double *v);
+    void copy_out(double *v, double ***a);
+
+  private:
+    EMfields3D *field;
+    const VirtualTopology3D *vct;
+    MPI_Comm comm;
+    int sweeps;
+    int bottom_sweeps;
+    int levels;
+    /*! local interior cells and inverse squared cell sizes of each level */
+    std::vector<int> nx, ny, nz;
+    std::vector<double> ax, ay, az;
+    /*! solution, source and residual of each level, with one ghost cell */
+    std::vector<array3_double*> u, f, r;
+    /*! buffers of the face exchanges */
+    std::vector<double> sendbuf, recvbuf;
+};
+
+#endif
@@ -0,0 +1,89 @@
+/*******************************************************************************************
+  NeutralAtmosphere.h -  Neutral exosphere of the planet.
+  -------------------
+ ********************************************************************************************/
+#ifndef _NeutralAtmosphere_
+#define _NeutralAtmosphere_
+#include <math.h>
+#include "ipicfwd.h"
+#include "Alloc.h"
+/*! @file
+ *  Neutral exosphere densities used by the photo-ionization injection and by
+ *  the electron-neutral collisions.
+ *
+ *  There is one neutral species per planetary plasma species (nSurf, hExo,
+ *  fExo in the input file), each with a radial profile selected by
+ *  NeutralProfile:
+ *    - exp      : n = nSurf * exp(-(r-R)/hExo)
+ *    - powerlaw : n = nSurf * (R/r)^hExo
+ *  The density is zero inside the planet. All profiles are tabulated once
+ *  on a radial table covering the local subdomain, and once at the cell
+ *  centres of the local grid, so no exp/pow is evaluated during the run.
+ */
+
+class NeutralAtmosphere {
+  public:
+      /*! @brief Constructor: tabulates the profiles for the local subdomain
+      *
+      * @param[in] col Collective with simulation parameters
+      * @param[in] grid local grid
+      */
+      NeutralAtmosphere(CollectiveIO * col, Grid * grid);
+      ~NeutralAtmosphere();
+
+      /*! Number of neutral species */
+      int getNspecies()const{ return nNeut; }
+
+      /*! @brief Analytic profile of neutral species is at distance dist from the planet centre */
+      double profile(int is, double dist)const;
+
+      /*! @brief Density of neutral species is at distance dist, interpolated in the radial table */
+      double density(int is, double dist)const
+      {
+        if (dist <= R) return 0.0;
+        const double t = (dist - R)*invdr;
+        const int k = int(t);
+        if (k >= nr-1) return profile(is, dist);
+        const double *tab = table + is*nr;
+        return tab[k] + (t - k)*(tab[k+1] - tab[k]);
+      }
+
+      /*! @brief Density of neutral species is at position (x,y,z) */
+      double densityAt(int is, double x, double y, double z)const
+      {
+        const double xd = x - x_center;
+        const double yd = y - y_center;
+        const double zd = z - z_center;
+        return density(is, sqrt(xd*xd + yd*yd + zd*zd));
+      }
+
+      /*! @brief Distance of the centre of local cell (i,j,k) from the planet centre */
+      double getCellDistance(int i, int j, int k)const{ return cellDist.get(i,j,k); }
+      /*! @brief Density of neutral species is at the centre of local cell (i,j,k) */
+      double getCellDensity(int is, int i, int j, int k)const{ return cellDens.get(is,i,j,k); }
+
+  private:
+    enum Profile { EXPONENTIAL, POWERLAW };
+
+    int nNeut;
+    int *profileType;
+    double *nSurf;
+    double *hExo;
+
+    // Planet radius and centre (including the planet offset along z)
+    double R;
+    double x_center;
+    double y_center;
+    double z_center;
+
+    // Radial table: nr points from R with step dr, one row per species
+    int nr;
+    double dr;
+    double invdr;
+    double *table;
+
+    // Distance and densities at the cell centres of the local grid
+    array3_double cellDist;
+    array4_double cellDens;
+};
+#endif
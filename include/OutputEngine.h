@@ -0,0 +1,101 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  OutputEngine.h  -  Background writes of the pvtk output
+  -------------------
+ ********************************************************************************************/
+
+#ifndef OutputEngine_H
+#define OutputEngine_H
+
+#include <mpi.h>
+#include <string>
+#include <vector>
+#include "Alloc.h"
+
+/*! @brief Double-buffered background writes of the files of the output cycles
+ *
+ * The writers pack each file into a staging array obtained with stage3()
+ * or stage4() and hand it over with write(), which opens the file, lets
+ * rank 0 write the header, sets the view and starts the collective write
+ * of the data (MPI_File_iwrite_all, or the split collective
+ * MPI_File_write_all_begin of nbcvtk before MPI 3.1), then returns to the
+ * time loop. The staging arrays must not be touched after write().
+ *
+ * The files of one output cycle are staged in one of two sets of arrays,
+ * the next output cycle uses the other set while the first one drains.
+ * When an output cycle starts and its set still holds the files of the
+ * output cycle before the previous one, it waits for them to be written
+ * (back-pressure); the waiting time is accumulated in get_wait_time(). The
+ * arrays of a set are kept and reused, so the staging memory is twice the
+ * output of one cycle. end_cycle() closes an output cycle, progress()
+ * lets the library advance the pending writes and finish() completes all
+ * of them. Files are closed (a collective operation) only in the calls
+ * made by all the processes, in the order they were written.
+ */
+class OutputEngine
+{
+  public:
+    OutputEngine(MPI_Comm comm);
+    ~OutputEngine();
+    /*! staging array of the next file of the current output cycle,
+        of n1*n2*n3 (n1*n2*n3*n4) floats */
+    float ***stage3(int n1, int n2, int n3);
+    float ****stage4(int n1, int n2, int n3, int n4);
+    /*! write count elements of etype of buffer, a staging array of the
+        current output cycle, with the view filetype after header in the
+        file filename */
+    void write(const std::string &filename, const char *header,
+      MPI_Datatype etype, MPI_Datatype filetype, const float *buffer, int count);
+    /*! the arrays staged from now on belong to the next output cycle */
+    void end_cycle(){ open = false; }
+    void progress();
+    void finish();
+    /*! time spent waiting for the writes of earlier output cycles */
+    double get_wait_time()const{ return wait_time; }
+
+  private:
+    struct Staged
+    {
+      iPic3D::array3<float> *array3;
+      iPic3D::array4<float> *array4;
+      MPI_File fh;
+      MPI_Request request;
+      std::string filename;
+      /*! data of the array staged in the current output cycle */
+      const float *buffer;
+      bool pending;
+    };
+    Staged &next_staged();
+    void complete(int s);
+
+  private:
+    MPI_Comm comm;
+    int rank;
+    /*! the two sets of staging arrays and the number used by their output cycle */
+    std::vector<Staged> sets[2];
+    int used[2];
+    int current;
+    bool open;
+    double wait_time;
+};
+
+#endif
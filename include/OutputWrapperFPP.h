@@ -60,6 +60,10 @@ class OutputWrapperFPP
   void append_output(const char* tag, int cycle);
   void append_output(const char* tag, int cycle, int sample);
   void append_restart(int cycle);
+  /*! write the restart dump of cycle in the new file filename */
+  void write_restart(const string& filename, int cycle);
+ private:
+  void output_restart(int cycle);
 };
 
 #endif // OutputWrapperFPP_h
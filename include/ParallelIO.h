@@ -33,6 +33,7 @@
 #include "ipicfwd.h"
 #include "arraysfwd.h"
 #include <string>
+class OutputEngine;
 using std::string;
 
 void WriteFieldsH5hut(int nspec, Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, int cycle);
@@ -66,10 +67,9 @@ int WriteMomentsVTKNonblk(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VC
  * @param[in] vct built-in type defining the 3D MPI cartesian topology
  * @param[in] tag tags for the desired files from the input configuration file (Spar, Sperp, Stot)
  * @param[in] cycle number of the current iteration
- * @param[in] spectrawritebuffere 4D array for electrons: [x index of cell][y index of cell][z index of cell][total absolute charge in different bins on the cell]
- * @param[in] spectrawritebufferi 4D array for ions: [x index of cell][y index of cell][z index of cell][total charge in different bins on the cell]
+ * @param[in] engine background writer of the files; the Stot, Spar and Sperp arrays are staged in it: [z index of cell][y index of cell][x index of cell][total absolute charge in different bins on the cell]
  */
-void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle,float****  spectrawritebuffere,float****  spectrawritebufferi);
+void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle, OutputEngine *engine);
 
 /*! @brief Write the temperature tensor into vtk files.
  *
@@ -83,13 +83,13 @@ void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, Collect
  * @param[in] vct built-in type defining the 3D MPI cartesian topology
  * @param[in] tag tags for the desired files from the input configuration file (Tcart, Tperpar)
  * @param[in] cycle number of the current iteration
- * @param[in] temperaturewritebuffer 4D array: [x index of cell][y index of cell][z index of cell][components of the tensor]
+ * @param[in] engine background writer of the files; the tensors are staged in it: [z index of cell][y index of cell][x index of cell][components of the tensor]
  */
-void WriteTemperatureVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle,float**** temperaturewritebuffer);
+void WriteTemperatureVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle, OutputEngine *engine);
 
 void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle);
-void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle,float**** fieldwritebuffer);
-void WriteMomentsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle,float***  momentswritebuffer);
+void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle, OutputEngine *engine);
+void WriteMomentsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle, OutputEngine *engine);
 void WriteTestPclsVTK(int nspec, Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & tag, int cycle, MPI_Request *testpartMPIReq, MPI_File *fh);
 void ByteSwap(unsigned char * b, int n);
 #endif
@@ -111,19 +111,50 @@ class Particles3D:public Particles3Dcomm {
    public:
     /** repopulate particles in boundary layer */
     double repopulate_particles(Field * EMf);
-    /*! Delete the particles inside the sphere with radius R and center x_center y_center and return the total charge removed */
-    double rotateAndCountParticlesInsideSphere(int cycle, double R, double x_center, double y_center, double z_center);
-    double deleteParticlesInsideSphere(int cycle, double Qrm, double R, double x_center, double y_center, double z_center);
+    /** remove the pcls leaving through the riemission faces and inject the
+        SW pcls entering through them, returns the net charge injected */
+    double inflow_particles(long long injected[6], long long removed[6]);
+    /*! Delete the particles inside the planet and return the total charge removed */
+    double removeParticlesInsideSphere(int cycle);
     double rotateAndCountParticlesInsideSphere2DPlaneXZ(int cycle, double R, double x_center, double z_center);
     double deleteParticlesInsideSphere2DPlaneXZ(int cycle, double Qrm, double R, double x_center, double z_center);
-    /** Add the ionized exosphere */
-    double AddIonizedExosphere(int i);
-    /** Calculate neutral density */
-    double neutralDensity(double Nexo, double dist, double R, double hexo);
+    /** Add the ionized exosphere of neutral species ipl */
+    double AddIonizedExosphere(int ipl, const NeutralAtmosphere *neutrals);
+    /** bins of the histograms of the particles per cell: 0, [1,2), [2,4),
+        ..., [512,1024), >= 1024 */
+    static const int population_bins = 12;
+    /** merge the particles of the cells holding more than nmax of them and
+        split the heaviest particles of the cells holding less than nmin
+        (0 = off); histogram[0] and [1] count the cells of the subdomain
+        before and after, removed and added the particles */
+    void control_population(int nmax, int nmin,
+      long long histogram[2][population_bins], long long& removed, long long& added);
+   private:
+    /** build the list of exosphere cells of neutral species ipl with their expected injection per cycle */
+    void initIonizedExosphere(int ipl, const NeutralAtmosphere *neutrals);
+   public:
     /**Particles Open Boundary */
     void openbc_particles_outflow();
     void openbc_delete_testparticles();
     void openbc_particles_inflow();
+
+  private:
+    /** add particle pidx, just moved to (x,y,z), to list if it is inside the planet of radius R2=R*R */
+    static void markIfInsideSphere(std::vector<int>& list, int pidx, double x, double y, double z,
+      double R2, double x_center, double y_center, double z_center)
+    {
+      const double xd = x - x_center;
+      const double yd = y - y_center;
+      const double zd = z - z_center;
+      if (xd*xd + yd*yd + zd*zd < R2) list.push_back(pidx);
+    }
+    /** append particle pcl to the binary log of removed particles */
+    void logRemovedParticle(int cycle, const SpeciesParticle& pcl);
+
+    // Particles3D must not add data members: arrays of Particles3D are
+    // also accessed as arrays of Particles3Dcomm (moments, output).
 };
+static_assert(sizeof(Particles3D) == sizeof(Particles3Dcomm),
+  "Particles3D must not add data members to Particles3Dcomm");
 
 #endif
@@ -27,6 +27,8 @@ developers: Stefano Markidis, Giovanni Lapenta
 #ifndef Part3DCOMM_H
 #define Part3DCOMM_H
 
+#include <stdio.h>
+#include <vector>
 #include "ipicfwd.h"
 #include "Alloc.h"
 #include "Particle.h" // for ParticleType
@@ -421,6 +423,8 @@ protected:
   int bcPfaceZright;
   /** Boundary Condition Particles: FaceYleft */
   int bcPfaceZleft;
+  /** InflowMethod = flux: the pcls leaving through the riemission faces are removed */
+  bool fluxInflow;
   //
   // Other variables
   //
@@ -447,6 +451,29 @@ protected:
   double umin;
   double vmin;
   double wmin;
+
+ protected:
+
+  // Planet surface: particles found inside the planet by the mover (all
+  // threads and per thread) and number of particles after the mover (-1 if
+  // the mover did not test them)
+  std::vector<int> pclsInsideSphere;
+  std::vector< std::vector<int> > insideSphereThread;
+  int nopMoved;
+  // Binary log of the removed particles, opened at the first write
+  FILE *removedLog;
+
+  // Ionized exosphere injection: neutral species the tables refer to (-1 if
+  // not built yet), local indices (i,j,k) of the cells between R and Rmax,
+  // expected number of particles injected per cycle in each cell, fraction
+  // of particle carried over to the next cycle, first particle of each cell
+  // in the current injection and one erand48 stream per thread.
+  int exoSpecies;
+  std::vector<int> exoCells;
+  std::vector<double> exoExpected;
+  std::vector<double> exoCarry;
+  std::vector<int> exoOffset;
+  std::vector<unsigned short> exoRng;
 };
 
 // find the particles with particular IDs and print them
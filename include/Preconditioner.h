@@ -0,0 +1,108 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  Preconditioner.h  -  Right preconditioners of the Krylov solvers
+  -------------------
+ ********************************************************************************************/
+
+#ifndef Preconditioner_H
+#define Preconditioner_H
+
+#include <mpi.h>
+#include "ipicfwd.h"
+#include "GMRES.h"
+
+/*! @brief Right preconditioner M of GMRES: z = M^{-1} v
+ *
+ * GMRES calls setup() at the start of every solve, since the operator
+ * changes from a cycle to the next, and apply() once per iteration.
+ */
+class KrylovPreconditioner
+{
+  public:
+    virtual ~KrylovPreconditioner(){}
+    /*! adapt to the current operator, return the number of global reductions made */
+    virtual int setup(){ return 0; }
+    /*! z = M^{-1} v, vectors of the length of the Krylov vectors */
+    virtual void apply(double *z, double *v) = 0;
+};
+
+/*! @brief Block-Jacobi preconditioner
+ *
+ * Each process solves its own subdomain problem, with the local operator
+ * LocalImage that does not communicate, by a few GMRES iterations without
+ * restart from a zero initial guess. There is no communication at all, the
+ * cost of one application is about the cost of iterations matrix-vector
+ * products. The inner iterations make it nonlinear, which the flexible
+ * GMRES of the solver allows for.
+ */
+class BlockJacobiPreconditioner : public KrylovPreconditioner
+{
+  public:
+    BlockJacobiPreconditioner(FIELD_IMAGE LocalImage, EMfields3D *field, int len, int iterations);
+    ~BlockJacobiPreconditioner();
+    void apply(double *z, double *v);
+
+  private:
+    FIELD_IMAGE LocalImage;
+    EMfields3D *field;
+    int len;
+    int iterations;
+    // Krylov basis and Hessenberg matrix of the inner GMRES
+    double **Q;
+    double **H;
+    double *g;
+    double *cs;
+    double *sn;
+};
+
+/*! @brief Polynomial preconditioner
+ *
+ * M^{-1} = p(A) with p the polynomial of degree iterations of damped
+ * Richardson iterations from a zero initial guess:
+ *   z = w v,  then  z += w (v - A z)  repeated iterations times.
+ * The damping w = 1/lambda with lambda the largest eigenvalue of the
+ * operator, estimated in setup() by a few power iterations on the local
+ * operator and a maximum over the processes. One application costs
+ * iterations matrix-vector products, with their halo exchanges, but no
+ * global reduction.
+ */
+class PolynomialPreconditioner : public KrylovPreconditioner
+{
+  public:
+    PolynomialPreconditioner(FIELD_IMAGE Image, FIELD_IMAGE LocalImage, EMfields3D *field,
+      int len, int iterations);
+    ~PolynomialPreconditioner();
+    int setup();
+    void apply(double *z, double *v);
+
+  private:
+    FIELD_IMAGE Image;
+    FIELD_IMAGE LocalImage;
+    EMfields3D *field;
+    int len;
+    int iterations;
+    double damping;
+    double *t;
+    double *q;
+};
+
+#endif
@@ -0,0 +1,95 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  RestartStager.h  -  Restart dumps staged on node-local storage
+  -------------------
+ ********************************************************************************************/
+
+#ifndef RestartStager_H
+#define RestartStager_H
+
+#include <mpi.h>
+#include <pthread.h>
+#include <string>
+using std::string;
+
+/*! @brief Two-level restart dumps (RestartStagingDirName)
+ *
+ * Each process writes its restart file in the node-local directory
+ * RestartStagingDirName, given by stage(), and calls flush(), which starts
+ * a thread copying it to SaveDirName/checkpoint_<cycle>/ and returns to
+ * the time loop. The staged file is removed once copied.
+ *
+ * progress(), called by all the processes, checks whether the copies of
+ * all the processes are done; if so rank 0 writes the completion marker
+ * checkpoint_<cycle>/complete and removes the checkpoints older than the
+ * last RestartKeep complete ones. A checkpoint without the marker (a copy
+ * interrupted by the end of the job) is never used for restarting. The
+ * next stage() waits for the copy of the previous dump (back-pressure);
+ * the waiting time is accumulated in get_wait_time(). finish() completes
+ * the pending copy.
+ */
+class RestartStager
+{
+  public:
+    RestartStager(MPI_Comm comm, const string &staging_dir, const string &save_dir, int keep);
+    ~RestartStager();
+    /*! file of this process in the staging directory for the dump of cycle */
+    string stage(int cycle);
+    /*! copy the file given by stage() in the background */
+    void flush();
+    void progress();
+    void finish();
+    /*! time spent waiting for the copy of the previous dump */
+    double get_wait_time()const{ return wait_time; }
+
+  private:
+    static void *copy_thread(void *stager);
+    void complete();
+    void remove_old_checkpoints();
+
+  private:
+    MPI_Comm comm;
+    int rank;
+    int nprocs;
+    string staging_dir;
+    string save_dir;
+    int keep;
+    /*! the staged file, its copy in the checkpoint directory and their cycle */
+    string staged_file;
+    string checkpoint_file;
+    int cycle;
+    pthread_t thread;
+    pthread_mutex_t mutex;
+    /*! a copy is running (or done and not yet completed) */
+    bool pending;
+    /*! the copy runs in thread */
+    bool threaded;
+    /*! set by the thread: 0 copying, 1 done, -1 failed */
+    int copy_status;
+    string copy_error;
+    double wait_time;
+};
+
+/*! directory of the newest complete checkpoint in dirname, dirname itself if there is none */
+string LatestCheckpointDirName(const string &dirname);
+
+#endif
@@ -0,0 +1,71 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  SharedRestart.h  -  Restart file shared by all the processes
+  -------------------
+ ********************************************************************************************/
+
+#ifndef SharedRestart_H
+#define SharedRestart_H
+
+#include "ipicfwd.h"
+#include "arraysfwd.h"
+#include "aligned_vector.h"
+#include <string>
+using std::string;
+
+/*! @brief Restart file shared by all the processes (RestartMethod = shared)
+ *
+ * The restart is written in the single file restart.h5, whose layout does
+ * not depend on the decomposition, so that a simulation can be restarted
+ * on a different XLEN x YLEN x ZLEN:
+ *
+ * /last_cycle, /ncell              cycle of the dump, global number of cells
+ * /fields/Bx ... /fields/Ez        global arrays of nodes, [Nxc+1][Nyc+1][Nzc+1]
+ * /moments/species_N/rho           same
+ * /particles/species_N/x ... /ID   particles of all the processes, one after
+ *                                  the other in the order of the ranks
+ * /particles/species_N/npart       number of particles of each writing process
+ * /particles/species_N/bounds      bounding box of them, [xmin xmax ymin ymax zmin zmax]
+ *
+ * With parallel HDF5 the file is written with the MPI-IO driver and
+ * collective transfers. With the sequential library the processes write
+ * their part in turn. The file is written as restart.h5.tmp and renamed
+ * once complete, so that a failed dump leaves the previous restart.
+ *
+ * On reading, each process takes the slab of nodes of its subdomain and
+ * the particles in it, reading only the blocks of the writing processes
+ * whose bounding box intersects the subdomain.
+ */
+void WriteSharedRestart(Grid3DCU *grid, EMfields3D *EMf, Particles3D *part, int ns, CollectiveIO *col, VCtopology3D *vct, int cycle);
+
+/*! cycle of the shared restart file in the directory dirname */
+int  ReadSharedRestartCycle(const string &dirname);
+
+void ReadSharedRestartFields(const Collective *col, const VCtopology3D *vct, const Grid3DCU *grid,
+  arr3_double Bxn, arr3_double Byn, arr3_double Bzn,
+  arr3_double Ex, arr3_double Ey, arr3_double Ez, array4_double *rhons, int ns);
+
+void ReadSharedRestartParticles(const Collective *col, const VCtopology3D *vct, const Grid3DCU *grid, int species_number,
+  vector_double& u, vector_double& v, vector_double& w, vector_double& q,
+  vector_double& x, vector_double& y, vector_double& z, vector_double& t);
+
+#endif
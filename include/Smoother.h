@@ -0,0 +1,95 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/*******************************************************************************************
+  Smoother.h  -  Smoothing of the fields and moments with wide halos
+  -------------------
+ ********************************************************************************************/
+
+#ifndef Smoother_H
+#define Smoother_H
+
+#include <vector>
+#include "ipicfwd.h"
+#include "arraysfwd.h"
+#include "HaloExchange.h"
+
+/*! @brief Repeated 7 point smoothing of one or more arrays
+ *
+ * Each pass replaces the interior cells by alpha times the cell plus
+ * (1-alpha)/6 times the sum of the 6 neighbours ((1-alpha)/4 of the 4
+ * neighbours in X and Z in 2D), with the boundary conditions of the
+ * arrays in the ghost cells of the faces without neighbour.
+ *
+ * The arrays are copied in two buffers of their size plus width-1 more
+ * layers of ghost cells on each side, allocated once. The passes go from
+ * one buffer to the other by swapping them, and one exchange of the
+ * width layers of ghost cells of all the arrays serves width passes: the
+ * first of them also computes the cells of the halo, the next ones fewer,
+ * as far as the stencil allows. The width is the number of passes, or
+ * less if the subdomains are too small. The first pass after an exchange
+ * computes the cells that do not need the halo while the messages are in
+ * flight. The smoothed arrays are copied back with, in their ghost cells,
+ * the values seen by the last pass.
+ */
+class Smoother
+{
+  public:
+    /*! smoothing of arrays of nx*ny*nz nodes (isCenter false) or centres,
+        with the neighbours of the particle topology if isParticle */
+    Smoother(const VirtualTopology3D *vct, int nx, int ny, int nz,
+      bool isCenter, bool isParticle, double alpha, int niter, bool is3D);
+    ~Smoother();
+    /*! add an array with the boundary conditions of its 6 faces (the bcFace
+        codes of BCface, in the order Xright, Xleft, Yright, Yleft, Zright, Zleft) */
+    void add(arr3_double vector, const int bc[6]);
+    /*! niter passes on all the arrays */
+    void smooth();
+    int get_width()const{ return width; }
+
+  private:
+    void sweep(int lo[3], int hi[3], int inlo[3], int inhi[3]);
+    void sweep_box(int i0, int i1, int j0, int j1, int k0, int k1);
+    void apply_bc(std::vector<double***> &buf);
+
+  private:
+    const VirtualTopology3D *vct;
+    /*! size of the arrays and of the buffers */
+    int nf[3];
+    int n[3];
+    double alpha;
+    int niter;
+    bool is3D;
+    int width;
+    /*! neighbours on the left and right of each direction */
+    bool neighbor[2][3];
+    std::vector<double***> vectors;
+    std::vector<int> bcs;
+    /*! the two buffers of each array and their halo exchanges */
+    std::vector<array3_double*> bufA, bufB;
+    std::vector<double***> arrA, arrB;
+    HaloExchange haloA;
+    HaloExchange haloB;
+    /*! source and destination of the current pass, swapped after each pass */
+    std::vector<double***> *src;
+    std::vector<double***> *dst;
+};
+
+#endif
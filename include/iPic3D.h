@@ -27,6 +27,8 @@
 #define _IPIC3D_H_
 
 class Timing;
+class OutputEngine;
+class RestartStager;
 
 #ifndef NO_MPI
 #include "mpi.h"
@@ -51,6 +53,9 @@ namespace iPic3D {
       EMf(0),
       part(0),
       colls(0),
+      neutrals(0),
+      outputEngine(0),
+      restartStager(0),
 #ifndef NO_HDF5
       outputWrapperFPP(0),
 #endif
@@ -58,10 +63,10 @@ namespace iPic3D {
       rho(0),
       BulkEnergy(0),
       momentum(0),
-      Count(0),
       Qdel(0),
       Qexo(0),
       Qrep(0),
+      inflowCounts(0),
       my_clock(0)
     {}
     int Init(int argc, char **argv);
@@ -74,6 +79,8 @@ namespace iPic3D {
     //
     void WriteRestart(int cycle);
     void WriteConserved(int cycle);
+    void WriteSolverStats(int cycle);
+    void WriteInflow(int cycle);
     void WriteVelocityDistribution(int cycle);
     void WriteVirtualSatelliteTraces();
     void WriteFields(int cycle);
@@ -92,6 +99,7 @@ namespace iPic3D {
     void convertParticlesToAoS();
     void convertParticlesToSynched();
     void sortParticles();
+    void ControlPopulation(int cycle);
 
   private:
     //static MPIdata * mpi;
@@ -103,14 +111,18 @@ namespace iPic3D {
     // Particles3D   *
     Particles3D   *testpart;
     Collisions    *colls;
+    NeutralAtmosphere *neutrals;
+    OutputEngine  *outputEngine; // background writes of the pvtk output
+    RestartStager *restartStager; // restart dumps staged on node-local storage
     double        *Ke;
     double        *rho;
     double        *BulkEnergy;
     double        *momentum;
-    double        *Count;
     double        *Qdel;
     double        *Qexo;
     double        *Qrep;
+    long long    (*inflowCounts)[2][6]; // pcls injected and removed at each face since the last diagnostics
+    int           inflowCycles;
     Timing        *my_clock;
 
 #ifndef NO_HDF5
@@ -125,6 +137,9 @@ namespace iPic3D {
     string RestartDirName;
     string cqsat;
     string cq;
+    string solverStats;
+    string populationStats;
+    string inflowStats;
     string ds;
     string num_proc_str;
     int restart_cycle;
@@ -164,24 +179,6 @@ namespace iPic3D {
     MPI_Status  momentstsArr[14];
     int momentreqcounter;
 
-    float**** spectrawritebuffere;
-    MPI_Request spectrareqArre[6];//Stot+Spar+Sperp for species0,1
-    MPI_File    spectrafhArre[6];
-    MPI_Status  spectrastsArre[6];
-    int spectrareqcountere;
-
-    float**** spectrawritebufferi;
-    MPI_Request spectrareqArri[6];//Stot+Spar+Sperp for species0,1
-    MPI_File    spectrafhArri[6];
-    MPI_Status  spectrastsArri[6];
-    int spectrareqcounteri;
-
-    float**** temperaturewritebuffer;
-    MPI_Request temperaturereqArr[4];//Tcart+Tperpar for species0,1
-    MPI_File    temperaturefhArr[4];
-    MPI_Status  temperaturestsArr[4];
-    int temperaturereqcounter;
-
   };
 
 }
@@ -33,5 +33,6 @@ class Particles3D;
 class Particles3Dcomm;
 typedef Particles3Dcomm Particles;
 class Collisions;
+class NeutralAtmosphere;
 
 #endif
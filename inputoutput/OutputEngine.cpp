@@ -0,0 +1,190 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <mpi.h>
+#include <assert.h>
+#include <string.h>
+#include "OutputEngine.h"
+#include "errors.h"
+
+// MPI_File_iwrite_all is part of MPI 3.1
+#if MPI_VERSION > 3 || (MPI_VERSION == 3 && MPI_SUBVERSION >= 1)
+  #define HAVE_IWRITE_ALL
+#endif
+
+/* message of an MPI error code */
+static void mpi_io_warning(const char *what, const std::string &filename, int error_code)
+{
+  char error_string[MPI_MAX_ERROR_STRING];
+  int length_of_error_string;
+  MPI_Error_string(error_code, error_string, &length_of_error_string);
+  warning_printf("%s of %s failed: %s", what, filename.c_str(), error_string);
+}
+
+OutputEngine::OutputEngine(MPI_Comm comm_) :
+  comm(comm_),
+  current(0),
+  open(false),
+  wait_time(0.0)
+{
+  MPI_Comm_rank(comm, &rank);
+  used[0] = 0;
+  used[1] = 0;
+}
+
+OutputEngine::~OutputEngine()
+{
+  finish();
+  for (int s = 0; s < 2; s++)
+    for (size_t i = 0; i < sets[s].size(); i++) {
+      delete sets[s][i].array3;
+      delete sets[s][i].array4;
+    }
+}
+
+/*! wait for the writes of the set s and close their files */
+void OutputEngine::complete(int s)
+{
+  for (int i = 0; i < used[s]; i++) {
+    Staged &staged = sets[s][i];
+    if (!staged.pending)
+      continue;
+    MPI_Status status;
+#ifdef HAVE_IWRITE_ALL
+    int error_code = MPI_Wait(&staged.request, &status);
+#else
+    int error_code = MPI_File_write_all_end(staged.fh, (void*) staged.buffer, &status);
+#endif
+    if (error_code != MPI_SUCCESS)
+      mpi_io_warning("Background write", staged.filename, error_code);
+    MPI_File_close(&staged.fh);
+    staged.pending = false;
+  }
+  used[s] = 0;
+}
+
+/*! next staging array of the current output cycle, starting a new
+    output cycle in the other set if none is open */
+OutputEngine::Staged &OutputEngine::next_staged()
+{
+  if (!open) {
+    current = 1 - current;
+    open = true;
+    // back-pressure: the set still holds the output cycle before the previous one
+    const double start = MPI_Wtime();
+    complete(current);
+    wait_time += MPI_Wtime() - start;
+  }
+  std::vector<Staged> &set = sets[current];
+  if (used[current] == (int) set.size()) {
+    Staged staged;
+    staged.array3 = 0;
+    staged.array4 = 0;
+    staged.buffer = 0;
+    staged.pending = false;
+    set.push_back(staged);
+  }
+  return set[used[current]++];
+}
+
+float ***OutputEngine::stage3(int n1, int n2, int n3)
+{
+  Staged &staged = next_staged();
+  iPic3D::array3<float> *&a = staged.array3;
+  if (a && (int(a->dim1()) != n1 || int(a->dim2()) != n2 || int(a->dim3()) != n3)) {
+    delete a;
+    a = 0;
+  }
+  if (!a)
+    a = new iPic3D::array3<float>(n1, n2, n3);
+  staged.buffer = a->get_arr();
+  return a->fetch_arr3();
+}
+
+float ****OutputEngine::stage4(int n1, int n2, int n3, int n4)
+{
+  Staged &staged = next_staged();
+  iPic3D::array4<float> *&a = staged.array4;
+  if (a && (int(a->dim1()) != n1 || int(a->dim2()) != n2 || int(a->dim3()) != n3 || int(a->dim4()) != n4)) {
+    delete a;
+    a = 0;
+  }
+  if (!a)
+    a = new iPic3D::array4<float>(n1, n2, n3, n4);
+  staged.buffer = a->get_arr();
+  return a->fetch_arr4();
+}
+
+void OutputEngine::write(const std::string &filename, const char *header,
+  MPI_Datatype etype, MPI_Datatype filetype, const float *buffer, int count)
+{
+  assert(open);
+  int i = 0;
+  while (i < used[current] && sets[current][i].buffer != buffer)
+    i++;
+  if (i == used[current] || sets[current][i].pending)
+    eprintf("%s is not written from a staging array", filename.c_str());
+  Staged &staged = sets[current][i];
+  const int nelem = strlen(header);
+  int error_code = MPI_File_open(comm, (char*) filename.c_str(), MPI_MODE_CREATE | MPI_MODE_WRONLY, MPI_INFO_NULL, &staged.fh);
+  if (error_code != MPI_SUCCESS) {
+    mpi_io_warning("MPI_File_open", filename, error_code);
+    return;
+  }
+  if (rank == 0) {
+    MPI_Status status;
+    MPI_File_write(staged.fh, (void*) header, nelem, MPI_BYTE, &status);
+  }
+  error_code = MPI_File_set_view(staged.fh, nelem, etype, filetype, (char*) "native", MPI_INFO_NULL);
+  if (error_code != MPI_SUCCESS)
+    mpi_io_warning("MPI_File_set_view", filename, error_code);
+#ifdef HAVE_IWRITE_ALL
+  error_code = MPI_File_iwrite_all(staged.fh, (void*) buffer, count, etype, &staged.request);
+#else
+  error_code = MPI_File_write_all_begin(staged.fh, (void*) buffer, count, etype);
+#endif
+  if (error_code != MPI_SUCCESS)
+    mpi_io_warning("Background write", filename, error_code);
+  staged.filename = filename;
+  staged.pending = true;
+}
+
+void OutputEngine::progress()
+{
+#ifdef HAVE_IWRITE_ALL
+  for (int s = 0; s < 2; s++)
+    for (int i = 0; i < used[s]; i++) {
+      Staged &staged = sets[s][i];
+      if (!staged.pending || staged.request == MPI_REQUEST_NULL)
+        continue;
+      // the request stays valid, the file is closed by complete()
+      int flag;
+      MPI_Request_get_status(staged.request, &flag, MPI_STATUS_IGNORE);
+    }
+#endif
+}
+
+void OutputEngine::finish()
+{
+  // the older output cycle first, as its files were opened first
+  complete(1 - current);
+  complete(current);
+  open = false;
+}
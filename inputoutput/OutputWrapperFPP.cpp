@@ -83,7 +83,8 @@ void OutputWrapperFPP::init_output_files(
   		  hdf5_agent.close();
         }
 
-    	if (restart_status == 0) {
+    	// staged dumps are written in new files
+    	if (restart_status == 0 && col->getRestartMethod() == "fpp" && col->getRestartStagingDirName().empty()) {
     		hdf5_agent.open(restart_file);
     		hdf5_agent.close();
     	}
@@ -115,11 +116,27 @@ void OutputWrapperFPP::append_restart(int cycle)
 {
 #ifndef NO_HDF5
 		hdf5_agent.open_append(restart_file);
+		output_restart(cycle);
+		hdf5_agent.close();
+#endif
+}
+
+void OutputWrapperFPP::write_restart(const string& filename, int cycle)
+{
+#ifndef NO_HDF5
+		hdf5_agent.open(filename);
+		output_restart(cycle);
+		hdf5_agent.close();
+#endif
+}
+
+void OutputWrapperFPP::output_restart(int cycle)
+{
+#ifndef NO_HDF5
 		output_mgr.output("proc_topology ", cycle);
 		output_mgr.output("Eall + Ball + rhos + Js + pressure", cycle);
 		output_mgr.output("position + velocity + q + ID", cycle, 0);
 		output_mgr.output("testpartpos + testpartvel + testpartcharge", cycle, 0);
 		output_mgr.output("last_cycle", cycle);
-		hdf5_agent.close();
 #endif
 }
@@ -24,6 +24,7 @@
 #include <stdlib.h>
 
 #include "ParallelIO.h"
+#include "OutputEngine.h"
 #include "MPIdata.h"
 #include "TimeTasks.h"
 #include "Collective.h"
@@ -36,6 +37,7 @@
 #include <iostream>
 #include <sstream>
 #include <iomanip>
+#include <vector>
 
 /*! Function used to write the EM fields using the parallel HDF5 library */
 void WriteOutputParallel(Grid3DCU *grid, EMfields3D *EMf, Particles3Dcomm *part, CollectiveIO *col, VCtopology3D *vct, int cycle){
@@ -681,7 +683,7 @@ void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopolo
 	}
 }
 
-void WriteMomentsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle, float*** momentswritebuffer){
+void WriteMomentsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle, OutputEngine *engine){
 
 	//All VTK output at grid cells excluding ghost cells
 	const int nxn  =grid->getNXN(),nyn  = grid->getNYN(),nzn =grid->getNZN();
@@ -690,8 +692,6 @@ void WriteMomentsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopol
 	const double spaceY = dimY>1 ?col->getLy()/(dimY-1) :col->getLy();
 	const double spaceZ = dimZ>1 ?col->getLz()/(dimZ-1) :col->getLz();
 	const int    nPoints = dimX*dimY*dimZ;
-	MPI_File     fh;
-	MPI_Status   status;
 	const string momentstags[]={"rho", "PXX", "PXY", "PXZ", "PYY", "PYZ", "PZZ"};
 	const int    tagsize = size(momentstags);
 	const string outputtag = col->getMomentsOutputTag();
@@ -702,6 +702,7 @@ void WriteMomentsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopol
 
 		 for(int si=0;si<ns;si++){
 			 char  header[1024];
+			 float ***momentswritebuffer = engine->stage3(nzn-3, nyn-3, nxn-3);
 			 if (momentstags[tagid].compare("rho") == 0){
 				for(int iz=0;iz<nzn-3;iz++)
 				  for(int iy=0;iy<nyn-3;iy++)
@@ -838,43 +839,14 @@ void WriteMomentsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopol
 					  }
 		 }
 
-		  int nelem = strlen(header);
-		  int charsize=sizeof(char);
-		  MPI_Offset disp = nelem*charsize;
-
 		  ostringstream filename;
 		  filename << col->getSaveDirName() << "/" << col->getSimName() << "_" << momentstags[tagid] << ((si%2==0)?"e":"i")<< si  << "_" << cycle << ".vtk";
-		  MPI_File_open(vct->getFieldComm(),filename.str().c_str(), MPI_MODE_CREATE|MPI_MODE_WRONLY, MPI_INFO_NULL, &fh);
-
-		  if (vct->getCartesian_rank()==0){
-			  MPI_File_write(fh, header, nelem, MPI_BYTE, &status);
-		  }
-
-	      int error_code = MPI_File_set_view(fh, disp, MPI_FLOAT, EMf->getProcview(), "native", MPI_INFO_NULL);
-	      if (error_code != MPI_SUCCESS) {
-			char error_string[100];
-			int length_of_error_string, error_class;
-			MPI_Error_class(error_code, &error_class);
-			MPI_Error_string(error_class, error_string, &length_of_error_string);
-			dprintf("Error in MPI_File_set_view: %s\n", error_string);
-		  }
-
-	      error_code = MPI_File_write_all(fh, momentswritebuffer[0][0],(nxn-3)*(nyn-3)*(nzn-3),MPI_FLOAT, &status);
-	      if(error_code != MPI_SUCCESS){
-		      int tcount=0;
-		      MPI_Get_count(&status, MPI_FLOAT, &tcount);
-	          char error_string[100];
-	          int length_of_error_string, error_class;
-	          MPI_Error_class(error_code, &error_class);
-	          MPI_Error_string(error_class, error_string, &length_of_error_string);
-	          dprintf("Error in MPI_File_write_all: %s, wrote %d MPI_FLOAT\n", error_string,tcount);
-	      }
-	      MPI_File_close(&fh);
+		  engine->write(filename.str(), header, MPI_FLOAT, EMf->getProcview(), momentswritebuffer[0][0], (nxn-3)*(nyn-3)*(nzn-3));
 		 }//END OF SPECIES
 	}//END OF TAGS
 }
 
-void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle,float**** fieldwritebuffer){
+void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle, OutputEngine *engine){
 
   //All VTK output at grid cells excluding ghost cells
   const int nxn  =grid->getNXN(),nyn  = grid->getNYN(),nzn =grid->getNZN();
@@ -883,8 +855,6 @@ void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopolo
   const double spaceY = dimY>1 ?col->getLy()/(dimY-1) :col->getLy();
   const double spaceZ = dimZ>1 ?col->getLz()/(dimZ-1) :col->getLz();
   const int    nPoints = dimX*dimY*dimZ;
-  MPI_File     fh;
-  MPI_Status   status;
   const string fieldtags[]={"B", "E", "Je", "Ji","Je2", "Ji3"};
   const int    tagsize = size(fieldtags);
   const string outputtag = col->getFieldOutputTag();
@@ -894,6 +864,7 @@ void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopolo
    if (outputTag.find(fieldtags[tagid], 0) == string::npos) continue;
 
    char   header[1024];
+   float ****fieldwritebuffer = engine->stage4(nzn-3, nyn-3, nxn-3, 3);
    if (fieldtags[tagid].compare("B") == 0){
      for(int iz=0;iz<nzn-3;iz++)
         for(int iy=0;iy<nyn-3;iy++)
@@ -1024,43 +995,13 @@ void WriteFieldsVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopolo
           }
    }
 
-    int nelem = strlen(header);
-    int charsize=sizeof(char);
-    MPI_Offset disp = nelem*charsize;
-
     ostringstream filename;
     filename << col->getSaveDirName() << "/" << col->getSimName() << "_"<< fieldtags[tagid] << "_" << cycle << ".vtk";
-    MPI_File_open(vct->getFieldComm(),filename.str().c_str(), MPI_MODE_CREATE|MPI_MODE_WRONLY, MPI_INFO_NULL, &fh);
-
-    if (vct->getCartesian_rank()==0){
-      MPI_File_write(fh, header, nelem, MPI_BYTE, &status);
-    }
-
-      int error_code = MPI_File_set_view(fh, disp, EMf->getXYZeType(), EMf->getProcviewXYZ(), "native", MPI_INFO_NULL);
-      if (error_code != MPI_SUCCESS) {
-    char error_string[100];
-    int length_of_error_string, error_class;
-
-    MPI_Error_class(error_code, &error_class);
-    MPI_Error_string(error_class, error_string, &length_of_error_string);
-    dprintf("Error in MPI_File_set_view: %s\n", error_string);
-    }
-
-      error_code = MPI_File_write_all(fh, fieldwritebuffer[0][0][0],(nxn-3)*(nyn-3)*(nzn-3),EMf->getXYZeType(), &status);
-      if(error_code != MPI_SUCCESS){
-        int tcount=0;
-        MPI_Get_count(&status, EMf->getXYZeType(), &tcount);
-          char error_string[100];
-          int length_of_error_string, error_class;
-          MPI_Error_class(error_code, &error_class);
-          MPI_Error_string(error_class, error_string, &length_of_error_string);
-          dprintf("Error in MPI_File_write_all: %s, wrote %d EMf->getXYZeType()\n", error_string,tcount);
-      }
-      MPI_File_close(&fh);
+    engine->write(filename.str(), header, EMf->getXYZeType(), EMf->getProcviewXYZ(), fieldwritebuffer[0][0][0], (nxn-3)*(nyn-3)*(nzn-3));
   }
 }
 
-void WriteTemperatureVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle,float**** temperaturewritebuffer){
+void WriteTemperatureVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle, OutputEngine *engine){
 
   //All VTK output at grid cells excluding ghost cells
   const int nxn  =grid->getNXN(),nyn  = grid->getNYN(),nzn =grid->getNZN();
@@ -1069,8 +1010,6 @@ void WriteTemperatureVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCt
   const double spaceY = dimY>1 ?col->getLy()/(dimY-1) :col->getLy();
   const double spaceZ = dimZ>1 ?col->getLz()/(dimZ-1) :col->getLz();
   const int    nPoints = dimX*dimY*dimZ;
-  MPI_File     fh;
-  MPI_Status   status;
   const string temperaturetags[]={"Tcart","Tperpar"};
   const int    tagsize = size(temperaturetags);
   const string outputtag = col->getTemperatureOutputTag();
@@ -1087,6 +1026,7 @@ void WriteTemperatureVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCt
 
    if (outputTag.find(temperaturetags[tagid], 0) == string::npos) continue;
 
+   float ****temperaturewritebuffer = engine->stage4(nzn-3, nyn-3, nxn-3, 6);
    ostringstream temperaturename;
    temperaturename <<  temperaturetags[tagid] << "_" << ((si%2==0)?"e":"i")<< si;
 
@@ -1138,45 +1078,30 @@ void WriteTemperatureVTK(Grid3DCU *grid, EMfields3D *EMf, CollectiveIO *col, VCt
           }
    }
 
-    int nelem = strlen(header);
-    int charsize=sizeof(char);
-    MPI_Offset disp = nelem*charsize;
-
-
     ostringstream filename;
     filename << col->getSaveDirName() << "/" << col->getSimName() << "_"<< temperaturetags[tagid] << ((si%2==0)?"e":"i")<< si  << "_" << cycle << ".vtk";
-    MPI_File_open(vct->getFieldComm(),filename.str().c_str(), MPI_MODE_CREATE|MPI_MODE_WRONLY, MPI_INFO_NULL, &fh);
-
-    if (vct->getCartesian_rank()==0){
-      MPI_File_write(fh, header, nelem, MPI_BYTE, &status);
-    }
-
-    int error_code = MPI_File_set_view(fh, disp, EMf->getTensorType(), EMf->getProcviewTensor(), "native", MPI_INFO_NULL);
-    if (error_code != MPI_SUCCESS) {
-      char error_string[100];
-      int length_of_error_string, error_class;
-
-      MPI_Error_class(error_code, &error_class);
-      MPI_Error_string(error_class, error_string, &length_of_error_string);
-      dprintf("Error in MPI_File_set_view: %s\n", error_string);
-    }
-
-      error_code = MPI_File_write_all(fh, temperaturewritebuffer[0][0][0],(nxn-3)*(nyn-3)*(nzn-3),EMf->getTensorType(), &status);
-      if(error_code != MPI_SUCCESS){
-        int tcount=0;
-        MPI_Get_count(&status, EMf->getTensorType(), &tcount);
-          char error_string[100];
-          int length_of_error_string, error_class;
-          MPI_Error_class(error_code, &error_class);
-          MPI_Error_string(error_class, error_string, &length_of_error_string);
-          dprintf("Error in MPI_File_write_all: %s, wrote %d EMf->getTensorType()\n", error_string,tcount);
-      }
-      MPI_File_close(&fh);
+    engine->write(filename.str(), header, EMf->getTensorType(), EMf->getProcviewTensor(), temperaturewritebuffer[0][0][0], (nxn-3)*(nyn-3)*(nzn-3));
     }//END OF TAGS
   }//END OF SPECIES
 }
 
-void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle, float**** spectrawritebuffere, float**** spectrawritebufferi){
+/*! Energy bin of E for bin edges spectra[0..Nspec-1] = 10^(Estart+dE*s)
+ *  (or Estart+dE*s on a linear axis): the first s with E < spectra[s],
+ *  or Nspec above the last edge. */
+static inline int spectraBin(double E, const double *spectra, int Nspec, double Estart, double dE, bool logAxis)
+{
+  int s = 0;
+  if (!logAxis || E > 0) {
+    const double t = ((logAxis ? log10(E) : E) - Estart)/dE;
+    s = t < 0 ? 0 : (t >= Nspec ? Nspec : int(t) + 1);
+  }
+  // correct the rounding next to the bin edges
+  while (s > 0 && E < spectra[s-1]) s--;
+  while (s < Nspec && E >= spectra[s]) s++;
+  return s;
+}
+
+void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, CollectiveIO *col, VCtopology3D *vct, const string & outputTag ,int cycle, OutputEngine *engine){
 
   //All VTK output at grid cells excluding ghost cells
   const int nxn  =grid->getNXN(),nyn  = grid->getNYN(),nzn =grid->getNZN();
@@ -1192,15 +1117,62 @@ void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, Collect
   const double xWidth = dx*(nxn-3), yWidth = dy*(nyn-3), zWidth = dz*(nzn-3);
   const double xStart = vct->getCoordinates(0) * xWidth, yStart = vct->getCoordinates(1) * yWidth, zStart = vct->getCoordinates(2) * zWidth;
   const int    nPoints = dimX*dimY*dimZ/(DeltaX*DeltaY*DeltaZ);
-  MPI_File     fh;
-  MPI_Status   status;
   const string spectratags[]={"Stot", "Spar", "Sperp"};
+  const string spectranames[]={"total", "parallel", "perpendicular"};
   const int    tagsize = size(spectratags);
-  const string outputtag = col->getSpectraOutputTag();
+  const bool   logAxis = col->getSpectraLogAxis();
   const int ns = col->getNs();
   const int sizeX = (nxn-3)/DeltaX, sizeY = (nyn-3)/DeltaY, sizeZ = (nzn-3)/DeltaZ;
+  const double invBlockX = 1.0/(dx*DeltaX), invBlockY = 1.0/(dy*DeltaY), invBlockZ = 1.0/(dz*DeltaZ);
   double Estart = 0, Eend = 0, dE = 0;
 
+  // Orthonormal basis (b, perp1, perp2) of each spectral block, from the
+  // block-averaged magnetic field; computed once and shared by all species.
+  vector<double> Bbasis(9*sizeX*sizeY*sizeZ);
+  for(int iz=0;iz<sizeZ;iz++)
+    for(int iy=0;iy<sizeY;iy++)
+      for(int ix=0;ix<sizeX;ix++){
+        double Bx = 0;
+        double By = 0;
+        double Bz = 0;
+        for(int cz=0;cz<DeltaZ;cz++)
+          for(int cy=0;cy<DeltaY;cy++)
+            for(int cx=0;cx<DeltaX;cx++){
+              const int i = ix*DeltaX+cx+1, j = iy*DeltaY+cy+1, k = iz*DeltaZ+cz+1;
+              Bx += (float)EMf->getBxTot(i,j,k);
+              By += (float)EMf->getByTot(i,j,k);
+              Bz += (float)EMf->getBzTot(i,j,k);
+            }
+        double modB = sqrt(Bx*Bx + By*By + Bz*Bz);
+
+        ///////// FIRST COORDINATE CHANGE
+        double a1 = Bx/modB;
+        double a2 = By/modB;
+        double a3 = Bz/modB;
+
+        double b1;
+        double b2;
+        double b3;
+        if (a2 != 0 || a3 != 0){
+          b1 = 0;
+          b2 = a3;
+          b3 = -a2;
+        }else{
+          b1 = -a3;
+          b2 = 0;
+          b3 = a1;
+        }
+        double modb = sqrt(b1*b1 + b2*b2 + b3*b3);
+        b1 = b1/modb;
+        b2 = b2/modb;
+        b3 = b3/modb;
+
+        double *e = &Bbasis[9*((iz*sizeY + iy)*sizeX + ix)];
+        e[0] = a1;            e[1] = a2;            e[2] = a3;
+        e[3] = b1;            e[4] = b2;            e[5] = b3;
+        e[6] = a2*b3 - a3*b2; e[7] = a3*b1 - a1*b3; e[8] = a1*b2 - a2*b1;
+      }
+
   for(int si=0;si<ns;si++){
 
       //si%2==0 for electrons, si%2==1 for ions.
@@ -1215,9 +1187,9 @@ void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, Collect
       }
 
       int Nspec = (Eend-Estart)/dE+1.001;
-      double spectra[Nspec];
+      vector<double> spectra(Nspec);
       for(int s=0;s<Nspec;s++){
-        spectra[s] = pow(10,Estart + dE*s);
+        spectra[s] = logAxis ? pow(10,Estart + dE*s) : Estart + dE*s;
       }
 
       if (vct->getCartesian_rank()==0){
@@ -1232,156 +1204,56 @@ void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, Collect
         fclose(fptr);
       }
 
-      double Stot[sizeZ][sizeY][sizeX][Nspec+1];
-      double Spar[sizeZ][sizeY][sizeX][Nspec+1];
-      double Sperp[sizeZ][sizeY][sizeX][Nspec+1];
+      // Stot, Spar and Sperp are accumulated directly in the (float) staging
+      // arrays of the output engine, only for the requested tags
+      float**** S[3];
+      for(int tagid=0; tagid<tagsize; tagid++){
+        S[tagid] = NULL;
+        if (outputTag.find(spectratags[tagid], 0) == string::npos) continue;
+        S[tagid] = engine->stage4(sizeZ, sizeY, sizeX, Nspec+1);
+        float *flat = S[tagid][0][0][0];
+        fill(flat, flat + sizeX*sizeY*sizeZ*(Nspec+1), 0.f);
+      }
 
        double qom = col->getQOM(si);
 
-       if (si%2==0){
-       for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebuffere[iz][iy][ix][s] = 0;
-                Stot[iz][iy][ix][s] = 0;
-                Spar[iz][iy][ix][s] = 0;
-                Sperp[iz][iy][ix][s] = 0;
-              }
-        }else{
-          for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebufferi[iz][iy][ix][s] = 0;
-                Stot[iz][iy][ix][s] = 0;
-                Spar[iz][iy][ix][s] = 0;
-                Sperp[iz][iy][ix][s] = 0;
-              }
-        }
-
        char  header[1024];
 
+        const double absqom = fabs(qom);
         for (int n = 0; n < part[si].getNOP(); n++){
-          double x = part[si].getX(n);
-          double y = part[si].getY(n);
-          double z = part[si].getZ(n);
-          double u = part[si].getU(n);
-          double v = part[si].getV(n);
-          double w = part[si].getW(n);
-
-          for(int iz=0;iz<sizeZ;iz++){
-            if(z > zStart + dz*DeltaZ*(iz+1)) continue;
-
-            for(int iy=0;iy<sizeY;iy++){
-              if(y > yStart + dy*DeltaY*(iy+1)) continue;
-
-              for(int ix=0;ix<sizeX;ix++){
-                if(x > xStart + dx*DeltaX*(ix+1)) continue;
-
-                double Bx = 0;
-                double By = 0;
-                double Bz = 0;
-
-                for(int cz=0;cz<DeltaZ;cz++)
-                  for(int cy=0;cy<DeltaY;cy++)
-                    for(int cx=0;cx<DeltaX;cx++){
-                      double Bxi = (float)EMf->getBxTot(ix+cx+1, iy+cy+1, iz+cz+1);
-                      double Byi = (float)EMf->getByTot(ix+cx+1, iy+cy+1, iz+cz+1);
-                      double Bzi = (float)EMf->getBzTot(ix+cx+1, iy+cy+1, iz+cz+1);
-                      Bx += Bxi;
-                      By += Byi;
-                      Bz += Bzi;
-                    }
-                double modB = sqrt(pow(Bx,2) + pow(By,2) + pow(Bz,2));
-
-                ///////// FIRST COORDINATE CHANGE
-                double a1 = Bx/modB;
-                double a2 = By/modB;
-                double a3 = Bz/modB;
-
-                double b1;
-                double b2;
-                double b3;
-                if (a2 != 0 || a3 != 0){
-                  b1 = 0;
-                  b2 = a3;
-                  b3 = -a2;
-                }else{
-                  b1 = -a3;
-                  b2 = 0;
-                  b3 = a1;
-                }
-                double modb = sqrt(pow(b1,2) + pow(b2,2) + pow(b3,2));
-                b1 = b1/modb;
-                b2 = b2/modb;
-                b3 = b3/modb;
-
-                double c1 = a2*b3 - a3*b2;
-                double c2 = a3*b1 - a1*b3;
-                double c3 = a1*b2 - a2*b1;
-
-                double vpar = a1*u + a2*v + a3*w;
-                double vperp1 = b1*u + b2*v + b3*w;
-                double vperp2 = c1*u + c2*v + c3*w;
-
-                ///////// SPECTRA CALC
-                double Epar = 0.5*vpar*vpar/fabs(qom);
-                double Eperp1 = 0.5*vperp1*vperp1/fabs(qom);
-                double Eperp2 = 0.5*vperp2*vperp2/fabs(qom);
-
-                for(int s=0;s<Nspec+1;s++){
-                  if(s==Nspec){
-                    if(Epar+Eperp1+Eperp2 > spectra[s-1]){
-                      Stot[iz][iy][ix][s] += fabs(part[si].getQ(n));
-                    }
-                  }else if(Epar+Eperp1+Eperp2 < spectra[s]){
-                    Stot[iz][iy][ix][s] += fabs(part[si].getQ(n));
-                    break;
-                  }else{
-                    continue;
-                  }
-                }
-                for(int s=0;s<Nspec+1;s++){
-                  if(s==Nspec){
-                    if(Epar > spectra[s-1]){
-                      Spar[iz][iy][ix][s] += fabs(part[si].getQ(n));
-                    }
-                  }else if(Epar < spectra[s]){
-                    Spar[iz][iy][ix][s] += fabs(part[si].getQ(n));
-                    break;
-                  }else{
-                    continue;
-                  }
-                }
-                for(int s=0;s<Nspec+1;s++){
-                  if(s==Nspec){
-                    if(Eperp1+Eperp2 > spectra[s-1]){
-                      Sperp[iz][iy][ix][s] += fabs(part[si].getQ(n));
-                    }
-                  }else if(Eperp1+Eperp2 < spectra[s]){
-                    Sperp[iz][iy][ix][s] += fabs(part[si].getQ(n));
-                    break;
-                  }else{
-                    continue;
-                  }
-                }
-                break;
-              }
-              break;
-            }
-            break;
-          }
+          // block of the particle: the first block whose upper edge is not below it,
+          // the particle is counted in this block only
+          int ix = int(ceil((part[si].getX(n) - xStart)*invBlockX)) - 1;
+          int iy = int(ceil((part[si].getY(n) - yStart)*invBlockY)) - 1;
+          int iz = int(ceil((part[si].getZ(n) - zStart)*invBlockZ)) - 1;
+          if (ix >= sizeX || iy >= sizeY || iz >= sizeZ) continue;
+          ix = max(ix,0); iy = max(iy,0); iz = max(iz,0);
+
+          const double *e = &Bbasis[9*((iz*sizeY + iy)*sizeX + ix)];
+          const double u = part[si].getU(n);
+          const double v = part[si].getV(n);
+          const double w = part[si].getW(n);
+          const double vpar   = e[0]*u + e[1]*v + e[2]*w;
+          const double vperp1 = e[3]*u + e[4]*v + e[5]*w;
+          const double vperp2 = e[6]*u + e[7]*v + e[8]*w;
+
+          ///////// SPECTRA CALC
+          const double Epar  = 0.5*vpar*vpar/absqom;
+          const double Eperp = 0.5*(vperp1*vperp1 + vperp2*vperp2)/absqom;
+          const double E[3]  = {Epar+Eperp, Epar, Eperp};
+          const float q = fabs(part[si].getQ(n));
+
+          for(int tagid=0; tagid<tagsize; tagid++)
+            if (S[tagid] != NULL)
+              S[tagid][iz][iy][ix][spectraBin(E[tagid], &spectra[0], Nspec, Estart, dE, logAxis)] += q;
         }
 
     for(int tagid=0; tagid<tagsize; tagid++){
-      if (outputtag.find(spectratags[tagid], 0) == string::npos) continue;
+      if (S[tagid] == NULL) continue;
 
-     
-      if(spectratags[tagid].compare("Stot") == 0){
         //Write VTK header
         sprintf(header, "# vtk DataFile Version 2.0\n"
-            "%s%d total energy spectra from iPIC3D\n"
+            "%s%d %s energy spectra from iPIC3D\n"
                    "BINARY\n"
                    "DATASET STRUCTURED_POINTS\n"
                    "DIMENSIONS %d %d %d\n"
@@ -1389,120 +1261,18 @@ void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, Collect
                    "SPACING %f %f %f\n"
                    "POINT_DATA %d \n"
                    "SCALARS %s float %d \n"
-          "LOOKUP_TABLE default\n",(si%2==0)?"Electron":"Ion",si,dimX/DeltaX,dimY/DeltaY,dimZ/DeltaZ, spaceX*DeltaX,spaceY*DeltaY,spaceZ*DeltaZ, nPoints,(si%2==0)?"Se":"Si", Nspec+1);
-
-      if (si%2==0){
-        for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebuffere[iz][iy][ix][s] = Stot[iz][iy][ix][s];
-              }
-      }else{
-        for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebufferi[iz][iy][ix][s] = Stot[iz][iy][ix][s];
-              }
-      }
-    }
-
-    if(spectratags[tagid].compare("Spar") == 0){
-        //Write VTK header
-        sprintf(header, "# vtk DataFile Version 2.0\n"
-            "%s%d parallel energy spectra from iPIC3D\n"
-                   "BINARY\n"
-                   "DATASET STRUCTURED_POINTS\n"
-                   "DIMENSIONS %d %d %d\n"
-                   "ORIGIN 0 0 0\n"
-                   "SPACING %f %f %f\n"
-                   "POINT_DATA %d \n"
-                   "SCALARS %s float %d \n"
-          "LOOKUP_TABLE default\n",(si%2==0)?"Electron":"Ion",si,dimX/DeltaX,dimY/DeltaY,dimZ/DeltaZ, spaceX*DeltaX,spaceY*DeltaY,spaceZ*DeltaZ, nPoints,(si%2==0)?"Se":"Si", Nspec+1);
-
-
-      if (si%2==0){
-        for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebuffere[iz][iy][ix][s] = Spar[iz][iy][ix][s];
-              }
-      }else{
-        for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebufferi[iz][iy][ix][s] = Spar[iz][iy][ix][s];
-              }
-      }
-    }
-
-    if(spectratags[tagid].compare("Sperp") == 0){
-        //Write VTK header
-        sprintf(header, "# vtk DataFile Version 2.0\n"
-            "%s%d perpendicular energy spectra from iPIC3D\n"
-                   "BINARY\n"
-                   "DATASET STRUCTURED_POINTS\n"
-                   "DIMENSIONS %d %d %d\n"
-                   "ORIGIN 0 0 0\n"
-                   "SPACING %f %f %f\n"
-                   "POINT_DATA %d \n"
-                   "SCALARS %s float %d \n"
-          "LOOKUP_TABLE default\n",(si%2==0)?"Electron":"Ion",si,dimX/DeltaX,dimY/DeltaY,dimZ/DeltaZ, spaceX*DeltaX,spaceY*DeltaY,spaceZ*DeltaZ, nPoints,(si%2==0)?"Se":"Si", Nspec+1);
-
-
-      if (si%2==0){
-        for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebuffere[iz][iy][ix][s] = Sperp[iz][iy][ix][s];
-              }
-      }else{
-        for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++)
-              for(int s=0;s<Nspec+1;s++){
-                spectrawritebufferi[iz][iy][ix][s] = Sperp[iz][iy][ix][s];
-              }
-      }
-    }
-
+          "LOOKUP_TABLE default\n",(si%2==0)?"Electron":"Ion",si,spectranames[tagid].c_str(),dimX/DeltaX,dimY/DeltaY,dimZ/DeltaZ, spaceX*DeltaX,spaceY*DeltaY,spaceZ*DeltaZ, nPoints,(si%2==0)?"Se":"Si", Nspec+1);
 
+     // the staging array is not used after the write, so it is swapped in place
      if(EMf->isLittleEndian()){
-      if (si%2==0){
-       for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++){
-              for(int s=0;s<Nspec+1;s++){
-                ByteSwap((unsigned char*) &spectrawritebuffere[iz][iy][ix][s],4);
-              }
-            }
-      }else{
-        for(int iz=0;iz<sizeZ;iz++)
-          for(int iy=0;iy<sizeY;iy++)
-            for(int ix= 0;ix<sizeX;ix++){
-              for(int s=0;s<Nspec+1;s++){
-                ByteSwap((unsigned char*) &spectrawritebufferi[iz][iy][ix][s],4);
-              }
-            }
-      }
+       float *flat = S[tagid][0][0][0];
+       const int nflat = sizeX*sizeY*sizeZ*(Nspec+1);
+       for(int i=0;i<nflat;i++)
+         ByteSwap((unsigned char*) &flat[i],4);
      }
 
-      int nelem = strlen(header);
-      int charsize=sizeof(char);
-      MPI_Offset disp = nelem*charsize;
-
       ostringstream filename;
       filename << col->getSaveDirName() << "/" << col->getSimName() << "_" << spectratags[tagid] << ((si%2==0)?"e":"i")<< si  << "_" << cycle << ".vtk";
-      MPI_File_open(vct->getFieldComm(),filename.str().c_str(), MPI_MODE_CREATE|MPI_MODE_WRONLY, MPI_INFO_NULL, &fh);
-
-      if (vct->getCartesian_rank()==0){
-        MPI_File_write(fh, header, nelem, MPI_BYTE, &status);
-      }
-
       MPI_Datatype  spectracomp, spectraview;
 
        //create process file view
@@ -1521,32 +1291,10 @@ void WriteSpectraVTK(Grid3DCU *grid, Particles3D *part, EMfields3D *EMf, Collect
       MPI_Type_create_subarray(3, size, subsize, start,MPI_ORDER_C, spectracomp, &spectraview);
       MPI_Type_commit(&spectraview);
 
-      int error_code = MPI_File_set_view(fh, disp, spectracomp, spectraview, "native", MPI_INFO_NULL);
-      if (error_code != MPI_SUCCESS) {
-        char error_string[100];
-        int length_of_error_string, error_class;
-
-        MPI_Error_class(error_code, &error_class);
-        MPI_Error_string(error_class, error_string, &length_of_error_string);
-        dprintf("Error in MPI_File_set_view: %s\n", error_string);
-      }
-        if (si%2==0){
-          error_code = MPI_File_write_all(fh, spectrawritebuffere[0][0][0],sizeX*sizeY*sizeZ,spectracomp, &status);
-        }else{
-          error_code = MPI_File_write_all(fh, spectrawritebufferi[0][0][0],sizeX*sizeY*sizeZ,spectracomp, &status);
-        }
-        if(error_code != MPI_SUCCESS){
-          int tcount=0;
-          MPI_Get_count(&status, spectracomp, &tcount);
-            char error_string[100];
-            int length_of_error_string, error_class;
-            MPI_Error_class(error_code, &error_class);
-            MPI_Error_string(error_class, error_string, &length_of_error_string);
-            dprintf("Error in MPI_File_write_all: %s, wrote %d spectracomp\n", error_string,tcount);
-        }
-        MPI_File_close(&fh);
-        MPI_Type_free(&spectraview);
-        MPI_Type_free(&spectracomp);
+      engine->write(filename.str(), header, spectracomp, spectraview, S[tagid][0][0][0], sizeX*sizeY*sizeZ);
+      // the view and the pending write keep their own reference
+      MPI_Type_free(&spectraview);
+      MPI_Type_free(&spectracomp);
      }//END OF TAGS
   }//END OF SPECIES
 }
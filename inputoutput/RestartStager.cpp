@@ -0,0 +1,264 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <mpi.h>
+#include <stdio.h>
+#include <string.h>
+#include <errno.h>
+#include <unistd.h>
+#include <dirent.h>
+#include <sys/stat.h>
+#include <algorithm>
+#include <functional>
+#include <sstream>
+#include <vector>
+#include "RestartStager.h"
+#include "errors.h"
+
+using std::stringstream;
+using std::vector;
+
+/* size of the blocks of the copies */
+static const size_t copy_block = 4 << 20;
+
+static string checkpoint_dir_name(const string &dirname, int cycle)
+{
+  stringstream ss;
+  ss << dirname << "/checkpoint_" << cycle;
+  return ss.str();
+}
+
+static bool file_exists(const string &filename)
+{
+  struct stat st;
+  return stat(filename.c_str(), &st) == 0;
+}
+
+static void make_dir(const string &dirname)
+{
+  if (mkdir(dirname.c_str(), 0755) != 0 && errno != EEXIST)
+    eprintf("cannot create %s: %s", dirname.c_str(), strerror(errno));
+}
+
+/* cycles of the complete and of the incomplete checkpoints in dirname */
+static void list_checkpoints(const string &dirname, vector<int> &complete, vector<int> &incomplete)
+{
+  DIR *dir = opendir(dirname.c_str());
+  if (!dir)
+    return;
+  struct dirent *entry;
+  while ((entry = readdir(dir)) != 0) {
+    int cycle;
+    int length = 0;
+    if (sscanf(entry->d_name, "checkpoint_%d%n", &cycle, &length) != 1 || entry->d_name[length] != '\0')
+      continue;
+    if (file_exists(checkpoint_dir_name(dirname, cycle) + "/complete"))
+      complete.push_back(cycle);
+    else
+      incomplete.push_back(cycle);
+  }
+  closedir(dir);
+  std::sort(complete.begin(), complete.end(), std::greater<int>());
+}
+
+/* remove the checkpoint directory and its files, the marker first */
+static void remove_checkpoint(const string &dirname)
+{
+  unlink((dirname + "/complete").c_str());
+  DIR *dir = opendir(dirname.c_str());
+  if (!dir)
+    return;
+  struct dirent *entry;
+  while ((entry = readdir(dir)) != 0)
+    if (strcmp(entry->d_name, ".") && strcmp(entry->d_name, ".."))
+      unlink((dirname + "/" + entry->d_name).c_str());
+  closedir(dir);
+  if (rmdir(dirname.c_str()) != 0)
+    warning_printf("cannot remove %s: %s", dirname.c_str(), strerror(errno));
+}
+
+string LatestCheckpointDirName(const string &dirname)
+{
+  vector<int> complete, incomplete;
+  list_checkpoints(dirname, complete, incomplete);
+  return complete.empty() ? dirname : checkpoint_dir_name(dirname, complete[0]);
+}
+
+RestartStager::RestartStager(MPI_Comm comm_, const string &staging_dir_, const string &save_dir_, int keep_) :
+  comm(comm_),
+  staging_dir(staging_dir_),
+  save_dir(save_dir_),
+  keep(keep_),
+  cycle(-1),
+  pending(false),
+  threaded(false),
+  copy_status(0),
+  wait_time(0.0)
+{
+  MPI_Comm_rank(comm, &rank);
+  MPI_Comm_size(comm, &nprocs);
+  pthread_mutex_init(&mutex, 0);
+  // the processes of a node share it
+  make_dir(staging_dir);
+}
+
+RestartStager::~RestartStager()
+{
+  // no communication here, the copy is completed by finish()
+  if (pending && threaded)
+    pthread_join(thread, 0);
+  pthread_mutex_destroy(&mutex);
+}
+
+string RestartStager::stage(int cycle_)
+{
+  // back-pressure: the copy of the previous dump is still running
+  if (pending) {
+    const double start = MPI_Wtime();
+    complete();
+    wait_time += MPI_Wtime() - start;
+  }
+  cycle = cycle_;
+  const string checkpoint_dir = checkpoint_dir_name(save_dir, cycle);
+  if (rank == 0) {
+    make_dir(checkpoint_dir);
+    // marker of an earlier run reaching the same cycle
+    unlink((checkpoint_dir + "/complete").c_str());
+  }
+  MPI_Barrier(comm);
+  stringstream ss;
+  ss << "/restart" << rank << ".hdf";
+  staged_file = staging_dir + ss.str();
+  checkpoint_file = checkpoint_dir + ss.str();
+  return staged_file;
+}
+
+void RestartStager::flush()
+{
+  copy_status = 0;
+  copy_error.clear();
+  pending = true;
+  threaded = pthread_create(&thread, 0, copy_thread, this) == 0;
+  if (!threaded) {
+    warning_printf("cannot start the copy of %s, copying it now", staged_file.c_str());
+    copy_thread(this);
+  }
+}
+
+/* copy the staged file to the checkpoint directory and remove it */
+void *RestartStager::copy_thread(void *arg)
+{
+  RestartStager *stager = (RestartStager *) arg;
+  const char *source = stager->staged_file.c_str();
+  const char *target = stager->checkpoint_file.c_str();
+  string error;
+  FILE *in = fopen(source, "rb");
+  FILE *out = in ? fopen(target, "wb") : 0;
+  if (!in || !out)
+    error = string("cannot open ") + (in ? target : source) + ": " + strerror(errno);
+  else {
+    vector<char> buffer(copy_block);
+    size_t n;
+    while ((n = fread(&buffer[0], 1, buffer.size(), in)) > 0)
+      if (fwrite(&buffer[0], 1, n, out) != n) {
+        error = string("cannot write ") + target + ": " + strerror(errno);
+        break;
+      }
+    if (error.empty() && ferror(in))
+      error = string("cannot read ") + source;
+    // the completion marker must not be written before the data is on disk
+    if (error.empty() && (fflush(out) != 0 || fsync(fileno(out)) != 0))
+      error = string("cannot write ") + target + ": " + strerror(errno);
+  }
+  if (in)
+    fclose(in);
+  if (out && fclose(out) != 0 && error.empty())
+    error = string("cannot close ") + target + ": " + strerror(errno);
+  if (error.empty())
+    unlink(source);
+
+  pthread_mutex_lock(&stager->mutex);
+  stager->copy_status = error.empty() ? 1 : -1;
+  stager->copy_error = error;
+  pthread_mutex_unlock(&stager->mutex);
+  return 0;
+}
+
+/*! wait for the copies of all the processes, then mark the checkpoint
+    as complete and apply the retention */
+void RestartStager::complete()
+{
+  if (threaded)
+    pthread_join(thread, 0);
+  pending = false;
+  if (copy_status < 0)
+    warning_printf("restart dump of cycle %d: %s", cycle, copy_error.c_str());
+  int status = copy_status;
+  MPI_Allreduce(MPI_IN_PLACE, &status, 1, MPI_INT, MPI_MIN, comm);
+  if (rank != 0)
+    return;
+  const string checkpoint_dir = checkpoint_dir_name(save_dir, cycle);
+  if (status < 0) {
+    warning_printf("%s is incomplete and will not be used for restarting", checkpoint_dir.c_str());
+    return;
+  }
+  FILE *marker = fopen((checkpoint_dir + "/complete").c_str(), "w");
+  if (!marker) {
+    warning_printf("cannot write the completion marker of %s: %s", checkpoint_dir.c_str(), strerror(errno));
+    return;
+  }
+  fprintf(marker, "cycle %d\nprocesses %d\n", cycle, nprocs);
+  fclose(marker);
+  remove_old_checkpoints();
+}
+
+/*! keep the last keep complete checkpoints and remove the incomplete
+    ones older than them */
+void RestartStager::remove_old_checkpoints()
+{
+  vector<int> complete, incomplete;
+  list_checkpoints(save_dir, complete, incomplete);
+  if (complete.empty())
+    return;
+  for (size_t i = keep; i < complete.size(); i++)
+    remove_checkpoint(checkpoint_dir_name(save_dir, complete[i]));
+  for (size_t i = 0; i < incomplete.size(); i++)
+    if (incomplete[i] < complete[0])
+      remove_checkpoint(checkpoint_dir_name(save_dir, incomplete[i]));
+}
+
+void RestartStager::progress()
+{
+  if (!pending)
+    return;
+  pthread_mutex_lock(&mutex);
+  int status = copy_status;
+  pthread_mutex_unlock(&mutex);
+  // all the processes are pending, the check is collective
+  MPI_Allreduce(MPI_IN_PLACE, &status, 1, MPI_INT, MPI_MIN, comm);
+  if (status != 0)
+    complete();
+}
+
+void RestartStager::finish()
+{
+  if (pending)
+    complete();
+}
@@ -0,0 +1,459 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <mpi.h>
+#include <stdio.h>
+#include <float.h>
+#include <math.h>
+#include <sstream>
+#include <vector>
+#include "SharedRestart.h"
+#include "ipichdf5.h"
+#include "Alloc.h"
+#include "Collective.h"
+#include "VCtopology3D.h"
+#include "Grid3DCU.h"
+#include "EMfields3D.h"
+#include "Particles3D.h"
+#include "errors.h"
+
+using std::vector;
+using std::stringstream;
+
+#ifndef NO_HDF5
+
+static const char *field_names[6] = { "Bx", "By", "Bz", "Ex", "Ey", "Ez" };
+static const char *particle_names[8] = { "x", "y", "z", "u", "v", "w", "q", "ID" };
+
+/* part of a dataset of the restart file written by one process */
+struct RestartSlab
+{
+  string name;
+  hid_t type;
+  int ndims;
+  hsize_t dims[3];
+  hsize_t offset[3];
+  hsize_t count[3];
+  const void *data;
+};
+
+static string species_group(const char *group, int is)
+{
+  stringstream ss;
+  ss << "/" << group << "/species_" << is;
+  return ss.str();
+}
+
+static void add_slab(vector<RestartSlab> &slabs, const string &name, hid_t type, int ndims,
+  const hsize_t *dims, const hsize_t *offset, const hsize_t *count, const void *data)
+{
+  RestartSlab slab;
+  slab.name = name;
+  slab.type = type;
+  slab.ndims = ndims;
+  for (int d = 0; d < ndims; d++) {
+    slab.dims[d] = dims[d];
+    slab.offset[d] = offset[d];
+    slab.count[d] = count[d];
+  }
+  slab.data = data;
+  slabs.push_back(slab);
+}
+
+/* the nodes 1..nxn-2 of the subdomain go to the global nodes offset..offset+nxn-3;
+   the last node is shared with the next subdomain, which writes it */
+static void node_slab(const Grid3DCU *grid, const VCtopology3D *vct, hsize_t offset[3], hsize_t count[3])
+{
+  offset[0] = (hsize_t) floor(grid->getXstart() / grid->getDX() + 0.5);
+  offset[1] = (hsize_t) floor(grid->getYstart() / grid->getDY() + 0.5);
+  offset[2] = (hsize_t) floor(grid->getZstart() / grid->getDZ() + 0.5);
+  count[0] = grid->getNXN() - 3 + (vct->isXupper() ? 1 : 0);
+  count[1] = grid->getNYN() - 3 + (vct->isYupper() ? 1 : 0);
+  count[2] = grid->getNZN() - 3 + (vct->isZupper() ? 1 : 0);
+}
+
+static void pack_nodes(vector<double> &buffer, const double *const *const *a, const hsize_t count[3])
+{
+  buffer.resize(count[0] * count[1] * count[2]);
+  size_t l = 0;
+  for (hsize_t i = 1; i <= count[0]; i++)
+    for (hsize_t j = 1; j <= count[1]; j++)
+      for (hsize_t k = 1; k <= count[2]; k++)
+        buffer[l++] = a[i][j][k];
+}
+
+/* open the file with access flags (H5F_ACC_TRUNC creates it), with the
+   MPI-IO driver on all the processes of comm if parallel */
+static hid_t open_restart(const string &filename, MPI_Comm comm, unsigned flags, bool parallel)
+{
+  hid_t fapl = H5Pcreate(H5P_FILE_ACCESS);
+#ifdef H5_HAVE_PARALLEL
+  if (parallel)
+    H5Pset_fapl_mpio(fapl, comm, MPI_INFO_NULL);
+#endif
+  hid_t file_id;
+  if (flags == H5F_ACC_TRUNC)
+    file_id = H5Fcreate(filename.c_str(), H5F_ACC_TRUNC, H5P_DEFAULT, fapl);
+  else
+    file_id = H5Fopen(filename.c_str(), flags, fapl);
+  H5Pclose(fapl);
+  if (file_id < 0)
+    eprintf("Failed to open the restart file %s", filename.c_str());
+  return file_id;
+}
+
+static void create_datasets(hid_t file_id, const vector<RestartSlab> &slabs, int ns)
+{
+  const char *groups[3] = { "/fields", "/moments", "/particles" };
+  for (int g = 0; g < 3; g++)
+    H5Gclose(H5Gcreate2(file_id, groups[g], H5P_DEFAULT, H5P_DEFAULT, H5P_DEFAULT));
+  for (int is = 0; is < ns; is++) {
+    H5Gclose(H5Gcreate2(file_id, species_group("moments", is).c_str(), H5P_DEFAULT, H5P_DEFAULT, H5P_DEFAULT));
+    H5Gclose(H5Gcreate2(file_id, species_group("particles", is).c_str(), H5P_DEFAULT, H5P_DEFAULT, H5P_DEFAULT));
+  }
+  for (size_t s = 0; s < slabs.size(); s++) {
+    hid_t space = H5Screate_simple(slabs[s].ndims, slabs[s].dims, NULL);
+    hid_t dataset = H5Dcreate2(file_id, slabs[s].name.c_str(), slabs[s].type, space, H5P_DEFAULT, H5P_DEFAULT, H5P_DEFAULT);
+    if (dataset < 0)
+      eprintf("Failed to create %s in the restart file", slabs[s].name.c_str());
+    H5Dclose(dataset);
+    H5Sclose(space);
+  }
+}
+
+/* write the slab, or take part in the collective write with nothing if it is empty */
+static void write_slab(hid_t file_id, const RestartSlab &slab, hid_t dxpl)
+{
+  hsize_t n = 1;
+  for (int d = 0; d < slab.ndims; d++)
+    n *= slab.count[d];
+  hid_t dataset = H5Dopen2(file_id, slab.name.c_str(), H5P_DEFAULT);
+  hid_t filespace = H5Dget_space(dataset);
+  hid_t memspace;
+  if (n > 0) {
+    H5Sselect_hyperslab(filespace, H5S_SELECT_SET, slab.offset, NULL, slab.count, NULL);
+    memspace = H5Screate_simple(slab.ndims, slab.count, NULL);
+  }
+  else {
+    const hsize_t one = 1;
+    H5Sselect_none(filespace);
+    memspace = H5Screate_simple(1, &one, NULL);
+    H5Sselect_none(memspace);
+  }
+  static const double dummy = 0.0;
+  if (H5Dwrite(dataset, slab.type, memspace, filespace, dxpl, n > 0 ? slab.data : &dummy) < 0)
+    eprintf("Failed to write %s in the restart file", slab.name.c_str());
+  H5Sclose(memspace);
+  H5Sclose(filespace);
+  H5Dclose(dataset);
+}
+
+static void read_slab(hid_t file_id, const string &name, hid_t type, int ndims,
+  const hsize_t *offset, const hsize_t *count, void *data, hid_t dxpl)
+{
+  hid_t dataset = H5Dopen2(file_id, name.c_str(), H5P_DEFAULT);
+  if (dataset < 0)
+    eprintf("%s is not in the restart file", name.c_str());
+  hid_t filespace = H5Dget_space(dataset);
+  H5Sselect_hyperslab(filespace, H5S_SELECT_SET, offset, NULL, count, NULL);
+  hid_t memspace = H5Screate_simple(ndims, count, NULL);
+  if (H5Dread(dataset, type, memspace, filespace, dxpl, data) < 0)
+    eprintf("Failed to read %s from the restart file", name.c_str());
+  H5Sclose(memspace);
+  H5Sclose(filespace);
+  H5Dclose(dataset);
+}
+
+/* extent of a one-dimensional dataset */
+static hsize_t dataset_size(hid_t file_id, const string &name)
+{
+  hid_t dataset = H5Dopen2(file_id, name.c_str(), H5P_DEFAULT);
+  if (dataset < 0)
+    eprintf("%s is not in the restart file", name.c_str());
+  hid_t space = H5Dget_space(dataset);
+  hsize_t n = 0;
+  H5Sget_simple_extent_dims(space, &n, NULL);
+  H5Sclose(space);
+  H5Dclose(dataset);
+  return n;
+}
+
+#endif
+
+void WriteSharedRestart(Grid3DCU *grid, EMfields3D *EMf, Particles3D *part, int ns, CollectiveIO *col, VCtopology3D *vct, int cycle)
+{
+#ifdef NO_HDF5
+  eprintf("Require HDF5 to write the restart file.");
+#else
+  const MPI_Comm comm = vct->getFieldComm();
+  int rank, nprocs;
+  MPI_Comm_rank(comm, &rank);
+  MPI_Comm_size(comm, &nprocs);
+#ifdef H5_HAVE_PARALLEL
+  const bool parallel = true;
+#else
+  const bool parallel = false;
+#endif
+  vector<RestartSlab> slabs;
+
+  // cycle and size of the mesh, from the first process
+  const int ncell[3] = { col->getNxc(), col->getNyc(), col->getNzc() };
+  {
+    const hsize_t dims[1] = { 1 }, dims3[1] = { 3 }, offset[1] = { 0 };
+    const hsize_t count[1] = { hsize_t(rank == 0 ? 1 : 0) }, count3[1] = { hsize_t(rank == 0 ? 3 : 0) };
+    add_slab(slabs, "/last_cycle", H5T_NATIVE_INT, 1, dims, offset, count, &cycle);
+    add_slab(slabs, "/ncell", H5T_NATIVE_INT, 1, dims3, offset, count3, ncell);
+  }
+
+  // fields and densities on the global mesh of nodes
+  hsize_t node_dims[3] = { hsize_t(ncell[0] + 1), hsize_t(ncell[1] + 1), hsize_t(ncell[2] + 1) };
+  hsize_t node_offset[3], node_count[3];
+  node_slab(grid, vct, node_offset, node_count);
+  vector<vector<double> > nodes(6 + ns);
+  double ***fields[6] = { EMf->getBx().fetch_arr3(), EMf->getBy().fetch_arr3(), EMf->getBz().fetch_arr3(),
+    EMf->getEx().fetch_arr3(), EMf->getEy().fetch_arr3(), EMf->getEz().fetch_arr3() };
+  for (int f = 0; f < 6; f++) {
+    pack_nodes(nodes[f], fields[f], node_count);
+    add_slab(slabs, string("/fields/") + field_names[f], H5T_NATIVE_DOUBLE, 3, node_dims, node_offset, node_count, &nodes[f][0]);
+  }
+  arr4_double rhons = EMf->getRHOns();
+  for (int is = 0; is < ns; is++) {
+    pack_nodes(nodes[6 + is], rhons[is], node_count);
+    add_slab(slabs, species_group("moments", is) + "/rho", H5T_NATIVE_DOUBLE, 3, node_dims, node_offset, node_count, &nodes[6 + is][0]);
+  }
+
+  // particles, one block per process in the order of the ranks
+  vector<long long> npart(nprocs * ns);
+  vector<double> bounds(6 * ns);
+  for (int is = 0; is < ns; is++) {
+    const long long nop = part[is].getNOP();
+    MPI_Allgather(&nop, 1, MPI_LONG_LONG, &npart[is * nprocs], 1, MPI_LONG_LONG, comm);
+    const double *pos[3] = { part[is].getXall(), part[is].getYall(), part[is].getZall() };
+    double *b = &bounds[6 * is];
+    for (int d = 0; d < 3; d++) {
+      b[2 * d] = DBL_MAX;
+      b[2 * d + 1] = -DBL_MAX;
+      for (long long p = 0; p < nop; p++) {
+        b[2 * d] = std::min(b[2 * d], pos[d][p]);
+        b[2 * d + 1] = std::max(b[2 * d + 1], pos[d][p]);
+      }
+    }
+  }
+  for (int is = 0; is < ns; is++) {
+    const string group = species_group("particles", is);
+    hsize_t total = 0, offset = 0;
+    for (int r = 0; r < nprocs; r++) {
+      if (r < rank) offset += npart[is * nprocs + r];
+      total += npart[is * nprocs + r];
+    }
+    const hsize_t count = npart[is * nprocs + rank];
+    const double *data[8] = { part[is].getXall(), part[is].getYall(), part[is].getZall(),
+      part[is].getUall(), part[is].getVall(), part[is].getWall(), part[is].getQall(), part[is].getParticleIDall() };
+    for (int c = 0; c < 8; c++)
+      add_slab(slabs, group + "/" + particle_names[c], H5T_NATIVE_DOUBLE, 1, &total, &offset, &count, count ? data[c] : 0);
+    const hsize_t procs = nprocs, r = rank, one = 1;
+    add_slab(slabs, group + "/npart", H5T_NATIVE_LLONG, 1, &procs, &r, &one, &npart[is * nprocs + rank]);
+    const hsize_t bdims[2] = { hsize_t(nprocs), 6 }, boffset[2] = { hsize_t(rank), 0 }, bcount[2] = { 1, 6 };
+    add_slab(slabs, group + "/bounds", H5T_NATIVE_DOUBLE, 2, bdims, boffset, bcount, &bounds[6 * is]);
+  }
+
+  const string filename = col->getSaveDirName() + "/restart.h5";
+  const string tmpname = filename + ".tmp";
+  if (parallel) {
+    hid_t file_id = open_restart(tmpname, comm, H5F_ACC_TRUNC, true);
+    create_datasets(file_id, slabs, ns);
+    hid_t dxpl = H5Pcreate(H5P_DATASET_XFER);
+#ifdef H5_HAVE_PARALLEL
+    H5Pset_dxpl_mpio(dxpl, H5FD_MPIO_COLLECTIVE);
+#endif
+    for (size_t s = 0; s < slabs.size(); s++)
+      write_slab(file_id, slabs[s], dxpl);
+    H5Pclose(dxpl);
+    H5Fclose(file_id);
+  }
+  else {
+    // sequential HDF5: the processes write their part in turn
+    int token = 0;
+    if (rank > 0)
+      MPI_Recv(&token, 1, MPI_INT, rank - 1, 0, comm, MPI_STATUS_IGNORE);
+    hid_t file_id = open_restart(tmpname, comm, rank == 0 ? H5F_ACC_TRUNC : H5F_ACC_RDWR, false);
+    if (rank == 0)
+      create_datasets(file_id, slabs, ns);
+    for (size_t s = 0; s < slabs.size(); s++) {
+      hsize_t n = 1;
+      for (int d = 0; d < slabs[s].ndims; d++)
+        n *= slabs[s].count[d];
+      if (n > 0)
+        write_slab(file_id, slabs[s], H5P_DEFAULT);
+    }
+    H5Fclose(file_id);
+    if (rank < nprocs - 1)
+      MPI_Send(&token, 1, MPI_INT, rank + 1, 0, comm);
+  }
+  MPI_Barrier(comm);
+  if (rank == 0 && rename(tmpname.c_str(), filename.c_str()) != 0)
+    eprintf("Failed to rename %s to %s", tmpname.c_str(), filename.c_str());
+#endif
+}
+
+int ReadSharedRestartCycle(const string &dirname)
+{
+  int last_cycle = -1;
+#ifdef NO_HDF5
+  eprintf("Require HDF5 to read from restart file.");
+#else
+  const string filename = dirname + "/restart.h5";
+  hid_t file_id = H5Fopen(filename.c_str(), H5F_ACC_RDONLY, H5P_DEFAULT);
+  if (file_id < 0)
+    eprintf("couldn't open file: %s\n"
+      "\tRESTART NOT POSSIBLE", filename.c_str());
+  H5LTread_dataset_int(file_id, "/last_cycle", &last_cycle);
+  H5Fclose(file_id);
+#endif
+  return last_cycle;
+}
+
+void ReadSharedRestartFields(const Collective *col, const VCtopology3D *vct, const Grid3DCU *grid,
+  arr3_double Bxn, arr3_double Byn, arr3_double Bzn,
+  arr3_double Ex, arr3_double Ey, arr3_double Ez, array4_double *rhons_, int ns)
+{
+#ifdef NO_HDF5
+  eprintf("Require HDF5 to read from restart file.");
+#else
+  const string filename = col->getRestartDirName() + "/restart.h5";
+  if (vct->getCartesian_rank() == 0)
+    printf("LOADING EM FIELD FROM RESTART FILE %s\n", filename.c_str());
+#ifdef H5_HAVE_PARALLEL
+  const bool parallel = true;
+#else
+  const bool parallel = false;
+#endif
+  hid_t file_id = open_restart(filename, vct->getFieldComm(), H5F_ACC_RDONLY, parallel);
+  hid_t dxpl = H5Pcreate(H5P_DATASET_XFER);
+#ifdef H5_HAVE_PARALLEL
+  H5Pset_dxpl_mpio(dxpl, H5FD_MPIO_COLLECTIVE);
+#endif
+
+  int ncell[3];
+  H5LTread_dataset_int(file_id, "/ncell", ncell);
+  if (ncell[0] != col->getNxc() || ncell[1] != col->getNyc() || ncell[2] != col->getNzc())
+    eprintf("The restart file has %d x %d x %d cells, the input file %d x %d x %d",
+      ncell[0], ncell[1], ncell[2], col->getNxc(), col->getNyc(), col->getNzc());
+
+  // the nodes 1..nxn-2, including the last one shared with the next subdomain
+  hsize_t offset[3], count[3];
+  node_slab(grid, vct, offset, count);
+  count[0] = grid->getNXN() - 2;
+  count[1] = grid->getNYN() - 2;
+  count[2] = grid->getNZN() - 2;
+  vector<double> buffer(count[0] * count[1] * count[2]);
+  arr3_double fields[6] = { Bxn, Byn, Bzn, Ex, Ey, Ez };
+  array4_double& rhons = *rhons_;
+  for (int f = 0; f < 6 + ns; f++) {
+    const string name = f < 6 ? string("/fields/") + field_names[f] : species_group("moments", f - 6) + "/rho";
+    read_slab(file_id, name, H5T_NATIVE_DOUBLE, 3, offset, count, &buffer[0], dxpl);
+    size_t l = 0;
+    for (hsize_t i = 1; i <= count[0]; i++)
+      for (hsize_t j = 1; j <= count[1]; j++)
+        for (hsize_t k = 1; k <= count[2]; k++) {
+          if (f < 6)
+            fields[f][i][j][k] = buffer[l++];
+          else
+            rhons[f - 6][i][j][k] = buffer[l++];
+        }
+  }
+  H5Pclose(dxpl);
+  H5Fclose(file_id);
+#endif
+}
+
+void ReadSharedRestartParticles(const Collective *col, const VCtopology3D *vct, const Grid3DCU *grid, int species_number,
+  vector_double& u, vector_double& v, vector_double& w, vector_double& q,
+  vector_double& x, vector_double& y, vector_double& z, vector_double& t)
+{
+#ifdef NO_HDF5
+  eprintf("Require HDF5 to read from restart file.");
+#else
+  const string filename = col->getRestartDirName() + "/restart.h5";
+  if (vct->getCartesian_rank() == 0 && species_number == 0)
+    printf("LOADING PARTICLES FROM RESTART FILE %s\n", filename.c_str());
+#ifdef H5_HAVE_PARALLEL
+  const bool parallel = true;
+#else
+  const bool parallel = false;
+#endif
+  hid_t file_id = open_restart(filename, vct->getFieldComm(), H5F_ACC_RDONLY, parallel);
+  const string group = species_group("particles", species_number);
+
+  // blocks of the writing processes
+  const hsize_t nwriters = dataset_size(file_id, group + "/npart");
+  vector<long long> npart(nwriters);
+  vector<double> bounds(6 * nwriters);
+  {
+    const hsize_t offset[2] = { 0, 0 }, count[2] = { nwriters, 6 };
+    read_slab(file_id, group + "/npart", H5T_NATIVE_LLONG, 1, offset, count, &npart[0], H5P_DEFAULT);
+    read_slab(file_id, group + "/bounds", H5T_NATIVE_DOUBLE, 2, offset, count, &bounds[0], H5P_DEFAULT);
+  }
+
+  // the subdomain, extended to the particles outside the box on the boundary processes
+  double lo[3] = { grid->getXstart(), grid->getYstart(), grid->getZstart() };
+  double hi[3] = { grid->getXend(), grid->getYend(), grid->getZend() };
+  const bool upper[3] = { vct->isXupper(), vct->isYupper(), vct->isZupper() };
+  for (int d = 0; d < 3; d++) {
+    if (vct->getCoordinates(d) == 0) lo[d] = -DBL_MAX;
+    if (upper[d]) hi[d] = DBL_MAX;
+  }
+
+  vector_double *components[8] = { &x, &y, &z, &u, &v, &w, &q, &t };
+  for (int c = 0; c < 8; c++)
+    components[c]->clear();
+  vector<double> block[8];
+  long long total = 0;
+  for (hsize_t r = 0; r < nwriters; r++) {
+    const long long first = total;
+    total += npart[r];
+    const double *b = &bounds[6 * r];
+    bool overlap = npart[r] > 0;
+    for (int d = 0; d < 3; d++)
+      overlap = overlap && b[2 * d] < hi[d] && b[2 * d + 1] >= lo[d];
+    if (!overlap) continue;
+    const hsize_t offset = first, count = npart[r];
+    for (int c = 0; c < 8; c++) {
+      block[c].resize(count);
+      read_slab(file_id, group + "/" + particle_names[c], H5T_NATIVE_DOUBLE, 1, &offset, &count, &block[c][0], H5P_DEFAULT);
+    }
+    for (hsize_t p = 0; p < count; p++) {
+      if (block[0][p] < lo[0] || block[0][p] >= hi[0]) continue;
+      if (block[1][p] < lo[1] || block[1][p] >= hi[1]) continue;
+      if (block[2][p] < lo[2] || block[2][p] >= hi[2]) continue;
+      for (int c = 0; c < 8; c++)
+        components[c]->push_back(block[c][p]);
+    }
+  }
+  H5Fclose(file_id);
+
+  // every particle must have found a process
+  long long nop = x.size(), nread = 0;
+  MPI_Allreduce(&nop, &nread, 1, MPI_LONG_LONG, MPI_SUM, vct->getFieldComm());
+  if (nread != total && vct->getCartesian_rank() == 0)
+    warning_printf("%lld of the %lld particles of species %d of the restart file are lost",
+      total - nread, total, species_number);
+#endif
+}
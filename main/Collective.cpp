@@ -26,6 +26,8 @@
 #include "input_array.h"
 #include "ipichdf5.h"
 #include "Collective.h"
+#include "SharedRestart.h"
+#include "RestartStager.h"
 #include "ConfigFile.h"
 #include "limits.h" // for INT_MAX
 #include "MPIdata.h"
@@ -102,6 +104,7 @@ void Collective::ReadInput(string inputfile) {
     c                 = config.read < double >("c",1.0);
     Smooth            = config.read < double >("Smooth",1.0);
     SmoothNiter       = config.read < int >("SmoothNiter",6);
+    MomentsCheck      = config.read < bool >("MomentsCheck",false);
     PoissonCorrection = config.read<string>("PoissonCorrection","yes");
     PoissonCorrectionCycle = config.read<int>("PoissonCorrectionCycle",10);
     Lx                = config.read < double >("Lx",10.0);
@@ -127,7 +130,19 @@ void Collective::ReadInput(string inputfile) {
     delta             = config.read < double >("delta",0.5); //TBR
     CGtol             = config.read < double >("CGtol",1e-3);
     GMREStol          = config.read < double >("GMREStol",1e-3);
+    MaxwellSolver     = config.read < string >("MaxwellSolver","GMRES");
+    MaxwellPreconditioner = config.read < string >("MaxwellPreconditioner","none");
+    PreconditionerIterations = config.read < int >("PreconditionerIterations",4);
+    PoissonSolver     = config.read < string >("PoissonSolver","GMRES");
+    MultigridSweeps   = config.read < int >("MultigridSweeps",2);
     NiterMover        = config.read < int >("NiterMover",8);
+    PopulationControlCycle = config.read < int >("PopulationControlCycle",0);
+    PopulationMax     = config.read < int >("PopulationMax",0);
+    PopulationMin     = config.read < int >("PopulationMin",0);
+    if (PopulationMax != 0 && PopulationMax < 3)
+      eprintf("PopulationMax must be at least 3, groups of 3 or more particles being merged into 2");
+    if (PopulationMax > 0 && 2 * PopulationMin > PopulationMax)
+      eprintf("PopulationMin must be at most half of PopulationMax, or the split cells would be merged again");
     int ns_tot =ns+nstestpart;
     npcelx            = new int[ns_tot];
     npcely            = new int[ns_tot];
@@ -222,6 +237,7 @@ void Collective::ReadInput(string inputfile) {
     L_square          = config.read < double >("L_square",5.0);
     PlanetOffset      = config.read <double>("PlanetOffset",0.0);
     ns_pl             = config.read < int >("ns_pl",0);
+    nNeutSpecies      = ns_pl; // one neutral parent per planetary species
     AddExosphere      = config.read < int >("AddExosphere",0);
     Rmax              = config.read < double >("Rmax",3.);
     Wfact = new double[ns_pl];
@@ -278,6 +294,13 @@ void Collective::ReadInput(string inputfile) {
       hExo[5]  = hExo0.f;
       fExo[5] = fExo0.f;
     }
+    // radial profile of each neutral species, space-separated (default exp)
+    NeutralProfile = new string[ns_pl];
+    {
+      istringstream profiles(config.read < string >("NeutralProfile", ""));
+      for (int i = 0; i < ns_pl; i++)
+        if (!(profiles >> NeutralProfile[i])) NeutralProfile[i] = "exp";
+    }
     collisionProcesses = config.read < bool >("collisionProcesses", 0);
     xSec               = config.read < double >("xSec", 8.82e-10);
     nCollProcesses     = config.read < int >("nCollProcesses", 3);
@@ -285,6 +308,7 @@ void Collective::ReadInput(string inputfile) {
     iSecElec           = config.read < int >("iSecElec", 2);
     iSecIon            = config.read < int >("iSecIon", 3);
     collStepSkip       = config.read< int >("collStepSkip", 1);
+    CollBulkVelocityCache = config.read< bool >("CollBulkVelocityCache", true);
     E_th_el = new double[nCollProcesses];
     array_double E_th_el0;
     if ((ns_pl>0) and (nCollProcesses>0)) 
@@ -326,6 +350,9 @@ void Collective::ReadInput(string inputfile) {
     bcPfaceYleft  = config.read < int >("bcPfaceYleft",2);
     bcPfaceZright = config.read < int >("bcPfaceZright",2);
     bcPfaceZleft  = config.read < int >("bcPfaceZleft",2);
+    InflowMethod  = config.read < string >("InflowMethod","layers");
+    if (InflowMethod != "layers" && InflowMethod != "flux")
+      eprintf("InflowMethod must be layers or flux, not %s", InflowMethod.c_str());
 
     /* sixth load the OUTPUT PARAMETERS */
     FieldOutputCycle   = config.read < int >("FieldOutputCycle",100);
@@ -339,6 +366,15 @@ void Collective::ReadInput(string inputfile) {
     ParticlesOutputTag =   config.read <string>("ParticlesOutputTag","");
     testPartFlushCycle = config.read < int >("TestParticlesOutputCycle",0); //TBR ?
     RestartOutputCycle = config.read < int >("RestartOutputCycle",5000);
+    RestartMethod      = config.read < string >("RestartMethod","fpp");
+    if (RestartMethod != "fpp" && RestartMethod != "shared")
+      eprintf("RestartMethod must be fpp or shared, not %s", RestartMethod.c_str());
+    RestartStagingDirName = config.read < string >("RestartStagingDirName","");
+    RestartKeep        = config.read < int >("RestartKeep",2);
+    if (!RestartStagingDirName.empty() && RestartMethod != "fpp")
+      eprintf("RestartStagingDirName requires RestartMethod = fpp, the node-local directories cannot hold a shared file");
+    if (RestartKeep < 1)
+      eprintf("RestartKeep must be at least 1");
     RemoveParticlesOutputCycle = config.read < int >("RemoveParticlesOutputCycle",0);
     DiagnosticsOutputCycle = config.read < int >("DiagnosticsOutputCycle",10);
     DeltaX = config.read < int >("DeltaX",1);
@@ -350,8 +386,10 @@ void Collective::ReadInput(string inputfile) {
     Estarte = config.read < double >("Estarte",-1);
     Eende = config.read < double >("Eende",1);
     dEe = config.read < double >("dEe",0.5);
+    SpectraLogAxis = config.read < bool >("SpectraLogAxis",true);
     CallFinalize = config.read < bool >("CallFinalize", true); //deprecated TBR
     ParaviewScriptPath =config.read <string>("ParaviewScriptPath", "");
+    CatalystZeroCopy = config.read < bool >("CatalystZeroCopy", false);
   }
 
   last_cycle = -1;
@@ -537,6 +575,13 @@ void Collective::ReadInput(string inputfile) {
     RestartDirName = config.read < string > ("RestartDirName","data");
     // ReadRestart(RestartDirName);
     restart_status = 1;
+    // the newest complete checkpoint of staged dumps, if any
+    RestartDirName = LatestCheckpointDirName(RestartDirName);
+
+    if (RestartMethod == "shared") {
+      last_cycle = ReadSharedRestartCycle(RestartDirName);
+      return;
+    }
 
     hid_t file_id = H5Fopen((RestartDirName + "/restart0.hdf").c_str(), H5F_ACC_RDWR, H5P_DEFAULT);
     if (file_id < 0) {
@@ -893,6 +938,7 @@ int Collective::ReadRestart(string inputfile) {
   nSurf = new double[nNeutSpecies];
   hExo = new double[nNeutSpecies];
   fExo = new double[nNeutSpecies];
+  NeutralProfile = new string[nNeutSpecies];
 
   stringstream *sNeut = new stringstream[nNeutSpecies];
   for (int i = 0; i < nNeutSpecies; i++){
@@ -909,6 +955,8 @@ int Collective::ReadRestart(string inputfile) {
     dataset_id = H5Dopen2(file_id, ("/collective/colls/fExo" + sNeut[i].str()).c_str(), H5P_DEFAULT); // HDF 1.8.8
     status = H5Dread(dataset_id, H5T_NATIVE_INT, H5S_ALL, H5S_ALL, H5P_DEFAULT, &fExo[i]);
     status = H5Dclose(dataset_id);
+    // the profile is not stored in the restart file
+    NeutralProfile[i] = "exp";
   }
 
 
@@ -35,7 +35,11 @@
 #include "Particles3Dcomm.h"
 #include "Timing.h"
 #include "ParallelIO.h"
+#include "OutputEngine.h"
+#include "RestartStager.h"
+#include "SharedRestart.h"
 #include "Collisions.h"
+#include "NeutralAtmosphere.h"
 //
 #ifndef NO_HDF5
 #include "OutputWrapperFPP.h"
@@ -52,6 +56,9 @@
 #endif
 
 using namespace iPic3D;
+
+/* the riemission faces, in the order of Particles3D::inflow_particles */
+static const char *inflow_faces[] = { "Xleft", "Xright", "Yleft", "Yright", "Zleft", "Zright" };
 //MPIdata* iPic3D::c_Solver::mpi=0;
 
 c_Solver::~c_Solver()
@@ -61,6 +68,9 @@ c_Solver::~c_Solver()
   delete grid; // grid
   delete EMf; // field
   delete colls; // Collisions
+  delete neutrals; // neutral exosphere
+  delete outputEngine; // pvtk output
+  delete restartStager; // staged restart dumps
 #ifndef NO_HDF5
   delete outputWrapperFPP;
 #endif
@@ -83,10 +93,10 @@ c_Solver::~c_Solver()
   delete [] Ke;
   delete [] rho;
   delete [] momentum;
-  delete [] Count;
   delete [] Qdel;
   delete [] Qrep;
   delete [] Qexo;
+  delete [] inflowCounts;
   delete my_clock;
 }
 
@@ -144,9 +154,16 @@ int c_Solver::Init(int argc, char **argv) {
 
   EMf = new EMfields3D(col, grid, vct);
  
+  if (col->getcollisionProcesses() || col->getAddExosphere())
+  {
+    neutrals = new NeutralAtmosphere(col, grid);
+    if (verbosity)
+      dprintf("(3a) tabulated the neutral exosphere.");
+  }
+
   if (col->getcollisionProcesses())
   {
-    colls = new Collisions(col, vct, grid, EMf);
+    colls = new Collisions(col, vct, grid, EMf, neutrals);
     if (verbosity)
       dprintf("(3a) create new collison object.");
   }
@@ -196,18 +213,19 @@ int c_Solver::Init(int argc, char **argv) {
       if (verbosity)
         dprintf("(5a) Output file. Created restart*.hdf (empty) and setting.hdf (full).");   
     }
+  // restart dumps written on node-local storage and copied in the background
+  if (!col->getRestartStagingDirName().empty())
+    restartStager = new RestartStager(vct->getFieldComm(), col->getRestartStagingDirName(), SaveDirName, col->getRestartKeep());
   #endif
  
+  // the pvtk files are staged and written in the background by the output
+  // engine, which allocates its buffers at the first output cycle
+  if(col->getWriteMethod()=="pvtk")
+    outputEngine = new OutputEngine(vct->getFieldComm());
+
   if(!col->field_output_is_off())
   {
-    if(col->getWriteMethod()=="pvtk")
-    {
-      if(!(col->getFieldOutputTag()).empty())
-        fieldwritebuffer = newArr4(float,(grid->getNZN()-3),grid->getNYN()-3,grid->getNXN()-3,3);
-      if(!(col->getMomentsOutputTag()).empty())
-        momentwritebuffer=newArr3(float,(grid->getNZN()-3), grid->getNYN()-3, grid->getNXN()-3);
-    }
-    else if(col->getWriteMethod()=="nbcvtk")
+    if(col->getWriteMethod()=="nbcvtk")
     {
       momentreqcounter=0;
       fieldreqcounter = 0;
@@ -226,23 +244,10 @@ int c_Solver::Init(int argc, char **argv) {
       {
         if ((grid->getNXN()-3)%col->getDeltaX() != 0 || (grid->getNYN()-3)%col->getDeltaY() != 0 || (grid->getNZN()-3)%col->getDeltaZ() != 0)
           eprintf("ERROR: Number of cells in MPI subdomain not a multiple of Delta (Energy Spectra).")
-        int Nspece = (col->getEende() - col->getEstarte())/col->getdEe() + 1.001;
-        int Nspeci = (col->getEendi() - col->getEstarti())/col->getdEi() + 1.001;
-        spectrawritebuffere=newArr4(float,(grid->getNZN()-3)/(col->getDeltaZ()),(grid->getNYN()-3)/(col->getDeltaY()),(grid->getNXN()-3)/(col->getDeltaX()),Nspece+1);
-        spectrawritebufferi=newArr4(float,(grid->getNZN()-3)/(col->getDeltaZ()),(grid->getNYN()-3)/(col->getDeltaY()),(grid->getNXN()-3)/(col->getDeltaX()),Nspeci+1);
       }
     }
   }
 
-  if(!col->temperature_output_is_off())
-  {
-    if(col->getWriteMethod()=="pvtk")
-    {
-     if(!(col->getTemperatureOutputTag()).empty())
-       temperaturewritebuffer=newArr4(float,grid->getNZN()-3, grid->getNYN()-3, grid->getNXN()-3,6);
-    }
-  }
-
   if (verbosity)
     dprintf("(6) initialized buffers for output to vtk files.");
 
@@ -256,12 +261,57 @@ int c_Solver::Init(int argc, char **argv) {
   if (verbosity)
     dprintf("(7) initialized ConservedQuantities.txt file.");
 
+  solverStats = SaveDirName + "/SolverStats.txt";
+  if (myrank == 0 && col->getDiagnosticsOutputCycle() > 0)
+  {
+    ofstream my_file(solverStats.c_str());
+    my_file << "#cycle";
+    const char *solve[] = { "PoissonE", "Maxwell", "PoissonB" };
+    for (int i = 0; i < 3; i++)
+      my_file << "\t" << solve[i] << "_iterations" << "\t" << solve[i] << "_restarts"
+              << "\t" << solve[i] << "_reductions"
+              << "\t" << solve[i] << "_residual" << "\t" << solve[i] << "_time"
+              << "\t" << solve[i] << "_preconditioner_time";
+    my_file << endl;
+    my_file.close();
+  }
+
+  populationStats = SaveDirName + "/PopulationControl.txt";
+  if (myrank == 0 && col->getPopulationControlCycle() > 0)
+  {
+    ofstream my_file(populationStats.c_str());
+    my_file << "#cycle\tspecies\tparticles\tremoved\tadded";
+    // cells of each bin of particles per cell, before and after
+    for (int h = 0; h < 2; h++)
+      for (int b = 0; b < Particles3D::population_bins; b++)
+        my_file << "\t" << (h ? "after" : "before") << "_" << (b ? 1 << (b-1) : 0);
+    my_file << endl;
+    my_file.close();
+  }
+
+  inflowStats = SaveDirName + "/Inflow.txt";
+  inflowCounts = new long long[ns][2][6];
+  for (int i = 0; i < ns; i++)
+    for (int f = 0; f < 6; f++)
+      inflowCounts[i][0][f] = inflowCounts[i][1][f] = 0;
+  inflowCycles = 0;
+  if (myrank == 0 && col->getInflowMethod() == "flux" && col->getDiagnosticsOutputCycle() > 0)
+  {
+    ofstream my_file(inflowStats.c_str());
+    // pcls per cycle of each face, summed over and largest of the processes
+    my_file << "#cycle\tspecies";
+    for (int f = 0; f < 6; f++)
+      my_file << "\t" << inflow_faces[f] << "_injected" << "\t" << inflow_faces[f] << "_removed"
+              << "\t" << inflow_faces[f] << "_max_injected";
+    my_file << endl;
+    my_file.close();
+  }
+
   rho = new double[ns];
   Ke = new double[ns];
   BulkEnergy = new double[ns];
   momentum = new double[ns];
   Qdel = new double[ns];
-  Count = new double[ns];
   Qrep = new double[ns];
   Qexo = new double[ns];
   
@@ -269,7 +319,6 @@ int c_Solver::Init(int argc, char **argv) {
   for (int i = 0; i < ns; i++)
   {
     Qdel[i] = 0.;
-    Count[i] = 0.;
     Qrep[i] = 0.;
     Qexo[i] = 0.;
   }
@@ -466,7 +515,7 @@ bool c_Solver::ParticlesMover(int cycle) {
     if ( (i>=col->getNs_sw()) and (col->getAddExosphere()) )
     {
       int i_pl = i-col->getNs_sw();
-      Qexo[i] = part[i].AddIonizedExosphere(i_pl);
+      Qexo[i] = part[i].AddIonizedExosphere(i_pl, neutrals);
       if (verbosity and myrank==0){
         dprintf("(2b) Injection of particles due to photoionization. Species %d",i);
         dprintf("(2c) Ionized Exosph Injection the total Q(is=%d) is = %e",i,Qexo[i]);
@@ -481,33 +530,28 @@ bool c_Solver::ParticlesMover(int cycle) {
       dprintf("(3a) Injection of particles due to electron impact ionization.");
   }
 
-  double Qrm=0., Count_plus=0., Count_mins=0.;
-    
-  if (col->getNonTrivialBCPlanet()) 
-  {
-    for (int i=0; i < ns; i++)
-    {
-      Count[i] = part[i].rotateAndCountParticlesInsideSphere(cycle,col->getL_square(),col->getx_center(),col->gety_center(),col->getz_center());
-      if (Count[i]>0)  Count_plus += Count[i];
-      if (Count[i]<0)  Count_mins += Count[i];
-      if ( col->getVerbose() and Count[i]>0 and myrank==0) 
-        dprintf("(4a) BC planet surface RotateAndCount-> the total Q(is=%d) counted is = %e",i,Count[i]);
-    }
-    Qrm = std::min(Count_plus,-Count_mins);
-  }
-  else 
-    Qrm = (double) INT_MAX;
-
+  // BC planet surface: the mover has already found the particles inside the planet
   for (int i=0; i < ns; i++) 
   {
-    Qdel[i] = part[i].deleteParticlesInsideSphere(cycle,Qrm,col->getL_square(),col->getx_center(),col->gety_center(),col->getz_center());
+    Qdel[i] = part[i].removeParticlesInsideSphere(cycle);
     if ( col->getVerbose() and fabs(Qdel[i])>0 and myrank==0)
-      dprintf("(4b) BC planet surface: Delete-> the total Q(is=%d) removed is = %e",i,Qdel[i]);
+      dprintf("(4) BC planet surface: Delete-> the total Q(is=%d) removed is = %e",i,Qdel[i]);
   }
 
   for (int i=0; i < ns; i++)
   { 
-    Qrep[i] = part[i].repopulate_particles(EMf);
+    if (col->getInflowMethod() == "flux")
+    {
+      long long counts[2][6];
+      Qrep[i] = part[i].inflow_particles(counts[0], counts[1]);
+      for (int f = 0; f < 6; f++)
+      {
+        inflowCounts[i][0][f] += counts[0][f];
+        inflowCounts[i][1][f] += counts[1][f];
+      }
+    }
+    else
+      Qrep[i] = part[i].repopulate_particles(EMf);
     if (verbosity)
       dprintf("(5a) BC box walls (remove and inject): the total Q(is=%d) removed is = %e",i,Qrep[i]);
 
@@ -519,24 +563,80 @@ bool c_Solver::ParticlesMover(int cycle) {
       dprintf("(6a) Communication pcls different MPI procs DONE. Species %d",i);
   }
 
+  if (col->getPopulationControlCycle() > 0 && cycle % col->getPopulationControlCycle() == 0)
+  {
+    ControlPopulation(cycle);
+    if (verbosity)
+      dprintf("(7) Merging and splitting of the pcls DONE.");
+  }
+
   return (false);
 
 }
 
 
+/*! Merge the particles of the overpopulated cells and split the heaviest
+    of the underpopulated ones, appending the histograms of the particles
+    per cell to PopulationControl.txt */
+void c_Solver::ControlPopulation(int cycle)
+{
+  const int nbins = Particles3D::population_bins;
+  for (int i = 0; i < ns; i++)
+  {
+    long long histogram[2][nbins];
+    long long counts[3];
+    part[i].control_population(col->getPopulationMax(), col->getPopulationMin(), histogram, counts[1], counts[2]);
+    counts[0] = part[i].getNOP();
+    MPI_Allreduce(MPI_IN_PLACE, histogram[0], 2*nbins, MPI_LONG_LONG, MPI_SUM, MPIdata::get_PicGlobalComm());
+    MPI_Allreduce(MPI_IN_PLACE, counts, 3, MPI_LONG_LONG, MPI_SUM, MPIdata::get_PicGlobalComm());
+    if (myrank == 0)
+    {
+      ofstream my_file(populationStats.c_str(), fstream::app);
+      my_file << cycle << "\t" << i << "\t" << counts[0] << "\t" << counts[1] << "\t" << counts[2];
+      for (int h = 0; h < 2; h++)
+        for (int b = 0; b < nbins; b++)
+          my_file << "\t" << histogram[h][b];
+      my_file << endl;
+      my_file.close();
+    }
+  }
+}
+
+/*! Restart dump of cycle, written in restart.h5 (RestartMethod = shared),
+    in the staging directory and copied in the background, or appended
+    to restart<rank>.hdf */
+void c_Solver::WriteRestart(int cycle)
+{
+#ifndef NO_HDF5
+  if (col->getRestartMethod() == "shared")
+    WriteSharedRestart(grid, EMf, part, ns, col, vct, cycle);
+  else if (restartStager)
+  {
+    fetch_outputWrapperFPP().write_restart(restartStager->stage(cycle), cycle);
+    restartStager->flush();
+  }
+  else
+    fetch_outputWrapperFPP().append_restart(cycle);
+#endif
+}
+
 /*  -------------- */
 /*!  Write Output */
 /*  -------------- */
 void c_Solver::WriteOutput(int cycle) {
 
   WriteConserved(cycle);
+  WriteSolverStats(cycle);
+  WriteInflow(cycle);
 
   #ifdef NO_HDF5
     eprintf("The selected output option must be compiled with HDF5");
   #else
+    if (restartStager)
+      restartStager->progress();
     if (restart_cycle>0 && cycle%restart_cycle==0){
       convertParticlesToSynched();
-      fetch_outputWrapperFPP().append_restart(cycle);
+      WriteRestart(cycle);
       if (verbosity) dprintf("(2) Dump all particles in restart*.hdf. Done.");
     }
   #endif  
@@ -607,30 +707,33 @@ void c_Solver::WriteOutput(int cycle) {
   
   else if (col->getWriteMethod() == "pvtk")
   {
+    outputEngine->progress();
     if(!col->field_output_is_off() && (cycle%(col->getFieldOutputCycle()) == 0 || cycle == first_cycle) )
     {
       if(!(col->getFieldOutputTag()).empty())
-        WriteFieldsVTK(grid, EMf, col, vct, col->getFieldOutputTag() ,cycle, fieldwritebuffer);//check this is E, B
+        WriteFieldsVTK(grid, EMf, col, vct, col->getFieldOutputTag() ,cycle, outputEngine);//check this is E, B
       if (verbosity) dprintf("(2a) pvtk done with the fields output.");
 
       if(!(col->getMomentsOutputTag()).empty())
-        WriteMomentsVTK(grid, EMf, col, vct, col->getMomentsOutputTag() ,cycle, momentwritebuffer);// and check this as Je0, Ji1 rhoe0 etc.
+        WriteMomentsVTK(grid, EMf, col, vct, col->getMomentsOutputTag() ,cycle, outputEngine);// and check this as Je0, Ji1 rhoe0 etc.
       if (verbosity) dprintf("(2b) pvtk done with the moments output.");
     }
 
     if(!col->spectra_output_is_off() && (cycle%(col->getSpectraOutputCycle()) == 0 || cycle == first_cycle) )
     {		  
       if(!(col->getSpectraOutputTag()).empty())
-        WriteSpectraVTK(grid, part, EMf, col, vct, col->getSpectraOutputTag(),cycle, spectrawritebuffere, spectrawritebufferi);
+        WriteSpectraVTK(grid, part, EMf, col, vct, col->getSpectraOutputTag(),cycle, outputEngine);
       if (verbosity) dprintf("(2c) pvtk done with the spectra output.");
     }
 
     if(!col->temperature_output_is_off() && (cycle%(col->getTemperatureOutputCycle()) == 0 || cycle == first_cycle) )
     {
       if(!(col->getTemperatureOutputTag()).empty())
-        WriteTemperatureVTK(grid, EMf, col, vct, col->getTemperatureOutputTag() ,cycle, temperaturewritebuffer);
+        WriteTemperatureVTK(grid, EMf, col, vct, col->getTemperatureOutputTag() ,cycle, outputEngine);
       if (verbosity) dprintf("(2d) pvtk done with the Temperature output.");
     }
+    // the files of this cycle are written while the next ones are computed
+    outputEngine->end_cycle();
   }
 
   else if (col->getWriteMethod() == "phdf5")
@@ -713,6 +816,60 @@ void c_Solver::WriteConserved(int cycle)
   }
 }
 
+/*  -------------- */
+/*!  Write Solver Stats */
+/*  -------------- */
+void c_Solver::WriteSolverStats(int cycle)
+{
+  // iterations and wall clock time of the field solves, every cycle
+  if (col->getDiagnosticsOutputCycle() > 0 && myrank == 0)
+  {
+    const KrylovStats *stats[] = {
+      &EMf->getPoissonEStats(), &EMf->getMaxwellStats(), &EMf->getPoissonBStats() };
+    ofstream my_file(solverStats.c_str(), fstream::app);
+    my_file << cycle;
+    for (int i = 0; i < 3; i++)
+      my_file << "\t" << stats[i]->iterations << "\t" << stats[i]->restarts
+              << "\t" << stats[i]->reductions
+              << "\t" << stats[i]->residual << "\t" << stats[i]->time
+              << "\t" << stats[i]->preconditioner_time;
+    my_file << endl;
+    my_file.close();
+  }
+}
+
+/*  -------------- */
+/*!  Write Inflow */
+/*  -------------- */
+void c_Solver::WriteInflow(int cycle)
+{
+  // pcls injected and removed per cycle at each riemission face, averaged
+  // since the last diagnostics cycle (InflowMethod = flux)
+  inflowCycles++;
+  if (col->getInflowMethod() != "flux" || col->getDiagnosticsOutputCycle() <= 0 || cycle % col->getDiagnosticsOutputCycle() != 0)
+    return;
+  for (int i = 0; i < ns; i++)
+  {
+    long long sum[2][6];
+    long long max[6];
+    MPI_Allreduce(inflowCounts[i][0], sum[0], 12, MPI_LONG_LONG, MPI_SUM, MPIdata::get_PicGlobalComm());
+    MPI_Allreduce(inflowCounts[i][0], max, 6, MPI_LONG_LONG, MPI_MAX, MPIdata::get_PicGlobalComm());
+    if (myrank == 0)
+    {
+      ofstream my_file(inflowStats.c_str(), fstream::app);
+      my_file << cycle << "\t" << i;
+      for (int f = 0; f < 6; f++)
+        my_file << "\t" << double(sum[0][f])/inflowCycles << "\t" << double(sum[1][f])/inflowCycles
+                << "\t" << double(max[f])/inflowCycles;
+      my_file << endl;
+      my_file.close();
+    }
+    for (int f = 0; f < 6; f++)
+      inflowCounts[i][0][f] = inflowCounts[i][1][f] = 0;
+  }
+  inflowCycles = 0;
+}
+
 /*
 void c_Solver::WriteVelocityDistribution(int cycle)
 {
@@ -802,9 +959,21 @@ void c_Solver::Finalize() {
   {
     #ifndef NO_HDF5
     convertParticlesToSynched();
-    fetch_outputWrapperFPP().append_restart((col->getNcycles() + first_cycle) - 1);
+    WriteRestart((col->getNcycles() + first_cycle) - 1);
     #endif
   }
+  if (restartStager)
+  {
+    restartStager->finish();
+    if (verbosity)
+      dprintf("(1b) restart dumps copied, %g s waiting for the copies.", restartStager->get_wait_time());
+  }
+  if (outputEngine)
+  {
+    outputEngine->finish();
+    if (verbosity)
+      dprintf("(1a) pvtk output done, %g s waiting for the background writes.", outputEngine->get_wait_time());
+  }
   my_clock->stopTiming();
   if (verbosity) 
     dprintf("(2) Stop time profiling. Finalize DONE.");
@@ -7,12 +7,21 @@ developers: Peter Stephenson
 
 #include <iostream>
 #include <math.h>
+#include <stdlib.h>
 #include "Particles3D.h"
+#include "Particle.h"
 #include "Collective.h"
 #include "EMfields3D.h"
+#include "Grid3DCU.h"
 #include "Collisions.h"
+#include "NeutralAtmosphere.h"
+#include "MPIdata.h"
 #include "ipicmath.h"
 #include "ipicfwd.h"
+#include "ompdefs.h"
+
+// Number of particles whose collision probabilities are computed together
+static const int collChunk = 256;
 
 
 Collisions::~Collisions()
@@ -20,8 +29,14 @@ Collisions::~Collisions()
 
 }
 
-Collisions::Collisions(CollectiveIO * col, VirtualTopology3D *vct, Grid * grid, EMfields3D *Emf)
+Collisions::Collisions(CollectiveIO * col, VirtualTopology3D *vct, Grid * grid, EMfields3D *Emf,
+  const NeutralAtmosphere *neutrals)
 {
+this->col = col;
+this->vct = vct;
+this->grid = grid;
+this->neutrals = neutrals;
+
 // Load simulation parameters
 Parameters::init_parameters();
 // Load cross sections for simulation
@@ -56,16 +71,21 @@ dz = col->getDz();
 // No. of species
 ns = col->getNs();   
 
-// Get planet offset
-PlanetOffset = col->getPlanetOffset();
-x_center = col->getx_center();
-y_center = col->gety_center();
-z_center = col->getz_center();
-
-// Get exosphere properties - Only need while they aren't loaded in Particles3D
-R = col->getL_square(); // Mercury/planet radius
-Nexo_H  = col->getnSurf(0);   // density of exosphere neutrals at the surface (in nsw units)
-hexo_H  = col->gethExo(0); // scale length of exosphere
+// Cache of the bulk velocity at the nodes
+bulkVelocityCache = col->getCollBulkVelocityCache();
+if (bulkVelocityCache)
+  bulkVelocity.resize(3*grid->getNXN()*grid->getNYN()*grid->getNZN());
+
+// One erand48 stream per thread, different on every process
+const int nThreads = omp_get_max_threads();
+rngState.resize(3*nThreads);
+collidingPcls.resize(nThreads);
+for (int t = 0; t < nThreads; t++){
+  const unsigned long long seed = 0x5DEECE66DULL*(MPIdata::get_rank()+1) + 0x9E3779B9ULL*(t+1);
+  rngState[3*t]   = seed & 0xFFFF;
+  rngState[3*t+1] = (seed >> 16) & 0xFFFF;
+  rngState[3*t+2] = (seed >> 32) & 0xFFFF;
+}
 
 // Set up ionized Pls object
 // Allocation of particles
@@ -85,47 +105,91 @@ void Collisions::Collide(int species, Particles3D *part, CollectiveIO * col, EMf
 
   if (qom<0)// If electrons
   {
-    int nPls = part[species].getNOP();
-    nCollsLikely = 0.0;
+    const int nPls = part[species].getNOP();
+    const vector_SpeciesParticle& pcls = part[species].get_pcl_list();
     // Scaling of velocity required when using heavier electrons
     // Not needed for ions
 
     // Alternative options used for validation
     // elMassRat = 1.0;
     elMassRat = sqrt(qom_eReal / qom); // Electrons
-    
-    // Alternative options used for validation
-    // u0 = col-> getU0(species);
-    // v0 = col-> getV0(species);
-    // w0 = col-> getW0(species);
-    // u0 = 0.0;
-    // v0 = 0.0;
-    // w0 = 0.0;
-
-    for (int pidx = 0; pidx < nPls; pidx++) 
-    {
-      // Find partilce position
-      xpl = part[species].getX(pidx);
-      ypl = part[species].getY(pidx);
-      zpl = part[species].getZ(pidx);
-
-      // Find neutral density at particle
-      double nNeutr = findneutDensity(species, part);
-
-      // Find Bulk velocity at particle
-      findBulkVelocity(species, Emf, u0, v0, w0);
-      
-      double vScaled = velMagnitude_wScale(species, part, pidx, u0, v0, w0);
-      double pColl = ProbColl(nNeutr, vScaled);
 
-      double rColl =  sample_clopen_u_double();// Random number for coll
+    if (bulkVelocityCache)
+    {
+      const int nxn = grid->getNXN(), nyn = grid->getNYN(), nzn = grid->getNZN();
+      #pragma omp parallel for collapse(2)
+      for (int i = 0; i < nxn; i++)
+        for (int j = 0; j < nyn; j++)
+          for (int k = 0; k < nzn; k++)
+          {
+            double *V = &bulkVelocity[3*((i*nyn + j)*nzn + k)];
+            const double rho = Emf->getRHOns(i,j,k,species);
+            const double invrho = (rho != 0) ? 1.0/rho : 0.0;
+            V[0] = Emf->getJxs(i,j,k,species)*invrho;
+            V[1] = Emf->getJys(i,j,k,species)*invrho;
+            V[2] = Emf->getJzs(i,j,k,species)*invrho;
+          }
+    }
 
+    // clear the lists of all threads, not only those of the coming team:
+    // a smaller team would leave stale hits that are processed below
+    for (size_t t = 0; t < collidingPcls.size(); t++)
+      collidingPcls[t].clear();
 
-      if (rColl < pColl) // Particle undergoes collision
+    long long nLikely = 0;
+    #pragma omp parallel reduction(+:nLikely)
+    {
+      const int tid = omp_get_thread_num();
+      unsigned short *rng = &rngState[3*tid];
+      std::vector<int>& hits = collidingPcls[tid];
+
+      double xc[collChunk], yc[collChunk], zc[collChunk];
+      double uc[collChunk], vc[collChunk], wc[collChunk];
+      double u0c[collChunk], v0c[collChunk], w0c[collChunk];
+      double pColl[collChunk];
+
+      // static schedule: each thread gets a contiguous range of chunks,
+      // so the hits of thread 0, 1, ... are in particle order
+      #pragma omp for schedule(static)
+      for (int first = 0; first < nPls; first += collChunk)
       {
-        CollideElectron(species, part, pidx, col); // Modify electron velocity
+        const int n = (nPls - first < collChunk) ? nPls - first : collChunk;
+
+        // gather the chunk from the particle list
+        for (int k = 0; k < n; k++)
+        {
+          const SpeciesParticle& pcl = pcls[first+k];
+          xc[k] = pcl.get_x(); yc[k] = pcl.get_y(); zc[k] = pcl.get_z();
+          uc[k] = pcl.get_u(); vc[k] = pcl.get_v(); wc[k] = pcl.get_w();
+        }
+
+        // Find Bulk velocity at particles
+        for (int k = 0; k < n; k++)
+          findBulkVelocity(species, Emf, xc[k], yc[k], zc[k], u0c[k], v0c[k], w0c[k]);
+
+        // Neutral density and collision probability
+        for (int k = 0; k < n; k++)
+        {
+          const double nNeutr = findneutDensity(xc[k], yc[k], zc[k]);
+          const double vScaled = velMagnitude_wScale(uc[k], vc[k], wc[k], u0c[k], v0c[k], w0c[k]);
+          pColl[k] = ProbColl(nNeutr, vScaled);
+        }
+
+        for (int k = 0; k < n; k++)
+        {
+          if (pColl[k] > 0.1) nLikely++;
+          const double rColl = 1.0 - erand48(rng); // Random number for coll in (0,1]
+          if (rColl < pColl[k]) hits.push_back(first+k); // Particle undergoes collision
+        }
       }
     }
+
+    // Modify the velocity of the colliding electrons
+    for (size_t t = 0; t < collidingPcls.size(); t++)
+      for (size_t h = 0; h < collidingPcls[t].size(); h++)
+        CollideElectron(species, part, collidingPcls[t][h], col);
+
+    nCollsLikely = nLikely;
     if  (nCollsLikely>0)
       cout << "No. Pls with large pColl:" << nCollsLikely << endl;
   }
@@ -139,15 +203,15 @@ void Collisions::CollideElectron(int species, Particles3D *part, int pidx, Colle
  // Find particle Energy and energy loss for each colliding particle
  // Energy values need to be rescaled into code units. 
   double qom = col->getQOM(species);
-  upl = part[species].getU(pidx);
-  vpl = part[species].getV(pidx);
-  wpl = part[species].getW(pidx);
+  double upl = part[species].getU(pidx);
+  double vpl = part[species].getV(pidx);
+  double wpl = part[species].getW(pidx);
 
-  Epl = 0.5 * (upl*upl + vpl*vpl + wpl*wpl) / fabs(qom); // Pl energy 
-  Eth = 0;
+  double Epl = 0.5 * (upl*upl + vpl*vpl + wpl*wpl) / fabs(qom); // Pl energy 
+  double Eth = 0;
   
   // Run through collisions with decreasing threshold energy
-  isIoni = false;
+  bool isIoni = false;
   for (int iColl = 0; iColl < nCollProcesses; iColl++)
   {
     if (Epl > E_th_el[iColl])
@@ -169,7 +233,7 @@ void Collisions::CollideElectron(int species, Particles3D *part, int pidx, Colle
   // Could add continuous cooling processes for v low energies.
 
   // Reduce particle energies 
-  Epl_new = Epl - Eth;
+  double Epl_new = Epl - Eth;
   if (Epl_new<0)
   {
     cout << endl;
@@ -201,45 +265,31 @@ void Collisions::CollideElectron(int species, Particles3D *part, int pidx, Colle
 }
 
 /* Calculate Collision probability in a given step */
-double Collisions::ProbColl(double nNeutral, double vMag)
+double Collisions::ProbColl(double nNeutral, double vMag)const
 {
   // nNeutral - neutral density of water (?) 
   // Should be same as used for photoionization module
 
   // xSec - Cross section of collision. Set in input file
   // vScale - Scaling ratio to correct for heavy electrons
-  //dprintf("nNeutral is %f",nNeutral);
   double tau = nNeutral * xSec * vMag * dt;
-  // double tau = nNeutral * xSec * vMag * dt;
-  
 
   /* If steps skipped then need to scale up collision probability
   by an appropriate amount */
   tau = tau * double(collStepSkip);
-  double pColl = 1 - exp(-tau);
-  if (pColl > 0.1) nCollsLikely += 1.0;
-
-  return pColl;
+  return 1 - exp(-tau);
 }
 
-double Collisions::velMagnitude_wScale(int species, Particles3D *part, int pidx, double u0, 
-  double v0, double w0)
+double Collisions::velMagnitude_wScale(double upl, double vpl, double wpl, double u0, 
+  double v0, double w0)const
 {
   // Finds velocity magnitude, including a correction for the increased electron mass.
-        
-  // Find particle velocity
-  upl = part[species].getU(pidx);
-  vpl = part[species].getV(pidx);
-  wpl = part[species].getW(pidx);
   
   // Calculate scaled up velocities
   double uSC = (upl - u0) * elMassRat + u0;
   double vSC = (vpl - v0) * elMassRat + v0;
   double wSC = (wpl - w0) * elMassRat + w0;
-  double vScaled_sq = uSC*uSC + vSC*vSC + wSC*wSC;
-  double vScaled = sqrt(vScaled_sq);
-  
-  return vScaled;
+  return sqrt(uSC*uSC + vSC*vSC + wSC*wSC);
 }
 
 /* Records the propertpies of secondary electrons and ions in case of ionization */
@@ -352,15 +402,25 @@ void Collisions::secElecVelocity(double &u, double &v, double &w)
 }
 
 
-void Collisions::findBulkVelocity(int species, EMfields3D *Emf, double &u0, double &v0, double &w0)
+void Collisions::findBulkVelocity(int species, EMfields3D *Emf, double x, double y, double z,
+  double &u0, double &v0, double &w0)const
 // Finds bulk velocity at the partilce position
 {
 
-  // Find cell index closest to pl. 
-  int iX = int((xpl/dx) + 0.5);
-  int iY = int((ypl/dy) + 0.5);
-  int iZ = int((zpl/dz) + 0.5);
+  // Find local node closest to pl (node 1 is at the start of the subdomain). 
+  int iX = int((x - grid->getXstart())/dx + 0.5) + 1;
+  int iY = int((y - grid->getYstart())/dy + 0.5) + 1;
+  int iZ = int((z - grid->getZstart())/dz + 0.5) + 1;
+  iX = iX < 0 ? 0 : (iX > grid->getNXN()-1 ? grid->getNXN()-1 : iX);
+  iY = iY < 0 ? 0 : (iY > grid->getNYN()-1 ? grid->getNYN()-1 : iY);
+  iZ = iZ < 0 ? 0 : (iZ > grid->getNZN()-1 ? grid->getNZN()-1 : iZ);
 
+  if (bulkVelocityCache)
+  {
+    const double *V = &bulkVelocity[3*((iX*grid->getNYN() + iY)*grid->getNZN() + iZ)];
+    u0 = V[0]; v0 = V[1]; w0 = V[2];
+    return;
+  }
 
   // Find Current and Density
   double Jx = Emf->getJxs(iX, iY, iZ, species);
@@ -383,19 +443,7 @@ void Collisions::findBulkVelocity(int species, EMfields3D *Emf, double &u0, doub
 
 }
 
-double Collisions::findneutDensity(int species, Particles3D *part)
+double Collisions::findneutDensity(double x, double y, double z)const
 {
-  
-  // Find distance from planet centre
-  double xd = xpl - x_center; // x position relative to planet
-  double yd = ypl - y_center; // y position relative to planet
-  double zd = zpl - z_center-PlanetOffset; // z position relative to planet
-  
-  double dist_sq = xd*xd+yd*yd+zd*zd;
-  double dist    = sqrt(dist_sq);
-  
-  // Use neutral density function for exosphere
-  double nNeutral = part->neutralDensity(Nexo_H, dist, R, hexo_H);
-  
-  return nNeutral;
+  return neutrals->densityAt(0, x, y, z);
 }
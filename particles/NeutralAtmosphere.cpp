@@ -0,0 +1,97 @@
+/*******************************************************************************************
+  NeutralAtmosphere.cpp -  Neutral exosphere of the planet.
+  -------------------
+ ********************************************************************************************/
+
+#include <math.h>
+#include "Collective.h"
+#include "Grid3DCU.h"
+#include "NeutralAtmosphere.h"
+#include "errors.h"
+
+// Radial table step in units of the smallest cell size
+static const int tableRefine = 16;
+
+NeutralAtmosphere::NeutralAtmosphere(CollectiveIO * col, Grid * grid):
+  nNeut(col->getnNeutSpecies()),
+  cellDist(grid->getNXC(), grid->getNYC(), grid->getNZC()),
+  cellDens(col->getnNeutSpecies() > 0 ? col->getnNeutSpecies() : 1, grid->getNXC(), grid->getNYC(), grid->getNZC())
+{
+  R = col->getL_square();
+  x_center = col->getx_center();
+  y_center = col->gety_center();
+  z_center = col->getz_center() + col->getPlanetOffset();
+
+  profileType = new int[nNeut];
+  nSurf = new double[nNeut];
+  hExo = new double[nNeut];
+  for (int is = 0; is < nNeut; is++)
+  {
+    nSurf[is] = col->getnSurf(is);
+    hExo[is] = col->gethExo(is);
+    const string name = col->getNeutralProfile(is);
+    if (name == "exp")
+      profileType[is] = EXPONENTIAL;
+    else if (name == "powerlaw")
+      profileType[is] = POWERLAW;
+    else
+      eprintf("ERROR unknown NeutralProfile %s for neutral species %d", name.c_str(), is);
+  }
+
+  // The table covers the local subdomain with its ghost cells: the farthest
+  // point of the subdomain from the planet centre is one of its corners.
+  const double dx = grid->getDX(), dy = grid->getDY(), dz = grid->getDZ();
+  const double xs[2] = {grid->getXstart() - dx, grid->getXend() + dx};
+  const double ys[2] = {grid->getYstart() - dy, grid->getYend() + dy};
+  const double zs[2] = {grid->getZstart() - dz, grid->getZend() + dz};
+  double rmax = 0.0;
+  for (int a = 0; a < 2; a++)
+    for (int b = 0; b < 2; b++)
+      for (int c = 0; c < 2; c++)
+      {
+        const double xd = xs[a] - x_center, yd = ys[b] - y_center, zd = zs[c] - z_center;
+        rmax = std::max(rmax, sqrt(xd*xd + yd*yd + zd*zd));
+      }
+
+  dr = std::min(dx, std::min(dy, dz))/tableRefine;
+  invdr = 1.0/dr;
+  nr = (rmax > R) ? int((rmax - R)*invdr) + 2 : 2;
+  table = new double[nNeut*nr];
+  for (int is = 0; is < nNeut; is++)
+    for (int k = 0; k < nr; k++)
+      table[is*nr + k] = profile(is, R + k*dr);
+
+  for (int i = 0; i < grid->getNXC(); i++)
+    for (int j = 0; j < grid->getNYC(); j++)
+      for (int k = 0; k < grid->getNZC(); k++)
+      {
+        const double xd = grid->getXC(i) - x_center;
+        const double yd = grid->getYC(j) - y_center;
+        const double zd = grid->getZC(k) - z_center;
+        const double dist = sqrt(xd*xd + yd*yd + zd*zd);
+        cellDist[i][j][k] = dist;
+        for (int is = 0; is < nNeut; is++)
+          cellDens[is][i][j][k] = profile(is, dist);
+      }
+}
+
+NeutralAtmosphere::~NeutralAtmosphere()
+{
+  delete [] profileType;
+  delete [] nSurf;
+  delete [] hExo;
+  delete [] table;
+}
+
+double NeutralAtmosphere::profile(int is, double dist)const
+{
+  if (dist <= R) return 0.0; //Zero if inside planet
+  switch (profileType[is])
+  {
+    case POWERLAW:
+      return nSurf[is]*pow(R/dist, hExo[is]);
+    case EXPONENTIAL:
+    default:
+      return nSurf[is]*exp(-(dist - R)/hExo[is]); // In SW units
+  }
+}
@@ -31,6 +31,9 @@ developers: Stefano Markidis, Giovanni Lapenta
 #include <sstream>
 #include <math.h>
 #include <limits.h>
+#include <stdlib.h>
+#include <algorithm>
+#include <vector>
 #include "asserts.h"
 #include "VCtopology3D.h"
 #include "Collective.h"
@@ -42,6 +45,9 @@ developers: Stefano Markidis, Giovanni Lapenta
 #include "TimeTasks.h"
 #include "parallel.h"
 #include "Particles3D.h"
+#include "NeutralAtmosphere.h"
+#include "ompdefs.h"
+#include "ipicmath.h"
 
 #include "mic_particles.h"
 #include "debug.h"
@@ -605,21 +611,38 @@ void Particles3D::mover_PC(Field * EMf) {
 
 void Particles3D::mover_PC_AoS(Field * EMf)
 {
-	// #pragma omp parallel
-	{
 	  convertParticlesToAoS();
 
-          // #pragma omp master
 	  if (vct->getCartesian_rank() == 0) {
 		cout << "***AoS MOVER species " << ns << " *** Max." << NiterMover << " ITERATIONS   ****" << endl;
 	  }
-	  int sum_innter = 0;
+	  long long sum_innter = 0;
 	  const_arr4_pfloat fieldForPcls = EMf->get_fieldForPcls();
 	
 
 	  const double dto2 = .5 * dt, qdto2mc = qom * dto2 / c;
-	  // #pragma omp for schedule(static)
-	  for (int pidx = 0; pidx < getNOP(); pidx++) {
+
+	  // planet surface: particles ending inside the planet are listed for removal
+	  const double R = col->getL_square();
+	  const double R2 = R*R;
+	  const double x_c = col->getx_center();
+	  const double y_c = col->gety_center();
+	  const double z_c = col->getz_center() + col->getPlanetOffset();
+	  // clear the lists of all threads, not only those of the coming team: a
+	  // smaller team would leave stale entries that are merged below
+	  if (int(insideSphereThread.size()) < omp_get_max_threads())
+		insideSphereThread.resize(omp_get_max_threads());
+	  for (int t = 0; t < int(insideSphereThread.size()); t++)
+		insideSphereThread[t].clear();
+
+	  // each thread moves a contiguous chunk of the particles, the same chunk
+	  // whose pages it has touched first when the list was last reallocated
+	  const int nop = getNOP();
+	  #pragma omp parallel reduction(+:sum_innter)
+	  {
+	  std::vector<int>& inside = insideSphereThread[omp_get_thread_num()];
+	  #pragma omp for schedule(static)
+	  for (int pidx = 0; pidx < nop; pidx++) {
 		// copy the particle
 		SpeciesParticle* pcl = &_pcls[pidx];
 		ALIGNED(pcl);
@@ -739,20 +762,31 @@ void Particles3D::mover_PC_AoS(Field * EMf)
 		  }
 		}
 		//
-		pcl->set_x(xorig + uavg * dt);
-		pcl->set_y(yorig + vavg * dt);
-		pcl->set_z(zorig + wavg * dt);
+		const double xnew = xorig + uavg * dt;
+		const double ynew = yorig + vavg * dt;
+		const double znew = zorig + wavg * dt;
+		pcl->set_x(xnew);
+		pcl->set_y(ynew);
+		pcl->set_z(znew);
 		pcl->set_u(2.0 * uavg - uorig);
 		pcl->set_v(2.0 * vavg - vorig);
 		pcl->set_w(2.0 * wavg - worig);
+		markIfInsideSphere(inside, pidx, xnew, ynew, znew, R2, x_c, y_c, z_c);
 	  }// END OF ALL THE PARTICLES
+	  }
+
+	  // the chunks are in thread order, so the indices stay sorted
+	  pclsInsideSphere.clear();
+	  for (int t = 0; t < int(insideSphereThread.size()); t++)
+		pclsInsideSphere.insert(pclsInsideSphere.end(),
+		  insideSphereThread[t].begin(), insideSphereThread[t].end());
+	  nopMoved = nop;
 	
 #ifdef PRINTPCL  
 	  if (vct->getCartesian_rank() == 0) {
 		cout << "***AoS MOVER species " << ns << " *** Avg." << (double)sum_innter/((double)getNOP()) << " ITERATIONS   ****" << endl;
 	  }
 #endif
-	}
 }
 
 
@@ -1870,6 +1904,159 @@ double Particles3D::repopulate_particles(Field * EMf)
   return TOTQremoved;
 }
 
+/* velocity along the inward normal of a pcl crossing an inflow face, for a
+   drifting Maxwellian of drift un and thermal velocity sigma along it: the
+   flux weights the Maxwellian by v, f(v) ~ v exp(-(v-un)^2/(2 sigma^2)), v > 0 */
+static double sample_flux_maxwellian(double un, double sigma)
+{
+  if (sigma <= 0.)
+    return un;
+  // z = (v-un)/(sqrt(2) sigma) has the density (z+a) exp(-z^2), z > -a
+  const double a = un/(M_SQRT2*sigma);
+  double z;
+  if (a < 0.)
+  {
+    // sample z exp(-z^2) for z > -a, accept with (z+a)/z
+    do
+      z = sqrt(a*a - log(sample_clopen_u_double()));
+    while (sample_u_double()*z > z + a);
+  }
+  else
+  {
+    // sample (|z|+a) exp(-z^2) for z > -a, a mixture of |z| exp(-z^2) for
+    // z > 0 and -a < z < 0 and of a exp(-z^2), accept with (z+a)/(|z|+a)
+    const double ea = exp(-a*a);
+    const double w_pos = 0.5;
+    const double w_neg = 0.5*(1. - ea);
+    const double w_gauss = 0.5*sqrt(M_PI)*a*(1. + erf(a));
+    do
+    {
+      const double r = sample_u_double()*(w_pos + w_neg + w_gauss);
+      if (r < w_pos)
+        z = sqrt(-log(sample_clopen_u_double()));
+      else if (r < w_pos + w_neg)
+        z = -sqrt(-log(ea + (1. - ea)*sample_clopen_u_double()));
+      else
+      {
+        do
+          sample_standard_maxwellian(z);
+        while (z*M_SQRT1_2 <= -a);
+        z *= M_SQRT1_2;
+      }
+    }
+    while (sample_u_double()*(fabs(z) + a) > z + a);
+  }
+  return un + M_SQRT2*sigma*z;
+}
+
+// Remove the pcls that left the box through the riemission faces and
+// inject the SW pcls that entered it through them during the time step
+// (InflowMethod = flux); injected[f] and removed[f] count the pcls of this
+// process on the faces Xleft, Xright, Yleft, Yright, Zleft, Zright
+double Particles3D::inflow_particles(long long injected[6], long long removed[6])
+{
+  using namespace BCparticles;
+
+  const bool inflow[6] = {
+    !vct->getPERIODICX_P() && vct->noXleftNeighbor_P() && bcPfaceXleft == REEMISSION,
+    !vct->getPERIODICX_P() && vct->noXrghtNeighbor_P() && bcPfaceXright == REEMISSION,
+    !vct->getPERIODICY_P() && vct->noYleftNeighbor_P() && bcPfaceYleft == REEMISSION,
+    !vct->getPERIODICY_P() && vct->noYrghtNeighbor_P() && bcPfaceYright == REEMISSION,
+    !vct->getPERIODICZ_P() && vct->noZleftNeighbor_P() && bcPfaceZleft == REEMISSION,
+    !vct->getPERIODICZ_P() && vct->noZrghtNeighbor_P() && bcPfaceZright == REEMISSION };
+  bool do_inflow = false;
+  for (int f = 0; f < 6; f++)
+  {
+    injected[f] = 0;
+    removed[f] = 0;
+    do_inflow = do_inflow || inflow[f];
+  }
+
+  const double FourPI = 16*atan(1.0);
+  const double q_per_particle = (qom/fabs(qom))*(1./FourPI/npcel)*(1.0/grid->getInvVOL());
+  const double L[3] = { Lx, Ly, Lz };
+  const double h[3] = { dx, dy, dz };
+  const int ncells[3] = { grid->getNXC(), grid->getNYC(), grid->getNZC() };
+  const double drift[3] = { u0, v0, w0 };
+  const double thermal[3] = { uth, vth, wth };
+  double Qinjected = 0., TOTQinjected = 0.;
+
+  if (do_inflow)
+  {
+    // remove the pcls beyond the faces, the mover has not applied the BCs yet
+    int pidx = 0;
+    while (pidx < getNOP())
+    {
+      SpeciesParticle& pcl = _pcls[pidx];
+      int f = 0;
+      while (f < 6 && !(inflow[f] && (f%2 ? pcl.get_x(f/2) > L[f/2] : pcl.get_x(f/2) < 0.)))
+        f++;
+      if (f < 6)
+      {
+        removed[f]++;
+        Qinjected += -pcl.get_q();
+        delete_particle(pidx);
+      }
+      else
+        pidx++;
+    }
+
+    // inject sw pcls, the exospheric species have no inflow
+    for (int f = 0; f < 6 && get_species_num() < col->getNs_sw(); f++)
+    {
+      if (!inflow[f])
+        continue;
+      // normal and tangential directions, sign of the inward normal
+      const int d = f/2;
+      const int d1 = (d+1)%3;
+      const int d2 = (d+2)%3;
+      const double sign = f%2 ? -1. : 1.;
+      const double face = f%2 ? L[d] : 0.;
+      // flux per unit density of the drifting Maxwellian through the face
+      const double un = sign*drift[d];
+      const double sigma = thermal[d];
+      double flux = un > 0. ? un : 0.;
+      if (sigma > 0.)
+      {
+        const double a = un/(M_SQRT2*sigma);
+        flux = sigma/sqrt(2.*M_PI)*exp(-a*a) + 0.5*un*(1. + erf(a));
+      }
+      // mean number of pcls crossing a cell face during dt
+      const double npcl_per_face = npcel*flux*dt/h[d];
+
+      int c[3];
+      c[d] = 1;
+      for (c[d1] = 1; c[d1] <= ncells[d1]-2; c[d1]++)
+      for (c[d2] = 1; c[d2] <= ncells[d2]-2; c[d2]++)
+      {
+        const double cell_low[3] = { grid->getXN(c[0]), grid->getYN(c[1]), grid->getZN(c[2]) };
+        // random rounding keeps the mean
+        const int n = int(npcl_per_face + sample_u_double());
+        for (int p = 0; p < n; p++)
+        {
+          double u[3], x[3];
+          do{
+          sample_maxwellian(u[0],u[1],u[2],uth,vth,wth,u0,v0,w0);
+          u[d] = sign*sample_flux_maxwellian(un, sigma);
+          }while(sqrt(u[0]*u[0]+u[1]*u[1]+u[2]*u[2])>1.0); //avoid to create supra-luminous particles
+          // the pcl crossed the face at a uniform time during dt
+          const double t = sample_u_double()*dt;
+          x[d] = face + u[d]*t;
+          x[d1] = cell_low[d1] + sample_u_double()*h[d1] + u[d1]*t;
+          x[d2] = cell_low[d2] + sample_u_double()*h[d2] + u[d2]*t;
+          create_new_particle(u[0],u[1],u[2],q_per_particle,x[0],x[1],x[2]);
+        }
+        injected[f] += n;
+        Qinjected += n*q_per_particle;
+      }
+    }
+  }
+
+  MPI_Allreduce(&Qinjected, &TOTQinjected, 1, MPI_DOUBLE, MPI_SUM, mpi_comm);
+
+  return TOTQinjected;
+}
+
 
 //Simply delete exiting test particles if openBC
 void Particles3D::openbc_delete_testparticles()
@@ -2105,104 +2292,65 @@ void Particles3D::RotatePlaneXY(double theta) {
 
 
 
-/*! change velocity of particels inside sphere (planet) with random radial speed, and count them */
-double Particles3D::rotateAndCountParticlesInsideSphere(int cycle, double R, double x_center, double y_center, double z_center)
+/*! Append the particle to data/RemovedParticles_<rank>.bin. Each record is
+ *  cycle, species, x, y, z, u, v, w, q, all stored as doubles. */
+void Particles3D::logRemovedParticle(int cycle, const SpeciesParticle& pcl)
 {
-  int pidx = 0;
-  double Q_removed=0., TOTQ_removed=0.;
-  int OutputCycle = col->getRemoveParticlesOutputCycle();
-  double uold,vold,wold,u,v,w,xd,yd,zd,theta,phi,Vmod;
-  const double RandNorm = 8 * atan(1.0) / (double) RAND_MAX;
-  double PlanetOffset;
-  
-  //srand(vct->getCartesian_rank()+2); DIABOLICO, mai usare! ./Job
-
-  PlanetOffset = col->getPlanetOffset();
-
-  ofstream my_file_ct ("data/CountedParticles.txt", ios::app);
-  ofstream my_file_rt ("data/RotatedParticles.txt", ios::app);
-  while (pidx < _pcls.size())
+  if (!removedLog)
   {
-    SpeciesParticle& pcl = _pcls[pidx];
-    xd = pcl.get_x() - x_center;
-    yd = pcl.get_y() - y_center;
-    zd = pcl.get_z() - z_center - PlanetOffset;
-    if ( (xd*xd+yd*yd+zd*zd) < (R*R) ){
-      uold = pcl.get_u();
-      vold = pcl.get_v();
-      wold = pcl.get_w();
-      Vmod = sqrt( pow(uold,2) + pow(vold,2) + pow(wold,2) );
-      Q_removed += pcl.get_q();
-      if( (OutputCycle!=0) and ((cycle%OutputCycle)==0) ) my_file_ct << cycle << "\t" << pcl.get_x() << "\t" << pcl.get_y() << "\t" << pcl.get_z() << "\t" << pcl.get_u() << "\t" << pcl.get_v() << "\t" << pcl.get_w() << "\t" << pcl.get_q() << endl;
-      do{
-         theta = rand() * RandNorm/2.;
-	 phi   = rand() * RandNorm;
-         u = Vmod*sin( theta )*cos( phi);
-         v = Vmod*sin( theta )*sin( phi );
-         w = Vmod*cos( theta );
-      }while((xd*u+yd*v+zd*w)<0);
-      pcl.set_u(u);
-      pcl.set_v(v);
-      pcl.set_w(w);
-      if( (OutputCycle!=0) and ((cycle%OutputCycle)==0) ) my_file_rt << cycle << "\t" << pcl.get_x() << "\t" << pcl.get_y() << "\t" << pcl.get_z() << "\t" << pcl.get_u() << "\t" << pcl.get_v() << "\t" << pcl.get_w() << "\t" << pcl.get_q() << endl;
+    std::stringstream ss;
+    ss << "data/RemovedParticles_" << vct->getCartesian_rank() << ".bin";
+    removedLog = fopen(ss.str().c_str(), "ab");
+    if (!removedLog)
+    {
+      eprintf("cannot open %s", ss.str().c_str());
     }
-    pidx++;
+    setvbuf(removedLog, NULL, _IOFBF, 1<<20);
   }
-  my_file_ct.close();
-  my_file_rt.close();
-
-  return Q_removed;
+  const double record[9] = {
+    double(cycle), double(ns),
+    pcl.get_x(), pcl.get_y(), pcl.get_z(),
+    pcl.get_u(), pcl.get_v(), pcl.get_w(),
+    pcl.get_q() };
+  fwrite(record, sizeof(double), 9, removedLog);
 }
 
-
-
-/*! Delete the particles inside the sphere with radius R and center x_center y_center and return the total charge removed */
-double Particles3D::deleteParticlesInsideSphere(int cycle, double Qrm, double R, double x_center, double y_center, double z_center)
+/*! Delete the particles inside the sphere (planet) and return the total charge removed.
+ *  The mover lists the particles it has moved inside the planet, so only the
+ *  particles added after the mover (exosphere, ionization) are tested here.
+ *  Other movers do not mark particles and all of them are tested. */
+double Particles3D::removeParticlesInsideSphere(int cycle)
 {
-  int pidx=0, prm=0;
   double Q_removed=0., TOTQ_removed=0.;
-  int OutputCycle = col->getRemoveParticlesOutputCycle();
-  double xd,yd,zd,xnw,ynw,znw,Rnw;
-  double  FourPI =16*atan(1.0);
-  const double q_per_particle = (Ninj/FourPI/npcel)*(1.0/grid->getInvVOL());
-  unsigned int Nrm;
-  double PlanetOffset;
-
-  Nrm = INT_MAX;//(int) Qrm/q_per_particle;
-
-  PlanetOffset = col->getPlanetOffset();
-
-  ofstream my_file ("data/RemovedParticles.txt", ios::app);
+  const int OutputCycle = col->getRemoveParticlesOutputCycle();
+  const bool logRemoved = (OutputCycle!=0) and ((cycle%OutputCycle)==0);
+  const double R = col->getL_square();
+  const double x_c = col->getx_center();
+  const double y_c = col->gety_center();
+  const double z_c = col->getz_center() + col->getPlanetOffset();
+
+  if (nopMoved < 0) pclsInsideSphere.clear();
+  const int first = (nopMoved < 0) ? 0 : nopMoved;
+  const int nop = getNOP();
+  for (int pidx = first; pidx < nop; pidx++)
+  {
+    const SpeciesParticle& pcl = _pcls[pidx];
+    markIfInsideSphere(pclsInsideSphere, pidx, pcl.get_x(), pcl.get_y(), pcl.get_z(), R*R, x_c, y_c, z_c);
+  }
 
-  while (pidx < _pcls.size())
+  // the indices are in increasing order: deleting from the last one, the
+  // particle moved into the hole of a deleted particle is never inside
+  for (int m = pclsInsideSphere.size()-1; m >= 0; m--)
   {
-    SpeciesParticle& pcl = _pcls[pidx];
-    xd = pcl.get_x() - x_center;
-    yd = pcl.get_y() - y_center;
-    zd = pcl.get_z() - z_center - PlanetOffset;
-    if ( (xd*xd+yd*yd+zd*zd) < (R*R) ){
-      if (prm<=Nrm){
-        Q_removed += pcl.get_q();
-        if( (OutputCycle!=0) and ((cycle%OutputCycle)==0) ) my_file << cycle << "\t" << pcl.get_x() << "\t" << pcl.get_y() << "\t" << pcl.get_z() << "\t" << pcl.get_u() << "\t" << pcl.get_v() << "\t" << pcl.get_w() << "\t" << pcl.get_q() << endl;
-        delete_particle(pidx);
-        prm++;
-      }
-      else{
-        Rnw = 2.*R - sqrt(xd*xd+yd*yd+zd*zd);
-	xnw = Rnw/sqrt(xd*xd+yd*yd+zd*zd)*pcl.get_x();
-        ynw = Rnw/sqrt(xd*xd+yd*yd+zd*zd)*pcl.get_y();
-        znw = Rnw/sqrt(xd*xd+yd*yd+zd*zd)*pcl.get_z();
-        pcl.set_x(xnw);	      
-        pcl.set_y(ynw);	      
-        pcl.set_z(znw);	      
-        pidx++;
-      }
-    }
-    else {
-      pidx++;
-    }
+    const int pidx = pclsInsideSphere[m];
+    const SpeciesParticle& pcl = _pcls[pidx];
+    Q_removed += pcl.get_q();
+    if (logRemoved) logRemovedParticle(cycle, pcl);
+    delete_particle(pidx);
   }
-  my_file.close();
+  if (logRemoved && removedLog) fflush(removedLog);
+  pclsInsideSphere.clear();
+  nopMoved = -1;
 
   MPI_Allreduce(&Q_removed, &TOTQ_removed, 1, MPI_DOUBLE, MPI_SUM, mpi_comm);
   
@@ -2345,85 +2493,354 @@ void Particles3D::maxwellianDipole(Field * EMf, double R, double x_center, doubl
 }
 
 
-/** Implementation of an ionized exosphere for Mercury */
-double Particles3D::AddIonizedExosphere(int i)
+// Maxwellian velocity drawn from the erand48 stream rng
+static inline void sample_maxwellian_erand48(unsigned short *rng,
+  double& u, double& v, double& w,
+  double ut, double vt, double wt,
+  double u0, double v0, double w0)
 {
+  const double prob1 = sqrt(-2.0 * log(1.0 - erand48(rng)));
+  const double theta1 = 2.0 * M_PI * erand48(rng);
+  const double prob2 = sqrt(-2.0 * log(1.0 - erand48(rng)));
+  const double theta2 = 2.0 * M_PI * erand48(rng);
+  u = u0 + ut * prob1 * cos(theta1);
+  v = v0 + vt * prob1 * sin(theta1);
+  w = w0 + wt * prob2 * cos(theta2);
+}
 
+/** Implementation of an ionized exosphere for Mercury */
+void Particles3D::initIonizedExosphere(int ipl, const NeutralAtmosphere *neutrals)
+{
   const double R = col->getL_square();
+  const double Rmax = col->getRmax();          // max radius to inject pcls
+  const double fexo  = col->getfExo(ipl);      // ioniz. frequency in units of wpi
+  const double w_fact  = col->getWfact(ipl);
 
-  const double Nexo  = col->getnSurf(i);   // density of exosphere neutrals at the surface (in nsw units)
-  const double fexo  = col->getfExo(i);    // ioniz. frequency in units of wpi
-  const double hexo  = col->gethExo(i);    // scale length of exosphere
-  const double w_fact  = col->getWfact(i);
+  exoCells.clear();
+  exoExpected.clear();
+  for (int i=1; i<grid->getNXC()-1;i++)
+    for (int j=1; j<grid->getNYC()-1;j++)
+      for (int k=1; k<grid->getNZC()-1;k++) {
+        // distance of the cell centre from the planet centre
+        const double dist = neutrals->getCellDistance(i,j,k);
+        if( (dist<=R) || (dist>=Rmax) ) continue;
+        const double Nexpected = (npcel_sw * w_fact) * (dt*fexo) * neutrals->getCellDensity(ipl,i,j,k);
+        if (Nexpected <= 0.0) continue;
+        exoCells.push_back(i);
+        exoCells.push_back(j);
+        exoCells.push_back(k);
+        exoExpected.push_back(Nexpected);
+      }
+  const int nCells = exoExpected.size();
+  exoOffset.resize(nCells+1);
+
+  // One erand48 stream per thread, different on every process and species
+  const int nThreads = omp_get_max_threads();
+  exoRng.resize(3*nThreads);
+  for (int t = 0; t < nThreads; t++){
+    const unsigned long long seed = 0x5DEECE66DULL*(MPIdata::get_rank()+1)
+      + 0x9E3779B9ULL*(t+1) + 0xB5ULL*(ns+1);
+    exoRng[3*t]   = seed & 0xFFFF;
+    exoRng[3*t+1] = (seed >> 16) & 0xFFFF;
+    exoRng[3*t+2] = (seed >> 32) & 0xFFFF;
+  }
 
-  const double Rmax = col->getRmax();          // max radius to inject pcls
+  // Random initial phase of the carry-over, so that also the first cycles
+  // inject the expected number of particles on average
+  exoCarry.resize(nCells);
+  for (int c = 0; c < nCells; c++)
+    exoCarry[c] = erand48(&exoRng[0]);
+
+  exoSpecies = ipl;
+}
+
+double Particles3D::AddIonizedExosphere(int ipl, const NeutralAtmosphere *neutrals)
+{
+  const double w_fact  = col->getWfact(ipl);
   const double FourPI =16*atan(1.0);
   const double q = (qom/fabs(qom))*grid->getVOL()/npcel_sw/FourPI/w_fact; // charge of injected pcls
 
-  int    Ninject_int;
-  double randx,randy,randz;
-  double x,y,z,u,v,w,Ninject;
-  double PlanetOffset, xd,yd,zd, dist, dist_sq;
   double Qinject=0., TOTQinject=0.;
 
-  PlanetOffset = col->getPlanetOffset();
-
   if (vct->getCartesian_rank()==0)  cout << "*** Species " << ns << "-" << " Injecting ionized exosphere particles ****" << endl;
 
-  for (int i=1; i<grid->getNXC()-1;i++)
-    for (int j=1; j<grid->getNYC()-1;j++)
-      for (int k=1; k<grid->getNZC()-1;k++) {
-              
-        xd = grid->getXC(i,j,k)-col->getx_center(); // x position relative to planet
-        yd = grid->getYC(i,j,k)-col->gety_center(); // y position relative to planet
-        zd = grid->getZC(i,j,k)-col->getz_center()-PlanetOffset; // z position relative to planet
-        
-      	dist_sq = xd*xd+yd*yd+zd*zd;
-        dist    = sqrt(dist_sq);
-        // If in range of production distance
-        if( (dist>R) and (dist<Rmax) ){
-          double nDens = neutralDensity(Nexo, dist, R, hexo);
-          Ninject = (npcel_sw * w_fact) * (dt*fexo)* nDens;
-          Ninject_int = (int) Ninject;
-          //dprintf("Injecting %e = %i pcls",Ninject,Ninject_int);
-          //dprintf("\t %e",fexo);
-          //dprintf("\t %e",Nexo);
-
-          for (int jj=0; jj<Ninject_int; jj++){
-            // Assign random position in the cell
-            randx = rand()/(double)RAND_MAX;
-            randy = rand()/(double)RAND_MAX;
-            randz = rand()/(double)RAND_MAX;
-            x = grid->getXC(i,j,k)+(randx-0.5)*dx;
-            y = grid->getYC(i,j,k)+(randy-0.5)*dy;
-            z = grid->getZC(i,j,k)+(randz-0.5)*dz;
-            //Assign velocities
-	    sample_maxwellian(u, v, w, uth, vth, wth, u0, v0, w0);
-            // create particle
-	    create_new_particle(u,v,w,q,x,y,z);
-	    Qinject += q;
-          }
+  if (exoSpecies != ipl) initIonizedExosphere(ipl, neutrals);
+  const int nCells = exoExpected.size();
+
+  // Number of particles of each cell: the fraction of particle left is
+  // carried over to the next cycle instead of being lost
+  int Ninject = 0;
+  for (int c = 0; c < nCells; c++){
+    exoCarry[c] += exoExpected[c];
+    const int n = (int) exoCarry[c];
+    exoCarry[c] -= n;
+    exoOffset[c] = Ninject;
+    Ninject += n;
+  }
+  exoOffset[nCells] = Ninject;
+
+  // Make room for all the new particles at once
+  const int nop_old = getNOP();
+  const int nop_new = nop_old + Ninject;
+  if (nop_new > _pcls.capacity())
+    _pcls.reserve(pow2roundup(nop_new));
+  _pcls.resize(nop_new);
 
-        } 
+  #pragma omp parallel
+  {
+    unsigned short *rng = &exoRng[3*omp_get_thread_num()];
+    #pragma omp for schedule(static)
+    for (int c = 0; c < nCells; c++){
+      const int i = exoCells[3*c];
+      const int j = exoCells[3*c+1];
+      const int k = exoCells[3*c+2];
+      // lower corner of the cell
+      const double xc = grid->getXC(i,j,k) - 0.5*dx;
+      const double yc = grid->getYC(i,j,k) - 0.5*dy;
+      const double zc = grid->getZC(i,j,k) - 0.5*dz;
+      for (int p = nop_old + exoOffset[c]; p < nop_old + exoOffset[c+1]; p++){
+        // Assign random position in the cell
+        const double x = xc + erand48(rng)*dx;
+        const double y = yc + erand48(rng)*dy;
+        const double z = zc + erand48(rng)*dz;
+        // Assign velocities
+        double u, v, w;
+        sample_maxwellian_erand48(rng, u, v, w, uth, vth, wth, u0, v0, w0);
+        _pcls[p] = SpeciesParticle(u,v,w,q,x,y,z,0.);
       }
+    }
+  }
+  // particle IDs are generated in order by the master thread
+  for (int p = nop_old; p < nop_new; p++)
+    _pcls[p].set_t(pclIDgenerator.generateID());
 
+  Qinject = q*Ninject;
   MPI_Allreduce(&Qinject, &TOTQinject, 1, MPI_DOUBLE, MPI_SUM, mpi_comm);
   
   return TOTQinject;
 }
 
-/* Calculate neutral density at distance dist from planet*/
-double Particles3D::neutralDensity(double Nexo, double dist, double R, double hexo)
+/* bin of the histograms of the particles per cell of a cell with n particles */
+static int population_bin(int n)
+{
+  int bin = 0;
+  while (bin < Particles3D::population_bins - 1 && n >= (1 << bin))
+    bin++;
+  return bin;
+}
+
+/* orders the particles of a cell by octant of the velocity, then by speed,
+   so that the merged groups hold similar velocities */
+struct by_velocity
+{
+  static int octant(const SpeciesParticle& pcl)
+  {
+    return (pcl.get_u() < 0.0) + 2 * (pcl.get_v() < 0.0) + 4 * (pcl.get_w() < 0.0);
+  }
+  static double speed2(const SpeciesParticle& pcl)
+  {
+    return pcl.get_u() * pcl.get_u() + pcl.get_v() * pcl.get_v() + pcl.get_w() * pcl.get_w();
+  }
+  bool operator()(const SpeciesParticle& a, const SpeciesParticle& b) const
+  {
+    const int octant_a = octant(a);
+    const int octant_b = octant(b);
+    if (octant_a != octant_b)
+      return octant_a < octant_b;
+    return speed2(a) < speed2(b);
+  }
+};
+
+/* orders the particles by decreasing weight */
+struct by_weight
+{
+  bool operator()(const SpeciesParticle& a, const SpeciesParticle& b) const
+  {
+    return fabs(a.get_q()) > fabs(b.get_q());
+  }
+};
+
+/* replace the g particles pcls by two particles of half their charge at
+   their centre of charge, with the velocities V +- delta e, V being the
+   mean velocity and e the deviation of the particle farthest from it: the
+   charge, the momentum and the kinetic energy are conserved, the mass
+   being proportional to the charge within a species */
+static void merge_group(const SpeciesParticle *pcls, int g, vector_SpeciesParticle& out)
+{
+  double Q = 0.0;
+  double X[3] = { 0.0, 0.0, 0.0 };
+  double V[3] = { 0.0, 0.0, 0.0 };
+  double E = 0.0;
+  for (int p = 0; p < g; p++) {
+    const double q = pcls[p].get_q();
+    Q += q;
+    for (int d = 0; d < 3; d++) {
+      X[d] += q * pcls[p].get_x(d);
+      V[d] += q * pcls[p].get_u(d);
+      E += q * pcls[p].get_u(d) * pcls[p].get_u(d);
+    }
+  }
+  double V2 = 0.0;
+  for (int d = 0; d < 3; d++) {
+    X[d] /= Q;
+    V[d] /= Q;
+    V2 += V[d] * V[d];
+  }
+  E /= Q;
+  double e[3] = { 0.0, 0.0, 0.0 };
+  double e2 = 0.0;
+  for (int p = 0; p < g; p++) {
+    double dev[3];
+    double dev2 = 0.0;
+    for (int d = 0; d < 3; d++) {
+      dev[d] = pcls[p].get_u(d) - V[d];
+      dev2 += dev[d] * dev[d];
+    }
+    if (dev2 > e2) {
+      e2 = dev2;
+      for (int d = 0; d < 3; d++)
+        e[d] = dev[d];
+    }
+  }
+  // E - V2 is the variance of the velocities, non negative up to round-off
+  const double delta = e2 > 0.0 ? sqrt(fmax(0.0, E - V2) / e2) : 0.0;
+  out.push_back(SpeciesParticle(V[0] + delta * e[0], V[1] + delta * e[1], V[2] + delta * e[2],
+    0.5 * Q, X[0], X[1], X[2], pcls[0].get_t()));
+  out.push_back(SpeciesParticle(V[0] - delta * e[0], V[1] - delta * e[1], V[2] - delta * e[2],
+    0.5 * Q, X[0], X[1], X[2], pcls[1].get_t()));
+}
+
+/* merge groups of the n particles pcls of a cell into out so that at most
+   nmax are left; returns the number of particles removed */
+static int merge_cell(SpeciesParticle *pcls, int n, int nmax, vector_SpeciesParticle& out)
 {
-  double nDens;
-  if (dist>R)  nDens = Nexo*exp(-(dist-R)/hexo);
-  else nDens = 0.0; //Zero if inside planet
+  std::sort(pcls, pcls + n, by_velocity());
+  const int excess = n - nmax;
+  // each group of g particles becomes 2, g being the smallest size that
+  // removes the excess (nmax >= 3 so g = n always does)
+  int g = 3;
+  while ((n / g) * (g - 2) < excess)
+    g++;
+  const int groups = (excess + g - 3) / (g - 2);
+  // the groups are spread over the velocities
+  const int stride = n / groups;
+  int p = 0;
+  for (int group = 0; group < groups; group++) {
+    const int start = group * stride;
+    for (; p < start; p++)
+      out.push_back(pcls[p]);
+    merge_group(pcls + start, g, out);
+    p = start + g;
+  }
+  for (; p < n; p++)
+    out.push_back(pcls[p]);
+  return groups * (g - 2);
+}
 
-  //dprintf("a distanza %f c'e' %f neutri",dist,nDens);
-  //dprintf("Nexo = %f",Nexo);
-  //dprintf("R = %f",R);
-  //dprintf("hexo = %f",hexo);
+/* unit vector normal to the velocity of pcl, along which its halves are placed */
+static void split_direction(const SpeciesParticle& pcl, double e[3])
+{
+  // the axis of the smallest velocity component is the least aligned with the velocity
+  int a = 0;
+  for (int d = 1; d < 3; d++)
+    if (fabs(pcl.get_u(d)) < fabs(pcl.get_u(a)))
+      a = d;
+  const int b = (a + 1) % 3;
+  const int c = (a + 2) % 3;
+  // velocity x axis a
+  e[a] = 0.0;
+  e[b] = pcl.get_u(c);
+  e[c] = -pcl.get_u(b);
+  const double norm = sqrt(e[b] * e[b] + e[c] * e[c]);
+  for (int d = 0; d < 3; d++)
+    e[d] = norm > 0.0 ? e[d] / norm : 1.0 / sqrt(3.0);
+}
 
-  return nDens; // In SW units
+void Particles3D::control_population(int nmax, int nmin,
+  long long histogram[2][population_bins], long long& removed, long long& added)
+{
+  convertParticlesToAoS();
+  // a group of at least 3 particles is merged into 2
+  assert(nmax == 0 || nmax >= 3);
+  if (nmax == 0)
+    nmax = INT_MAX;
+  for (int h = 0; h < 2; h++)
+    for (int b = 0; b < population_bins; b++)
+      histogram[h][b] = 0;
+  removed = 0;
+  added = 0;
+
+  // counting sort of the particles by cell into _pclstmp
+  const int nop = getNOP();
+  const int ncells = nxc * nyc * nzc;
+  std::vector<int> cell(nop);
+  std::vector<int> offset(ncells + 1, 0);
+  for (int pidx = 0; pidx < nop; pidx++) {
+    const SpeciesParticle& pcl = _pcls[pidx];
+    int cx, cy, cz;
+    grid->get_safe_cell_coordinates(cx, cy, cz, pcl.get_x(), pcl.get_y(), pcl.get_z());
+    cell[pidx] = (cx * nyc + cy) * nzc + cz;
+    offset[cell[pidx] + 1]++;
+  }
+  for (int c = 0; c < ncells; c++)
+    offset[c + 1] += offset[c];
+  _pclstmp.resize(nop);
+  {
+    std::vector<int> next(offset.begin(), offset.end() - 1);
+    for (int pidx = 0; pidx < nop; pidx++)
+      _pclstmp[next[cell[pidx]]++] = _pcls[pidx];
+  }
 
+  _pcls.clear();
+  for (int cx = 0; cx < nxc; cx++)
+    for (int cy = 0; cy < nyc; cy++)
+      for (int cz = 0; cz < nzc; cz++) {
+        const int c = (cx * nyc + cy) * nzc + cz;
+        const int n = offset[c + 1] - offset[c];
+        const bool interior = cx > 0 && cx < nxc - 1 && cy > 0 && cy < nyc - 1 && cz > 0 && cz < nzc - 1;
+        if (interior)
+          histogram[0][population_bin(n)]++;
+        const int now = _pcls.size();
+        if (n > 0) {
+          SpeciesParticle *pcls = &_pclstmp[offset[c]];
+          if (n > nmax)
+            removed += merge_cell(pcls, n, nmax, _pcls);
+          else if (n < nmin) {
+            // split the heaviest particles into two halves, placed on both
+            // sides of the particle inside the cell
+            std::sort(pcls, pcls + n, by_weight());
+            const int nsplit = nmin - n < n ? nmin - n : n;
+            const double lo[3] = { grid->getXN(cx), grid->getYN(cy), grid->getZN(cz) };
+            const double hi[3] = { grid->getXN(cx + 1), grid->getYN(cy + 1), grid->getZN(cz + 1) };
+            for (int p = 0; p < n; p++) {
+              SpeciesParticle pcl = pcls[p];
+              if (p >= nsplit) {
+                _pcls.push_back(pcl);
+                continue;
+              }
+              double e[3];
+              split_direction(pcl, e);
+              pcl.set_q(0.5 * pcl.get_q());
+              SpeciesParticle twin = pcl;
+              twin.set_t(pclIDgenerator.generateID());
+              for (int d = 0; d < 3; d++) {
+                const double x = pcl.get_x(d);
+                const double h = 0.5 * e[d] * fmax(0.0, fmin(x - lo[d], hi[d] - x));
+                pcl.set_x(d, x + h);
+                twin.set_x(d, x - h);
+              }
+              _pcls.push_back(pcl);
+              _pcls.push_back(twin);
+            }
+            added += nsplit;
+          }
+          else
+            for (int p = 0; p < n; p++)
+              _pcls.push_back(pcls[p]);
+        }
+        if (interior)
+          histogram[1][population_bin(_pcls.size() - now)]++;
+      }
+  // SoA particle representation is no longer valid
+  particleType = ParticleType::AoS;
 }
@@ -32,6 +32,7 @@ developers: Stefano Markidis, Giovanni Lapenta.
 #include <algorithm> // for swap, std::max
 #include "VCtopology3D.h"
 #include "Collective.h"
+#include "SharedRestart.h"
 #include "Alloc.h"
 #include "Grid3DCU.h"
 #include "EMfields3D.h"
@@ -120,6 +121,7 @@ Particles3Dcomm::~Particles3Dcomm() {
   delete numpcls_in_bucket;
   delete numpcls_in_bucket_now;
   delete bucket_offset;
+  if (removedLog) fclose(removedLog);
 }
 /** constructor for a single species*/
 // was Particles3Dcomm::allocate()
@@ -134,7 +136,10 @@ Particles3Dcomm::Particles3Dcomm(
   vct(vct_),
   grid(grid_),
   pclIDgenerator(),
-  particleType(ParticleType::AoS)
+  particleType(ParticleType::AoS),
+  nopMoved(-1),
+  removedLog(NULL),
+  exoSpecies(-1)
 {
   // communicators for particles
   //
@@ -210,6 +215,7 @@ if( !isTestParticle ){
   bcPfaceYleft = col->getBcPfaceYleft();
   bcPfaceZright = col->getBcPfaceZright();
   bcPfaceZleft = col->getBcPfaceZleft();
+  fluxInflow = col->getInflowMethod() == "flux";
 
   // info from Grid
   //
@@ -325,7 +331,10 @@ void Particles3Dcomm::load_restart_pcls()
     int species_number = get_species_num();
     // prepare arrays to receive particles
     particleType = ParticleType::SoA;
-    col->read_particles_restart(vct, species_number,u, v, w, q, x, y, z, t);
+    if (col->getRestartMethod() == "shared")
+      ReadSharedRestartParticles(col, vct, grid, species_number, u, v, w, q, x, y, z, t);
+    else
+      col->read_particles_restart(vct, species_number,u, v, w, q, x, y, z, t);
     convertParticlesToAoS();
   #endif
   }
@@ -1103,6 +1112,12 @@ void Particles3Dcomm::apply_Xleft_BC(vector_SpeciesParticle& pcls, int start)
       }
       break;
     case BCparticles::REEMISSION:
+      // with the flux inflow the pcls leaving the domain are removed
+      if(fluxInflow)
+      {
+        pcls.resize(start);
+        break;
+      }
       // in this case it might be faster to convert to and
       // from SoA format, if calls to rand() can vectorize.
       for(int p=start;p<size;p++)
@@ -1162,6 +1177,12 @@ void Particles3Dcomm::apply_Yleft_BC(vector_SpeciesParticle& pcls, int start)
       }
       break;
     case BCparticles::REEMISSION:
+      // with the flux inflow the pcls leaving the domain are removed
+      if(fluxInflow)
+      {
+        pcls.resize(start);
+        break;
+      }
       // in this case it might be faster to convert to and
       // from SoA format, if calls to rand() can vectorize.
       for(int p=start;p<size;p++)
@@ -1214,6 +1235,12 @@ void Particles3Dcomm::apply_Zleft_BC(vector_SpeciesParticle& pcls, int start)
       }
       break;
     case BCparticles::REEMISSION:
+      // with the flux inflow the pcls leaving the domain are removed
+      if(fluxInflow)
+      {
+        pcls.resize(start);
+        break;
+      }
       // in this case it might be faster to convert to and
       // from SoA format, if calls to rand() can vectorize.
       for(int p=start;p<size;p++)
@@ -1266,6 +1293,12 @@ void Particles3Dcomm::apply_Xrght_BC(vector_SpeciesParticle& pcls, int start)
       }
       break;
     case BCparticles::REEMISSION:
+      // with the flux inflow the pcls leaving the domain are removed
+      if(fluxInflow)
+      {
+        pcls.resize(start);
+        break;
+      }
       // in this case it might be faster to convert to and
       // from SoA format, if calls to rand() can vectorize.
       /*for(int p=start;p<size;p++)
@@ -1328,6 +1361,12 @@ void Particles3Dcomm::apply_Yrght_BC(vector_SpeciesParticle& pcls, int start)
       }
       break;
     case BCparticles::REEMISSION:
+      // with the flux inflow the pcls leaving the domain are removed
+      if(fluxInflow)
+      {
+        pcls.resize(start);
+        break;
+      }
       for(int p=start;p<size;p++)
       {
         SpeciesParticle& pcl = pcls[p];
@@ -1380,6 +1419,12 @@ void Particles3Dcomm::apply_Zrght_BC(vector_SpeciesParticle& pcls, int start)
       }
       break;
     case BCparticles::REEMISSION:
+      // with the flux inflow the pcls leaving the domain are removed
+      if(fluxInflow)
+      {
+        pcls.resize(start);
+        break;
+      }
       for(int p=start;p<size;p++)
       {
         SpeciesParticle& pcl = pcls[p];
@@ -0,0 +1,163 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/* Microbenchmark of the halo exchange of node arrays: one
+ * communicateNodeBC() per array against one HaloExchange of all of them.
+ *
+ * usage: mpirun -n <XLEN*YLEN*ZLEN> halo_exchange_benchmark <input file> [repetitions]
+ *
+ * Only the grid, the topology and the boundary conditions of E are taken
+ * from the input file. For 1, 3 and 6 arrays the total number of messages
+ * of one exchange, the time per exchange (maximum over the processes) and
+ * the largest difference between the results of the two exchanges, on
+ * the interior and face ghost nodes, are printed. Build it with
+ * "make halo_exchange_benchmark".
+ */
+
+#include <mpi.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include "MPIdata.h"
+#include "Parameters.h"
+#include "Collective.h"
+#include "VCtopology3D.h"
+#include "Grid3DCU.h"
+#include "EMfields3D.h"
+#include "Com3DNonblk.h"
+#include "HaloExchange.h"
+
+/* messages sent by one communicateNodeBC(), following NBDerivedHaloComm() */
+static int messages_per_array(const VirtualTopology3D *vct)
+{
+  const int me = vct->getCartesian_rank();
+  const int nb[6] = { vct->getXleft_neighbor(), vct->getXright_neighbor(),
+                      vct->getYleft_neighbor(), vct->getYright_neighbor(),
+                      vct->getZleft_neighbor(), vct->getZright_neighbor() };
+  int c[6];
+  for (int i = 0; i < 6; i++)
+    c[i] = (nb[i] != MPI_PROC_NULL && nb[i] != me);
+  // faces
+  int m = c[0] + c[1] + c[2] + c[3] + c[4] + c[5];
+  // edges
+  m += (c[0] + c[1]) * (c[4] || c[5]);
+  m += (c[2] + c[3]) * (c[0] || c[1]);
+  m += (c[4] + c[5]) * (c[2] || c[3]);
+  // corners
+  if ((c[2] || c[3]) && (c[4] || c[5]))
+    m += c[0] + c[1];
+  return m;
+}
+
+/* interior of array a filled with a function of the global node and of a */
+static void fill(arr3_double v, int a, const Grid *grid)
+{
+  for (int i = 1; i < grid->getNXN() - 1; i++)
+    for (int j = 1; j < grid->getNYN() - 1; j++)
+      for (int k = 1; k < grid->getNZN() - 1; k++)
+        v[i][j][k] = sin(grid->getXN(i, j, k) + 2.0 * grid->getYN(i, j, k)
+                       + 3.0 * grid->getZN(i, j, k) + a);
+}
+
+int main(int argc, char **argv)
+{
+  MPIdata::init(&argc, &argv);
+  {
+    Parameters::init_parameters();
+    // the second argument is not the restart flag of Collective
+    Collective col(argc > 2 ? 2 : argc, argv);
+    VCtopology3D vct(col);
+    vct.setup_vctopology(MPIdata::get_PicGlobalComm());
+    Grid3DCU grid(&col, &vct);
+    EMfields3D EMf(&col, &grid, &vct);
+    const int repetitions = argc > 2 ? atoi(argv[2]) : 100;
+    const int nxn = grid.getNXN();
+    const int nyn = grid.getNYN();
+    const int nzn = grid.getNZN();
+    const MPI_Comm comm = vct.getFieldComm();
+    const int myrank = vct.getCartesian_rank();
+    const int *bc[3] = { col.bcEx, col.bcEy, col.bcEz };
+
+    const int maxarrays = 6;
+    array3_double *single[maxarrays];
+    array3_double *batched[maxarrays];
+    for (int a = 0; a < maxarrays; a++) {
+      single[a] = new array3_double(nxn, nyn, nzn);
+      batched[a] = new array3_double(nxn, nyn, nzn);
+    }
+    if (myrank == 0)
+      printf("%8s %10s %14s %10s %14s %12s\n", "arrays", "messages", "time/exchange",
+        "batched", "time/exchange", "difference");
+    const int narrays[3] = { 1, 3, 6 };
+    for (int t = 0; t < 3; t++) {
+      const int n = narrays[t];
+      HaloExchange halo(&vct, nxn, nyn, nzn, false);
+      for (int a = 0; a < n; a++) {
+        single[a]->setall(0.0);
+        batched[a]->setall(0.0);
+        fill(*single[a], a, &grid);
+        fill(*batched[a], a, &grid);
+        halo.add(*batched[a], bc[a % 3]);
+      }
+      // one exchange per array
+      MPI_Barrier(comm);
+      double tsingle = MPI_Wtime();
+      for (int r = 0; r < repetitions; r++)
+        for (int a = 0; a < n; a++) {
+          const int *b = bc[a % 3];
+          communicateNodeBC(nxn, nyn, nzn, *single[a], b[0], b[1], b[2], b[3], b[4], b[5], &vct, &EMf);
+        }
+      tsingle = (MPI_Wtime() - tsingle) / repetitions;
+      // one exchange of all the arrays
+      MPI_Barrier(comm);
+      double tbatched = MPI_Wtime();
+      for (int r = 0; r < repetitions; r++)
+        halo.exchange();
+      tbatched = (MPI_Wtime() - tbatched) / repetitions;
+      // both give the same ghost nodes on the faces; the ghost nodes of the
+      // edges and corners are not compared since NBDerivedHaloComm() sends
+      // them from the shared boundary nodes instead of the next ones
+      double diff = 0.0;
+      for (int a = 0; a < n; a++)
+        for (int i = 0; i < nxn; i++)
+          for (int j = 0; j < nyn; j++)
+            for (int k = 0; k < nzn; k++) {
+              const int ghosts = (i == 0 || i == nxn - 1) + (j == 0 || j == nyn - 1) + (k == 0 || k == nzn - 1);
+              if (ghosts < 2)
+                diff = fmax(diff, fabs(single[a]->get(i, j, k) - batched[a]->get(i, j, k)));
+            }
+      int msingle = n * messages_per_array(&vct);
+      int mbatched = halo.get_messages();
+      MPI_Allreduce(MPI_IN_PLACE, &msingle, 1, MPI_INT, MPI_SUM, comm);
+      MPI_Allreduce(MPI_IN_PLACE, &mbatched, 1, MPI_INT, MPI_SUM, comm);
+      MPI_Allreduce(MPI_IN_PLACE, &tsingle, 1, MPI_DOUBLE, MPI_MAX, comm);
+      MPI_Allreduce(MPI_IN_PLACE, &tbatched, 1, MPI_DOUBLE, MPI_MAX, comm);
+      MPI_Allreduce(MPI_IN_PLACE, &diff, 1, MPI_DOUBLE, MPI_MAX, comm);
+      if (myrank == 0)
+        printf("%8d %10d %14.3e %10d %14.3e %12.3e\n", n, msingle, tsingle, mbatched, tbatched, diff);
+    }
+    for (int a = 0; a < maxarrays; a++) {
+      delete single[a];
+      delete batched[a];
+    }
+  }
+  MPIdata::instance().finalize_mpi();
+  return 0;
+}
@@ -0,0 +1,157 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/* Microbenchmark of the image of the Maxwell operator: the composition of
+ * the Grid3DCU operators (MaxwellImageComposed) against the two fused
+ * sweeps of MaxwellImage, with and without the halo exchanges.
+ *
+ * usage: mpirun -n <XLEN*YLEN*ZLEN> maxwell_image_benchmark <input file> [repetitions]
+ *
+ * Only the grid, the topology, the species and the boundary conditions are
+ * taken from the input file; B, the densities of the species and the
+ * Krylov vector are analytic functions of the global node. For each
+ * variant the time per image (maximum over the processes), the memory
+ * traffic of one image following the model below, the effective
+ * bandwidth and the largest difference with the composed image, relative
+ * to its largest value, are printed. Build it with
+ * "make maxwell_image_benchmark".
+ */
+
+#include <mpi.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <vector>
+#include "MPIdata.h"
+#include "Parameters.h"
+#include "Collective.h"
+#include "VCtopology3D.h"
+#include "Grid3DCU.h"
+#include "EMfields3D.h"
+
+/* Arrays of nodes (or centres, of about the same size) read or written by
+ * one image, counting each pass over an array once, with ns species:
+ *
+ * composed: zeroing of im and of 9 temporaries (12), solver2phys (6),
+ * 3 lapN2N with their 3 allocated gradients (3 * 11), neg (6), MUdot
+ * (3 + 16 ns), divN2C (4), gradC2N (4), sub (9), scale (6), sum (18),
+ * phys2solver (6);
+ *
+ * fused: the first sweep reads the Krylov vector, B, the external B and
+ * the densities and writes E, D and the 10 arrays of centres (3 + 6 + ns
+ * + 6 + 10), the planes of E and D staying in cache; the second sweep
+ * reads the 10 arrays of centres, E and D and writes the image (19). */
+static double arrays_composed(int ns)
+{
+  return 12 + 6 + 3 * 11 + 6 + (3 + 16 * ns) + 4 + 4 + 9 + 6 + 18 + 6;
+}
+
+static double arrays_fused(int ns)
+{
+  return (3 + 6 + ns + 6 + 10) + 19;
+}
+
+/* value of the global node of the interior node i, j, k, shifted by a */
+static double wave(const Grid *grid, int i, int j, int k, double a)
+{
+  return sin(grid->getXN(i, j, k) + 2.0 * grid->getYN(i, j, k)
+             + 3.0 * grid->getZN(i, j, k) + a);
+}
+
+int main(int argc, char **argv)
+{
+  MPIdata::init(&argc, &argv);
+  {
+    Parameters::init_parameters();
+    // the second argument is not the restart flag of Collective
+    Collective col(argc > 2 ? 2 : argc, argv);
+    VCtopology3D vct(col);
+    vct.setup_vctopology(MPIdata::get_PicGlobalComm());
+    Grid3DCU grid(&col, &vct);
+    EMfields3D EMf(&col, &grid, &vct);
+    const int repetitions = argc > 2 ? atoi(argv[2]) : 100;
+    const int nxn = grid.getNXN();
+    const int nyn = grid.getNYN();
+    const int nzn = grid.getNZN();
+    const int ns = col.getNs();
+    const MPI_Comm comm = vct.getFieldComm();
+    const int myrank = vct.getCartesian_rank();
+
+    arr3_double Bx = EMf.getBx();
+    arr3_double By = EMf.getBy();
+    arr3_double Bz = EMf.getBz();
+    arr4_double rhons = EMf.getRHOns();
+    for (int i = 0; i < nxn; i++)
+      for (int j = 0; j < nyn; j++)
+        for (int k = 0; k < nzn; k++) {
+          Bx[i][j][k] = 0.01 * wave(&grid, i, j, k, 0.0);
+          By[i][j][k] = 0.01 * wave(&grid, i, j, k, 1.0);
+          Bz[i][j][k] = 0.01 * wave(&grid, i, j, k, 2.0);
+          for (int is = 0; is < ns; is++)
+            rhons[is][i][j][k] = (is % 2 ? 1.0 : -1.0) * (1.0 + 0.5 * wave(&grid, i, j, k, 3.0 + is)) / (4.0 * M_PI);
+        }
+    const int n = 3 * (nxn - 2) * (nyn - 2) * (nzn - 2);
+    std::vector<double> vector(n), reference(n), image(n);
+    for (int i = 1; i < nxn - 1; i++)
+      for (int j = 1; j < nyn - 1; j++)
+        for (int k = 1; k < nzn - 1; k++)
+          for (int c = 0; c < 3; c++)
+            vector[3 * (((i - 1) * (nyn - 2) + (j - 1)) * (nzn - 2) + (k - 1)) + c] = wave(&grid, i, j, k, 5.0 + c);
+
+    const double bytes_node = 8.0 * nxn * nyn * nzn;
+    if (myrank == 0)
+      printf("%-16s %14s %14s %10s %12s\n", "variant", "time/image", "bytes/image", "GB/s", "difference");
+    for (int v = 0; v < 4; v++) {
+      const bool local = v >= 2;
+      const bool fused = v % 2;
+      if (fused)
+        EMf.MaxwellImageComposed(&reference[0], &vector[0], local);
+      MPI_Barrier(comm);
+      double time = MPI_Wtime();
+      for (int r = 0; r < repetitions; r++) {
+        if (!fused)
+          EMf.MaxwellImageComposed(&image[0], &vector[0], local);
+        else if (local)
+          EMf.MaxwellImageLocal(&image[0], &vector[0]);
+        else
+          EMf.MaxwellImage(&image[0], &vector[0]);
+      }
+      time = (MPI_Wtime() - time) / repetitions;
+      double diff = 0.0;
+      double norm = 0.0;
+      if (fused)
+        for (int m = 0; m < n; m++) {
+          diff = fmax(diff, fabs(image[m] - reference[m]));
+          norm = fmax(norm, fabs(reference[m]));
+        }
+      double bytes = bytes_node * (fused ? arrays_fused(ns) : arrays_composed(ns));
+      MPI_Allreduce(MPI_IN_PLACE, &time, 1, MPI_DOUBLE, MPI_MAX, comm);
+      MPI_Allreduce(MPI_IN_PLACE, &bytes, 1, MPI_DOUBLE, MPI_SUM, comm);
+      MPI_Allreduce(MPI_IN_PLACE, &diff, 1, MPI_DOUBLE, MPI_MAX, comm);
+      MPI_Allreduce(MPI_IN_PLACE, &norm, 1, MPI_DOUBLE, MPI_MAX, comm);
+      const char *name[4] = { "composed", "fused", "composed local", "fused local" };
+      if (myrank == 0)
+        printf("%-16s %14.3e %14.3e %10.2f %12.3e\n", name[v], time, bytes,
+          bytes / time * 1e-9, norm > 0.0 ? diff / norm : diff);
+    }
+  }
+  MPIdata::instance().finalize_mpi();
+  return 0;
+}
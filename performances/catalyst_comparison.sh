@@ -0,0 +1,57 @@
+#!/bin/bash
+
+# Comparison of the copy and zero-copy modes of the Catalyst legacy adaptor
+# (CatalystZeroCopy) on a test deck.
+#
+# usage: ./catalyst_comparison.sh [build dir] [pipeline script] [cycles]
+#
+# The code must be compiled with USE_CATALYST set to LEGACY. The pipeline
+# script defaults to all_fields.py, which requests every array the adaptor
+# can publish. The test case runs on 8 MPI processes (XLEN*YLEN*ZLEN), set
+# MPIRUN to change the launcher, e.g. MPIRUN="srun -n 512".
+# For each mode the time spent by the adaptor per co-processed cycle
+# (slowest process, as printed by Adaptor_legacy::Finalize) is printed,
+# with the speedup of the zero-copy mode.
+
+BUILD=$(cd ${1:-../build} && pwd)
+SCRIPT=${2:-$(dirname $0)/../catalyst_legacy/scripts/all_fields.py}
+SCRIPT=$(cd $(dirname $SCRIPT) && pwd)/$(basename $SCRIPT)
+NCYCLES=${3:-20}
+MPIRUN=${MPIRUN:-"mpirun -n 8"}
+INPUT=$(cd $(dirname $0)/../inputfiles && pwd)/testMagnetosphere3D_yesAll_small.inp
+
+RUNDIR=$(mktemp -d catalyst_comparison.XXXX)
+cd $RUNDIR
+mkdir data
+
+printf "%-10s %10s %12s %8s\n" mode cycles "time/cycle" speedup
+for mode in copy zero-copy; do
+  if [ $mode = copy ]; then zerocopy=false; else zerocopy=true; fi
+  # same case, without output but the Catalyst pipeline
+  sed -e "s/^ncycles .*/ncycles = $NCYCLES/" \
+      -e "s/^FieldOutputCycle .*/FieldOutputCycle = 100000/" \
+      -e "s/^TemperatureOutputCycle .*/TemperatureOutputCycle = 0/" \
+      -e "s/^SpectraOutputCycle .*/SpectraOutputCycle = 0/" \
+      -e "s/^RestartOutputCycle .*/RestartOutputCycle = 0/" \
+      -e "/^SaveDirName/d" -e "/^ParaviewScriptPath/d" -e "/^CatalystZeroCopy/d" \
+      $INPUT > $mode.inp
+  echo "SaveDirName = data" >> $mode.inp
+  echo "ParaviewScriptPath = $SCRIPT" >> $mode.inp
+  echo "CatalystZeroCopy = $zerocopy" >> $mode.inp
+  $MPIRUN $BUILD/iPIC3D $mode.inp > run_$mode.out 2>&1
+  # "Catalyst adaptor (<mode>): <n> co-processed cycles, <t> s per cycle"
+  line=$(grep "^Catalyst adaptor" run_$mode.out)
+  cycles=$(echo "$line" | awk '{ print $4 }')
+  time=$(echo "$line" | awk '{ print $7 }')
+  if [ -z "$time" ]; then
+    printf "%-10s %10s\n" $mode failed
+    continue
+  fi
+  if [ $mode = copy ]; then time1=$time; fi
+  awk -v m=$mode -v n=$cycles -v x=$time -v x1=${time1:-$time} \
+    'BEGIN { printf "%-10s %10d %12.4e %8.2f\n", m, n, x, x1/x }'
+  rm -rf data/*
+done
+
+cd ..
+echo "outputs of the runs are in $RUNDIR"
@@ -0,0 +1,66 @@
+#!/bin/bash
+
+# Cost per output of the Catalyst images: the single-field scripts run one
+# at a time against all their outputs rendered through the shared pipeline
+# of all_fields.py (run synchronously, so that the render time is measured).
+#
+# usage: ./catalyst_pipeline_cost.sh [build dir] [cycles]
+#
+# The code must be compiled with USE_CATALYST set to LEGACY. The test case
+# runs on 8 MPI processes (XLEN*YLEN*ZLEN), set MPIRUN to change the
+# launcher, e.g. MPIRUN="srun -n 512".
+# For each run the producer update time, the render time and the render time
+# per output, read from catalyst_timing.txt and averaged over all cycles but
+# the first, are printed, then the cost per output of the separate scripts
+# and of the shared pipeline.
+
+BUILD=$(cd ${1:-../build} && pwd)
+NCYCLES=${2:-20}
+MPIRUN=${MPIRUN:-"mpirun -n 8"}
+SCRIPTS=$(cd $(dirname $0)/../catalyst_legacy/scripts && pwd)
+INPUT=$(cd $(dirname $0)/../inputfiles && pwd)/testMagnetosphere3D_yesAll_small.inp
+
+RUNDIR=$(mktemp -d catalyst_pipeline_cost.XXXX)
+cd $RUNDIR
+RUNDIR=$(pwd)
+mkdir data
+
+# the scripts import ipic_pipeline
+export PYTHONPATH=$SCRIPTS${PYTHONPATH:+:$PYTHONPATH}
+# shared pipeline, rendered in the solver
+sed -e "s/asyncImages=True/asyncImages=False/" $SCRIPTS/all_fields.py > all_fields_sync.py
+
+printf "%-16s %8s %12s %12s %12s\n" script outputs "update[s]" "render[s]" "per output"
+for script in B rhoe0 rhoi1 Tcart_e0 Tcart_e0_YY Tperpar_e0 Tperpar_e0_YY Ve0 all_fields_sync; do
+  if [ $script = all_fields_sync ]; then path=$RUNDIR/$script.py; else path=$SCRIPTS/$script.py; fi
+  # same case, without output but the Catalyst images
+  sed -e "s/^ncycles .*/ncycles = $NCYCLES/" \
+      -e "s/^FieldOutputCycle .*/FieldOutputCycle = 100000/" \
+      -e "s/^TemperatureOutputCycle .*/TemperatureOutputCycle = 0/" \
+      -e "s/^SpectraOutputCycle .*/SpectraOutputCycle = 0/" \
+      -e "s/^RestartOutputCycle .*/RestartOutputCycle = 0/" \
+      -e "/^SaveDirName/d" -e "/^ParaviewScriptPath/d" \
+      $INPUT > $script.inp
+  echo "SaveDirName = data" >> $script.inp
+  echo "ParaviewScriptPath = $path" >> $script.inp
+  $MPIRUN $BUILD/iPIC3D $script.inp > run_$script.out 2>&1
+  if [ ! -f data/images/catalyst_timing.txt ]; then
+    printf "%-16s %8s\n" $script failed
+    rm -rf data/*
+    continue
+  fi
+  # columns: cycle, outputs, update, render, render per output, dropped
+  awk -v s=$script '!/^#/ { n++; if (n > 1) { o = $2; u += $3; r += $4; m++ } }
+    END { if (m > 0 && o > 0) printf "%-16s %8d %12.4e %12.4e %12.4e\n", s, o, u/m, r/m, (u+r)/m/o;
+          else printf "%-16s %8s\n", s, "failed" }' data/images/catalyst_timing.txt | tee -a costs.txt
+  mv data/images/catalyst_timing.txt catalyst_timing_$script.txt
+  rm -rf data/*
+done
+
+# separate: every script updates its own producer; shared: one update for all
+awk '$1 == "all_fields_sync" { shared = $5; next } $2+0 > 0 { t += $3 + $4; o += $2 }
+  END { if (o > 0 && shared > 0)
+          printf "\nper output: separate %.4e s, shared %.4e s, saving %.1f%%\n", t/o, shared, 100*(1 - shared*o/t) }' costs.txt
+
+cd ..
+echo "outputs of the runs are in $RUNDIR"
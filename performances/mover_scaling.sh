@@ -0,0 +1,54 @@
+#!/bin/bash
+
+# Strong scaling of the particle mover with the number of OpenMP threads
+# per MPI process, on the small magnetosphere test case.
+#
+# usage: ./mover_scaling.sh [build dir] [max threads] [cycles]
+#
+# The code must be compiled with USE_OPENMP set to YES. The test case
+# runs on 8 MPI processes (XLEN*YLEN*ZLEN), set MPIRUN to change the
+# launcher, e.g. MPIRUN="srun -n 8 -c 16".
+# For 1, 2, 4, ... up to max threads the computation time of the particles task
+# (mover, injection and collisions, without communication), averaged over
+# all processes and over all cycles but the first, is printed with the
+# speedup and the parallel efficiency with respect to one thread.
+
+BUILD=$(cd ${1:-../build} && pwd)
+MAXTHREADS=${2:-$(( $(nproc) / 8 ))}
+NCYCLES=${3:-20}
+MPIRUN=${MPIRUN:-"mpirun -n 8 --bind-to none"}
+INPUT=$(cd $(dirname $0)/../inputfiles && pwd)/testMagnetosphere3D_yesAll_small.inp
+
+if [ $MAXTHREADS -lt 1 ]; then MAXTHREADS=1; fi
+
+RUNDIR=$(mktemp -d mover_scaling.XXXX)
+cd $RUNDIR
+mkdir data
+
+# same case, without output
+sed -e "s/^ncycles .*/ncycles = $NCYCLES/" \
+    -e "s/^FieldOutputCycle .*/FieldOutputCycle = 100000/" \
+    -e "s/^TemperatureOutputCycle .*/TemperatureOutputCycle = 0/" \
+    -e "s/^SpectraOutputCycle .*/SpectraOutputCycle = 0/" \
+    -e "s/^RestartOutputCycle .*/RestartOutputCycle = 0/" \
+    $INPUT > scaling.inp
+
+export OMP_PROC_BIND=close
+export OMP_PLACES=cores
+
+printf "%8s %12s %8s %10s\n" threads "time/cycle" speedup efficiency
+t=1
+while [ $t -le $MAXTHREADS ]; do
+  OMP_NUM_THREADS=$t $MPIRUN $BUILD/iPIC3D scaling.inp > run_$t.out 2>&1
+  # comput column of the particles task, skipping the first cycle
+  time=$(awk '/^avg_\|.* particles$/ { sub(/^avg_\|/, ""); n++; if (n > 1) { s += $2; m++ } }
+              END { if (m > 0) printf "%.4f", s/m; else print "nan" }' run_$t.out)
+  if [ $t -eq 1 ]; then time1=$time; fi
+  awk -v t=$t -v x=$time -v x1=$time1 \
+    'BEGIN { printf "%8d %12.4f %8.2f %10.2f\n", t, x, x1/x, x1/x/t }'
+  rm -rf data/*
+  t=$(( t * 2 ))
+done
+
+cd ..
+echo "outputs of the runs are in $RUNDIR"
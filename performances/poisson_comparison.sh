@@ -0,0 +1,58 @@
+#!/bin/bash
+
+# Comparison of the solvers of the divergence cleanings (PoissonSolver =
+# GMRES, Multigrid or GMRES_Multigrid) for growing grid sizes.
+#
+# usage: ./poisson_comparison.sh [build dir] [input file] [cycles]
+#
+# The input file defaults to the small magnetosphere test case, which runs
+# on 8 MPI processes (XLEN*YLEN*ZLEN); set MPIRUN to change the launcher,
+# e.g. MPIRUN="srun -n 512", and GRIDS to change the grid sizes, given as
+# nxcxnycxnzc, e.g. GRIDS="64x64x16 128x128x32". The local numbers of
+# cells should be divisible by a few powers of 2 for the multigrid. For
+# each grid size and solver the iterations (V-cycles for Multigrid), the
+# global reductions and the time of the div(B) cleaning per cycle, read
+# from SolverStats.txt and averaged over all cycles but the first, are
+# printed.
+
+BUILD=$(cd ${1:-../build} && pwd)
+INPUT=${2:-$(dirname $0)/../inputfiles/testMagnetosphere3D_yesAll_small.inp}
+INPUT=$(cd $(dirname $INPUT) && pwd)/$(basename $INPUT)
+NCYCLES=${3:-10}
+MPIRUN=${MPIRUN:-"mpirun -n 8"}
+GRIDS=${GRIDS:-"64x64x16 128x128x32 256x256x64"}
+
+RUNDIR=$(mktemp -d poisson_comparison.XXXX)
+cd $RUNDIR
+mkdir data
+
+printf "%-16s %-16s %10s %10s %10s\n" grid solver iterations reductions time/cycle
+for grid in $GRIDS; do
+  nxc=$(echo $grid | cut -dx -f1)
+  nyc=$(echo $grid | cut -dx -f2)
+  nzc=$(echo $grid | cut -dx -f3)
+  for solver in GMRES Multigrid GMRES_Multigrid; do
+    # same case on the given grid, without output but the solver statistics
+    sed -e "s/^ncycles .*/ncycles = $NCYCLES/" \
+        -e "s/^nxc .*/nxc = $nxc/" -e "s/^nyc .*/nyc = $nyc/" -e "s/^nzc .*/nzc = $nzc/" \
+        -e "s/^FieldOutputCycle .*/FieldOutputCycle = 100000/" \
+        -e "s/^TemperatureOutputCycle .*/TemperatureOutputCycle = 0/" \
+        -e "s/^SpectraOutputCycle .*/SpectraOutputCycle = 0/" \
+        -e "s/^RestartOutputCycle .*/RestartOutputCycle = 0/" \
+        -e "/^SaveDirName/d" -e "/^DiagnosticsOutputCycle/d" -e "/^PoissonSolver/d" \
+        $INPUT > $grid.$solver.inp
+    echo "SaveDirName = data" >> $grid.$solver.inp
+    echo "DiagnosticsOutputCycle = 1" >> $grid.$solver.inp
+    echo "PoissonSolver = $solver" >> $grid.$solver.inp
+    $MPIRUN $BUILD/iPIC3D $grid.$solver.inp > run_$grid.$solver.out 2>&1
+    # PoissonB columns: iterations, restarts, reductions, residual, time, preconditioner time
+    awk -v g="$grid" -v s="$solver" '!/^#/ { n++; if (n > 1) { it += $14; red += $16; t += $18; m++ } }
+      END { if (m > 0) printf "%-16s %-16s %10.1f %10.1f %10.4f\n", g, s, it/m, red/m, t/m;
+            else printf "%-16s %-16s %10s\n", g, s, "failed" }' data/SolverStats.txt
+    mv data/SolverStats.txt SolverStats_$grid.$solver.txt
+    rm -rf data/*
+  done
+done
+
+cd ..
+echo "outputs of the runs are in $RUNDIR"
@@ -0,0 +1,57 @@
+#!/bin/bash
+
+# Comparison of the Krylov solvers (MaxwellSolver = GMRES or GMRES_CGS2)
+# and of the preconditioners (MaxwellPreconditioner) of the implicit
+# Maxwell solve on a test deck.
+#
+# usage: ./solver_comparison.sh [build dir] [input file] [cycles]
+#
+# The input file defaults to the small magnetosphere test case, which runs
+# on 8 MPI processes (XLEN*YLEN*ZLEN); set MPIRUN to change the launcher,
+# e.g. MPIRUN="srun -n 512", and PRECITERATIONS to change the
+# PreconditionerIterations of the preconditioned runs. For each solver the
+# iterations, the global reductions, the time of the Maxwell solve and the
+# part of it spent in the preconditioner per cycle, and the time per
+# iteration, read from SolverStats.txt and averaged over all cycles but the
+# first, are printed.
+
+BUILD=$(cd ${1:-../build} && pwd)
+INPUT=${2:-$(dirname $0)/../inputfiles/testMagnetosphere3D_yesAll_small.inp}
+INPUT=$(cd $(dirname $INPUT) && pwd)/$(basename $INPUT)
+NCYCLES=${3:-20}
+MPIRUN=${MPIRUN:-"mpirun -n 8"}
+PRECITERATIONS=${PRECITERATIONS:-4}
+
+RUNDIR=$(mktemp -d solver_comparison.XXXX)
+cd $RUNDIR
+mkdir data
+
+printf "%-24s %10s %10s %10s %10s %10s\n" solver iterations reductions time/cycle precond time/iter
+for run in GMRES:none GMRES_CGS2:none GMRES:BlockJacobi GMRES:Polynomial; do
+  solver=${run%:*}
+  prec=${run#*:}
+  # same case, without output but the solver statistics
+  sed -e "s/^ncycles .*/ncycles = $NCYCLES/" \
+      -e "s/^FieldOutputCycle .*/FieldOutputCycle = 100000/" \
+      -e "s/^TemperatureOutputCycle .*/TemperatureOutputCycle = 0/" \
+      -e "s/^SpectraOutputCycle .*/SpectraOutputCycle = 0/" \
+      -e "s/^RestartOutputCycle .*/RestartOutputCycle = 0/" \
+      -e "/^SaveDirName/d" -e "/^DiagnosticsOutputCycle/d" \
+      -e "/^MaxwellSolver/d" -e "/^MaxwellPreconditioner/d" -e "/^PreconditionerIterations/d" \
+      $INPUT > $solver.$prec.inp
+  echo "SaveDirName = data" >> $solver.$prec.inp
+  echo "DiagnosticsOutputCycle = 1" >> $solver.$prec.inp
+  echo "MaxwellSolver = $solver" >> $solver.$prec.inp
+  echo "MaxwellPreconditioner = $prec" >> $solver.$prec.inp
+  echo "PreconditionerIterations = $PRECITERATIONS" >> $solver.$prec.inp
+  $MPIRUN $BUILD/iPIC3D $solver.$prec.inp > run_$solver.$prec.out 2>&1
+  # Maxwell columns: iterations, restarts, reductions, residual, time, preconditioner time
+  awk -v s="$solver $prec" '!/^#/ { n++; if (n > 1) { it += $8; red += $10; t += $12; p += $13; m++ } }
+    END { if (m > 0 && it > 0) printf "%-24s %10.1f %10.1f %10.4f %10.4f %10.5f\n", s, it/m, red/m, t/m, p/m, t/it;
+          else printf "%-24s %10s\n", s, "failed" }' data/SolverStats.txt
+  mv data/SolverStats.txt SolverStats_$solver.$prec.txt
+  rm -rf data/*
+done
+
+cd ..
+echo "outputs of the runs are in $RUNDIR"
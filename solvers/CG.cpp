@@ -36,12 +36,18 @@
  *
  */
 
-bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD_IMAGE FunctionImage, Field * field) {
-  // allocate residual, image, p, b, calculated on central points
-  double *r = new double[xkrylovlen];
-  double *v = new double[xkrylovlen];
-  double *z = new double[xkrylovlen];
-  double *im = new double[xkrylovlen];
+bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD_IMAGE FunctionImage, Field * field,
+  KrylovWorkspace *workspace, KrylovStats *stats) {
+  const double start_time = MPI_Wtime();
+  // residual, image, p, b, calculated on central points,
+  // taken from the workspace of the caller if there is one
+  KrylovWorkspace local_workspace;
+  KrylovWorkspace& ws = workspace ? *workspace : local_workspace;
+  ws.reserve(xkrylovlen, 1);
+  double *r = ws.r;
+  double *v = ws.V[0];
+  double *z = ws.V[1];
+  double *im = ws.im;
   double c, t, d, initial_error;
   eqValue(0.0, r, xkrylovlen);
   eqValue(0.0, v, xkrylovlen);
@@ -53,8 +59,7 @@ bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD
   int i = 0;
   bool CONVERGED = false;
   bool CGVERBOSE = false;
-  // initial guess for x: all the components are equal to 0
-  eqValue(0, xkrylov, xkrylovlen);
+  // the initial guess for x is the content of xkrylov
   // Compute r = b -Ax
   (field->*FunctionImage) (im, xkrylov);
   sub(r, b, im, xkrylovlen);
@@ -65,10 +70,13 @@ bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD
   if (is_output_thread())
     printf("CG Initial error: %g\n", initial_error);
     //cout << "CG Initial error: " << initial_error << endl;
+  d = c;
+  int iterations = 0;
   if (initial_error < 1E-16)
-    return (true);
-  while (i < maxit) {
+    CONVERGED = true;
+  while (!CONVERGED && i < maxit) {
     (field->*FunctionImage) (z, v);
+    iterations++;
     t = c / dotP(v, z, xkrylovlen,&fieldcomm);
     // x(i+1) = x + t*v
     addscale(t, xkrylov, v, xkrylovlen);
@@ -100,7 +108,6 @@ bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD
 
       }
       CONVERGED = false;
-      return (CONVERGED);
       break;
 
     }
@@ -116,11 +123,14 @@ bool CG(double *xkrylov, int xkrylovlen, double *b, int maxit, double tol, FIELD
     printf("CG not converged after %d iterations\n", maxit);
     //cout << "CG not converged after " << maxit << " iterations" << endl;
   }
-  // deallocate
-  delete[]r;
-  delete[]im;
-  delete[]v;
-  delete[]z;
+  if (stats) {
+    stats->iterations = iterations;
+    stats->restarts = 0;
+    stats->reductions = 1 + 2 * iterations;
+    stats->residual = initial_error > 0.0 ? sqrt(d) / initial_error : 0.0;
+    stats->time = MPI_Wtime() - start_time;
+    stats->converged = CONVERGED;
+  }
   return (CONVERGED);
 }
 
@@ -29,9 +29,89 @@
 //#include "ipicdefs.h"
 #include "EMfields3D.h"
 #include "VCtopology3D.h"
+#include "Preconditioner.h"
 
-void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
-  const double *b, int m, int max_iter, double tol, Field * field)
+// block of the vectors kept in cache by the fused kernels below
+static const int GMRES_BLOCK = 1024;
+
+/*! dots[j] = w.V[j] for j < nv and dots[nv] = w.w, in one sweep over w */
+static void fused_dots(double *dots, const double *w, double **V, int nv, int len)
+{
+  for (int j = 0; j <= nv; j++)
+    dots[j] = 0.0;
+  for (int i0 = 0; i0 < len; i0 += GMRES_BLOCK) {
+    const int i1 = i0 + GMRES_BLOCK < len ? i0 + GMRES_BLOCK : len;
+    for (int j = 0; j < nv; j++) {
+      const double *Vj = V[j];
+      double sum = 0.0;
+      for (int i = i0; i < i1; i++)
+        sum += w[i] * Vj[i];
+      dots[j] += sum;
+    }
+    double sum = 0.0;
+    for (int i = i0; i < i1; i++)
+      sum += w[i] * w[i];
+    dots[nv] += sum;
+  }
+}
+
+/*! w -= sum_j h[j] V[j] for j < nv, in one sweep over w */
+static void fused_update(double *w, double **V, const double *h, int nv, int len)
+{
+  for (int i0 = 0; i0 < len; i0 += GMRES_BLOCK) {
+    const int i1 = i0 + GMRES_BLOCK < len ? i0 + GMRES_BLOCK : len;
+    for (int j = 0; j < nv; j++) {
+      const double *Vj = V[j];
+      const double hj = h[j];
+      for (int i = i0; i < i1; i++)
+        w[i] -= hj * Vj[i];
+    }
+  }
+}
+
+/*! Orthogonalize w against V[0..k] and return its norm, the projections
+ *  are added to column k of H.
+ *
+ *  Classical Gram-Schmidt where each pass takes a single MPI_Allreduce of
+ *  the k+1 projections together with the squared norm of w, so that the
+ *  norm of the result follows from ||w - V h||^2 = ||w||^2 - ||h||^2.
+ *  A second pass (CGS2) is made only when the first one removed more than
+ *  99% of the squared norm of w (||w - V h|| < ||w||/10): with such a
+ *  cancellation a single pass may lose orthogonality and the norm from the
+ *  difference above loses digits. In the Maxwell solve the first pass keeps
+ *  8% to 55% of the squared norm, so there is one reduction per iteration.
+ *  If after two passes the norm is still not reliable it is computed
+ *  explicitly with a third reduction. */
+static double orthogonalize_CGS2(double *w, double **V, double **H, double *dots,
+  int k, int len, MPI_Comm comm, int& reductions)
+{
+  for (int j = 0; j <= k; j++)
+    H[j][k] = 0.0;
+  double ww = 0.0;
+  double norm2w = 0.0;
+  for (int pass = 0; pass < 2; pass++) {
+    fused_dots(dots, w, V, k + 1, len);
+    MPI_Allreduce(MPI_IN_PLACE, dots, k + 2, MPI_DOUBLE, MPI_SUM, comm);
+    reductions++;
+    fused_update(w, V, dots, k + 1, len);
+    double hh = 0.0;
+    for (int j = 0; j <= k; j++) {
+      H[j][k] += dots[j];
+      hh += dots[j] * dots[j];
+    }
+    ww = dots[k + 1];
+    norm2w = ww - hh;
+    if (norm2w > 1e-2 * ww)
+      return sqrt(norm2w);
+  }
+  reductions++;
+  return normP(w, len, &comm);
+}
+
+static void GMRES_solve(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
+  const double *b, int m, int max_iter, double tol, Field * field,
+  KrylovWorkspace *workspace, KrylovStats *stats, KrylovPreconditioner *preconditioner,
+  bool cgs2)
 {
   if (m > xkrylovlen) {
     // m need not be the same for all processes,
@@ -41,33 +121,38 @@ void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
     eprintf("In GMRES the dimension of Krylov space(m) "
       "can't be > (length of krylov vector)/(# processors)\n");
   }
+  const double start_time = MPI_Wtime();
   bool GMRESVERBOSE = false;
   double initial_error, rho_tol;
-  double *r = new double[xkrylovlen];
-  double *im = new double[xkrylovlen];
 
-  double *s = new double[m + 1];
-  double *cs = new double[m + 1];
-  double *sn = new double[m + 1];
-  double *y = new double[m + 3];
+  // without a workspace of the caller the work vectors
+  // are allocated here and released on return
+  KrylovWorkspace local_workspace;
+  KrylovWorkspace& ws = workspace ? *workspace : local_workspace;
+  // with a preconditioner this is flexible GMRES: the operator is applied
+  // to Z[k] = M^{-1} V[k] and the solution is updated with the Z vectors,
+  // so M may change from one iteration to the next (e.g. inner iterations)
+  ws.reserve(xkrylovlen, m, preconditioner != 0);
+  double *r = ws.r;
+  double *im = ws.im;
+  double *s = ws.s;
+  double *cs = ws.cs;
+  double *sn = ws.sn;
+  double *y = ws.y;
+  double **H = ws.H;
+  double **V = ws.V;
+  double **Z = preconditioner ? ws.Z : ws.V;
+  // the Krylov basis V is always written before it is read,
+  // only the small arrays need to be cleared
   eqValue(0.0, s, m + 1);
   eqValue(0.0, cs, m + 1);
   eqValue(0.0, sn, m + 1);
   eqValue(0.0, y, m + 3);
-
-
-  // allocate H for storing the results from decomposition
-  double **H = newArr2(double, m + 1, m);
   for (int ii = 0; ii < m + 1; ii++)
     for (int jj = 0; jj < m; jj++)
       H[ii][jj] = 0;
-  // allocate V
-  double **V = newArr2(double, m+1, xkrylovlen);
-  for (int ii = 0; ii < m+1; ii++)
-    for (int jj = 0; jj < xkrylovlen; jj++)
-      V[ii][jj] = 0;
-
-
+  int iterations = 0;
+  int reductions = 0;
 
   if (GMRESVERBOSE && is_output_thread()) {
     printf( "------------------------------------\n"
@@ -76,8 +161,15 @@ void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
   }
 
   MPI_Comm fieldcomm = (field->get_vct()).getFieldComm();
+  double preconditioner_time = 0.0;
+  if (preconditioner) {
+    preconditioner_time -= MPI_Wtime();
+    reductions += preconditioner->setup();
+    preconditioner_time += MPI_Wtime();
+  }
     
   double normb = normP(b, xkrylovlen,&fieldcomm);
+  reductions++;
   if (normb == 0.0)
     normb = 1.0;
 
@@ -88,6 +180,7 @@ void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
     (field->*FunctionImage) (im, xkrylov);
     sub(r, b, im, xkrylovlen);
     initial_error = normP(r, xkrylovlen,&fieldcomm);
+    reductions++;
 
     if (itr == 0) {
       if (is_output_thread())
@@ -112,53 +205,65 @@ void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
 
       // w= A*V(:,k)
       double *w = V[k+1];
-      (field->*FunctionImage) (w, V[k]);
-      // old code (many MPI_Allreduce calls)
-      //
-      //const double av = normP(w, xkrylovlen);
-      //for (register int j = 0; j <= k; j++) {
-      //  H[j][k] = dotP(w, V[j], xkrylovlen);
-      //  addscale(-H[j][k], w, V[j], xkrylovlen);
-      //}
-
-      // new code to make a single MPI_Allreduce call
-      for (int j = 0; j <= k; j++)
-      {
-        y[j] = dot(w, V[j], xkrylovlen);
-      }
-      y[k+1] = norm2(w,xkrylovlen);
-      {
-        
-        MPI_Allreduce(MPI_IN_PLACE, y, (k+2),
-          MPI_DOUBLE, MPI_SUM, fieldcomm);
+      if (preconditioner) {
+        preconditioner_time -= MPI_Wtime();
+        preconditioner->apply(Z[k], V[k]);
+        preconditioner_time += MPI_Wtime();
       }
-      for (int j = 0; j <= k; j++) {
-        H[j][k] = y[j];
-        addscale(-H[j][k], V[k+1], V[j], xkrylovlen);
+      (field->*FunctionImage) (w, Z[k]);
+      if (cgs2) {
+        H[k+1][k] = orthogonalize_CGS2(w, V, H, y, k, xkrylovlen, fieldcomm, reductions);
       }
-      // Is there a numerically stable way to
-      // eliminate this second all-reduce all?
-      H[k+1][k] = normP(V[k+1], xkrylovlen,&fieldcomm);
-      //
-      // check that vectors are orthogonal
-      //
-      //for (register int j = 0; j <= k; j++) {
-      //  dprint(dotP(w, V[j], xkrylovlen));
-      //}
-
-      double av = sqrt(y[k+1]);
-      // why are we testing floating point numbers
-      // for equality?  Is this supposed to say
-      //if (av < delta * fabs(H[k + 1][k]))
-      const double delta=0.001;
-      if (av + delta * H[k + 1][k] == av)
-      {
+      else {
+        // old code (many MPI_Allreduce calls)
+        //
+        //const double av = normP(w, xkrylovlen);
+        //for (register int j = 0; j <= k; j++) {
+        //  H[j][k] = dotP(w, V[j], xkrylovlen);
+        //  addscale(-H[j][k], w, V[j], xkrylovlen);
+        //}
+
+        // new code to make a single MPI_Allreduce call
+        for (int j = 0; j <= k; j++)
+        {
+          y[j] = dot(w, V[j], xkrylovlen);
+        }
+        y[k+1] = norm2(w,xkrylovlen);
+        {
+        
+          MPI_Allreduce(MPI_IN_PLACE, y, (k+2),
+            MPI_DOUBLE, MPI_SUM, fieldcomm);
+        }
         for (int j = 0; j <= k; j++) {
-          const double htmp = dotP(w, V[j], xkrylovlen,&fieldcomm);
-          H[j][k] = H[j][k] + htmp;
-          addscale(-htmp, w, V[j], xkrylovlen);
+          H[j][k] = y[j];
+          addscale(-H[j][k], V[k+1], V[j], xkrylovlen);
+        }
+        // Is there a numerically stable way to
+        // eliminate this second all-reduce all?
+        H[k+1][k] = normP(V[k+1], xkrylovlen,&fieldcomm);
+        reductions += 2;
+        //
+        // check that vectors are orthogonal
+        //
+        //for (register int j = 0; j <= k; j++) {
+        //  dprint(dotP(w, V[j], xkrylovlen));
+        //}
+
+        double av = sqrt(y[k+1]);
+        // why are we testing floating point numbers
+        // for equality?  Is this supposed to say
+        //if (av < delta * fabs(H[k + 1][k]))
+        const double delta=0.001;
+        if (av + delta * H[k + 1][k] == av)
+        {
+          for (int j = 0; j <= k; j++) {
+            const double htmp = dotP(w, V[j], xkrylovlen,&fieldcomm);
+            H[j][k] = H[j][k] + htmp;
+            addscale(-htmp, w, V[j], xkrylovlen);
+          }
+          H[k + 1][k] = normP(w, xkrylovlen,&fieldcomm);
+          reductions += k + 2;
         }
-        H[k + 1][k] = normP(w, xkrylovlen,&fieldcomm);
       }
       // normalize the new vector
       scale(w, (1.0 / H[k + 1][k]), xkrylovlen);
@@ -182,6 +287,7 @@ void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
       k++;
     }
 
+    iterations += k;
     k--;
     y[k] = s[k] / H[k][k];
 
@@ -197,9 +303,9 @@ void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
     for (int j = 0; j < k; j++)
     {
       const double yj = y[j];
-      double* Vj = V[j];
+      double* Zj = Z[j];
       for (int i = 0; i < xkrylovlen; i++)
-        xkrylov[i] += yj * Vj[i];
+        xkrylov[i] += yj * Zj[i];
     }
 
     if (initial_error <= rho_tol) {
@@ -225,18 +331,35 @@ void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
     //cout << "GMRES not converged !! Final error: " << initial_error / rho_tol * tol << endl;
   }
 
-  delete[]r;
-  delete[]im;
-  delete[]s;
-  delete[]cs;
-  delete[]sn;
-  delete[]y;
-  delArr2(H, m + 1);
-  delArr2(V, m + 1);
+  if (stats) {
+    stats->iterations = iterations;
+    stats->restarts = itr;
+    stats->reductions = reductions;
+    stats->residual = initial_error / normb;
+    stats->time = MPI_Wtime() - start_time;
+    stats->preconditioner_time = preconditioner_time;
+    stats->converged = (itr < max_iter);
+  }
   return;
 }
 
 
+void GMRES(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
+  const double *b, int m, int max_iter, double tol, Field * field,
+  KrylovWorkspace *workspace, KrylovStats *stats, KrylovPreconditioner *preconditioner)
+{
+  GMRES_solve(FunctionImage, xkrylov, xkrylovlen, b, m, max_iter, tol, field,
+    workspace, stats, preconditioner, false);
+}
+
+void GMRES_CGS2(FIELD_IMAGE FunctionImage, double *xkrylov, int xkrylovlen,
+  const double *b, int m, int max_iter, double tol, Field * field,
+  KrylovWorkspace *workspace, KrylovStats *stats, KrylovPreconditioner *preconditioner)
+{
+  GMRES_solve(FunctionImage, xkrylov, xkrylovlen, b, m, max_iter, tol, field,
+    workspace, stats, preconditioner, true);
+}
+
 void ApplyPlaneRotation(double &dx, double &dy, double &cs, double &sn) {
   double temp = cs * dx + sn * dy;
   dy = -sn * dx + cs * dy;
@@ -0,0 +1,71 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "KrylovWorkspace.h"
+#include "Alloc.h"
+
+KrylovWorkspace::KrylovWorkspace() :
+  r(0), im(0), V(0), Z(0), H(0), s(0), cs(0), sn(0), y(0), len(0), m(0), flexible(false)
+{}
+
+KrylovWorkspace::~KrylovWorkspace()
+{
+  release();
+}
+
+void KrylovWorkspace::release()
+{
+  delete[]r;
+  delete[]im;
+  delete[]s;
+  delete[]cs;
+  delete[]sn;
+  delete[]y;
+  if (H) delArr2(H, m + 1);
+  if (V) delArr2(V, m + 1);
+  if (Z) delArr2(Z, m + 1);
+  r = im = s = cs = sn = y = 0;
+  H = V = Z = 0;
+  len = m = 0;
+  flexible = false;
+}
+
+void KrylovWorkspace::reserve(int len_, int m_, bool flexible_)
+{
+  if (len_ <= len && m_ <= m && (flexible || !flexible_))
+    return;
+  if (len_ < len) len_ = len;
+  if (m_ < m) m_ = m;
+  flexible_ = flexible_ || flexible;
+  release();
+  len = len_;
+  m = m_;
+  flexible = flexible_;
+  r = new double[len];
+  im = new double[len];
+  s = new double[m + 1];
+  cs = new double[m + 1];
+  sn = new double[m + 1];
+  y = new double[m + 3];
+  H = newArr2(double, m + 1, m);
+  V = newArr2(double, m + 1, len);
+  if (flexible)
+    Z = newArr2(double, m + 1, len);
+}
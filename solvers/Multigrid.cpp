@@ -0,0 +1,339 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <mpi.h>
+#include <math.h>
+#include <stdio.h>
+#include "Multigrid.h"
+#include "KrylovWorkspace.h"
+#include "Alloc.h"
+#include "parallel.h"
+#include "errors.h"
+#include "EMfields3D.h"
+#include "Grid3DCU.h"
+#include "VCtopology3D.h"
+#include "Com3DNonblk.h"
+
+/* cell p of the plane normal to direction d, q and s along the two other directions */
+static inline double &plane_cell(double ***a, int d, int p, int q, int s)
+{
+  if (d == 0)
+    return a[p][q][s];
+  if (d == 1)
+    return a[q][p][s];
+  return a[q][s][p];
+}
+
+PoissonMultigrid::PoissonMultigrid(EMfields3D *field_, int sweeps_) :
+  field(field_),
+  vct(&field_->get_vct()),
+  comm(field_->get_vct().getFieldComm()),
+  sweeps(sweeps_),
+  bottom_sweeps(0),
+  levels(0)
+{
+  const Grid *grid = &field->get_grid();
+  int n[3] = { grid->getNXC() - 2, grid->getNYC() - 2, grid->getNZC() - 2 };
+  double a[3] = { 1.0 / (grid->getDX() * grid->getDX()),
+                  1.0 / (grid->getDY() * grid->getDY()),
+                  1.0 / (grid->getDZ() * grid->getDZ()) };
+  // the subdomains stay the same on all levels, so a direction
+  // can only be coarsened while its local number of cells is even
+  while (true) {
+    nx.push_back(n[0]);
+    ny.push_back(n[1]);
+    nz.push_back(n[2]);
+    ax.push_back(a[0]);
+    ay.push_back(a[1]);
+    az.push_back(a[2]);
+    u.push_back(new array3_double(n[0] + 2, n[1] + 2, n[2] + 2));
+    f.push_back(new array3_double(n[0] + 2, n[1] + 2, n[2] + 2));
+    r.push_back(new array3_double(n[0] + 2, n[1] + 2, n[2] + 2));
+    u.back()->setall(0.0);
+    f.back()->setall(0.0);
+    r.back()->setall(0.0);
+    levels++;
+    if (n[0] % 2 || n[1] % 2 || n[2] % 2)
+      break;
+    for (int d = 0; d < 3; d++) {
+      n[d] /= 2;
+      a[d] /= 4.0;
+    }
+  }
+  if (levels == 1 && vct->getCartesian_rank() == 0)
+    warning_printf("no coarse level of multigrid, the local numbers of cells are not even");
+  // Gauss-Seidel needs a number of sweeps of the order of the number of
+  // cells across the coarsest grid to damp its smooth errors
+  const int *dims = vct->getDims();
+  const int L = levels - 1;
+  int nmax = nx[L] * dims[0];
+  if (ny[L] * dims[1] > nmax) nmax = ny[L] * dims[1];
+  if (nz[L] * dims[2] > nmax) nmax = nz[L] * dims[2];
+  bottom_sweeps = 2 * nmax;
+  // the faces of the coarse levels include the ghost cells of the
+  // directions exchanged before them
+  int face = 0;
+  if (levels > 1) {
+    const int fx = (ny[1] + 2) * (nz[1] + 2);
+    const int fy = (nx[1] + 2) * (nz[1] + 2);
+    const int fz = (nx[1] + 2) * (ny[1] + 2);
+    face = fx > fy ? fx : fy;
+    face = face > fz ? face : fz;
+  }
+  sendbuf.resize(face);
+  recvbuf.resize(face);
+}
+
+PoissonMultigrid::~PoissonMultigrid()
+{
+  for (int l = 0; l < levels; l++) {
+    delete u[l];
+    delete f[l];
+    delete r[l];
+  }
+}
+
+/*! exchange the ghost cells of a level, zero at the physical boundaries */
+void PoissonMultigrid::exchange(int l, array3_double *a)
+{
+  // the finest level has the layout of the field arrays
+  if (l == 0) {
+    communicateCenterBoxStencilBC(nx[0] + 2, ny[0] + 2, nz[0] + 2, *a, 1, 1, 1, 1, 1, 1, vct, field);
+    return;
+  }
+  double ***A = a->fetch_arr3();
+  const int n[3] = { nx[l], ny[l], nz[l] };
+  const int left[3] = { vct->getXleft_neighbor(), vct->getYleft_neighbor(), vct->getZleft_neighbor() };
+  const int right[3] = { vct->getXright_neighbor(), vct->getYright_neighbor(), vct->getZright_neighbor() };
+  // one direction after the other, the planes of a direction include
+  // the ghost cells of the previous ones to fill edges and corners
+  for (int d = 0; d < 3; d++) {
+    const int t1 = (d == 0) ? 1 : 0;
+    const int t2 = (d == 2) ? 1 : 2;
+    const int q0 = (t1 < d) ? 0 : 1;
+    const int q1 = (t1 < d) ? n[t1] + 1 : n[t1];
+    const int s0 = (t2 < d) ? 0 : 1;
+    const int s1 = (t2 < d) ? n[t2] + 1 : n[t2];
+    const int count = (q1 - q0 + 1) * (s1 - s0 + 1);
+    for (int side = 0; side < 2; side++) {
+      // side 0: first plane to the left, ghost plane from the right
+      const int dest = side == 0 ? left[d] : right[d];
+      const int source = side == 0 ? right[d] : left[d];
+      const int psend = side == 0 ? 1 : n[d];
+      const int precv = side == 0 ? n[d] + 1 : 0;
+      int c = 0;
+      for (int q = q0; q <= q1; q++)
+        for (int s = s0; s <= s1; s++)
+          sendbuf[c++] = plane_cell(A, d, psend, q, s);
+      MPI_Sendrecv(&sendbuf[0], count, MPI_DOUBLE, dest, 2 * d + side,
+                   &recvbuf[0], count, MPI_DOUBLE, source, 2 * d + side,
+                   comm, MPI_STATUS_IGNORE);
+      c = 0;
+      for (int q = q0; q <= q1; q++)
+        for (int s = s0; s <= s1; s++, c++)
+          plane_cell(A, d, precv, q, s) = (source == MPI_PROC_NULL) ? 0.0 : recvbuf[c];
+    }
+  }
+}
+
+/*! one red-black Gauss-Seidel half sweep on the cells of the given colour */
+void PoissonMultigrid::smooth(int l, int colour)
+{
+  exchange(l, u[l]);
+  double ***U = u[l]->fetch_arr3();
+  double ***F = f[l]->fetch_arr3();
+  const double cx = ax[l];
+  const double cy = ay[l];
+  const double cz = az[l];
+  const double diag = 1.0 / (2.0 * (cx + cy + cz));
+  // colour of the global cell index
+  const int offset = vct->getCoordinates(0) * nx[l] + vct->getCoordinates(1) * ny[l] + vct->getCoordinates(2) * nz[l];
+  for (int i = 1; i <= nx[l]; i++)
+    for (int j = 1; j <= ny[l]; j++) {
+      const int k0 = ((i + j + 1 + offset) % 2 == colour) ? 1 : 2;
+      for (int k = k0; k <= nz[l]; k += 2)
+        U[i][j][k] = (cx * (U[i - 1][j][k] + U[i + 1][j][k])
+                    + cy * (U[i][j - 1][k] + U[i][j + 1][k])
+                    + cz * (U[i][j][k - 1] + U[i][j][k + 1]) - F[i][j][k]) * diag;
+    }
+}
+
+/*! r = f - lap(u) on the interior cells */
+void PoissonMultigrid::residual(int l)
+{
+  exchange(l, u[l]);
+  double ***U = u[l]->fetch_arr3();
+  double ***F = f[l]->fetch_arr3();
+  double ***R = r[l]->fetch_arr3();
+  const double cx = ax[l];
+  const double cy = ay[l];
+  const double cz = az[l];
+  for (int i = 1; i <= nx[l]; i++)
+    for (int j = 1; j <= ny[l]; j++)
+      for (int k = 1; k <= nz[l]; k++)
+        R[i][j][k] = F[i][j][k]
+          - cx * (U[i - 1][j][k] - 2.0 * U[i][j][k] + U[i + 1][j][k])
+          - cy * (U[i][j - 1][k] - 2.0 * U[i][j][k] + U[i][j + 1][k])
+          - cz * (U[i][j][k - 1] - 2.0 * U[i][j][k] + U[i][j][k + 1]);
+}
+
+/*! source of level l+1: average of the residual on the 8 fine cells, zero initial guess */
+void PoissonMultigrid::restrict_residual(int l)
+{
+  double ***R = r[l]->fetch_arr3();
+  double ***Fc = f[l + 1]->fetch_arr3();
+  for (int I = 1; I <= nx[l + 1]; I++)
+    for (int J = 1; J <= ny[l + 1]; J++)
+      for (int K = 1; K <= nz[l + 1]; K++) {
+        const int i = 2 * I - 1;
+        const int j = 2 * J - 1;
+        const int k = 2 * K - 1;
+        Fc[I][J][K] = 0.125 * (R[i][j][k] + R[i][j][k + 1] + R[i][j + 1][k] + R[i][j + 1][k + 1]
+                             + R[i + 1][j][k] + R[i + 1][j][k + 1] + R[i + 1][j + 1][k] + R[i + 1][j + 1][k + 1]);
+      }
+  u[l + 1]->setall(0.0);
+}
+
+/*! u of level l += trilinear interpolation of the solution of level l+1 */
+void PoissonMultigrid::prolong_correction(int l)
+{
+  exchange(l + 1, u[l + 1]);
+  double ***U = u[l]->fetch_arr3();
+  double ***Uc = u[l + 1]->fetch_arr3();
+  for (int i = 1; i <= nx[l]; i++) {
+    // coarse cell of the fine cell and its nearest neighbour
+    const int I = (i + 1) / 2;
+    const int In = (i % 2) ? I - 1 : I + 1;
+    for (int j = 1; j <= ny[l]; j++) {
+      const int J = (j + 1) / 2;
+      const int Jn = (j % 2) ? J - 1 : J + 1;
+      for (int k = 1; k <= nz[l]; k++) {
+        const int K = (k + 1) / 2;
+        const int Kn = (k % 2) ? K - 1 : K + 1;
+        U[i][j][k] += 0.421875 * Uc[I][J][K]
+          + 0.140625 * (Uc[In][J][K] + Uc[I][Jn][K] + Uc[I][J][Kn])
+          + 0.046875 * (Uc[In][Jn][K] + Uc[In][J][Kn] + Uc[I][Jn][Kn])
+          + 0.015625 * Uc[In][Jn][Kn];
+      }
+    }
+  }
+}
+
+void PoissonMultigrid::vcycle(int l)
+{
+  if (l == levels - 1) {
+    for (int s = 0; s < bottom_sweeps; s++) {
+      smooth(l, 0);
+      smooth(l, 1);
+    }
+    return;
+  }
+  for (int s = 0; s < sweeps; s++) {
+    smooth(l, 0);
+    smooth(l, 1);
+  }
+  residual(l);
+  restrict_residual(l);
+  vcycle(l + 1);
+  prolong_correction(l);
+  // reverse order of the colours, so that the V-cycle is symmetric
+  for (int s = 0; s < sweeps; s++) {
+    smooth(l, 1);
+    smooth(l, 0);
+  }
+}
+
+void PoissonMultigrid::copy_in(double ***a, const double *v)
+{
+  for (int i = 1; i <= nx[0]; i++)
+    for (int j = 1; j <= ny[0]; j++)
+      for (int k = 1; k <= nz[0]; k++)
+        a[i][j][k] = *v++;
+}
+
+void PoissonMultigrid::copy_out(double *v, double ***a)
+{
+  for (int i = 1; i <= nx[0]; i++)
+    for (int j = 1; j <= ny[0]; j++)
+      for (int k = 1; k <= nz[0]; k++)
+        *v++ = a[i][j][k];
+}
+
+void PoissonMultigrid::apply(double *z, double *v)
+{
+  copy_in(f[0]->fetch_arr3(), v);
+  u[0]->setall(0.0);
+  vcycle(0);
+  copy_out(z, u[0]->fetch_arr3());
+}
+
+bool PoissonMultigrid::solve(double *x, const double *b, double tol, int max_cycles, KrylovStats *stats)
+{
+  const double start_time = MPI_Wtime();
+  const int len = nx[0] * ny[0] * nz[0];
+  int reductions = 0;
+  double normb = 0.0;
+  for (int i = 0; i < len; i++)
+    normb += b[i] * b[i];
+  MPI_Allreduce(MPI_IN_PLACE, &normb, 1, MPI_DOUBLE, MPI_SUM, comm);
+  reductions++;
+  normb = sqrt(normb);
+  if (normb == 0.0)
+    normb = 1.0;
+
+  copy_in(f[0]->fetch_arr3(), b);
+  copy_in(u[0]->fetch_arr3(), x);
+  double ***R = r[0]->fetch_arr3();
+  double error = 0.0;
+  int cycles = 0;
+  for (cycles = 0;; cycles++) {
+    residual(0);
+    error = 0.0;
+    for (int i = 1; i <= nx[0]; i++)
+      for (int j = 1; j <= ny[0]; j++)
+        for (int k = 1; k <= nz[0]; k++)
+          error += R[i][j][k] * R[i][j][k];
+    MPI_Allreduce(MPI_IN_PLACE, &error, 1, MPI_DOUBLE, MPI_SUM, comm);
+    reductions++;
+    error = sqrt(error) / normb;
+    if (error <= tol || cycles == max_cycles)
+      break;
+    vcycle(0);
+  }
+  copy_out(x, u[0]->fetch_arr3());
+
+  const bool converged = (error <= tol);
+  if (is_output_thread()) {
+    if (converged)
+      printf("Multigrid converged after %d V-cycles with error: %g\n", cycles, error);
+    else
+      printf("Multigrid not converged !! Final error: %g\n", error);
+  }
+  if (stats) {
+    stats->iterations = cycles;
+    stats->restarts = 0;
+    stats->reductions = reductions;
+    stats->residual = error;
+    stats->time = MPI_Wtime() - start_time;
+    stats->preconditioner_time = 0.0;
+    stats->converged = converged;
+  }
+  return converged;
+}
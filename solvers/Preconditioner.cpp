@@ -0,0 +1,159 @@
+/* iPIC3D was originally developed by Stefano Markidis and Giovanni Lapenta.
+ * This release was contributed by Alec Johnson and Ivy Bo Peng.
+ * Publications that use results from iPIC3D need to properly cite
+ * 'S. Markidis, G. Lapenta, and Rizwan-uddin. "Multi-scale simulations of
+ * plasma with iPIC3D." Mathematics and Computers in Simulation 80.7 (2010): 1509-1519.'
+ *
+ *        Copyright 2015 KTH Royal Institute of Technology
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *         http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <mpi.h>
+#include <math.h>
+#include "Preconditioner.h"
+#include "Basic.h"
+#include "Alloc.h"
+#include "EMfields3D.h"
+#include "VCtopology3D.h"
+
+/* -------------------------------------------------------------------------- */
+/* Block-Jacobi                                                               */
+/* -------------------------------------------------------------------------- */
+
+BlockJacobiPreconditioner::BlockJacobiPreconditioner(FIELD_IMAGE LocalImage_,
+  EMfields3D *field_, int len_, int iterations_) :
+  LocalImage(LocalImage_),
+  field(field_),
+  len(len_),
+  iterations(iterations_)
+{
+  Q = newArr2(double, iterations + 1, len);
+  H = newArr2(double, iterations + 1, iterations);
+  g = new double[iterations + 1];
+  cs = new double[iterations];
+  sn = new double[iterations];
+}
+
+BlockJacobiPreconditioner::~BlockJacobiPreconditioner()
+{
+  delArr2(Q, iterations + 1);
+  delArr2(H, iterations + 1);
+  delete[]g;
+  delete[]cs;
+  delete[]sn;
+}
+
+void BlockJacobiPreconditioner::apply(double *z, double *v)
+{
+  // GMRES on the local subdomain, without restart and
+  // with modified Gram-Schmidt, from z = 0
+  const double beta = sqrt(norm2(v, len));
+  eqValue(0.0, z, len);
+  if (beta == 0.0)
+    return;
+  scale(Q[0], v, 1.0 / beta, len);
+  eqValue(0.0, g, iterations + 1);
+  g[0] = beta;
+  int k = 0;
+  for (k = 0; k < iterations; k++) {
+    double *w = Q[k + 1];
+    (field->*LocalImage) (w, Q[k]);
+    for (int j = 0; j <= k; j++) {
+      H[j][k] = dot(w, Q[j], len);
+      addscale(-H[j][k], w, Q[j], len);
+    }
+    H[k + 1][k] = sqrt(norm2(w, len));
+    // apply the previous rotations and compute the new one
+    for (int j = 0; j < k; j++)
+      ApplyPlaneRotation(H[j + 1][k], H[j][k], cs[j], sn[j]);
+    const double mu = sqrt(H[k][k] * H[k][k] + H[k + 1][k] * H[k + 1][k]);
+    cs[k] = H[k][k] / mu;
+    sn[k] = -H[k + 1][k] / mu;
+    H[k][k] = cs[k] * H[k][k] - sn[k] * H[k + 1][k];
+    const double hnext = H[k + 1][k];
+    H[k + 1][k] = 0.0;
+    ApplyPlaneRotation(g[k + 1], g[k], cs[k], sn[k]);
+    // the local problem is solved exactly (happy breakdown)
+    if (hnext == 0.0) {
+      k++;
+      break;
+    }
+    scale(w, 1.0 / hnext, len);
+  }
+  // back substitution, g is overwritten by the coefficients
+  for (int i = k - 1; i >= 0; i--) {
+    double tmp = g[i];
+    for (int l = i + 1; l < k; l++)
+      tmp -= H[i][l] * g[l];
+    g[i] = tmp / H[i][i];
+  }
+  for (int j = 0; j < k; j++)
+    addscale(g[j], z, Q[j], len);
+}
+
+/* -------------------------------------------------------------------------- */
+/* Polynomial                                                                 */
+/* -------------------------------------------------------------------------- */
+
+PolynomialPreconditioner::PolynomialPreconditioner(FIELD_IMAGE Image_, FIELD_IMAGE LocalImage_,
+  EMfields3D *field_, int len_, int iterations_) :
+  Image(Image_),
+  LocalImage(LocalImage_),
+  field(field_),
+  len(len_),
+  iterations(iterations_),
+  damping(1.0)
+{
+  t = new double[len];
+  q = new double[len];
+}
+
+PolynomialPreconditioner::~PolynomialPreconditioner()
+{
+  delete[]t;
+  delete[]q;
+}
+
+int PolynomialPreconditioner::setup()
+{
+  // largest eigenvalue of the local operators by power iterations,
+  // from a start vector that is not smooth
+  const int power_iterations = 10;
+  for (int i = 0; i < len; i++)
+    q[i] = 1.0 + 0.1 * (i % 7);
+  double lambda = 0.0;
+  for (int it = 0; it < power_iterations; it++) {
+    const double qnorm = sqrt(norm2(q, len));
+    if (qnorm == 0.0)
+      break;
+    scale(q, 1.0 / qnorm, len);
+    (field->*LocalImage) (t, q);
+    lambda = sqrt(norm2(t, len));
+    double *swap = q; q = t; t = swap;
+  }
+  MPI_Comm fieldcomm = (field->get_vct()).getFieldComm();
+  MPI_Allreduce(MPI_IN_PLACE, &lambda, 1, MPI_DOUBLE, MPI_MAX, fieldcomm);
+  damping = lambda > 0.0 ? 1.0 / lambda : 1.0;
+  return 1;
+}
+
+void PolynomialPreconditioner::apply(double *z, double *v)
+{
+  scale(z, v, damping, len);
+  for (int it = 0; it < iterations; it++) {
+    (field->*Image) (t, z);
+    // z += damping * (v - A z)
+    for (int i = 0; i < len; i++)
+      z[i] += damping * (v[i] - t[i]);
+  }
+}